@@ -16,21 +16,33 @@ Example:
 
 from flask import Flask, jsonify 
 from app.config import Config   
-import logging
+import atexit
+import os
+import threading
 from app.errors import RetryableError
+from app.logging_setup import configure_logging
 
 # Lazy imports are a very good practice in modular Flask applications, don't move them out of the function to avoid circular imports.
-def create_app():
+def create_app(config_class=Config):
     """
     Create and configure the Flask application for the WhatsApp AI bot.
 
     This factory function:
     - Initializes Flask app with configuration
-    - Sets up logging with both console and file handlers
+    - Sets up non-blocking logging to the console and a rotating log file
     - Registers global error handlers for different exception types
     - Injects WhatsApp and AI clients as app extensions
+    - Builds the background worker pool in ack-first mode, or the worker
+      processes of the sharded mode, and the outbox sender pool when the
+      durable outbox is enabled; they start on the first request of the
+      process that serves it (see start_services)
+    - Builds the clients and the pipeline again in workers forked from a
+      preloading master (gunicorn --preload)
     - Registers blueprints for webhook handling
 
+    Args:
+        config_class (type): Configuration object to load, defaults to Config
+
     Returns:
         Flask: Configured Flask application instance
 
@@ -39,17 +51,10 @@ def create_app():
         WhatsApp and AI clients are attached as app extensions for easy access in routes.
     """
     app = Flask(__name__) 
-    app.config.from_object(Config) 
-
-    # Logging config
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s [%(levelname)s] %(message)s",
-        handlers=[
-            logging.StreamHandler(),
-            logging.FileHandler("logs/app.log")
-        ]
-    ) 
+    app.config.from_object(config_class) 
+
+    # Logging config, records are written by a background thread
+    configure_logging(app.config)
 
     # Register global error handlers
     @app.errorhandler(Exception)
@@ -61,31 +66,161 @@ def create_app():
     @app.errorhandler(RetryableError)
     def handle_retryable_error(e):
         """Handle retryable errors with 503 response to trigger WhatsApp retries."""
-        app.logger.warning(f"Retryable error: {e}")
+        app.logger.warning("Retryable error: %s", e)
+        if app.metrics is not None:
+            app.metrics.count_retryable_error()
         return jsonify({"error": str(e)}), 503
 
     @app.errorhandler(PermissionError)
     def handle_permission_error(e):
         """Handle permission errors with 403 response."""
-        app.logger.warning(f"Permission error: {e}")
+        app.logger.warning("Permission error: %s", e)
         return jsonify({"error": str(e)}), 403
 
     @app.errorhandler(ValueError)
     def handle_value_error(e):
         """Handle validation errors with 400 response."""
-        app.logger.warning(f"Validation error: {e}") 
+        app.logger.warning("Validation error: %s", e)
         return jsonify({"error": str(e)}), 400
 
     # Dependency injections, services - AI, Whatsapp client
     from app.whatsapp import WhatsAppClient
     from app.ai import AIClient 
-
-    app.whatsapp_client = WhatsAppClient(app.config["WHATSAPP_API_URL"], app.config["WHATSAPP_WEBHOOK_VERIFY_TOKEN"],
-                                          app.config["WHATSAPP_ACCESS_TOKEN"], app.config["WHATSAPP_PHONE_NUMBER_ID"])
-    app.ai_client = AIClient(app.config["OPENAI_API_KEY"], app.config["OPENAI_MODEL"], float(app.config["OPENAI_TEMPERATURE"]))  
+    from app.lazy import LazyClient, after_fork
+    from app.services import (build_reply_cache, build_conversations, build_rate_limiter, build_resilience,
+                              build_metrics, build_phone_normalizer, build_router, build_faq, build_retriever)
+
+    def build_whatsapp_client():
+        whatsapp_retries, whatsapp_breaker = build_resilience(app.config, "whatsapp")
+        return WhatsAppClient(app.config["WHATSAPP_API_URL"], app.config["WHATSAPP_WEBHOOK_VERIFY_TOKEN"],
+                              app.config["WHATSAPP_ACCESS_TOKEN"], app.config["WHATSAPP_PHONE_NUMBER_ID"],
+                              int(app.config["WHATSAPP_POOL_SIZE"]), float(app.config["WHATSAPP_CONNECT_TIMEOUT"]),
+                              float(app.config["WHATSAPP_READ_TIMEOUT"]), build_rate_limiter(app.config, "whatsapp"),
+                              whatsapp_retries, whatsapp_breaker, build_phone_normalizer(app.config))
+
+    def build_ai_client():
+        openai_retries, openai_breaker = build_resilience(app.config, "openai")
+        return AIClient(app.config["OPENAI_API_KEY"], app.config["OPENAI_MODEL"], float(app.config["OPENAI_TEMPERATURE"]),
+                        build_reply_cache(app.config), build_conversations(app.config), int(app.config["OPENAI_MAX_TOKENS"]), app.config["OPENAI_API_BASE"],
+                        app.config["OPENAI_STREAMING"].lower() == "true", int(app.config["STREAM_SEGMENT_MIN_CHARS"]), build_rate_limiter(app.config, "openai"),
+                        openai_retries, openai_breaker, app.metrics, build_router(app.config),
+                        build_faq(app.config), build_retriever(app.config))
+
+    app.metrics = build_metrics(app.config)
+    # The clients import requests and openai on their first call. They are built here so configuration
+    # errors stop the start-up, and built again in each worker forked from a preloading master (gunicorn
+    # --preload), which must not share the master's connections and database handles.
+    app.whatsapp_client = LazyClient(build_whatsapp_client)
+    app.ai_client = LazyClient(build_ai_client)
+    app.whatsapp_client.get()
+    app.ai_client.get()
+    if app.metrics is not None:
+        app.metrics.track_clients(app.ai_client, app.whatsapp_client)
+
+    # Message pipeline, built again in forked workers. Its background services start in the process that
+    # serves requests: a preloading master only forks the workers, which start their own set.
+    _build_pipeline(app)
+    after_fork(app, _build_pipeline)
+
+    @app.before_request
+    def start_background_services():
+        start_services(app)
 
     # Blueprints/routes creation
-    from app.routes import webhook_verification_blueprint  
+    from app.routes import webhook_verification_blueprint, stats_blueprint, metrics_blueprint
     app.register_blueprint(webhook_verification_blueprint)   
+    app.register_blueprint(stats_blueprint)
+    app.register_blueprint(metrics_blueprint)
+
+    return app
+
+
+def _build_pipeline(app):
+    """
+    Build the message pipeline and its background services without starting them.
+
+    Args:
+        app (Flask): Application whose clients and configuration are used
+    """
+    from app.pipeline import MessageProcessor
+    from app.workers import WorkerPool
+    from app.coalescer import MessageCoalescer
+    from app.services import (build_deduplicator, build_outbox, build_outbox_sender, build_dispatcher,
+                              build_scheduler, build_media)
+
+    outbox = build_outbox(app.config)
+    app.message_processor = MessageProcessor(app.whatsapp_client, app.ai_client, build_deduplicator(app.config),
+                                             int(app.config["MAX_CONCURRENT_SENDERS"]), app.metrics, outbox,
+                                             build_media(app.config, app.whatsapp_client),
+                                             int(app.config["WHATSAPP_MAX_MESSAGE_CHARS"]))
+
+    # Durable outbox, replies are delivered by the sender pool (pending ones are recovered on start)
+    app.outbox_sender = None
+    if outbox is not None:
+        app.outbox_sender = build_outbox_sender(app.config, app, outbox, app.whatsapp_client)
+
+    app.worker_pool = None
+    if app.config["MESSAGE_PROCESSING_MODE"] == "background":
+        app.worker_pool = WorkerPool(app, app.message_processor, int(app.config["WORKER_POOL_SIZE"]),
+                                     int(app.config["WORKER_QUEUE_MAXSIZE"]), build_scheduler(app.config))
+    elif app.config["MESSAGE_PROCESSING_MODE"] == "sharded":
+        # same interface as the worker pool, but each sender is pinned to one worker process
+        app.worker_pool = build_dispatcher(app.config, app.message_processor)
+    elif app.config["MESSAGE_PROCESSING_MODE"] != "inline":
+        raise ValueError(f"Unknown MESSAGE_PROCESSING_MODE: {app.config['MESSAGE_PROCESSING_MODE']}")
+
+    # Per-sender debounce window, bursts are merged before they reach the workers
+    app.coalescer = None
+    if float(app.config["COALESCE_WINDOW_SECONDS"]) > 0:
+        if app.worker_pool is None:
+            raise ValueError("Message coalescing requires MESSAGE_PROCESSING_MODE=background or sharded")
+        app.coalescer = MessageCoalescer(app.worker_pool.submit_detached, float(app.config["COALESCE_WINDOW_SECONDS"]),
+                                         float(app.config["COALESCE_MAX_WAIT_SECONDS"]),
+                                         int(app.config["COALESCE_MAX_BATCH"]))
+
+    # pid of the process that started the services (None = not started)
+    app.services_pid = None
+    app.services_lock = threading.Lock()
+
+
+def start_services(app):
+    """
+    Start the background services of the pipeline in this process.
+
+    Runs before the first request of every process that serves, so a
+    gunicorn master started with --preload, which never serves, starts no
+    threads or worker processes that its forked workers would inherit.
+    Calling it again in the same process does nothing.
 
-    return app 
+    Args:
+        app (Flask): Application created by create_app
+    """
+    if app.services_pid == os.getpid():
+        return
+    with app.services_lock:
+        if app.services_pid == os.getpid():
+            return
+        if app.metrics is not None:
+            app.metrics.start()
+        if app.outbox_sender is not None:
+            app.outbox_sender.start()
+        if app.worker_pool is not None:
+            app.worker_pool.start()
+        if app.coalescer is not None:
+            app.coalescer.start()
+        app.services_pid = os.getpid()
+    # a forked child inherits the handler, which only stops the services of the process that started them
+    atexit.register(_stop_services, app, app.services_pid)
+
+
+def _stop_services(app, pid):
+    """Stop the background services at exit, if this process started them."""
+    if os.getpid() != pid:
+        return
+    # the coalescer flushes into a live pool, the outbox sender stops after the workers wrote their last replies
+    if app.coalescer is not None:
+        app.coalescer.stop()
+    if app.worker_pool is not None:
+        app.worker_pool.stop(10 if app.config["MESSAGE_PROCESSING_MODE"] == "sharded" else 5)
+    if app.outbox_sender is not None:
+        app.outbox_sender.stop(5)
@@ -10,6 +10,16 @@ The client supports:
 - Customizable prompts and model parameters
 - Error handling for API failures
 - Temperature and token limit configuration
+- Optional reply cache for frequently repeated messages
+- Optional per-sender conversation memory with bounded prompt size
+- Streaming generation that yields complete sentence/paragraph segments
+- Optional client-side rate limiting in requests and tokens per minute
+- Retries with jittered backoff and an optional circuit breaker
+- Optional token count metrics per completion
+- Optional routing of each message to a model tier (model and token budget)
+- Optional local FAQ answers that skip the API altogether
+- Optional knowledge base snippets retrieved for each message
+- The openai package imported on the first request, not at start-up
 
 Example:
     client = AIClient(
@@ -20,10 +30,21 @@ Example:
     response = client.generate_reply("Hello, how can you help me?")
 """
 
-from app.ai_prompts import default_prompt
-import openai 
-from openai import OpenAIError
-from app.errors import RetryableError
+import time
+
+from app.ai_prompts import system_prompt, context_prompt, message_prompt, PROMPT_VERSION
+from app.conversations import estimate_tokens
+from app.errors import RateLimitError, RetryableError
+from app.resilience import RetryPolicy
+from app.routing import DEFAULT, ModelTier
+from app.segmenter import SentenceSegmenter
+
+
+def _openai():
+    """Return the openai package, imported on first use since it is the slowest import of the bot."""
+    import openai
+
+    return openai
 
 
 class AIClient:
@@ -38,9 +59,21 @@ class AIClient:
         api_key (str): OpenAI API key for authentication
         model (str): OpenAI model to use for text generation
         temperature (float): Temperature parameter for response creativity
+        reply_cache (ReplyCache): Optional cache of replies to repeated messages
+        conversations (ConversationStore): Optional per-sender conversation memory
+        rate_limiter (RateLimiter): Optional limiter of OpenAI requests and tokens
+        retry_policy (RetryPolicy): Retries of failed requests (a single attempt by default)
+        circuit_breaker (CircuitBreaker): Optional breaker failing fast while OpenAI is down
+        metrics (BotMetrics): Optional registry of token count metrics
+        router (ModelRouter): Optional router choosing the model tier of each message
+        faq (FaqEngine): Optional FAQ engine answering known questions locally
+        retriever (Retriever): Optional knowledge base retrieval adding snippets to prompts
     """
 
-    def __init__(self, api_key, model, temperature):
+    def __init__(self, api_key, model, temperature, reply_cache=None, conversations=None,
+                 max_tokens=150, api_base=None, streaming=False, segment_min_chars=80, rate_limiter=None,
+                 retry_policy=None, circuit_breaker=None, metrics=None, router=None, faq=None,
+                 retriever=None):
         """
         Initialize AI client with OpenAI configuration.
 
@@ -49,13 +82,40 @@ class AIClient:
             model (str): OpenAI model name (e.g., "gpt-3.5-turbo", "gpt-4")
             temperature (float): Temperature parameter (0.0-2.0) controlling
                                response randomness. Higher values = more creative
+            reply_cache (ReplyCache, optional): Cache of replies to repeated messages
+            conversations (ConversationStore, optional): Per-sender conversation memory
+            max_tokens (int): Maximum number of tokens of a generated reply
+            api_base (str, optional): OpenAI API base URL, defaults to the public API
+            streaming (bool): Stream replies and deliver them segment by segment
+            segment_min_chars (int): Minimum length of a streamed segment
+            rate_limiter (RateLimiter, optional): Limiter of OpenAI requests and tokens
+            retry_policy (RetryPolicy, optional): Retries of failed requests
+            circuit_breaker (CircuitBreaker, optional): Breaker of the OpenAI API
+            metrics (BotMetrics, optional): Registry of token count metrics
+            router (ModelRouter, optional): Router choosing the model and max_tokens of each
+                                            message; without it every message uses model and max_tokens
+            faq (FaqEngine, optional): FAQ engine answering known questions before the model is asked
+            retriever (Retriever, optional): Knowledge base retrieval adding the best snippets to each prompt
         """
         self.api_key = api_key
-        openai.api_key = self.api_key
         self.model = model 
         self.temperature = temperature 
+        self.reply_cache = reply_cache
+        self.conversations = conversations
+        self.max_tokens = max_tokens
+        self.api_base = api_base
+        self.streaming = streaming
+        self.segment_min_chars = segment_min_chars
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy("openai", max_attempts=1)
+        self.circuit_breaker = circuit_breaker
+        self.metrics = metrics
+        self.router = router
+        self.faq = faq
+        self.retriever = retriever
+        self.default_tier = ModelTier(DEFAULT, model, max_tokens)
 
-    def generate_reply(self, message):
+    def generate_reply(self, message, sender=None):
         """
         Generate AI-powered reply to a WhatsApp message.
 
@@ -65,26 +125,235 @@ class AIClient:
 
         Args:
             message (str): The incoming WhatsApp message to respond to
+            sender (str, optional): Sender WhatsApp id, used for conversation memory
 
         Returns:
             str: AI-generated response message
 
         Raises:
-            RetryableError: If OpenAI API call fails or returns an error
+            RetryableError: If OpenAI API call fails or returns an error and the
+                            retry policy gives up
+            CircuitOpenError: If the OpenAI circuit breaker is open
 
         Note:
-            Uses a default prompt template that can be customized in ai_prompts.py.
-            Response is limited to 150 tokens for WhatsApp message length constraints.
+            Uses the prompt templates of ai_prompts.py: the static system prompt
+            first, then knowledge base snippets, the history and the formatted message.
+            Response is limited to max_tokens (150 by default) for WhatsApp message length constraints;
+            with a router, model and max_tokens come from the tier chosen for the message.
+            FAQ matches and, with a reply cache, repeated messages are answered without calling the API.
+            With conversation memory, earlier turns of the sender are sent along,
+            trimmed to the store's token budget; the cache is only used for
+            messages without history since their reply depends on the context.
+        """
+        messages, with_history, cached_reply, tier = self._prepare(message, sender)
+        if cached_reply is not None:
+            self._finish(message, sender, cached_reply, with_history, tier, from_cache=True)
+            return cached_reply
+        started = time.perf_counter()
+        reply = self.retry_policy.call(lambda timeout: self._complete(messages, tier, timeout), self.circuit_breaker)
+        self._record_latency(tier, time.perf_counter() - started)
+        self._finish(message, sender, reply, with_history, tier)
+        return reply
+
+    def _complete(self, messages, tier, timeout=None):
+        """
+        Request one completion (a single attempt).
+
+        Args:
+            messages (list[dict]): Chat messages of the request
+            tier (ModelTier): Model and max_tokens of the request
+            timeout (float, optional): Seconds left until the call's deadline
+
+        Returns:
+            str: Reply text
         """
-        prompt = default_prompt.format(message_text=message) 
+        self._acquire(messages, tier)
+        openai = _openai()
         try:
             response = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
+                model=tier.model,
+                messages=messages,
                 temperature=self.temperature,
-                max_tokens=150,
+                max_tokens=tier.max_tokens,
+                api_key=self.api_key,
+                api_base=self.api_base,
+                request_timeout=timeout,
             )
-            return response["choices"][0]["message"]["content"].strip()
+            reply = response["choices"][0]["message"]["content"].strip()
+            self._record_usage(messages, reply, response.get("usage"))
+
+        except openai.error.RateLimitError as error:
+            self._rate_limited(error)
+        except openai.OpenAIError as error:
+            raise RetryableError(f"Error during AI response generation: {error}")
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.on_success()
+        return reply
+
+    def stream_reply(self, message, sender=None):
+        """
+        Generate a reply as a stream of complete segments.
+
+        Consumes the completion as a token stream and yields paragraphs or
+        groups of sentences as soon as they are complete, so the first part
+        of a long answer can be delivered while the rest is generated.
+
+        Args:
+            message (str): The incoming WhatsApp message to respond to
+            sender (str, optional): Sender WhatsApp id, used for conversation memory
+
+        Yields:
+            str: Complete reply segments in order
+
+        Raises:
+            RetryableError: If the OpenAI API call or the stream fails
+        """
+        messages, with_history, cached_reply, tier = self._prepare(message, sender)
+        if cached_reply is not None:
+            self._finish(message, sender, cached_reply, with_history, tier, from_cache=True)
+            yield cached_reply
+            return
+
+        segmenter = SentenceSegmenter(min_chars=self.segment_min_chars)
+        segments = []
+        started = time.perf_counter()
+        stream = self.retry_policy.call(lambda timeout: self._open_stream(messages, tier, timeout),
+                                        self.circuit_breaker)
+        openai = _openai()
+        try:
+            for chunk in stream:
+                content = chunk["choices"][0]["delta"].get("content")
+                if not content:
+                    continue
+                for segment in segmenter.feed(content):
+                    segments.append(segment)
+                    yield segment
+
+        except openai.OpenAIError as error:
+            raise RetryableError(f"Error during AI response generation: {error}")
+
+        tail = segmenter.flush()
+        if tail:
+            segments.append(tail)
+            yield tail
+        reply = "\n\n".join(segments)
+        self._record_latency(tier, time.perf_counter() - started)
+        self._record_usage(messages, reply)
+        self._finish(message, sender, reply, with_history, tier)
+
+    def _open_stream(self, messages, tier, timeout=None):
+        """
+        Start one streamed completion (a single attempt).
+
+        Only opening the stream is retried; once segments have been
+        delivered, a broken stream is not started over.
+
+        Args:
+            messages (list[dict]): Chat messages of the request
+            tier (ModelTier): Model and max_tokens of the request
+            timeout (float, optional): Seconds left until the call's deadline
 
-        except OpenAIError as error:
+        Returns:
+            iterator: Completion chunks
+        """
+        self._acquire(messages, tier)
+        openai = _openai()
+        try:
+            stream = openai.ChatCompletion.create(
+                model=tier.model,
+                messages=messages,
+                temperature=self.temperature,
+                max_tokens=tier.max_tokens,
+                api_key=self.api_key,
+                api_base=self.api_base,
+                stream=True,
+                request_timeout=timeout,
+            )
+        except openai.error.RateLimitError as error:
+            self._rate_limited(error)
+        except openai.OpenAIError as error:
             raise RetryableError(f"Error during AI response generation: {error}")
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.on_success()
+        return stream
+
+    def _prepare(self, message, sender):
+        """
+        Choose the model tier and build the chat messages for a request, or find a FAQ or cached reply.
+
+        The static system prompt always comes first, so all requests share
+        the same prefix; knowledge base snippets, history and the formatted
+        message follow it.
+
+        Returns:
+            tuple: (chat messages, whether history is included, FAQ/cached reply or None, ModelTier)
+        """
+        if self.faq is not None:
+            answer = self.faq.answer(message)
+            if answer is not None:
+                return None, False, answer, self.default_tier
+        tier = self.router.route(message) if self.router is not None else self.default_tier
+        with_history = (self.conversations is not None and sender is not None
+                        and self.conversations.has_history(sender))
+        if self.reply_cache is not None and not with_history:
+            cached_reply = self.reply_cache.get(message, tier.model, self.temperature, self._prompt_version())
+            if cached_reply is not None:
+                return None, with_history, cached_reply, tier
+
+        prompt = message_prompt.format(message_text=message)
+        if self.conversations is not None and sender is not None:
+            messages = self.conversations.build_messages(sender, prompt)
+        else:
+            messages = [{"role": "user", "content": prompt}]
+        prefix = [{"role": "system", "content": system_prompt}]
+        snippets = self.retriever.context(message) if self.retriever is not None else []
+        if snippets:
+            prefix.append({"role": "system", "content": context_prompt.format(snippets="\n\n".join(snippets))})
+        return prefix + messages, with_history, None, tier
+
+    def _prompt_version(self):
+        """Prompt version of the reply cache key; a rebuilt knowledge base index invalidates cached replies."""
+        if self.retriever is None:
+            return PROMPT_VERSION
+        return f"{PROMPT_VERSION}:{self.retriever.version}"
+
+    def _request_tokens(self, messages, tier):
+        """Estimate the tokens OpenAI counts against the limit: prompt plus max_tokens."""
+        return sum(estimate_tokens(item["content"]) for item in messages) + tier.max_tokens
+
+    def _record_latency(self, tier, duration):
+        """Record the completion time of a tier in the router stats and the metrics."""
+        if self.router is not None:
+            self.router.record_latency(tier, duration)
+        if self.metrics is not None:
+            self.metrics.observe_tier(tier.name, duration)
+
+    def _record_usage(self, messages, reply, usage=None):
+        """Record the tokens of a completion, estimating them when OpenAI did not report usage."""
+        if self.metrics is None:
+            return
+        if usage:
+            self.metrics.observe_tokens(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+        else:
+            self.metrics.observe_tokens(sum(estimate_tokens(item["content"]) for item in messages),
+                                        estimate_tokens(reply))
+
+    def _acquire(self, messages, tier):
+        """Wait for the rate limiter before a completion request."""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(self._request_tokens(messages, tier))
+
+    def _rate_limited(self, error):
+        """Slow the limiter down after a 429 and raise a retryable error."""
+        if self.rate_limiter is not None:
+            self.rate_limiter.on_rate_limited(getattr(error, "headers", None))
+        raise RateLimitError(f"OpenAI rate limit: {error}")
+
+    def _finish(self, message, sender, reply, with_history, tier, from_cache=False):
+        """Store a reply in the reply cache and the conversation memory."""
+        if self.reply_cache is not None and not with_history and not from_cache:
+            self.reply_cache.set(message, tier.model, self.temperature, self._prompt_version(), reply)
+        if self.conversations is not None and sender is not None:
+            self.conversations.record_exchange(sender, message, reply)
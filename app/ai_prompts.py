@@ -10,34 +10,44 @@ The prompt system supports:
 - Multi-language support
 - Context-aware responses
 - Business-friendly tone
+- Static instructions as a stable, cacheable prompt prefix
+
+Prompt layout:
+    The static instructions are sent as a separate system message ahead of
+    everything else, so every request starts with the same bytes and
+    providers with prompt caching can reuse the processed prefix. Only the
+    message_prompt part changes from request to request; keep anything
+    variable (names, dates, the message itself) out of system_prompt.
 
 Customization:
-    Modify the default_prompt template to change the AI's personality,
-    response style, or add specific instructions for your use case.
-    
-    You can also add additional prompt templates for different scenarios
-    or message types.
+    Modify system_prompt to change the AI's personality, response style, or
+    add specific instructions for your use case, and bump PROMPT_VERSION.
 
 Example:
-    # Custom prompt for customer service
-    customer_service_prompt = '''
-    You are a helpful customer service representative for {company_name}.
+    # Custom instructions for customer service
+    system_prompt = '''
+    You are a helpful customer service representative for Example Ltd.
     Always be polite, professional, and solution-oriented.
-    
-    Customer message: "{message_text}"
-    Your response:
     '''
 """
 
-default_prompt = """ 
+# Bump whenever a prompt template changes, cached replies of older versions are then ignored
+PROMPT_VERSION = "2"
+
+system_prompt = """\
 You are an intelligent, friendly assistant replying to WhatsApp messages on behalf of a business.
 Your responses should be helpful, clear, and conversational.
 
-Reply appropriately to the following message in the same language it was sent in. 
-Keep it short, polite, and useful.
+Reply appropriately to each incoming message in the same language it was sent in.
+Keep it short, polite, and useful."""
+
+# Knowledge base snippets, sent as a second system message after the static prefix
+context_prompt = """\
+Business information that may help with the reply (do not mention it if it is unrelated):
+{snippets}"""
 
+message_prompt = """\
 Incoming message:
 "{message_text}"
 
-Your reply:
-""" 
\ No newline at end of file
+Your reply:"""
@@ -0,0 +1,255 @@
+"""
+ASGI Application Entry Point
+
+This module is the asyncio alternative to app/main.py. It serves the same
+webhook with AsyncWhatsAppClient and AsyncAIClient on one shared
+ShardedAsyncClient, so a single process keeps hundreds of conversations in
+flight while it waits on OpenAI and the Graph API, instead of tying up one
+worker thread or process per request.
+
+The ASGI app handles:
+- Webhook verification (GET /)
+- Message processing (POST /), inline or ack-first (MESSAGE_PROCESSING_MODE)
+- Processing statistics (GET /stats)
+- Prometheus metrics (GET /metrics)
+- Lifespan startup/shutdown of the shared HTTP client
+
+It is configured with the same environment variables as the Flask app.
+Coalescing, streaming and the background worker pool remain features of the
+Flask app.
+
+Example:
+    uvicorn app.asgi:app --host 0.0.0.0 --port 8000
+"""
+
+import asyncio
+import json
+import logging
+import time
+from urllib.parse import parse_qs
+
+from app.async_clients import AsyncAIClient, AsyncWhatsAppClient, ShardedAsyncClient
+from app.config import Config
+from app.errors import RetryableError
+from app.logging_setup import configure_logging, logging_stats
+from app.pipeline import AsyncMessageProcessor
+from app.rate_limit import rate_limit_stats
+from app.resilience import resilience_stats
+from app.services import (build_conversations, build_deduplicator, build_metrics, build_phone_normalizer,
+                          build_rate_limiters, build_reply_cache, build_resilience, build_router,
+                          build_faq, build_retriever, build_media, config_to_dict)
+
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookASGIApp:
+    """
+    Minimal ASGI application serving the WhatsApp webhook.
+
+    Attributes:
+        config (dict): Application configuration
+        http_client (ShardedAsyncClient): Shared async HTTP client, created on startup
+        whatsapp_client (AsyncWhatsAppClient): Async WhatsApp client
+        ai_client (AsyncAIClient): Async OpenAI client
+        message_processor (AsyncMessageProcessor): Async reply pipeline
+        metrics (BotMetrics): Metrics registry, None if disabled
+    """
+
+    def __init__(self, config=None):
+        """
+        Initialize the application; clients are created on startup.
+
+        Args:
+            config (dict, optional): Configuration, defaults to the Config class values
+
+        Raises:
+            ValueError: If the configuration enables a feature the ASGI app does not support
+        """
+        self.config = config if config is not None else config_to_dict(Config)
+        if self.config["MESSAGE_PROCESSING_MODE"] == "sharded":
+            raise ValueError("MESSAGE_PROCESSING_MODE=sharded is only supported by the Flask app")
+        if self.config["OUTBOX_ENABLED"].lower() == "true":
+            raise ValueError("The durable outbox is only supported by the Flask app (OUTBOX_ENABLED=false)")
+        self.http_client = None
+        self.whatsapp_client = None
+        self.ai_client = None
+        self.message_processor = None
+        self.metrics = build_metrics(self.config)
+        self._background_tasks = set()
+
+    async def startup(self):
+        """Create the shared HTTP client and the service clients (idempotent)."""
+        if self.http_client is not None:
+            return
+        config = self.config
+        self.http_client = ShardedAsyncClient(int(config["ASGI_MAX_CONNECTIONS"]))
+        openai_limiter, whatsapp_limiter = build_rate_limiters(config)
+        openai_retries, openai_breaker = build_resilience(config, "openai")
+        whatsapp_retries, whatsapp_breaker = build_resilience(config, "whatsapp")
+        self.whatsapp_client = AsyncWhatsAppClient(config["WHATSAPP_API_URL"], config["WHATSAPP_WEBHOOK_VERIFY_TOKEN"],
+                                                   config["WHATSAPP_ACCESS_TOKEN"], config["WHATSAPP_PHONE_NUMBER_ID"],
+                                                   self.http_client, float(config["WHATSAPP_CONNECT_TIMEOUT"]),
+                                                   float(config["WHATSAPP_READ_TIMEOUT"]), whatsapp_limiter,
+                                                   whatsapp_retries, whatsapp_breaker,
+                                                   build_phone_normalizer(config))
+        self.ai_client = AsyncAIClient(config["OPENAI_API_KEY"], config["OPENAI_MODEL"], float(config["OPENAI_TEMPERATURE"]),
+                                       build_reply_cache(config), build_conversations(config),
+                                       int(config["OPENAI_MAX_TOKENS"]), config["OPENAI_API_BASE"], self.http_client,
+                                       rate_limiter=openai_limiter, retry_policy=openai_retries,
+                                       circuit_breaker=openai_breaker, metrics=self.metrics,
+                                       router=build_router(config), faq=build_faq(config),
+                                       retriever=build_retriever(config))
+        self.message_processor = AsyncMessageProcessor(self.whatsapp_client, self.ai_client, build_deduplicator(config),
+                                                       int(config["ASGI_MAX_IN_FLIGHT"]), self.metrics,
+                                                       build_media(config, self.whatsapp_client),
+                                                       int(config["WHATSAPP_MAX_MESSAGE_CHARS"]))
+        if self.metrics is not None:
+            self.metrics.track_clients(self.ai_client, self.whatsapp_client)
+            self.metrics.start()
+
+    async def shutdown(self):
+        """Wait for background replies and close the shared HTTP client."""
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        await self.startup()
+        try:
+            status, payload = await self._dispatch(scope, receive)
+        except RetryableError as error:
+            logger.warning("Retryable error: %s", error)
+            if self.metrics is not None:
+                self.metrics.count_retryable_error()
+            status, payload = 503, {"error": str(error)}
+        except PermissionError as error:
+            logger.warning("Permission error: %s", error)
+            status, payload = 403, {"error": str(error)}
+        except ValueError as error:
+            logger.warning("Validation error: %s", error)
+            status, payload = 400, {"error": str(error)}
+        except Exception as error:
+            logger.exception("Unhandled exception:")
+            status, payload = 500, {"error": str(error)}
+        await self._respond(send, status, payload)
+
+    async def _lifespan(self, receive, send):
+        """Handle the ASGI lifespan protocol."""
+        while True:
+            event = await receive()
+            if event["type"] == "lifespan.startup":
+                await self.startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif event["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _dispatch(self, scope, receive):
+        """Route a request and return (status, payload)."""
+        path, method = scope["path"], scope["method"]
+        if path == "/stats" and method == "GET":
+            processor = self.message_processor
+            reply_cache = self.ai_client.reply_cache
+            return 200, {
+                "mode": "asgi",
+                "in_flight_tasks": len(self._background_tasks),
+                "stages": processor.stats(),
+                "dedup": processor.dedup_stats(),
+                "reply_cache": reply_cache.stats() if reply_cache is not None else None,
+                "routing": self.ai_client.router.stats() if self.ai_client.router is not None else None,
+                "faq": self.ai_client.faq.stats() if self.ai_client.faq is not None else None,
+                "retrieval": self.ai_client.retriever.stats() if self.ai_client.retriever is not None else None,
+                "media": processor.media.stats() if processor.media is not None else None,
+                "delivery": processor.delivery.stats(),
+                "rate_limits": rate_limit_stats(self.ai_client, self.whatsapp_client),
+                "resilience": resilience_stats(self.ai_client, self.whatsapp_client),
+                "logging": logging_stats(),
+            }
+        if path == "/metrics" and method == "GET":
+            if self.metrics is None:
+                return 404, {"error": "Metrics are disabled"}
+            return 200, self.metrics.render()
+        if path != "/":
+            return 404, {"error": "Not found"}
+
+        if method == "GET":
+            query = parse_qs(scope.get("query_string", b"").decode())
+            challenge = self.whatsapp_client.verify_token(query.get("hub.verify_token", [None])[0],
+                                                          query.get("hub.challenge", [None])[0])
+            return 200, challenge
+        if method != "POST":
+            return 405, {"error": "Method not allowed"}
+
+        body = await self._read_body(receive)
+        processor = self.message_processor
+        started = time.perf_counter()
+        messages = self.whatsapp_client.decode_messages(body)
+        if self.metrics is not None:
+            self.metrics.observe_stage("unpack_messages", time.perf_counter() - started)
+            for message in messages:
+                self.metrics.count_message(message.type)
+        messages = [message for message in messages if processor.claim(message)]
+        if self.config["MESSAGE_PROCESSING_MODE"] == "background":
+            task = asyncio.create_task(self._process_in_background(messages))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+            return 200, {"status": "accepted"}
+        await processor.process_batch(messages)
+        return 200, {"status": "ok"}
+
+    async def _process_in_background(self, messages):
+        """Process an acknowledged batch, logging failures instead of raising them."""
+        try:
+            await self.message_processor.process_batch(messages)
+        except RetryableError as error:
+            logger.warning("Background processing failed: %s", error)
+        except Exception:
+            logger.exception("Unhandled exception in background task:")
+
+    @staticmethod
+    async def _read_body(receive):
+        """Read the full request body."""
+        chunks = []
+        while True:
+            event = await receive()
+            chunks.append(event.get("body", b""))
+            if not event.get("more_body"):
+                return b"".join(chunks)
+
+    @staticmethod
+    async def _respond(send, status, payload):
+        """Send a JSON (or plain text for strings) response."""
+        if isinstance(payload, str) or payload is None:
+            body, content_type = (payload or "").encode(), b"text/plain; charset=utf-8"
+        else:
+            body, content_type = json.dumps(payload).encode(), b"application/json"
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+
+def create_asgi_app(config=None):
+    """
+    Create the ASGI application for the WhatsApp AI bot.
+
+    Args:
+        config (dict, optional): Configuration, defaults to the Config class values
+
+    Returns:
+        WebhookASGIApp: ASGI application instance
+    """
+    app = WebhookASGIApp(config)
+    configure_logging(app.config)
+    return app
+
+
+app = create_asgi_app()
@@ -0,0 +1,262 @@
+"""
+Async WhatsApp and OpenAI Clients
+
+This module provides asyncio versions of WhatsAppClient and AIClient for the
+ASGI serving mode (app/asgi.py). Both clients share one ShardedAsyncClient, so
+a single process keeps hundreds of conversations in flight on a small,
+reused connection pool instead of one blocked thread per request.
+
+The async clients reuse everything that does not do I/O from their sync
+counterparts (webhook verification, message extraction, phone number
+formatting, prompt building, reply cache and conversation memory) and only
+replace the network calls.
+
+Example:
+    http_client = ShardedAsyncClient(max_connections=100)
+    whatsapp_client = AsyncWhatsAppClient(api_url, verify_token, access_token, phone_number_id, http_client)
+    ai_client = AsyncAIClient(api_key, model, 0.7, http_client=http_client)
+    reply = await ai_client.generate_reply("hi")
+    await whatsapp_client.send_message(reply, "70000000000")
+"""
+
+import asyncio
+import logging
+import time
+
+import httpx
+
+from app.ai import AIClient
+from app.errors import RateLimitError, RetryableError
+from app.whatsapp import WhatsAppClient
+
+
+logger = logging.getLogger(__name__)
+
+
+class ShardedAsyncClient:
+    """
+    Async HTTP client that spreads requests over several small httpx pools.
+
+    httpcore scans every pending request against every pooled connection on
+    each pool event, so one large pool spends seconds of CPU per hundred
+    concurrent requests. Several pools of shard_size connections keep that
+    scan small, and a semaphore per shard queues excess requests in asyncio
+    instead of inside the pool.
+
+    Attributes:
+        shards (list[httpx.AsyncClient]): Underlying clients
+    """
+
+    def __init__(self, max_connections=100, shard_size=10, **client_kwargs):
+        """
+        Initialize the shards.
+
+        Args:
+            max_connections (int): Total number of connections over all shards
+            shard_size (int): Connections per shard
+            **client_kwargs: Extra httpx.AsyncClient arguments (e.g. transport)
+        """
+        shard_size = max(1, min(shard_size, max_connections))
+        count = max(1, -(-max_connections // shard_size))
+        limits = httpx.Limits(max_connections=shard_size, max_keepalive_connections=shard_size)
+        self.shards = [httpx.AsyncClient(limits=limits, **client_kwargs) for _ in range(count)]
+        self._shard_size = shard_size
+        self._semaphores = None
+        self._next = 0
+
+    async def post(self, url, **kwargs):
+        """Send a POST request on the next shard, see httpx.AsyncClient.post."""
+        if self._semaphores is None:
+            # created lazily, so they bind to the running event loop
+            self._semaphores = [asyncio.Semaphore(self._shard_size) for _ in self.shards]
+        index = self._next
+        self._next = (index + 1) % len(self.shards)
+        async with self._semaphores[index]:
+            return await self.shards[index].post(url, **kwargs)
+
+    async def aclose(self):
+        """Close every shard."""
+        await asyncio.gather(*(shard.aclose() for shard in self.shards))
+
+
+class AsyncWhatsAppClient(WhatsAppClient):
+    """
+    WhatsApp Business API client with an async send_message.
+
+    Attributes:
+        http_client (ShardedAsyncClient): Shared async HTTP client
+    """
+
+    def __init__(self, api_url, webhook_verify_token, access_token, phone_number_id, http_client,
+                 connect_timeout=3.05, read_timeout=10.0, rate_limiter=None, retry_policy=None,
+                 circuit_breaker=None, phone_normalizer=None):
+        """
+        Initialize the async WhatsApp client.
+
+        Args:
+            api_url (str): Base URL for WhatsApp Business API
+            webhook_verify_token (str): Token used for webhook verification
+            access_token (str): Access token for API authentication
+            phone_number_id (str): WhatsApp phone number ID for sending messages
+            http_client (ShardedAsyncClient): Shared async HTTP client
+            connect_timeout (float): Seconds to wait for a TCP/TLS connection
+            read_timeout (float): Seconds to wait for the API response
+            rate_limiter (RateLimiter, optional): Limiter of outgoing messages
+            retry_policy (RetryPolicy, optional): Retries of failed sends
+            circuit_breaker (CircuitBreaker, optional): Breaker of the Graph API
+            phone_normalizer (PhoneNormalizer, optional): Normalizer of recipient numbers
+        """
+        super().__init__(api_url, webhook_verify_token, access_token, phone_number_id,
+                         connect_timeout=connect_timeout, read_timeout=read_timeout, rate_limiter=rate_limiter,
+                         retry_policy=retry_policy, circuit_breaker=circuit_breaker,
+                         phone_normalizer=phone_normalizer)
+        self.http_client = http_client
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+    async def send_message(self, message_text, receiver_phone_number):
+        """
+        Send text message to WhatsApp user.
+
+        Args:
+            message_text (str): Text content to send
+            receiver_phone_number (str): Recipient's phone number
+
+        Raises:
+            RetryableError: If API returns 5xx or rate limit errors, the rate limiter
+                            would wait too long, or network issues occur, and the
+                            retry policy gives up
+            CircuitOpenError: If the Graph API circuit breaker is open
+        """
+        payload = {
+            "messaging_product": "whatsapp",
+            "to": self.format_wa_phone_number(receiver_phone_number),
+            "type": "text",
+            "text": {
+                "preview_url": False,
+                "body": message_text
+            }
+        }
+        await self.retry_policy.acall(lambda timeout: self._post_message_async(payload, timeout),
+                                      self.circuit_breaker)
+
+    async def _post_message_async(self, payload, timeout=None):
+        """Post one message payload to the Graph API (a single attempt)."""
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire_async()
+        read_timeout = self.read_timeout if timeout is None else max(0.001, min(self.read_timeout, timeout))
+        try:
+            response = await self.http_client.post(self.messages_url, headers=self.headers, json=payload,
+                                                   timeout=httpx.Timeout(read_timeout, connect=self.connect_timeout))
+        except httpx.HTTPError as error:
+            raise RetryableError(f"Error sending message: {error}")
+
+        if self.is_rate_limited(response.status_code, response.content):
+            if self.rate_limiter is not None:
+                self.rate_limiter.on_rate_limited(response.headers)
+            raise RateLimitError(f"WhatsApp API rate limited: {response.status_code}")
+        if self.rate_limiter is not None and not response.is_error:
+            self.rate_limiter.on_success(response.headers)
+        if response.is_error:
+            if 500 <= response.status_code < 600:
+                raise RetryableError(f"WhatsApp API 5xx error: {response.status_code}")
+            logger.warning("WhatsApp API non-retryable error (%s): %s", response.status_code, response.text)
+
+
+class AsyncAIClient(AIClient):
+    """
+    OpenAI client with an async generate_reply on a shared HTTP client.
+
+    Attributes:
+        http_client (ShardedAsyncClient): Shared async HTTP client
+        timeout (float): Seconds to wait for a completion
+    """
+
+    def __init__(self, api_key, model, temperature, reply_cache=None, conversations=None,
+                 max_tokens=150, api_base=None, http_client=None, timeout=60.0, rate_limiter=None,
+                 retry_policy=None, circuit_breaker=None, metrics=None, router=None, faq=None,
+                 retriever=None):
+        """
+        Initialize the async AI client.
+
+        Args:
+            api_key (str): OpenAI API key for authentication
+            model (str): OpenAI model name (e.g., "gpt-3.5-turbo", "gpt-4")
+            temperature (float): Temperature parameter (0.0-2.0)
+            reply_cache (ReplyCache, optional): Cache of replies to repeated messages
+            conversations (ConversationStore, optional): Per-sender conversation memory
+            max_tokens (int): Maximum number of tokens of a generated reply
+            api_base (str, optional): OpenAI API base URL, defaults to the public API
+            http_client (ShardedAsyncClient): Shared async HTTP client
+            timeout (float): Seconds to wait for a completion
+            rate_limiter (RateLimiter, optional): Limiter of OpenAI requests and tokens
+            retry_policy (RetryPolicy, optional): Retries of failed requests
+            circuit_breaker (CircuitBreaker, optional): Breaker of the OpenAI API
+            metrics (BotMetrics, optional): Registry of token count metrics
+            router (ModelRouter, optional): Router choosing the model and max_tokens of each message
+            faq (FaqEngine, optional): FAQ engine answering known questions before the model is asked
+            retriever (Retriever, optional): Knowledge base retrieval adding the best snippets to each prompt
+        """
+        super().__init__(api_key, model, temperature, reply_cache, conversations, max_tokens, api_base,
+                         rate_limiter=rate_limiter, retry_policy=retry_policy, circuit_breaker=circuit_breaker,
+                         metrics=metrics, router=router, faq=faq, retriever=retriever)
+        self.http_client = http_client
+        self.timeout = timeout
+        self.completions_url = f"{(api_base or 'https://api.openai.com/v1').rstrip('/')}/chat/completions"
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+
+    async def generate_reply(self, message, sender=None):
+        """
+        Generate AI-powered reply to a WhatsApp message.
+
+        Args:
+            message (str): The incoming WhatsApp message to respond to
+            sender (str, optional): Sender WhatsApp id, used for conversation memory
+
+        Returns:
+            str: AI-generated response message
+
+        Raises:
+            RetryableError: If OpenAI API call fails or returns an error and the
+                            retry policy gives up
+            CircuitOpenError: If the OpenAI circuit breaker is open
+        """
+        messages, with_history, cached_reply, tier = self._prepare(message, sender)
+        if cached_reply is not None:
+            self._finish(message, sender, cached_reply, with_history, tier, from_cache=True)
+            return cached_reply
+
+        started = time.perf_counter()
+        reply = await self.retry_policy.acall(lambda timeout: self._complete_async(messages, tier, timeout),
+                                              self.circuit_breaker)
+        self._record_latency(tier, time.perf_counter() - started)
+        self._finish(message, sender, reply, with_history, tier)
+        return reply
+
+    async def _complete_async(self, messages, tier, timeout=None):
+        """Request one completion (a single attempt)."""
+        request = {
+            "model": tier.model,
+            "messages": messages,
+            "temperature": self.temperature,
+            "max_tokens": tier.max_tokens,
+        }
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire_async(self._request_tokens(messages, tier))
+        try:
+            response = await self.http_client.post(self.completions_url, headers=self.headers, json=request,
+                                                   timeout=self.timeout if timeout is None else min(self.timeout, timeout))
+            if response.status_code == 429:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.on_rate_limited(response.headers)
+                raise RateLimitError(f"OpenAI rate limit: {response.status_code}")
+            response.raise_for_status()
+            completion = response.json()
+            reply = completion["choices"][0]["message"]["content"].strip()
+        except (httpx.HTTPError, KeyError, IndexError, ValueError) as error:
+            raise RetryableError(f"Error during AI response generation: {error}")
+
+        self._record_usage(messages, reply, completion.get("usage"))
+        if self.rate_limiter is not None:
+            self.rate_limiter.on_success(response.headers)
+        return reply
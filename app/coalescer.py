@@ -0,0 +1,163 @@
+"""
+Per-Sender Message Coalescing
+
+Users often send several short messages in a row ("hi" / "I have a question"
+/ "about delivery"). This module buffers each sender's messages for a short
+debounce window and hands the whole burst over at once, so the burst is
+answered with one model request and one reply.
+
+The coalescer supports:
+- Debounce window that restarts with every new message of the sender
+- Maximum wait measured from the first message, so latency stays bounded
+- Maximum batch size that flushes a burst immediately
+- Counters for received messages and flushed bursts
+
+Example:
+    coalescer = MessageCoalescer(worker_pool.submit_detached, window=1.5, max_wait=5, max_batch=5)
+    coalescer.start()
+    coalescer.add(message)
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+from app.messages import merge_text_messages
+
+
+class _Burst:
+    """Messages buffered for one sender and the time the burst is due."""
+
+    __slots__ = ("messages", "first_at", "deadline")
+
+    def __init__(self, now):
+        self.messages = []
+        self.first_at = now
+        self.deadline = now
+
+
+class MessageCoalescer:
+    """
+    Buffers messages per sender and flushes them as merged bursts.
+
+    Attributes:
+        flush (callable): Called with the merged list of a sender's messages
+        window (float): Seconds of silence after which a burst is flushed
+        max_wait (float): Maximum seconds a message waits in the buffer
+        max_batch (int): Number of messages that flushes a burst immediately
+    """
+
+    def __init__(self, flush, window=1.5, max_wait=5.0, max_batch=5):
+        """
+        Initialize the coalescer without starting its timer thread.
+
+        Args:
+            flush (callable): Called with the merged list of a sender's messages
+            window (float): Seconds of silence after which a burst is flushed
+            max_wait (float): Maximum seconds a message waits in the buffer
+            max_batch (int): Number of messages that flushes a burst immediately
+        """
+        self.flush = flush
+        self.window = window
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self._bursts = {}
+        self._deadlines = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._received = 0
+        self._flushed = 0
+
+    def start(self):
+        """Start the timer thread that flushes due bursts."""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="whatsapp-coalescer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the timer thread and flush every buffered burst."""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._condition:
+            bursts, self._bursts = list(self._bursts.values()), {}
+            self._deadlines.clear()
+        for burst in bursts:
+            self._flush(burst)
+
+    def add(self, message):
+        """
+        Buffer a message until its sender's burst is complete.
+
+        Args:
+            message (InboundMessage): Message extracted from the webhook payload
+        """
+        ready = None
+        with self._condition:
+            now = time.monotonic()
+            self._received += 1
+            burst = self._bursts.get(message.sender)
+            if burst is None:
+                burst = self._bursts[message.sender] = _Burst(now)
+            burst.messages.append(message)
+
+            if len(burst.messages) >= self.max_batch:
+                ready = self._bursts.pop(message.sender)
+            else:
+                burst.deadline = min(now + self.window, burst.first_at + self.max_wait)
+                heapq.heappush(self._deadlines, (burst.deadline, next(self._sequence), message.sender))
+                self._condition.notify()
+        if ready is not None:
+            self._flush(ready)
+
+    def _run(self):
+        """Timer loop: flush bursts whose deadline has passed."""
+        while True:
+            due = []
+            with self._condition:
+                while self._running:
+                    now = time.monotonic()
+                    if self._deadlines and self._deadlines[0][0] <= now:
+                        break
+                    timeout = self._deadlines[0][0] - now if self._deadlines else None
+                    self._condition.wait(timeout)
+                if not self._running:
+                    return
+                now = time.monotonic()
+                while self._deadlines and self._deadlines[0][0] <= now:
+                    _, _, sender = heapq.heappop(self._deadlines)
+                    burst = self._bursts.get(sender)
+                    # heap entries of bursts that were extended or flushed are stale
+                    if burst is not None and burst.deadline <= now:
+                        due.append(self._bursts.pop(sender))
+            for burst in due:
+                self._flush(burst)
+
+    def _flush(self, burst):
+        """Merge a burst and hand it to the flush callback."""
+        with self._condition:
+            self._flushed += 1
+        self.flush(merge_text_messages(burst.messages))
+
+    def stats(self):
+        """
+        Return coalescing counters.
+
+        Returns:
+            dict: Received messages, flushed bursts and currently buffered senders
+        """
+        with self._condition:
+            return {
+                "received": self._received,
+                "bursts": self._flushed,
+                "buffered_senders": len(self._bursts),
+            }
@@ -6,7 +6,7 @@ It loads environment variables and provides default values for all
 required API credentials and settings.
 
 The configuration system supports:
-- Environment variable loading with dotenv
+- Environment variable loading with dotenv, imported only if a .env file exists
 - Default values for development
 - Centralized configuration management
 - WhatsApp Business API settings
@@ -17,9 +17,104 @@ Environment Variables:
     WHATSAPP_WEBHOOK_VERIFY_TOKEN: Token for webhook verification
     WHATSAPP_ACCESS_TOKEN: Access token for WhatsApp API
     WHATSAPP_PHONE_NUMBER_ID: WhatsApp phone number ID
+    WHATSAPP_POOL_SIZE: Kept-alive connections to the Graph API per process
+    WHATSAPP_CONNECT_TIMEOUT: Seconds to wait for a Graph API connection
+    WHATSAPP_READ_TIMEOUT: Seconds to wait for a Graph API response
+    WHATSAPP_MAX_MESSAGE_CHARS: Maximum length of one text message, longer replies are sent in several parts
+    PHONE_DEFAULT_REGIONS: Comma-separated ISO regions for numbers without a valid country code (e.g., "KZ")
+    PHONE_REWRITE_RULES: Comma-separated rewrite rules applied to recipient numbers (e.g., "kz_trunk_prefix")
+    PHONE_REWRITE_RULES_FILE: JSON file with additional rewrite rules (name, region, pattern, replacement)
+    PHONE_CACHE_SIZE: Maximum number of memoized phone numbers
     OPENAI_API_KEY: OpenAI API key for AI responses
     OPENAI_MODEL: OpenAI model to use (e.g., gpt-3.5-turbo)
     OPENAI_TEMPERATURE: Temperature for AI response creativity
+    OPENAI_MAX_TOKENS: Maximum number of tokens of a generated reply
+    OPENAI_API_BASE: OpenAI API base URL (e.g., a local stub server)
+    OPENAI_STREAMING: Stream replies and send them segment by segment ("true"/"false")
+    MODEL_ROUTING_ENABLED: Route simple messages to a fast model tier ("true"/"false")
+    MODEL_ROUTING_FAST_MODEL: OpenAI model of the fast tier (e.g., gpt-4o-mini)
+    MODEL_ROUTING_FAST_MAX_TOKENS: Maximum number of tokens of a fast tier reply
+    MODEL_ROUTING_SIMPLE_MAX_CHARS: Longest message the built-in classifier considers simple
+    MODEL_ROUTING_FAST_SCRIPTS: Comma-separated scripts the fast tier is trusted with (e.g., "latin,cyrillic")
+    MODEL_ROUTING_CLASSIFIER: "module:attribute" of a custom classifier (empty = built-in heuristic)
+    FAQ_FILE: JSON (or YAML) FAQ file answered locally without OpenAI (empty = off)
+    FAQ_MIN_COVERAGE: Share of a message's content words one intent must match for a FAQ answer
+    FAQ_FUZZY_CUTOFF: Minimum similarity (0..1) of a misspelled message to a FAQ pattern (0 = exact only)
+    FAQ_RELOAD_SECONDS: Interval of the checks of the FAQ file for changes (0 = never reload)
+    RETRIEVAL_INDEX_PATH: Knowledge base index built with "python -m app.retrieval build" (empty = off)
+    RETRIEVAL_TOP_K: Maximum knowledge base snippets added to a prompt
+    RETRIEVAL_TOKEN_BUDGET: Maximum estimated tokens of the snippets of one prompt
+    STREAM_SEGMENT_MIN_CHARS: Minimum length of a streamed segment
+    CONVERSATION_MEMORY_ENABLED: Send the sender's recent turns along with each message ("true"/"false")
+    CONVERSATION_MAX_TURNS: Turns kept per conversation
+    CONVERSATION_TOKEN_BUDGET: Maximum estimated tokens of history per prompt
+    CONVERSATION_SUMMARY_TOKENS: Token budget of the summary of older turns
+    CONVERSATION_IDLE_TTL_SECONDS: Idle time after which a conversation is forgotten
+    CONVERSATION_MAX_CONVERSATIONS: Maximum number of conversations kept in memory
+    REPLY_CACHE_BACKEND: Reply cache store ("none", "memory" or "sqlite")
+    REPLY_CACHE_TTL_SECONDS: How long a cached reply stays valid
+    REPLY_CACHE_MAX_ENTRIES: Maximum number of cached replies, the least recently used (memory) or written (sqlite) are evicted
+    REPLY_CACHE_MAX_BYTES: Size cap in bytes of the cached replies
+    REPLY_CACHE_SQLITE_PATH: Database file shared by all workers with the sqlite backend
+    MESSAGE_PROCESSING_MODE: "inline" (reply before acking), "background" (ack first) or "sharded"
+        (ack first, each sender pinned to one of SHARD_PROCESSES worker processes)
+    WORKER_POOL_SIZE: Number of background worker threads
+    WORKER_QUEUE_MAXSIZE: Maximum number of queued messages in background mode
+    MAX_CONCURRENT_SENDERS: Senders of one webhook batch processed in parallel
+    ASGI_MAX_CONNECTIONS: Upstream HTTP connections per process, in pools of 10 (ASGI mode)
+    ASGI_MAX_IN_FLIGHT: Maximum messages processed concurrently per process (ASGI mode)
+    COALESCE_WINDOW_SECONDS: Debounce window merging a sender's bursts (0 = off, background mode only)
+    COALESCE_MAX_WAIT_SECONDS: Maximum time a message waits in a burst
+    COALESCE_MAX_BATCH: Number of messages that flushes a burst immediately
+    SHARD_PROCESSES: Worker processes in sharded mode (0 = one per CPU core)
+    SHARD_THREADS: Sender lanes (threads) per worker process in sharded mode
+    SHARD_QUEUE_MAXSIZE: Maximum queued sender batches per worker process in sharded mode
+    SCHEDULER_MAX_PER_SENDER: Batches of one sender processed at once in background mode
+    SCHEDULER_MAX_QUEUED_PER_SENDER: Maximum queued batches of one sender in background mode (0 = unbounded)
+    SCHEDULER_PRIORITY_CLASSES: Sender weights, "name=weight:sender,sender;..." (e.g. "vip=4:77010000000")
+    DEDUP_BACKEND: Store for processed message ids ("memory", "sqlite" or "none")
+    DEDUP_TTL_SECONDS: How long a processed message id is remembered
+    DEDUP_MAX_ENTRIES: Maximum number of ids kept, the oldest are evicted first
+    DEDUP_SQLITE_PATH: Database file shared by all workers with the sqlite backend
+    OUTBOX_ENABLED: Commit replies to a durable local outbox and deliver them from there ("true"/"false", Flask app only)
+    OUTBOX_SQLITE_PATH: Outbox database file, shared by all workers pointing at it
+    OUTBOX_SENDER_CONCURRENCY: Outbox replies sent in parallel per process
+    OUTBOX_MAX_BATCH: Maximum replies committed in one group commit
+    OUTBOX_MAX_ATTEMPTS: Delivery attempts before an outbox reply is marked dead
+    OUTBOX_RETRY_BASE_DELAY_SECONDS: Backoff after the first failed delivery (doubles per attempt, with full jitter)
+    OUTBOX_RETRY_MAX_DELAY_SECONDS: Upper bound of a single delivery backoff
+    OUTBOX_LEASE_SECONDS: Time a claimed reply is reserved before another sender may take it
+    OUTBOX_RETENTION_SECONDS: How long delivered replies are kept for inspection
+    MEDIA_ENABLED: Answer image, audio, video, document and sticker messages ("true"/"false")
+    MEDIA_MAX_BYTES: Largest media file downloaded; larger ones are answered without their content (0 = unlimited)
+    MEDIA_MAX_CONCURRENT_DOWNLOADS: Media downloads running at the same time per process
+    MEDIA_SPOOL_BYTES: Size up to which a download is kept in memory before it is spooled to a temporary file
+    MEDIA_CHUNK_BYTES: Size of the chunks a download is read in
+    MEDIA_PROCESSOR: Custom "module:attribute" turning media into text, e.g. a transcriber (empty = describe the file)
+    RATE_LIMIT_BACKEND: Token bucket state ("memory" per process or "sqlite" shared by all workers)
+    RATE_LIMIT_SQLITE_PATH: Database file shared by all workers with the sqlite backend
+    RATE_LIMIT_MAX_WAIT_SECONDS: Longest a call waits for the limiter before failing with a 503
+    OPENAI_RATE_LIMIT_RPS: OpenAI requests per second (0 = unlimited)
+    OPENAI_RATE_LIMIT_TPM: OpenAI tokens per minute, prompt plus max_tokens (0 = unlimited)
+    WHATSAPP_RATE_LIMIT_RPS: Graph API messages per second (0 = unlimited)
+    RETRY_MAX_ATTEMPTS: Attempts per OpenAI or Graph API call, including the first
+    RETRY_BASE_DELAY_SECONDS: Backoff before the first retry (doubles per retry, with full jitter)
+    RETRY_MAX_DELAY_SECONDS: Upper bound of a single backoff
+    OPENAI_DEADLINE_SECONDS: Time budget of one reply generation over all attempts
+    WHATSAPP_DEADLINE_SECONDS: Time budget of one message send over all attempts
+    CIRCUIT_BREAKER_FAILURES: Consecutive failures that open an upstream's circuit breaker (0 = off)
+    CIRCUIT_BREAKER_RESET_SECONDS: Time an open circuit breaker fails fast before a probe call
+    METRICS_ENABLED: Collect metrics and serve them at /metrics ("true"/"false")
+    METRICS_MULTIPROC_DIR: Directory where gunicorn workers share metric snapshots (empty = single process)
+    METRICS_FLUSH_SECONDS: Interval of the snapshot writes in multi-process mode
+    LOG_LEVEL: Minimum level of logged records (e.g., INFO, WARNING)
+    LOG_FORMAT: "text" or "json" (JSON lines with message_id and sender correlation fields)
+    LOG_FILE: Log file path (empty = console only)
+    LOG_ROTATION: Log file rotation, "size", "time" or "none"
+    LOG_MAX_BYTES: File size that triggers a rotation with size rotation
+    LOG_BACKUP_COUNT: Number of rotated files kept
+    LOG_ROTATE_WHEN: Rotation interval with time rotation (e.g., "midnight", "H")
+    LOG_QUEUE_SIZE: Records buffered for the writer thread before new ones are dropped
 
 Example:
     Create a .env file with your API credentials:
@@ -33,10 +128,27 @@ Example:
 """
 
 import os
-from dotenv import load_dotenv
 
 
-load_dotenv()
+def _find_dotenv():
+    """Return the nearest .env file above this package, like dotenv's find_dotenv, or None."""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        path = os.path.join(directory, ".env")
+        if os.path.isfile(path):
+            return path
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+# Containers usually get their settings from the environment, they skip the dotenv import
+_dotenv_path = _find_dotenv()
+if _dotenv_path is not None:
+    from dotenv import load_dotenv
+
+    load_dotenv(_dotenv_path)
 
 
 class Config:
@@ -58,9 +170,129 @@ class Config:
     WHATSAPP_WEBHOOK_VERIFY_TOKEN = os.getenv("WHATSAPP_WEBHOOK_VERIFY_TOKEN", "your-whatsapp-webhook-verify-token")
     WHATSAPP_ACCESS_TOKEN = os.getenv("WHATSAPP_ACCESS_TOKEN", "your-whatsapp-access-token") 
     WHATSAPP_PHONE_NUMBER_ID = os.getenv("WHATSAPP_PHONE_NUMBER_ID", "your-whatsapp-phone-number-id")
+    WHATSAPP_POOL_SIZE = os.getenv("WHATSAPP_POOL_SIZE", "10")
+    WHATSAPP_CONNECT_TIMEOUT = os.getenv("WHATSAPP_CONNECT_TIMEOUT", "3.05")
+    WHATSAPP_READ_TIMEOUT = os.getenv("WHATSAPP_READ_TIMEOUT", "10")
+    WHATSAPP_MAX_MESSAGE_CHARS = os.getenv("WHATSAPP_MAX_MESSAGE_CHARS", "4096")
+    PHONE_DEFAULT_REGIONS = os.getenv("PHONE_DEFAULT_REGIONS", "KZ")
+    PHONE_REWRITE_RULES = os.getenv("PHONE_REWRITE_RULES", "kz_trunk_prefix")
+    PHONE_REWRITE_RULES_FILE = os.getenv("PHONE_REWRITE_RULES_FILE", "")
+    PHONE_CACHE_SIZE = os.getenv("PHONE_CACHE_SIZE", "10000")
 
     # OpenAI API Configuration
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "your-openai-api-key")
     OPENAI_MODEL = os.getenv("OPENAI_MODEL", "your-openai-model")
     OPENAI_TEMPERATURE = os.getenv("OPENAI_TEMPERATURE", 'your-openai-temperature') 
+    OPENAI_MAX_TOKENS = os.getenv("OPENAI_MAX_TOKENS", "150")
+    OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
+    OPENAI_STREAMING = os.getenv("OPENAI_STREAMING", "false")
+    STREAM_SEGMENT_MIN_CHARS = os.getenv("STREAM_SEGMENT_MIN_CHARS", "80")
+
+    # Model Routing Configuration (opt-in), the default tier is OPENAI_MODEL with OPENAI_MAX_TOKENS
+    MODEL_ROUTING_ENABLED = os.getenv("MODEL_ROUTING_ENABLED", "false")
+    MODEL_ROUTING_FAST_MODEL = os.getenv("MODEL_ROUTING_FAST_MODEL", "gpt-4o-mini")
+    MODEL_ROUTING_FAST_MAX_TOKENS = os.getenv("MODEL_ROUTING_FAST_MAX_TOKENS", "60")
+    MODEL_ROUTING_SIMPLE_MAX_CHARS = os.getenv("MODEL_ROUTING_SIMPLE_MAX_CHARS", "40")
+    MODEL_ROUTING_FAST_SCRIPTS = os.getenv("MODEL_ROUTING_FAST_SCRIPTS", "latin,cyrillic")
+    MODEL_ROUTING_CLASSIFIER = os.getenv("MODEL_ROUTING_CLASSIFIER", "")
+
+    # FAQ Fast Path Configuration (opt-in)
+    FAQ_FILE = os.getenv("FAQ_FILE", "")
+    FAQ_MIN_COVERAGE = os.getenv("FAQ_MIN_COVERAGE", "0.6")
+    FAQ_FUZZY_CUTOFF = os.getenv("FAQ_FUZZY_CUTOFF", "0.85")
+    FAQ_RELOAD_SECONDS = os.getenv("FAQ_RELOAD_SECONDS", "5")
+
+    # Knowledge Base Retrieval Configuration (opt-in)
+    RETRIEVAL_INDEX_PATH = os.getenv("RETRIEVAL_INDEX_PATH", "")
+    RETRIEVAL_TOP_K = os.getenv("RETRIEVAL_TOP_K", "3")
+    RETRIEVAL_TOKEN_BUDGET = os.getenv("RETRIEVAL_TOKEN_BUDGET", "300")
+
+    # Conversation Memory Configuration (opt-in)
+    CONVERSATION_MEMORY_ENABLED = os.getenv("CONVERSATION_MEMORY_ENABLED", "false")
+    CONVERSATION_MAX_TURNS = os.getenv("CONVERSATION_MAX_TURNS", "10")
+    CONVERSATION_TOKEN_BUDGET = os.getenv("CONVERSATION_TOKEN_BUDGET", "1000")
+    CONVERSATION_SUMMARY_TOKENS = os.getenv("CONVERSATION_SUMMARY_TOKENS", "200")
+    CONVERSATION_IDLE_TTL_SECONDS = os.getenv("CONVERSATION_IDLE_TTL_SECONDS", "3600")
+    CONVERSATION_MAX_CONVERSATIONS = os.getenv("CONVERSATION_MAX_CONVERSATIONS", "10000")
+
+    # AI Reply Cache Configuration (opt-in)
+    REPLY_CACHE_BACKEND = os.getenv("REPLY_CACHE_BACKEND", "none")
+    REPLY_CACHE_TTL_SECONDS = os.getenv("REPLY_CACHE_TTL_SECONDS", "3600")
+    REPLY_CACHE_MAX_ENTRIES = os.getenv("REPLY_CACHE_MAX_ENTRIES", "10000")
+    REPLY_CACHE_MAX_BYTES = os.getenv("REPLY_CACHE_MAX_BYTES", "10485760")
+    REPLY_CACHE_SQLITE_PATH = os.getenv("REPLY_CACHE_SQLITE_PATH", "state/reply_cache.sqlite3")
+
+    # Message Processing Configuration
+    MESSAGE_PROCESSING_MODE = os.getenv("MESSAGE_PROCESSING_MODE", "inline")
+    WORKER_POOL_SIZE = os.getenv("WORKER_POOL_SIZE", "4")
+    WORKER_QUEUE_MAXSIZE = os.getenv("WORKER_QUEUE_MAXSIZE", "1000")
+    MAX_CONCURRENT_SENDERS = os.getenv("MAX_CONCURRENT_SENDERS", "8")
+    ASGI_MAX_CONNECTIONS = os.getenv("ASGI_MAX_CONNECTIONS", "100")
+    ASGI_MAX_IN_FLIGHT = os.getenv("ASGI_MAX_IN_FLIGHT", "500")
+    COALESCE_WINDOW_SECONDS = os.getenv("COALESCE_WINDOW_SECONDS", "0")
+    COALESCE_MAX_WAIT_SECONDS = os.getenv("COALESCE_MAX_WAIT_SECONDS", "5")
+    COALESCE_MAX_BATCH = os.getenv("COALESCE_MAX_BATCH", "5")
+    SHARD_PROCESSES = os.getenv("SHARD_PROCESSES", "0")
+    SHARD_THREADS = os.getenv("SHARD_THREADS", "8")
+    SHARD_QUEUE_MAXSIZE = os.getenv("SHARD_QUEUE_MAXSIZE", "1000")
+    SCHEDULER_MAX_PER_SENDER = os.getenv("SCHEDULER_MAX_PER_SENDER", "1")
+    SCHEDULER_MAX_QUEUED_PER_SENDER = os.getenv("SCHEDULER_MAX_QUEUED_PER_SENDER", "100")
+    SCHEDULER_PRIORITY_CLASSES = os.getenv("SCHEDULER_PRIORITY_CLASSES", "")
+
+    # Message Deduplication Configuration
+    DEDUP_BACKEND = os.getenv("DEDUP_BACKEND", "memory")
+    DEDUP_TTL_SECONDS = os.getenv("DEDUP_TTL_SECONDS", "86400")
+    DEDUP_MAX_ENTRIES = os.getenv("DEDUP_MAX_ENTRIES", "100000")
+    DEDUP_SQLITE_PATH = os.getenv("DEDUP_SQLITE_PATH", "state/dedup.sqlite3")
+
+    # Durable Reply Outbox Configuration (opt-in, Flask app only)
+    OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "false")
+    OUTBOX_SQLITE_PATH = os.getenv("OUTBOX_SQLITE_PATH", "state/outbox.sqlite3")
+    OUTBOX_SENDER_CONCURRENCY = os.getenv("OUTBOX_SENDER_CONCURRENCY", "4")
+    OUTBOX_MAX_BATCH = os.getenv("OUTBOX_MAX_BATCH", "256")
+    OUTBOX_MAX_ATTEMPTS = os.getenv("OUTBOX_MAX_ATTEMPTS", "10")
+    OUTBOX_RETRY_BASE_DELAY_SECONDS = os.getenv("OUTBOX_RETRY_BASE_DELAY_SECONDS", "1")
+    OUTBOX_RETRY_MAX_DELAY_SECONDS = os.getenv("OUTBOX_RETRY_MAX_DELAY_SECONDS", "300")
+    OUTBOX_LEASE_SECONDS = os.getenv("OUTBOX_LEASE_SECONDS", "60")
+    OUTBOX_RETENTION_SECONDS = os.getenv("OUTBOX_RETENTION_SECONDS", "86400")
+
+    # Media Messages Configuration (opt-in)
+    MEDIA_ENABLED = os.getenv("MEDIA_ENABLED", "false")
+    MEDIA_MAX_BYTES = os.getenv("MEDIA_MAX_BYTES", "16777216")
+    MEDIA_MAX_CONCURRENT_DOWNLOADS = os.getenv("MEDIA_MAX_CONCURRENT_DOWNLOADS", "4")
+    MEDIA_SPOOL_BYTES = os.getenv("MEDIA_SPOOL_BYTES", "1048576")
+    MEDIA_CHUNK_BYTES = os.getenv("MEDIA_CHUNK_BYTES", "65536")
+    MEDIA_PROCESSOR = os.getenv("MEDIA_PROCESSOR", "")
+
+    # Client-Side Rate Limiting Configuration
+    RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    RATE_LIMIT_SQLITE_PATH = os.getenv("RATE_LIMIT_SQLITE_PATH", "state/rate_limit.sqlite3")
+    RATE_LIMIT_MAX_WAIT_SECONDS = os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "10")
+    OPENAI_RATE_LIMIT_RPS = os.getenv("OPENAI_RATE_LIMIT_RPS", "0")
+    OPENAI_RATE_LIMIT_TPM = os.getenv("OPENAI_RATE_LIMIT_TPM", "0")
+    WHATSAPP_RATE_LIMIT_RPS = os.getenv("WHATSAPP_RATE_LIMIT_RPS", "80")
+
+    # Retries and Circuit Breaker Configuration
+    RETRY_MAX_ATTEMPTS = os.getenv("RETRY_MAX_ATTEMPTS", "3")
+    RETRY_BASE_DELAY_SECONDS = os.getenv("RETRY_BASE_DELAY_SECONDS", "0.2")
+    RETRY_MAX_DELAY_SECONDS = os.getenv("RETRY_MAX_DELAY_SECONDS", "2")
+    OPENAI_DEADLINE_SECONDS = os.getenv("OPENAI_DEADLINE_SECONDS", "30")
+    WHATSAPP_DEADLINE_SECONDS = os.getenv("WHATSAPP_DEADLINE_SECONDS", "15")
+    CIRCUIT_BREAKER_FAILURES = os.getenv("CIRCUIT_BREAKER_FAILURES", "5")
+    CIRCUIT_BREAKER_RESET_SECONDS = os.getenv("CIRCUIT_BREAKER_RESET_SECONDS", "30")
+
+    # Metrics Configuration
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true")
+    METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR", "")
+    METRICS_FLUSH_SECONDS = os.getenv("METRICS_FLUSH_SECONDS", "5")
+
+    # Logging Configuration
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+    LOG_FILE = os.getenv("LOG_FILE", "logs/app.log")
+    LOG_ROTATION = os.getenv("LOG_ROTATION", "size")
+    LOG_MAX_BYTES = os.getenv("LOG_MAX_BYTES", "10485760")
+    LOG_BACKUP_COUNT = os.getenv("LOG_BACKUP_COUNT", "5")
+    LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")
+    LOG_QUEUE_SIZE = os.getenv("LOG_QUEUE_SIZE", "10000")
     # Add more configuration variables as needed
@@ -0,0 +1,246 @@
+"""
+Conversation Memory
+
+This module keeps a short per-sender history of the conversation so the AI
+client can answer follow-up messages in context, while keeping the prompt
+size (and with it latency and cost) bounded no matter how long a
+conversation runs.
+
+The conversation store supports:
+- Last N turns per sender in a ring buffer of compact __slots__ records
+- Incremental summary of turns that fall out of the ring buffer
+- Token-budget trimming when building the prompt messages
+- Eviction of idle conversations and a cap on the number of conversations
+
+Example:
+    store = ConversationStore(max_turns=10, token_budget=1000)
+    messages = store.build_messages("70000000000", prompt)
+    ...  # call the model with messages
+    store.record_exchange("70000000000", "hi", "Hello! How can I help?")
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+def estimate_tokens(text):
+    """
+    Estimate the number of model tokens in a text.
+
+    Uses the common ~4 characters per token rule of thumb, which is close
+    enough for budgeting without loading a tokenizer.
+
+    Args:
+        text (str): Text to measure
+
+    Returns:
+        int: Estimated token count
+    """
+    return len(text) // 4 + 1
+
+
+def summarize_turn(summary, turn, max_tokens):
+    """
+    Fold a turn that left the ring buffer into the running summary.
+
+    The default summarizer is extractive: it keeps the first sentence of
+    every dropped turn and cuts the oldest part of the summary once it
+    exceeds its own token budget.
+
+    Args:
+        summary (str): Current summary ("" if none)
+        turn (Turn): Turn that fell out of the ring buffer
+        max_tokens (int): Token budget of the summary
+
+    Returns:
+        str: Updated summary
+    """
+    first_sentence = turn.content.strip().split("\n")[0]
+    for separator in (". ", "? ", "! "):
+        first_sentence = first_sentence.split(separator)[0]
+    line = f"{turn.role}: {first_sentence[:200]}"
+    summary = f"{summary}\n{line}" if summary else line
+
+    max_chars = max_tokens * 4
+    if len(summary) > max_chars:
+        summary = summary[-max_chars:]
+        summary = summary[summary.find("\n") + 1:] if "\n" in summary else summary
+    return summary
+
+
+class Turn:
+    """
+    Single message of a conversation.
+
+    Attributes:
+        role (str): "user" or "assistant"
+        content (str): Message text
+        tokens (int): Estimated token count of the content
+    """
+
+    __slots__ = ("role", "content", "tokens")
+
+    def __init__(self, role, content):
+        self.role = role
+        self.content = content
+        self.tokens = estimate_tokens(content)
+
+
+class Conversation:
+    """
+    Recent turns and running summary of one sender's conversation.
+
+    Attributes:
+        turns (deque): Ring buffer with the last turns
+        summary (str): Summary of the turns that left the ring buffer
+        last_active (float): Monotonic time of the last recorded turn
+    """
+
+    __slots__ = ("turns", "summary", "last_active")
+
+    def __init__(self, max_turns):
+        self.turns = deque(maxlen=max_turns)
+        self.summary = ""
+        self.last_active = time.monotonic()
+
+
+class ConversationStore:
+    """
+    Thread-safe store of per-sender conversations.
+
+    Conversations are kept in an OrderedDict ordered by last activity, so
+    idle ones are evicted from the front in O(1).
+
+    Attributes:
+        max_turns (int): Turns kept per conversation
+        token_budget (int): Maximum estimated tokens of history sent with a prompt
+        summary_tokens (int): Token budget of the running summary
+        idle_ttl (float): Seconds after which an idle conversation is dropped
+        max_conversations (int): Maximum number of conversations kept in memory
+        summarizer (callable): Function (summary, turn, max_tokens) -> summary
+    """
+
+    def __init__(self, max_turns=10, token_budget=1000, summary_tokens=200,
+                 idle_ttl=3600, max_conversations=10000, summarizer=summarize_turn):
+        """
+        Initialize an empty conversation store.
+
+        Args:
+            max_turns (int): Turns kept per conversation
+            token_budget (int): Maximum estimated tokens of history sent with a prompt
+            summary_tokens (int): Token budget of the running summary
+            idle_ttl (float): Seconds after which an idle conversation is dropped
+            max_conversations (int): Maximum number of conversations kept in memory
+            summarizer (callable): Function (summary, turn, max_tokens) -> summary
+        """
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.idle_ttl = idle_ttl
+        self.max_conversations = max_conversations
+        self.summarizer = summarizer
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        """Drop idle conversations and the least active ones above the cap."""
+        while self._conversations:
+            sender, conversation = next(iter(self._conversations.items()))
+            idle = now - conversation.last_active > self.idle_ttl
+            if not idle and len(self._conversations) <= self.max_conversations:
+                break
+            del self._conversations[sender]
+
+    def has_history(self, sender):
+        """
+        Check whether a sender has an active conversation.
+
+        Args:
+            sender (str): Sender WhatsApp id
+
+        Returns:
+            bool: True if there are recorded turns or a summary for the sender
+        """
+        with self._lock:
+            conversation = self._conversations.get(sender)
+            if conversation is None:
+                return False
+            if time.monotonic() - conversation.last_active > self.idle_ttl:
+                del self._conversations[sender]
+                return False
+            return bool(conversation.turns or conversation.summary)
+
+    def build_messages(self, sender, prompt):
+        """
+        Build the chat messages for a new prompt, including trimmed history.
+
+        The newest turns are kept first; older turns that do not fit in the
+        token budget are left out and only represented by the summary.
+
+        Args:
+            sender (str): Sender WhatsApp id
+            prompt (str): Formatted prompt for the new message
+
+        Returns:
+            list[dict]: Chat messages for the OpenAI ChatCompletion API
+        """
+        with self._lock:
+            conversation = self._conversations.get(sender)
+            turns = list(conversation.turns) if conversation is not None else []
+            summary = conversation.summary if conversation is not None else ""
+
+        budget = self.token_budget
+        messages = []
+        if summary:
+            summary_message = f"Summary of the earlier conversation:\n{summary}"
+            budget -= estimate_tokens(summary_message)
+            messages.append({"role": "system", "content": summary_message})
+
+        history = []
+        for turn in reversed(turns):
+            if turn.tokens > budget:
+                break
+            budget -= turn.tokens
+            history.append({"role": turn.role, "content": turn.content})
+        messages.extend(reversed(history))
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def record_exchange(self, sender, message, reply):
+        """
+        Record a user message and the reply sent back.
+
+        Args:
+            sender (str): Sender WhatsApp id
+            message (str): Incoming message text
+            reply (str): Reply sent to the sender
+        """
+        with self._lock:
+            now = time.monotonic()
+            conversation = self._conversations.pop(sender, None)
+            if conversation is None:
+                conversation = Conversation(self.max_turns)
+            for turn in (Turn("user", message), Turn("assistant", reply)):
+                if len(conversation.turns) == conversation.turns.maxlen:
+                    conversation.summary = self.summarizer(
+                        conversation.summary, conversation.turns[0], self.summary_tokens
+                    )
+                conversation.turns.append(turn)
+            conversation.last_active = now
+            self._conversations[sender] = conversation
+            self._evict(now)
+
+    def forget(self, sender):
+        """
+        Drop a sender's conversation.
+
+        Args:
+            sender (str): Sender WhatsApp id
+        """
+        with self._lock:
+            self._conversations.pop(sender, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._conversations)
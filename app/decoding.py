@@ -0,0 +1,123 @@
+"""
+Webhook Decoding
+
+This module turns the raw body of a WhatsApp webhook POST into typed
+inbound messages. Most webhook traffic is status callbacks (sent,
+delivered, read) that need no work at all, so those are recognized from
+the raw bytes and answered without decoding the JSON.
+
+The decoder supports:
+- Early rejection of status-only updates with a byte scan, before any parsing
+- orjson for the remaining bodies when installed, the json module otherwise
+- Classification of messages into text, media, interactive and unsupported
+  kinds, without assuming any particular message shape
+- The same RetryableError as before for payloads with an unexpected structure
+
+Example:
+    messages = decode_webhook(request.get_data())
+    for message in messages:
+        if message.kind == "media":
+            ...
+"""
+
+import json
+import re
+
+from app.errors import RetryableError
+from app.messages import InboundMessage
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:  # pragma: no cover - depends on the environment
+    _loads = json.loads
+    JSON_BACKEND = "json"
+
+
+# Meta writes object keys verbatim, so a body without this key holds no messages;
+# the colon tells the key apart from the "field": "messages" value of every change
+_MESSAGES_KEY = re.compile(rb'"messages"\s*:')
+_STATUSES_KEY = b'"statuses"'
+
+
+def is_status_only(body):
+    """
+    Tell from the raw bytes whether a webhook body carries only status updates.
+
+    Args:
+        body (bytes): Raw request body
+
+    Returns:
+        bool: True if the body has status updates and no messages
+    """
+    return _STATUSES_KEY in body and _MESSAGES_KEY.search(body) is None
+
+
+def decode_webhook(body):
+    """
+    Decode a raw webhook body into typed messages.
+
+    Args:
+        body (bytes): Raw request body
+
+    Returns:
+        list[InboundMessage]: Messages in payload order, empty for status-only updates
+
+    Raises:
+        ValueError: If the body is not valid JSON
+        RetryableError: If the JSON structure is invalid or missing expected fields
+    """
+    if is_status_only(body):
+        return []
+    try:
+        payload = _loads(body)
+    except ValueError:
+        raise ValueError("Request body is not valid JSON")
+    return extract_messages(payload)
+
+
+def extract_messages(payload):
+    """
+    Extract typed messages from every entry and change of a decoded payload.
+
+    Args:
+        payload (dict): Decoded webhook payload
+
+    Returns:
+        list[InboundMessage]: Flat list of messages in payload order
+
+    Raises:
+        RetryableError: If the JSON structure is invalid or missing expected fields
+    """
+    try:
+        return [InboundMessage.from_payload(message, metadata) for message, metadata in iter_messages(payload)]
+    except (KeyError, TypeError, AttributeError) as error:
+        raise RetryableError(f"Error during json extraction: {error}")
+
+
+def iter_messages(payload):
+    """
+    Collect (message, metadata) pairs from all entries and changes of a payload.
+
+    Args:
+        payload (dict): Decoded webhook payload
+
+    Returns:
+        list[tuple]: Message objects with the metadata of their change
+
+    Raises:
+        RetryableError: If the JSON structure is invalid or missing expected fields
+    """
+    try:
+        pairs = []
+        for entry in payload["entry"]:
+            for change in entry["changes"]:
+                update_payload = change["value"]
+                metadata = update_payload.get("metadata")
+                for message in update_payload.get("messages", []):
+                    pairs.append((message, metadata))
+        return pairs
+    except (KeyError, IndexError, TypeError, AttributeError) as error:
+        raise RetryableError(f"Error during json extraction: {error}")
@@ -0,0 +1,86 @@
+"""
+Message Deduplication
+
+This module keeps track of the WhatsApp message ids that were already
+answered, so a redelivered webhook payload (for example after a 503 caused by
+a RetryableError on another message of the same batch) does not trigger a
+second OpenAI call and a second reply to the user.
+
+The deduplicator supports:
+- Atomic claim of a message id before it is processed
+- Releasing the claim when processing fails so the redelivery is handled
+- Any store from app.stores (in-memory LRU/TTL or shared SQLite)
+- Counters for claimed and skipped duplicate messages
+
+Example:
+    deduplicator = MessageDeduplicator(MemoryTTLStore(max_entries=100000), ttl=86400)
+    if deduplicator.claim(message["id"]):
+        ...  # process the message
+"""
+
+import threading
+
+
+class MessageDeduplicator:
+    """
+    Claims WhatsApp message ids so each message is processed only once.
+
+    Attributes:
+        store (MemoryTTLStore | SQLiteTTLStore): Backing store for claimed ids
+        ttl (float): Seconds a claimed id is remembered
+    """
+
+    def __init__(self, store, ttl=86400):
+        """
+        Initialize the deduplicator.
+
+        Args:
+            store (MemoryTTLStore | SQLiteTTLStore): Backing store for claimed ids
+            ttl (float): Seconds a claimed id is remembered
+        """
+        self.store = store
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._claimed = 0
+        self._duplicates = 0
+
+    def claim(self, message_id):
+        """
+        Claim a message id for processing.
+
+        Args:
+            message_id (str): WhatsApp message id ("wamid...")
+
+        Returns:
+            bool: True if the caller should process the message, False if it
+                  was already processed or is being processed elsewhere
+        """
+        if not message_id:
+            return True
+        claimed = self.store.add(message_id, "1", self.ttl)
+        with self._lock:
+            if claimed:
+                self._claimed += 1
+            else:
+                self._duplicates += 1
+        return claimed
+
+    def release(self, message_id):
+        """
+        Forget a claimed message id after processing failed.
+
+        Args:
+            message_id (str): WhatsApp message id ("wamid...")
+        """
+        if message_id:
+            self.store.delete(message_id)
+
+    def stats(self):
+        """
+        Return deduplication counters.
+
+        Returns:
+            dict: Number of claimed and skipped duplicate messages
+        """
+        with self._lock:
+            return {"claimed": self._claimed, "duplicates": self._duplicates}
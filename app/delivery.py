@@ -0,0 +1,265 @@
+"""
+Reply Delivery
+
+This module sends generated replies to WhatsApp. The Graph API refuses text
+messages longer than 4096 characters, so a long reply is split into parts
+at natural boundaries and the parts are sent in order.
+
+The delivery supports:
+- Splitting at paragraph, line, sentence or word boundaries (see
+  app.segmenter.split_reply), as few parts as the limit allows
+- Ordered, back-to-back sending on the client's kept-alive connection: a
+  part goes out as soon as the Graph API accepted the previous one, without
+  waiting for its delivery receipt (parts sent concurrently could arrive
+  in any order)
+- Per-part retries by the client's retry policy; when a part still fails,
+  the parts not sent yet are kept and a redelivery of the message sends
+  them instead of generating and sending the whole reply again
+- Committing all parts to the durable outbox at once, whose per-recipient
+  ordering sends and retries them one by one
+- Per-part and per-reply send timings, and counters of parts and of
+  split, interrupted and resumed replies
+
+Example:
+    delivery = ReplyDelivery(whatsapp_client, max_part_chars=4096)
+    if not delivery.resume("wamid.123"):
+        delivery.deliver("wamid.123", long_reply, "77010000000")
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from app.errors import RetryableError
+from app.segmenter import split_reply
+
+
+def part_key(key, index):
+    """
+    Return the outbox key of one part of a reply.
+
+    Args:
+        key (str): Key of the reply (the id of the answered message), or None
+        index (int): Position of the part
+
+    Returns:
+        str: The reply key for the first part, "key#pN" for the others (None stays None)
+    """
+    if key is None or index == 0:
+        return key
+    return f"{key}#p{index}"
+
+
+class ReplyDelivery:
+    """
+    Splits replies into WhatsApp-sized parts and sends them in order.
+
+    Attributes:
+        whatsapp_client (WhatsAppClient): Client used to send the parts
+        outbox (Outbox): Optional durable queue the parts are committed to instead of being sent
+        max_part_chars (int): Maximum length of a part
+        max_pending (int): Maximum number of interrupted replies whose remaining parts are kept
+    """
+
+    def __init__(self, whatsapp_client, outbox=None, max_part_chars=4096, max_pending=1000, record_stage=None):
+        """
+        Initialize the delivery.
+
+        Args:
+            whatsapp_client (WhatsAppClient): Client used to send the parts
+            outbox (Outbox, optional): Durable queue the parts are committed to instead of being sent
+            max_part_chars (int): Maximum length of a part
+            max_pending (int): Maximum number of interrupted replies whose remaining parts are kept
+            record_stage (callable, optional): Called as record_stage(stage, seconds) with the timings
+        """
+        self.whatsapp_client = whatsapp_client
+        self.outbox = outbox
+        self.max_part_chars = max_part_chars
+        self.max_pending = max_pending
+        self._record_stage = record_stage
+        self._lock = threading.Lock()
+        # reply key -> (recipient, parts not sent yet), oldest first
+        self._pending = OrderedDict()
+        self._counters = {"replies": 0, "parts": 0, "split_replies": 0, "interrupted": 0, "resumed": 0}
+
+    def split(self, text):
+        """
+        Split a reply into the parts sent as separate messages.
+
+        Args:
+            text (str): Reply text
+
+        Returns:
+            list[str]: Parts in sending order (a blank reply is sent as is)
+        """
+        parts = split_reply(text, self.max_part_chars) or [text]
+        with self._lock:
+            self._counters["replies"] += 1
+            self._counters["parts"] += len(parts)
+            self._counters["split_replies"] += len(parts) > 1
+        return parts
+
+    def deliver(self, key, text, recipient, resume_key=None, continued=False):
+        """
+        Send a reply, or commit it to the outbox, as one or more parts.
+
+        Args:
+            key (str): Id of the answered message, used to resume an interrupted reply (None = no resume)
+            text (str): Reply text
+            recipient (str): Recipient WhatsApp id
+            resume_key (str, optional): Key the parts not sent yet are kept under, defaults to key
+            continued (bool): Whether earlier messages of the same reply already reached the user
+                (streamed segments), so even a failed first part is kept for resume()
+
+        Raises:
+            RetryableError: If a part could not be sent; the parts not sent yet are kept for resume()
+        """
+        parts = self.split(text)
+        if self.outbox is not None:
+            started = time.perf_counter()
+            self.outbox.add_many([(part_key(key, index), recipient, part) for index, part in enumerate(parts)])
+            self._record("outbox_write", time.perf_counter() - started)
+            return
+        self._send_parts(key if resume_key is None else resume_key, recipient, parts, resumed=continued)
+
+    def resume(self, key):
+        """
+        Send the remaining parts of a reply interrupted by a failed part.
+
+        Args:
+            key (str): Id of the answered message
+
+        Returns:
+            bool: True if the reply was interrupted and its remaining parts were sent
+
+        Raises:
+            RetryableError: If a part fails again; the parts not sent yet are kept again
+        """
+        entry = self._take_pending(key)
+        if entry is None:
+            return False
+        recipient, parts = entry
+        self._send_parts(key, recipient, parts, resumed=True)
+        return True
+
+    def keep(self, key, recipient, parts):
+        """
+        Keep more parts of an interrupted reply, sent by resume() after the parts already kept.
+
+        Args:
+            key (str): Id of the answered message (None = nothing is kept)
+            recipient (str): Recipient WhatsApp id
+            parts (list[str]): Parts in sending order
+        """
+        if key is None or not parts:
+            return
+        with self._lock:
+            kept = self._pending.pop(key, (recipient, []))[1]
+            self._store(key, recipient, kept + list(parts))
+
+    def _send_parts(self, key, recipient, parts, resumed):
+        """Send parts in order, each once the previous one was accepted."""
+        started = time.perf_counter()
+        for index, part in enumerate(parts):
+            part_started = time.perf_counter()
+            try:
+                self.whatsapp_client.send_message(part, recipient)
+            except RetryableError:
+                self._interrupted(key, recipient, parts[index:], index > 0 or resumed)
+                raise
+            self._record("send_part", time.perf_counter() - part_started)
+        self._record("send", time.perf_counter() - started)
+
+    def _take_pending(self, key):
+        """Remove and return the (recipient, parts) of an interrupted reply, or None."""
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._pending.pop(key, None)
+            if entry is not None:
+                self._counters["resumed"] += 1
+        return entry
+
+    def _interrupted(self, key, recipient, remaining, partly_sent):
+        """Keep the remaining parts of a reply whose first parts reached the user."""
+        if key is None or not partly_sent:
+            # nothing was sent, a redelivery generates and sends the whole reply
+            return
+        with self._lock:
+            self._counters["interrupted"] += 1
+            self._store(key, recipient, remaining)
+
+    def _store(self, key, recipient, parts):
+        """Store the parts of an interrupted reply as the newest entry (called with the lock held)."""
+        self._pending[key] = (recipient, parts)
+        self._pending.move_to_end(key)
+        while len(self._pending) > self.max_pending:
+            self._pending.popitem(last=False)
+
+    def _record(self, stage, duration):
+        if self._record_stage is not None:
+            self._record_stage(stage, duration)
+
+    def stats(self):
+        """
+        Return delivery counters.
+
+        Returns:
+            dict: Replies, parts, split, interrupted and resumed replies, interrupted replies kept
+        """
+        with self._lock:
+            return {**self._counters, "pending": len(self._pending), "max_part_chars": self.max_part_chars}
+
+
+class AsyncReplyDelivery(ReplyDelivery):
+    """
+    Delivery for the async pipeline, sending with an AsyncWhatsAppClient.
+
+    The durable outbox is not supported by the async pipeline.
+    """
+
+    async def deliver(self, key, text, recipient, resume_key=None, continued=False):
+        """
+        Send a reply as one or more parts.
+
+        Args:
+            key (str): Id of the answered message, used to resume an interrupted reply (None = no resume)
+            text (str): Reply text
+            recipient (str): Recipient WhatsApp id
+            resume_key (str, optional): Key the parts not sent yet are kept under, defaults to key
+            continued (bool): Whether earlier messages of the same reply already reached the user
+
+        Raises:
+            RetryableError: If a part could not be sent; the parts not sent yet are kept for resume()
+        """
+        await self._send_parts(key if resume_key is None else resume_key, recipient, self.split(text),
+                               resumed=continued)
+
+    async def resume(self, key):
+        """
+        Send the remaining parts of a reply interrupted by a failed part.
+
+        Args:
+            key (str): Id of the answered message
+
+        Returns:
+            bool: True if the reply was interrupted and its remaining parts were sent
+        """
+        entry = self._take_pending(key)
+        if entry is None:
+            return False
+        recipient, parts = entry
+        await self._send_parts(key, recipient, parts, resumed=True)
+        return True
+
+    async def _send_parts(self, key, recipient, parts, resumed):
+        started = time.perf_counter()
+        for index, part in enumerate(parts):
+            part_started = time.perf_counter()
+            try:
+                await self.whatsapp_client.send_message(part, recipient)
+            except RetryableError:
+                self._interrupted(key, recipient, parts[index:], index > 0 or resumed)
+                raise
+            self._record("send_part", time.perf_counter() - part_started)
+        self._record("send", time.perf_counter() - started)
@@ -0,0 +1,356 @@
+"""
+Sender-Affinity Sharding
+
+This module provides the "sharded" processing mode: the webhook front end
+acknowledges each webhook and hands every sender's messages to one of N
+worker processes, chosen by consistent hashing of the sender id. All
+messages of a sender are processed by the same process, in order, so adding
+processes adds capacity without reordering replies the way independent
+gunicorn workers do.
+
+The dispatcher supports:
+- A consistent hash ring with virtual nodes, so changing the number of
+  processes moves only about 1/N of the senders
+- Worker processes that build their own Flask app with the regular
+  AIClient/WhatsAppClient pipeline and keep per-process state (conversation
+  memory, reply cache) warm for the senders they own
+- Per-sender lanes inside each process: a fixed set of threads, each sender
+  always handled by the same one, so senders run concurrently but in order
+- Bounded per-process queues that turn into a 503 when full
+- Claims of failed messages released in the front end, so redeliveries are
+  processed again
+- Restart of a worker process that died, on the next message routed to it
+- The same submit/stats/stop interface as the in-process WorkerPool
+- Ownership by the process that started it: a forked child (e.g. a
+  gunicorn worker of a preloading master) neither stops nor restarts the
+  parent's processes and starts its own set
+
+Run the front end as a single web process (e.g. gunicorn --workers 1
+--threads 8); the worker processes provide the parallelism.
+
+Example:
+    dispatcher = ShardedDispatcher(config, processor, processes=4, threads=8)
+    dispatcher.start()
+    dispatcher.submit(sender_messages)
+"""
+
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+import zlib
+
+from app.errors import RetryableError
+from app.lazy import after_fork
+
+
+logger = logging.getLogger(__name__)
+
+
+def _ring_hash(key):
+    """Stable 64-bit hash of a string, the same in every process and run."""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping keys to nodes.
+
+    Each node is placed on the ring at `virtual_nodes` points; a key belongs
+    to the first node point at or after its own hash.
+
+    Attributes:
+        nodes (list): Nodes on the ring
+        virtual_nodes (int): Points per node
+    """
+
+    def __init__(self, nodes, virtual_nodes=128):
+        """
+        Build the ring.
+
+        Args:
+            nodes (Iterable): Hashable nodes with a stable str() (e.g., shard indexes)
+            virtual_nodes (int): Points per node; more points spread the keys more evenly
+
+        Raises:
+            ValueError: If there are no nodes
+        """
+        self.nodes = list(nodes)
+        if not self.nodes:
+            raise ValueError("A hash ring needs at least one node")
+        self.virtual_nodes = virtual_nodes
+        points = sorted((_ring_hash(f"{node}#{point}"), node)
+                        for node in self.nodes for point in range(virtual_nodes))
+        self._hashes = [point_hash for point_hash, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key):
+        """
+        Return the node that owns a key.
+
+        Args:
+            key (str): Key to place, e.g. a sender id
+
+        Returns:
+            The owning node
+        """
+        index = bisect.bisect_left(self._hashes, _ring_hash(key))
+        return self._owners[index % len(self._owners)]
+
+
+def _shard_main(index, config, inbox, results, threads):
+    """
+    Worker process entry point: process the messages routed to this shard.
+
+    Args:
+        index (int): Shard index
+        config (dict): Application configuration of the front end
+        inbox (multiprocessing.Queue): (messages, enqueued_at) items, None to stop
+        results (multiprocessing.Queue): (shard, processed, failed messages, stage stats) reports
+        threads (int): Sender lanes in this process
+    """
+    # shutdown is driven by the front end; don't die half-way through a reply on Ctrl-C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from app import create_app, start_services
+
+    shard_config = type("ShardConfig", (), {**config, "MESSAGE_PROCESSING_MODE": "inline",
+                                            "COALESCE_WINDOW_SECONDS": "0"})
+    app = create_app(shard_config)
+    # no request reaches this process to start the services
+    start_services(app)
+    processor = app.message_processor
+    lanes = [queue.Queue() for _ in range(threads)]
+
+    def run_lane(lane):
+        while True:
+            item = lane.get()
+            if item is None:
+                return
+            messages, enqueued_at = item
+            processor.record_stage("queue_wait", max(0.0, time.time() - enqueued_at))
+            failed = []
+            with app.app_context():
+                # like process_sequence, but remembering where the sequence stopped
+                for position, message in enumerate(messages):
+                    try:
+                        processor.process(message)
+                    except RetryableError as error:
+                        app.logger.warning("Shard %d processing failed: %s", index, error)
+                    except Exception:
+                        app.logger.exception("Unhandled exception in shard %d:", index)
+                    else:
+                        continue
+                    failed = messages[position:]
+                    break
+            results.put((index, len(messages) - len(failed), failed, processor.stats()))
+
+    lane_threads = [threading.Thread(target=run_lane, args=(lane,), name=f"shard-{index}-lane-{number}", daemon=True)
+                    for number, lane in enumerate(lanes)]
+    for thread in lane_threads:
+        thread.start()
+    while True:
+        item = inbox.get()
+        if item is None:
+            break
+        messages, _ = item
+        lanes[zlib.crc32(messages[0].sender.encode()) % threads].put(item)
+    for lane in lanes:
+        lane.put(None)
+    for thread in lane_threads:
+        thread.join()
+
+
+class ShardedDispatcher:
+    """
+    Routes each sender's messages to a fixed worker process.
+
+    Attributes:
+        config (dict): Application configuration passed to the worker processes
+        processor (MessageProcessor): Front end processor whose claims are released on failure
+        processes (int): Number of worker processes
+        threads (int): Sender lanes per worker process
+        max_queue_size (int): Maximum queued items per worker process (0 = unbounded)
+        ring (HashRing): Sender to process mapping
+    """
+
+    def __init__(self, config, processor, processes=4, threads=8, max_queue_size=1000, virtual_nodes=128):
+        """
+        Initialize the dispatcher without starting the processes.
+
+        Args:
+            config (Mapping): Application configuration passed to the worker processes
+            processor (MessageProcessor): Front end processor whose claims are released on failure
+            processes (int): Number of worker processes
+            threads (int): Sender lanes per worker process
+            max_queue_size (int): Maximum queued items per worker process (0 = unbounded)
+            virtual_nodes (int): Points per process on the hash ring
+        """
+        self.config = {name: value for name, value in dict(config).items() if name.isupper()}
+        self.processor = processor
+        self.processes = processes
+        self.threads = threads
+        self.max_queue_size = max_queue_size
+        self.ring = HashRing(range(processes), virtual_nodes)
+        # spawned, not forked: the front end already runs threads (logging, metrics)
+        self._context = multiprocessing.get_context("spawn")
+        self._reset()
+        after_fork(self, ShardedDispatcher._reset)
+
+    def _reset(self):
+        """Start over without worker processes, e.g. in a child forked from the process that owns them."""
+        self._inboxes = [self._context.Queue(self.max_queue_size) for _ in range(self.processes)]
+        self._results = self._context.Queue()
+        self._workers = [None] * self.processes
+        self._collector = None
+        # pid of the process that started the worker processes, the only one that may stop or restart them
+        self._owner_pid = None
+        self._lock = threading.Lock()
+        self._shards = [{"processed": 0, "failed": 0, "restarts": 0, "stages": {}} for _ in range(self.processes)]
+
+    def start(self):
+        """Start the worker processes. Calling it on a running dispatcher does nothing."""
+        if multiprocessing.parent_process() is not None:
+            # the spawned workers re-import the main script; don't let that start another set
+            return
+        with self._lock:
+            if self._collector is not None:
+                return
+            self._owner_pid = os.getpid()
+            for index in range(self.processes):
+                self._spawn(index)
+            self._collector = threading.Thread(target=self._collect, name="shard-results", daemon=True)
+            self._collector.start()
+
+    def _spawn(self, index):
+        """Start the worker process of a shard (with the lock held)."""
+        worker = self._context.Process(target=_shard_main, name=f"whatsapp-shard-{index}", daemon=True,
+                                       args=(index, self.config, self._inboxes[index], self._results, self.threads))
+        worker.start()
+        self._workers[index] = worker
+
+    def stop(self, timeout=None):
+        """
+        Stop the worker processes after their queued messages are processed.
+
+        Args:
+            timeout (float, optional): Maximum seconds to wait for each process
+        """
+        with self._lock:
+            if self._owner_pid != os.getpid():
+                # not started, or started by the parent of this forked process
+                return
+            workers, self._workers = self._workers, [None] * self.processes
+            collector, self._collector = self._collector, None
+        for inbox, worker in zip(self._inboxes, workers):
+            if worker is not None and worker.is_alive():
+                inbox.put(None)
+        for worker in workers:
+            if worker is None:
+                continue
+            worker.join(timeout)
+            if worker.is_alive():
+                logger.warning("Shard process %s did not stop in time, terminating it", worker.name)
+                worker.terminate()
+        if collector is not None:
+            self._results.put(None)
+            collector.join(timeout)
+
+    def shard_for(self, sender):
+        """
+        Return the index of the worker process that owns a sender.
+
+        Args:
+            sender (str): Sender WhatsApp id
+
+        Returns:
+            int: Shard index
+        """
+        return self.ring.node_for(sender)
+
+    def submit(self, messages):
+        """
+        Queue one sender's messages on the worker process that owns the sender.
+
+        Args:
+            messages (list[InboundMessage]): One sender's messages in arrival order
+
+        Raises:
+            RetryableError: If that process's queue is full, so WhatsApp redelivers later
+        """
+        index = self.shard_for(messages[0].sender)
+        self._ensure_alive(index)
+        try:
+            self._inboxes[index].put_nowait((messages, time.time()))
+        except queue.Full:
+            raise RetryableError(f"Shard {index} queue is full")
+
+    def submit_detached(self, messages):
+        """
+        Queue messages from outside a webhook request (e.g., the coalescer).
+
+        A full queue is logged and the message claims are released instead of raising.
+
+        Args:
+            messages (list[InboundMessage]): One sender's messages in arrival order
+        """
+        try:
+            self.submit(messages)
+        except RetryableError as error:
+            logger.warning("Dropping %d message(s): %s", len(messages), error)
+            for message in messages:
+                self.processor.release(message)
+
+    def _ensure_alive(self, index):
+        """Restart the worker process of a shard if it died; its queued items are kept."""
+        with self._lock:
+            worker = self._workers[index]
+            if self._owner_pid != os.getpid() or worker is None or worker.is_alive():
+                return
+            logger.error("Shard process %s exited with code %s, restarting it", worker.name, worker.exitcode)
+            self._shards[index]["restarts"] += 1
+            self._spawn(index)
+
+    def _collect(self):
+        """Collector thread: record worker reports and release the claims of failed messages."""
+        while True:
+            report = self._results.get()
+            if report is None:
+                return
+            index, processed, failed, stages = report
+            for message in failed:
+                self.processor.release(message)
+            with self._lock:
+                shard = self._shards[index]
+                shard["processed"] += processed
+                shard["failed"] += len(failed)
+                shard["stages"] = stages
+
+    def stats(self):
+        """
+        Return per-process queue, liveness and message statistics.
+
+        Returns:
+            dict: Totals plus a list with each process's queue depth, counters and stage timings
+        """
+        with self._lock:
+            shards = []
+            for index, (worker, shard) in enumerate(zip(self._workers, self._shards)):
+                try:
+                    depth = self._inboxes[index].qsize()
+                except NotImplementedError:  # macOS
+                    depth = None
+                shards.append({"index": index, "alive": worker is not None and worker.is_alive(),
+                               "queue_depth": depth, **shard, "stages": dict(shard["stages"])})
+        return {
+            "processes": self.processes,
+            "threads_per_process": self.threads,
+            "max_queue_size": self.max_queue_size,
+            "processed": sum(shard["processed"] for shard in shards),
+            "failed": sum(shard["failed"] for shard in shards),
+            "shards": shards,
+        }
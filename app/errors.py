@@ -1,3 +1,13 @@
 class RetryableError(Exception):
     """Raise this to trigger a WhatsApp retry via 503 response"""
     pass
+
+
+class RateLimitError(RetryableError):
+    """Raised when an upstream API or our own rate limiter refuses a call"""
+    pass
+
+
+class CircuitOpenError(RetryableError):
+    """Raised without calling an upstream whose circuit breaker is open"""
+    pass
@@ -0,0 +1,371 @@
+"""
+FAQ Fast Path
+
+This module answers frequently asked questions ("what are your hours",
+"where are you", "how much is delivery") from a fixed FAQ file, without an
+OpenAI round-trip. Anything it is not confident about falls through to the
+model.
+
+The FAQ engine supports:
+- JSON FAQ files, and YAML files when PyYAML is installed
+- A word-level Aho-Corasick automaton over all patterns of all intents, so
+  a message is matched against every pattern in a single pass
+- Confidence as the share of the message's content words covered by one
+  intent's patterns; messages matching several intents are left to the model
+- Fuzzy matching for misspelled messages without an exact match: unknown
+  words are corrected to the closest pattern word with difflib (memoized)
+  and the corrected message goes through the automaton again
+- Hot reload: the file is checked for changes every few seconds and swapped
+  in atomically, a broken edit keeps the previous version
+- Hit/miss counters for the fast-path hit rate
+
+FAQ file format:
+    {
+      "stop_words": ["what", "are", "your"],
+      "intents": [
+        {"intent": "hours", "patterns": ["opening hours", "when are you open"],
+         "answer": "We are open every day from 9:00 to 18:00."}
+      ]
+    }
+
+    "stop_words" is optional and replaces the built-in list; a plain list of
+    intents is accepted as well.
+
+Example:
+    faq = FaqEngine("faq.json")
+    faq.answer("What are your opening hours?")  # "We are open every day from 9:00 to 18:00."
+    faq.answer("Can I pay by card?")  # None, ask the model
+"""
+
+import difflib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from app.reply_cache import normalize_message
+
+
+logger = logging.getLogger(__name__)
+
+# Words that carry no intent; they neither count towards nor against the coverage of a message
+STOP_WORDS = frozenset("""
+    a an the is are am be do does did can could would will i me my we our you your it its this that
+    there here what whats when where which who to of in on at for from with and or please pls hi hello
+    hey tell know want need like just u r
+    el la los las de del que es un una por favor
+    что как где когда у вас вы я мне пожалуйста скажите а и в на
+""".split())
+
+# Memoized spelling corrections per FAQ version; the memo starts over when full
+_MAX_CORRECTIONS = 10000
+
+
+@dataclass(frozen=True)
+class FaqMatch:
+    """
+    A confident FAQ answer.
+
+    Attributes:
+        intent (str): Intent name from the FAQ file
+        answer (str): Reply text
+        method (str): "exact", or "fuzzy" if misspelled words were corrected first
+        score (float): Covered share of content words
+    """
+
+    intent: str
+    answer: str
+    method: str
+    score: float
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over word sequences.
+
+    States are nodes of a trie of the patterns' words; failure links make a
+    search a single left-to-right pass over the message words, whatever the
+    number of patterns.
+    """
+
+    def __init__(self, patterns):
+        """
+        Build the automaton.
+
+        Args:
+            patterns (Iterable[tuple[str, ...]]): Word sequences, reported by their index
+        """
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for index, words in enumerate(patterns):
+            state = 0
+            for word in words:
+                next_state = self._goto[state].get(word)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][word] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            if words:
+                self._output[state].append((index, len(words)))
+
+        # breadth-first, so the failure target of a state is always complete before the state
+        frontier = list(self._goto[0].values())
+        while frontier:
+            next_frontier = []
+            for state in frontier:
+                for word, child in self._goto[state].items():
+                    fallback = self._fail[state]
+                    while fallback and word not in self._goto[fallback]:
+                        fallback = self._fail[fallback]
+                    target = self._goto[fallback].get(word, 0)
+                    self._fail[child] = target if target != child else 0
+                    self._output[child] = self._output[child] + self._output[self._fail[child]]
+                    next_frontier.append(child)
+            frontier = next_frontier
+
+    def search(self, words):
+        """
+        Find all pattern occurrences in a word sequence.
+
+        Args:
+            words (Sequence[str]): Message words
+
+        Returns:
+            list[tuple[int, int, int]]: (pattern index, first word, end word) of every occurrence
+        """
+        goto, fail, output = self._goto, self._fail, self._output
+        matches = []
+        state = 0
+        for position, word in enumerate(words):
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            for index, length in output[state]:
+                matches.append((index, position + 1 - length, position + 1))
+        return matches
+
+
+class _FaqIndex:
+    """Compiled form of one version of the FAQ file; only the correction memo changes."""
+
+    def __init__(self, intents, stop_words):
+        self.stop_words = stop_words
+        self.answers = {}
+        self.pattern_intents = []
+        patterns = []
+        for item in intents:
+            intent, answer = str(item["intent"]), str(item["answer"])
+            self.answers[intent] = answer
+            for pattern in item["patterns"]:
+                words = tuple(normalize_message(str(pattern)).split())
+                if words:
+                    patterns.append(words)
+                    self.pattern_intents.append(intent)
+        self.automaton = KeywordAutomaton(patterns)
+        # content words of the patterns by first letter, the candidates of spelling corrections
+        self.vocabulary = {}
+        for word in {word for words in patterns for word in words if word not in stop_words}:
+            self.vocabulary.setdefault(word[0], []).append(word)
+        self.corrections = {}
+
+
+def load_faq_file(path):
+    """
+    Read and compile a FAQ file.
+
+    Args:
+        path (str): JSON file, or YAML file (.yaml/.yml) when PyYAML is installed
+
+    Returns:
+        _FaqIndex: Compiled FAQ
+
+    Raises:
+        ValueError: If the file cannot be read or is malformed
+    """
+    try:
+        with open(path, encoding="utf-8") as faq_file:
+            if path.endswith((".yaml", ".yml")):
+                import yaml
+
+                data = yaml.safe_load(faq_file)
+            else:
+                data = json.load(faq_file)
+        if isinstance(data, list):
+            data = {"intents": data}
+        stop_words = STOP_WORDS
+        if data.get("stop_words") is not None:
+            stop_words = frozenset(normalize_message(" ".join(map(str, data["stop_words"]))).split())
+        return _FaqIndex(data["intents"], stop_words)
+    except ImportError:
+        raise ValueError(f"Reading the YAML FAQ file {path} requires PyYAML")
+    except Exception as error:
+        raise ValueError(f"Invalid FAQ file {path}: {error}")
+
+
+class FaqEngine:
+    """
+    Local intent matcher answering FAQs without the model.
+
+    Attributes:
+        path (str): FAQ file
+        min_coverage (float): Share of content words an intent must cover for an exact answer
+        fuzzy_cutoff (float): Minimum difflib ratio of a fuzzy answer (0 disables fuzzy matching)
+        reload_interval (float): Seconds between checks of the file for changes (0 = never)
+    """
+
+    def __init__(self, path, min_coverage=0.6, fuzzy_cutoff=0.85, reload_interval=5.0):
+        """
+        Load the FAQ file.
+
+        Args:
+            path (str): FAQ file
+            min_coverage (float): Share of content words an intent must cover for an exact answer
+            fuzzy_cutoff (float): Minimum difflib ratio of a fuzzy answer (0 disables fuzzy matching)
+            reload_interval (float): Seconds between checks of the file for changes (0 = never)
+
+        Raises:
+            ValueError: If the file cannot be read or is malformed
+        """
+        self.path = path
+        self.min_coverage = min_coverage
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._signature = self._file_signature()
+        self._index = load_faq_file(path)
+        self._next_check = time.monotonic() + reload_interval
+        self._counters = {"exact": 0, "fuzzy": 0, "misses": 0, "reloads": 0, "reload_errors": 0}
+
+    def answer(self, text):
+        """
+        Answer a message from the FAQ.
+
+        Args:
+            text (str): Message text
+
+        Returns:
+            str: FAQ answer, or None to ask the model
+        """
+        match = self.match(text)
+        return match.answer if match is not None else None
+
+    def match(self, text):
+        """
+        Find the confident FAQ match of a message.
+
+        Args:
+            text (str): Message text
+
+        Returns:
+            FaqMatch: Match, or None if no intent is confident enough
+        """
+        self._maybe_reload()
+        index = self._index
+        words = normalize_message(text).split()
+        match = self._match_exact(index, words) or self._match_fuzzy(index, words)
+        with self._lock:
+            self._counters[match.method if match is not None else "misses"] += 1
+        return match
+
+    def _match_exact(self, index, words, method="exact"):
+        """Match with the automaton; the single matching intent must cover enough content words."""
+        covered = {}
+        for pattern, start, end in index.automaton.search(words):
+            covered.setdefault(index.pattern_intents[pattern], set()).update(range(start, end))
+        if len(covered) != 1:
+            # nothing matched, or several intents did ("hours and address?"), the model does better
+            return None
+        intent, positions = covered.popitem()
+        content = [position for position, word in enumerate(words) if word not in index.stop_words]
+        if not content:
+            return None
+        score = sum(1 for position in content if position in positions) / len(content)
+        if score < self.min_coverage:
+            return None
+        return FaqMatch(intent, index.answers[intent], method, score)
+
+    def _match_fuzzy(self, index, words):
+        """Correct misspelled words to pattern words and match again."""
+        if not self.fuzzy_cutoff:
+            return None
+        corrected = [self._correct(index, word) for word in words]
+        if corrected == words:
+            return None
+        return self._match_exact(index, corrected, "fuzzy")
+
+    def _correct(self, index, word):
+        """Return the closest pattern word of an unknown word, or the word itself."""
+        if word in index.stop_words or len(word) < 4:
+            return word
+        correction = index.corrections.get(word)
+        if correction is None:
+            # misspellings rarely change the first letter, which keeps the candidate list short
+            close = difflib.get_close_matches(word, index.vocabulary.get(word[0], ()), 1, self.fuzzy_cutoff)
+            correction = close[0] if close else word
+            if len(index.corrections) >= _MAX_CORRECTIONS:
+                index.corrections.clear()
+            index.corrections[word] = correction
+        return correction
+
+    def _file_signature(self):
+        """Modification time and size of the FAQ file, None if it cannot be read."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _maybe_reload(self):
+        """Reload the FAQ file if the check interval elapsed and the file changed."""
+        if not self.reload_interval or time.monotonic() < self._next_check:
+            return
+        with self._lock:
+            if time.monotonic() < self._next_check:
+                return
+            self._next_check = time.monotonic() + self.reload_interval
+            signature = self._file_signature()
+            if signature is None or signature == self._signature:
+                return
+            self._signature = signature
+        self.reload()
+
+    def reload(self):
+        """
+        Load the FAQ file again; a broken file is logged and the previous version kept.
+
+        Returns:
+            bool: True if the new version was loaded
+        """
+        try:
+            index = load_faq_file(self.path)
+        except ValueError as error:
+            logger.error("Keeping the previous FAQ: %s", error)
+            with self._lock:
+                self._counters["reload_errors"] += 1
+            return False
+        with self._lock:
+            self._index = index
+            self._counters["reloads"] += 1
+        logger.info("Reloaded FAQ file %s (%d intents)", self.path, len(index.answers))
+        return True
+
+    def stats(self):
+        """
+        Return match counters and the fast-path hit rate.
+
+        Returns:
+            dict: Intents, exact/fuzzy hits, misses, hit rate and reload counters
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            intents = len(self._index.answers)
+        lookups = counters["exact"] + counters["fuzzy"] + counters["misses"]
+        hits = counters["exact"] + counters["fuzzy"]
+        return {"intents": intents, "lookups": lookups, "hits": hits,
+                "hit_rate": hits / lookups if lookups else 0.0, **counters}
@@ -0,0 +1,127 @@
+"""
+Lazy Start-up
+
+This module keeps the start-up of a worker process cheap and safe to fork.
+The application factory wraps the clients in proxies instead of building
+them, so a process pays for the OpenAI and HTTP libraries only once it
+handles a message, and a gunicorn master started with --preload never
+opens a connection or a database that its forked workers would share.
+
+The helpers support:
+- LazyClient: a proxy building its client on first use, and building a
+  new one in a forked child process
+- after_fork: callbacks run in the child process after a fork, e.g. to
+  start again the background threads that do not survive it
+
+Example:
+    client = LazyClient(lambda: AIClient(api_key, model, temperature))
+    client.generate_reply("Hello")  # the AIClient is built here
+"""
+
+import logging
+import os
+import threading
+import weakref
+
+
+logger = logging.getLogger(__name__)
+
+# Forks this process went through; a client built in an earlier generation was built by a parent
+_generation = 0
+# (weak reference to the owner, callback(owner)) run in the child after a fork
+_fork_callbacks = []
+# Every proxy, whose lock may have been held by another thread of the parent at the fork
+_proxies = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    """Start a new client generation and run the after-fork callbacks of live owners."""
+    global _generation
+    _generation += 1
+    for proxy in list(_proxies):
+        object.__setattr__(proxy, "_lock", threading.Lock())
+    _fork_callbacks[:] = [(owner_ref, callback) for owner_ref, callback in _fork_callbacks if owner_ref() is not None]
+    for owner_ref, callback in list(_fork_callbacks):
+        owner = owner_ref()
+        if owner is None:
+            continue
+        try:
+            callback(owner)
+        except Exception:
+            logger.exception("After-fork callback %r failed", callback)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def after_fork(owner, callback):
+    """
+    Run a callback in every child process forked from this one.
+
+    Only a weak reference to the owner is kept, so registering does not
+    keep e.g. an application alive; the callback is dropped with its owner.
+    Forks of subprocess and of multiprocessing's spawn start method do not
+    run the callbacks.
+
+    Args:
+        owner (object): Object passed to the callback
+        callback (callable): Function called as callback(owner) in the child
+    """
+    _fork_callbacks.append((weakref.ref(owner), callback))
+
+
+class LazyClient:
+    """
+    Proxy building a client on first use.
+
+    Attribute access is forwarded to the client, which the factory builds
+    on the first access under a lock. A child process forked after that
+    builds its own client, since the parent's copy would share connections,
+    database handles and locks with the parent.
+
+    Attributes:
+        factory (callable): Function returning a new client
+    """
+
+    def __init__(self, factory):
+        """
+        Initialize the proxy without building the client.
+
+        Args:
+            factory (callable): Function returning a new client
+        """
+        object.__setattr__(self, "factory", factory)
+        object.__setattr__(self, "_client", None)
+        object.__setattr__(self, "_generation", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+        _proxies.add(self)
+
+    @property
+    def built(self):
+        """bool: Whether this process already built the client."""
+        return self._generation == _generation
+
+    def get(self):
+        """
+        Return the client of this process, building it if needed.
+
+        Returns:
+            object: Client returned by the factory
+        """
+        if self._generation != _generation:
+            with self._lock:
+                if self._generation != _generation:
+                    object.__setattr__(self, "_client", self.factory())
+                    object.__setattr__(self, "_generation", _generation)
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.get(), name, value)
+
+    def __repr__(self):
+        state = repr(self._client) if self.built else "not built"
+        return f"<LazyClient {state}>"
@@ -0,0 +1,237 @@
+"""
+Non-blocking Logging
+
+This module configures the application logging so that a log call on the
+request path never waits for the disk. Records are put on a bounded queue
+by a QueueHandler and written by a QueueListener thread to the console and
+the log file.
+
+The logging setup supports:
+- A background writer thread; the calling thread only formats the message
+- A bounded queue that drops records (and counts them) instead of blocking
+  when the writer falls behind
+- Size-based or time-based rotation of the log file
+- Plain text or JSON lines output
+- Correlation fields (message id, sender) attached to every record logged
+  while a message is being processed, emitted by the JSON output
+- A new writer thread in every worker forked from a preloading master
+  (gunicorn --preload), since threads do not survive a fork
+
+Log calls should use lazy %-style arguments, logger.info("Sent %s", message_id),
+so messages filtered out by the level are never formatted.
+
+Example:
+    configure_logging(config)
+    with log_context(message_id=message.id, sender=message.sender):
+        logger.info("Generating reply")  # carries message_id and sender
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from app.lazy import after_fork
+
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+CORRELATION_FIELDS = ("message_id", "sender")
+
+_correlation = contextvars.ContextVar("log_correlation", default={})
+_queue_handler = None
+_listener = None
+_atexit_registered = False
+
+
+@contextmanager
+def log_context(**fields):
+    """
+    Attach correlation fields to the records logged inside the block.
+
+    The fields follow the context into threads started with a copied
+    context and into asyncio tasks.
+
+    Args:
+        **fields: Field values, e.g. message_id and sender
+    """
+    token = _correlation.set({**_correlation.get(), **fields})
+    try:
+        yield
+    finally:
+        _correlation.reset(token)
+
+
+class CorrelationFilter(logging.Filter):
+    """Copy the current correlation fields onto each record, in the thread that logs it."""
+
+    def filter(self, record):
+        for name, value in _correlation.get().items():
+            setattr(record, name, value)
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that never blocks the logging thread.
+
+    Uses an unbounded SimpleQueue (cheaper than queue.Queue) and enforces
+    max_size itself; the check is not atomic, so the queue may briefly
+    exceed max_size by a few records under contention.
+
+    Attributes:
+        max_size (int): Queued records above which new records are dropped
+        dropped (int): Records dropped because the queue was full
+    """
+
+    def __init__(self, max_size):
+        super().__init__(queue.SimpleQueue())
+        self.max_size = max_size
+        self.dropped = 0
+
+    def prepare(self, record):
+        """
+        Render the message and traceback in the calling thread.
+
+        Arguments and traceback objects may change or keep frames alive
+        after the call returns, so only their text is queued. Like the
+        standard QueueHandler before Python 3.12, the record is updated in
+        place rather than copied, which would double the cost of a call.
+        """
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+    def enqueue(self, record):
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+
+class JSONFormatter(logging.Formatter):
+    """Format records as single-line JSON objects with the correlation fields."""
+
+    def format(self, record):
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name in CORRELATION_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _file_handler(config):
+    """Build the log file handler for the configured rotation, or None without a log file."""
+    path = config["LOG_FILE"]
+    if not path:
+        return None
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    rotation = config["LOG_ROTATION"]
+    backups = int(config["LOG_BACKUP_COUNT"])
+    if rotation == "size":
+        return logging.handlers.RotatingFileHandler(path, maxBytes=int(config["LOG_MAX_BYTES"]),
+                                                    backupCount=backups, encoding="utf-8")
+    if rotation == "time":
+        return logging.handlers.TimedRotatingFileHandler(path, when=config["LOG_ROTATE_WHEN"], backupCount=backups,
+                                                         encoding="utf-8", utc=True)
+    if rotation == "none":
+        return logging.FileHandler(path, encoding="utf-8")
+    raise ValueError(f"Unknown LOG_ROTATION: {rotation}")
+
+
+def configure_logging(config, handlers=None):
+    """
+    Route the root logger through a queue to a background writer thread.
+
+    Calling it again replaces the previous setup, so each application
+    created in the same process (e.g. in tests) gets its own configuration.
+
+    Args:
+        config (Mapping): Application configuration
+        handlers (list, optional): Output handlers, defaults to the console and the log file
+
+    Returns:
+        NonBlockingQueueHandler: Handler installed on the root logger
+
+    Raises:
+        ValueError: If LOG_LEVEL, LOG_FORMAT or LOG_ROTATION is unknown
+    """
+    global _queue_handler, _listener, _atexit_registered
+    level = logging.getLevelName(config["LOG_LEVEL"].upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown LOG_LEVEL: {config['LOG_LEVEL']}")
+    if config["LOG_FORMAT"] not in ("text", "json"):
+        raise ValueError(f"Unknown LOG_FORMAT: {config['LOG_FORMAT']}")
+
+    if handlers is None:
+        handlers = [logging.StreamHandler(), _file_handler(config)]
+    formatter = JSONFormatter() if config["LOG_FORMAT"] == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [handler for handler in handlers if handler is not None]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    stop_logging()
+    _queue_handler = NonBlockingQueueHandler(int(config["LOG_QUEUE_SIZE"]))
+    _queue_handler.addFilter(CorrelationFilter())
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    after_fork(_queue_handler, _restart_after_fork)
+    root = logging.getLogger()
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    if not _atexit_registered:
+        atexit.register(stop_logging)
+        _atexit_registered = True
+    return _queue_handler
+
+
+def _restart_after_fork(queue_handler):
+    """Start a writer thread in a forked child, on an empty queue so the parent's records are not repeated."""
+    global _listener
+    if queue_handler is not _queue_handler:
+        return
+    queue_handler.queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(queue_handler.queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """Write out the queued records, stop the writer thread and close its handlers."""
+    global _queue_handler, _listener
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+    _queue_handler, _listener = None, None
+
+
+def logging_stats():
+    """
+    Return the state of the logging queue.
+
+    Returns:
+        dict: Queued and dropped records, or None if configure_logging was not called
+    """
+    if _queue_handler is None:
+        return None
+    return {"queued": _queue_handler.queue.qsize(), "dropped": _queue_handler.dropped}
@@ -0,0 +1,383 @@
+"""
+Media Messages
+
+This module lets the pipeline answer image, audio, video, document and
+sticker messages. The media is downloaded through the Graph API and handed
+to a processor that turns it into text for the model, e.g. a transcription
+of a voice note or a caption of a photo.
+
+The media handler supports:
+- Resolving a media id to its download URL with the Graph API
+- Streaming downloads in chunks into a spooled temporary file: small files
+  stay in memory, larger ones are written to disk, so the memory used by a
+  download does not grow with the file size
+- Memory-mapped access to files spooled to disk
+- A per-message size limit, checked against the announced size before the
+  download and against the received bytes while downloading
+- A bound on the number of concurrent downloads
+- SHA-256 verification against the hash announced by the Graph API
+- Pluggable processors loaded from "module:attribute"; the built-in one
+  describes the file (type, size, caption) without looking at its content
+- Download and processing counters
+
+Example:
+    handler = MediaHandler(MediaDownloader(whatsapp_client), DescribeMediaProcessor())
+    text = handler.to_text(message)  # "[image received: image/jpeg, 245 KB]", answered by the model
+"""
+
+import hashlib
+import importlib
+import logging
+import mmap
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from app.errors import RetryableError
+
+
+logger = logging.getLogger(__name__)
+
+
+class MediaRejectedError(Exception):
+    """Raised for media that is too large or cannot be downloaded; retrying would not help."""
+
+
+class MediaFile:
+    """
+    A downloaded media file.
+
+    Attributes:
+        media_id (str): Graph API media id
+        mime_type (str): MIME type announced by the Graph API or the webhook
+        size (int): Size in bytes
+        sha256 (str): Hex SHA-256 of the content
+        file (SpooledTemporaryFile): Content, in memory up to the spool size, on disk above it
+        on_disk (bool): Whether the content was spooled to disk
+    """
+
+    def __init__(self, media_id, mime_type, size, sha256, file, on_disk):
+        self.media_id = media_id
+        self.mime_type = mime_type
+        self.size = size
+        self.sha256 = sha256
+        self.file = file
+        self.on_disk = on_disk
+
+    def chunks(self, chunk_bytes=65536):
+        """
+        Read the content in chunks from the start.
+
+        Args:
+            chunk_bytes (int): Size of the chunks
+
+        Yields:
+            bytes: Consecutive chunks of the content
+        """
+        self.file.seek(0)
+        while True:
+            chunk = self.file.read(chunk_bytes)
+            if not chunk:
+                return
+            yield chunk
+
+    @contextmanager
+    def mapped(self):
+        """
+        Give random access to the whole content without reading it into memory.
+
+        Files spooled to disk are memory-mapped, so pages are loaded on
+        access and can be dropped again by the OS; files kept in memory are
+        small and returned as bytes.
+
+        Yields:
+            bytes-like: The content (an mmap or bytes object)
+        """
+        if not self.on_disk or not self.size:
+            self.file.seek(0)
+            yield self.file.read()
+            return
+        view = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield view
+        finally:
+            view.close()
+
+    def close(self):
+        """Delete the temporary file."""
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class MediaDownloader:
+    """
+    Downloads media through the Graph API with bounded memory and concurrency.
+
+    Attributes:
+        whatsapp_client (WhatsAppClient): Client whose authenticated session and timeouts are used
+        max_bytes (int): Largest accepted file (0 = unlimited)
+        max_concurrent (int): Maximum number of downloads at the same time
+        chunk_bytes (int): Size of the chunks read from the network
+        spool_bytes (int): Size up to which a file is kept in memory
+        acquire_timeout (float): Seconds to wait for a download slot before giving up
+    """
+
+    def __init__(self, whatsapp_client, max_bytes=16 * 1024 * 1024, max_concurrent=4, chunk_bytes=65536,
+                 spool_bytes=1024 * 1024, acquire_timeout=30.0):
+        """
+        Initialize the downloader.
+
+        Args:
+            whatsapp_client (WhatsAppClient): Client whose authenticated session and timeouts are used
+            max_bytes (int): Largest accepted file (0 = unlimited)
+            max_concurrent (int): Maximum number of downloads at the same time
+            chunk_bytes (int): Size of the chunks read from the network
+            spool_bytes (int): Size up to which a file is kept in memory
+            acquire_timeout (float): Seconds to wait for a download slot before giving up
+        """
+        self.whatsapp_client = whatsapp_client
+        self.max_bytes = max_bytes
+        self.max_concurrent = max_concurrent
+        self.chunk_bytes = chunk_bytes
+        self.spool_bytes = spool_bytes
+        self.acquire_timeout = acquire_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._counters = {"downloads": 0, "bytes": 0, "spooled_to_disk": 0, "too_large": 0, "failed": 0}
+
+    def download(self, media_id, mime_type=None):
+        """
+        Resolve a media id and download the file.
+
+        Args:
+            media_id (str): Graph API media id from the webhook
+            mime_type (str, optional): MIME type from the webhook, used if the Graph API has none
+
+        Returns:
+            MediaFile: Downloaded file, to be closed by the caller
+
+        Raises:
+            MediaRejectedError: If the file is too large, the media id is unknown or the content is corrupt
+            RetryableError: If no download slot frees up in time or the Graph API fails in a retryable way
+        """
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise RetryableError("Too many concurrent media downloads")
+        with self._lock:
+            self._in_flight += 1
+        try:
+            media = self._download(media_id, mime_type)
+        except (MediaRejectedError, RetryableError):
+            self._count("failed")
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+        with self._lock:
+            self._counters["downloads"] += 1
+            self._counters["bytes"] += media.size
+            self._counters["spooled_to_disk"] += media.on_disk
+        return media
+
+    def _download(self, media_id, mime_type):
+        """Resolve and stream one file into a spooled temporary file."""
+        from requests import RequestException
+
+        client = self.whatsapp_client
+        try:
+            response = client.session.get(f"{client.api_url}/{media_id}", timeout=client.timeout)
+            self._check_status(response, f"Resolving media {media_id}")
+            info = response.json()
+            announced = int(info.get("file_size") or 0)
+            if self.max_bytes and announced > self.max_bytes:
+                self._count("too_large")
+                raise MediaRejectedError(f"Media {media_id} has {announced} bytes, the limit is {self.max_bytes}")
+
+            spool = tempfile.SpooledTemporaryFile(max_size=self.spool_bytes, prefix="whatsapp-media-")
+            try:
+                size, digest = self._stream_to(spool, client, info["url"], media_id)
+            except BaseException:
+                spool.close()
+                raise
+        except RequestException as error:
+            raise RetryableError(f"Error downloading media {media_id}: {error}")
+        except (ValueError, KeyError, TypeError) as error:
+            raise MediaRejectedError(f"Invalid media info of {media_id}: {error}")
+
+        expected = info.get("sha256")
+        if expected and expected != digest:
+            spool.close()
+            raise MediaRejectedError(f"Media {media_id} does not match its SHA-256")
+        return MediaFile(media_id, info.get("mime_type") or mime_type, size, digest, spool, size > self.spool_bytes)
+
+    def _stream_to(self, spool, client, url, media_id):
+        """Copy the response body in chunks, hashing and counting; return (size, hex sha256)."""
+        digest = hashlib.sha256()
+        size = 0
+        with client.session.get(url, stream=True, timeout=client.timeout) as response:
+            self._check_status(response, f"Downloading media {media_id}")
+            for chunk in response.iter_content(self.chunk_bytes):
+                size += len(chunk)
+                if self.max_bytes and size > self.max_bytes:
+                    self._count("too_large")
+                    raise MediaRejectedError(f"Media {media_id} exceeds the limit of {self.max_bytes} bytes")
+                digest.update(chunk)
+                spool.write(chunk)
+        return size, digest.hexdigest()
+
+    @staticmethod
+    def _check_status(response, action):
+        """Raise RetryableError for 5xx and 429 answers, MediaRejectedError for other errors."""
+        if response.status_code >= 500 or response.status_code == 429:
+            raise RetryableError(f"{action} failed: {response.status_code}")
+        if not response.ok:
+            raise MediaRejectedError(f"{action} failed: {response.status_code}")
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def stats(self):
+        """
+        Return download counters.
+
+        Returns:
+            dict: Downloads, bytes, files spooled to disk, rejected and failed downloads, downloads in flight
+        """
+        with self._lock:
+            return {"in_flight": self._in_flight, "max_concurrent": self.max_concurrent, **self._counters}
+
+
+def format_size(size):
+    """Return a size in bytes as a short human readable string."""
+    for unit in ("bytes", "KB", "MB"):
+        if size < 1024 or unit == "MB":
+            return f"{size} {unit}" if unit == "bytes" else f"{size:.0f} {unit}"
+        size /= 1024
+
+
+class DescribeMediaProcessor:
+    """
+    Default processor: describes the file without looking at its content.
+
+    The model can still acknowledge the file and ask what the customer
+    needs. Replace it with a transcription or captioning processor to let
+    the model answer the content itself.
+    """
+
+    def process(self, media, message):
+        """
+        Describe a media file.
+
+        Args:
+            media (MediaFile): Downloaded file
+            message (InboundMessage): Media message
+
+        Returns:
+            str: Description of the file
+        """
+        return f"[{message.type} received: {media.mime_type or 'unknown type'}, {format_size(media.size)}]"
+
+
+def load_media_processor(path):
+    """
+    Load a custom media processor.
+
+    Args:
+        path (str): "module:attribute" of a class or factory called without
+                    arguments, returning an object with a process(media, message)
+                    method that returns text (or None to skip the message)
+
+    Returns:
+        object: Processor instance
+
+    Raises:
+        ValueError: If the path cannot be imported or the object has no process method
+    """
+    module_name, _, attribute = path.partition(":")
+    try:
+        processor = getattr(importlib.import_module(module_name), attribute)()
+    except (ImportError, AttributeError, ValueError, TypeError) as error:
+        raise ValueError(f"Invalid media processor {path}: {error}")
+    if not callable(getattr(processor, "process", None)):
+        raise ValueError(f"Media processor {path} has no process method")
+    return processor
+
+
+class MediaHandler:
+    """
+    Turns media messages into text for the model.
+
+    Attributes:
+        downloader (MediaDownloader): Downloader of the media files
+        processor: Object with a process(media, message) method returning text
+    """
+
+    def __init__(self, downloader, processor=None):
+        """
+        Initialize the handler.
+
+        Args:
+            downloader (MediaDownloader): Downloader of the media files
+            processor (optional): Object with a process(media, message) method, DescribeMediaProcessor by default
+        """
+        self.downloader = downloader
+        self.processor = processor if processor is not None else DescribeMediaProcessor()
+        self._lock = threading.Lock()
+        self._counters = {"processed": 0, "rejected": 0, "processor_errors": 0}
+
+    def to_text(self, message):
+        """
+        Download a media message and turn it into the text the model answers.
+
+        The caption, if any, comes first. Media that is rejected (too large,
+        expired) or that the processor fails on is described instead, so the
+        customer still gets an answer.
+
+        Args:
+            message (InboundMessage): Media message
+
+        Returns:
+            str: Text for the model, or None if the processor skips the message
+
+        Raises:
+            RetryableError: If the download fails in a retryable way
+        """
+        try:
+            with self.downloader.download(message.media_id, message.mime_type) as media:
+                try:
+                    text = self.processor.process(media, message)
+                except Exception:
+                    logger.exception("Media processor failed on %s", message.media_id)
+                    self._count("processor_errors")
+                    text = DescribeMediaProcessor().process(media, message)
+        except MediaRejectedError as error:
+            logger.warning("Media of message %s rejected: %s", message.id, error)
+            self._count("rejected")
+            text = f"[{message.type} received but it could not be opened: {error}]"
+        else:
+            self._count("processed")
+        if text is None:
+            return None
+        return f"{message.caption}\n{text}" if message.caption else text
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def stats(self):
+        """
+        Return processing and download counters.
+
+        Returns:
+            dict: Processed, rejected and failed messages plus the downloader's counters
+        """
+        with self._lock:
+            counters = dict(self._counters)
+        return {**counters, "downloads": self.downloader.stats()}
@@ -0,0 +1,168 @@
+"""
+Inbound Message Types
+
+This module defines the typed representation of messages extracted from
+WhatsApp webhook payloads. The rest of the pipeline works with these objects
+instead of digging through the nested webhook dictionaries.
+
+The module supports:
+- A flat, typed message record with the fields the pipeline needs
+- Classification into text, media, interactive and unsupported kinds; the
+  title of a tapped button or list row is used as the message text
+- Grouping messages by sender while keeping their original order
+- Merging a burst of text messages into a single message
+
+Example:
+    messages = whatsapp_client.extract_messages(payload)
+    for sender, sender_messages in group_by_sender(messages).items():
+        ...
+"""
+
+from dataclasses import dataclass, replace
+from typing import Optional
+
+
+MEDIA_TYPES = frozenset({"image", "audio", "video", "document", "sticker"})
+INTERACTIVE_TYPES = frozenset({"interactive", "button"})
+
+
+def _object(container, key):
+    """Return container[key] if it is a JSON object, else an empty dict."""
+    value = container.get(key)
+    return value if isinstance(value, dict) else {}
+
+
+@dataclass(frozen=True)
+class InboundMessage:
+    """
+    Single message received through a WhatsApp webhook.
+
+    Attributes:
+        id (str): WhatsApp message id ("wamid...")
+        sender (str): Sender WhatsApp id (the "from" field)
+        type (str): Message type (e.g., "text", "image", "audio")
+        timestamp (str): Unix timestamp sent by WhatsApp
+        text (str): Text body for text messages, the selected title for
+            interactive replies, None otherwise
+        phone_number_id (str): Business phone number id the message was sent to
+        media_id (str): Media id for media messages, None otherwise
+        mime_type (str): Media MIME type for media messages, None otherwise
+        caption (str): Media caption, if any
+        reply_id (str): Id or payload of the selected button or list row for interactive replies
+        merged_ids (tuple): Ids of earlier messages merged into this one
+    """
+
+    id: Optional[str]
+    sender: str
+    type: str
+    timestamp: Optional[str] = None
+    text: Optional[str] = None
+    phone_number_id: Optional[str] = None
+    media_id: Optional[str] = None
+    mime_type: Optional[str] = None
+    caption: Optional[str] = None
+    reply_id: Optional[str] = None
+    merged_ids: tuple = ()
+
+    @property
+    def all_ids(self):
+        """Ids of this message and every message merged into it."""
+        return self.merged_ids + (self.id,)
+
+    @property
+    def kind(self):
+        """Message kind: "text", "media", "interactive" or "unsupported"."""
+        if self.type == "text":
+            return "text"
+        if self.type in MEDIA_TYPES:
+            return "media"
+        if self.type in INTERACTIVE_TYPES:
+            return "interactive"
+        return "unsupported"
+
+    @classmethod
+    def from_payload(cls, message, metadata=None):
+        """
+        Build a message from a webhook message object.
+
+        Only the fields the pipeline uses are kept, so the decoded payload
+        can be freed. Missing or oddly shaped type objects leave the
+        corresponding fields empty instead of failing.
+
+        Args:
+            message (dict): Entry of the "messages" list in a webhook change value
+            metadata (dict, optional): The "metadata" object of the same change value
+
+        Returns:
+            InboundMessage: Typed message
+
+        Raises:
+            KeyError: If the message has no sender
+        """
+        message_type = message.get("type", "text" if "text" in message else "unknown")
+        fields = {}
+        if message_type == "text":
+            fields["text"] = _object(message, "text").get("body")
+        elif message_type in MEDIA_TYPES:
+            media = _object(message, message_type)
+            fields.update(media_id=media.get("id"), mime_type=media.get("mime_type"), caption=media.get("caption"))
+        elif message_type == "interactive":
+            interactive = _object(message, "interactive")
+            selected = _object(interactive, str(interactive.get("type")))
+            fields.update(text=selected.get("title"), reply_id=selected.get("id"))
+        elif message_type == "button":
+            button = _object(message, "button")
+            fields.update(text=button.get("text"), reply_id=button.get("payload"))
+        return cls(
+            id=message.get("id"),
+            sender=message["from"],
+            type=message_type,
+            timestamp=message.get("timestamp"),
+            phone_number_id=(metadata or {}).get("phone_number_id"),
+            **fields,
+        )
+
+
+def group_by_sender(messages):
+    """
+    Group messages by sender, keeping the arrival order inside each group.
+
+    Args:
+        messages (list[InboundMessage]): Messages in arrival order
+
+    Returns:
+        dict: Mapping of sender id to that sender's messages, in order of first appearance
+    """
+    groups = {}
+    for message in messages:
+        groups.setdefault(message.sender, []).append(message)
+    return groups
+
+
+def merge_text_messages(messages):
+    """
+    Merge consecutive text messages of one sender into single messages.
+
+    A burst like "hi" / "I have a question" / "about delivery" becomes one
+    message whose text joins the parts with newlines, so it needs a single
+    model request and a single reply. Non-text messages are kept as they are
+    and split the burst, so the original order is preserved.
+
+    Args:
+        messages (list[InboundMessage]): One sender's messages in arrival order
+
+    Returns:
+        list[InboundMessage]: Messages with consecutive text messages merged
+    """
+    merged = []
+    for message in messages:
+        previous = merged[-1] if merged else None
+        if previous is not None and previous.text is not None and message.text is not None:
+            merged[-1] = replace(
+                message,
+                text=f"{previous.text}\n{message.text}",
+                merged_ids=previous.all_ids + message.merged_ids,
+            )
+        else:
+            merged.append(message)
+    return merged
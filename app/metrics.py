@@ -0,0 +1,458 @@
+"""
+Prometheus Metrics
+
+This module collects the bot's metrics and renders them in the Prometheus
+text exposition format for the /metrics endpoint.
+
+The module supports:
+- Counters and histograms with labels
+- Per-thread aggregation: the hot path updates a dict owned by the calling
+  thread without taking a lock, and shards are merged only when scraped
+- Collectors that turn existing counters (retry policies, reply cache) into
+  metrics at scrape time, at no cost on the hot path
+- Multi-process servers (gunicorn workers): with a shared directory, every
+  process writes its snapshot there periodically and on exit, and a scrape
+  of any worker sums the snapshots of all of them
+
+Example:
+    metrics = BotMetrics()
+    metrics.observe_stage("send", 0.12)
+    metrics.count_message("text")
+    print(metrics.render())
+"""
+
+import atexit
+import glob
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+from bisect import bisect_left
+
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+
+
+class _ThreadShards:
+    """
+    Per-thread value dicts of one metric.
+
+    Each thread gets its own dict on first use. Shards of threads that have
+    exited are folded into a retired dict, so servers that start a thread per
+    request do not accumulate shards.
+    """
+
+    def __init__(self, merge):
+        """
+        Args:
+            merge (callable): merge(total, value) -> combined value of one series
+        """
+        self._merge = merge
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._live = {}
+        self._retired = {}
+
+    def values(self):
+        """Return the calling thread's dict (hot path, lock-free after the first call)."""
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._retire_dead_threads()
+                self._live[threading.current_thread()] = values
+            return values
+
+    def _retire_dead_threads(self):
+        """Fold the shards of exited threads into the retired dict (lock held)."""
+        for thread in [thread for thread in self._live if not thread.is_alive()]:
+            self._merge_into(self._retired, self._live.pop(thread))
+
+    def _merge_into(self, total, values):
+        for labels, value in list(values.items()):
+            total[labels] = self._merge(total[labels], value) if labels in total else self._merge(None, value)
+
+    def merged(self):
+        """Return all shards merged into one dict of label tuple -> value."""
+        with self._lock:
+            self._retire_dead_threads()
+            shards = list(self._live.values())
+            total = {labels: self._merge(None, value) for labels, value in self._retired.items()}
+        for values in shards:
+            # dict() copies under the GIL, the owning thread may keep writing meanwhile
+            self._merge_into(total, dict(values))
+        return total
+
+
+class Counter:
+    """
+    Monotonic counter with optional labels.
+
+    Attributes:
+        name (str): Metric name, ending in _total by convention
+        help (str): Description shown in the exposition format
+        labelnames (tuple): Label names, values are passed positionally to inc
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._shards = _ThreadShards(lambda total, value: value if total is None else total + value)
+
+    def inc(self, *labels, amount=1):
+        """Add amount to the series of the given label values."""
+        values = self._shards.values()
+        values[labels] = values.get(labels, 0) + amount
+
+    def samples(self):
+        """Return label tuple -> value of every series."""
+        return self._shards.merged()
+
+
+class Histogram:
+    """
+    Histogram with fixed upper bounds and optional labels.
+
+    A series is stored as non-cumulative bucket counts (the last one for
+    +Inf) followed by the sum of observed values.
+
+    Attributes:
+        name (str): Metric name
+        help (str): Description shown in the exposition format
+        labelnames (tuple): Label names, values are passed positionally to observe
+        buckets (tuple): Sorted bucket upper bounds, without +Inf
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._shards = _ThreadShards(
+            lambda total, value: list(value) if total is None else [a + b for a, b in zip(total, value)])
+
+    def observe(self, value, *labels):
+        """Record one observation in the series of the given label values."""
+        values = self._shards.values()
+        series = values.get(labels)
+        if series is None:
+            series = values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        """Return label tuple -> [bucket counts..., sum] of every series."""
+        return self._shards.merged()
+
+
+class CollectedCounter:
+    """
+    Counter whose values are read from a callable at scrape time.
+
+    Attributes:
+        name (str): Metric name
+        help (str): Description shown in the exposition format
+        labelnames (tuple): Label names
+        collect (callable): Returns label tuple -> current value
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames, collect):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def samples(self):
+        return dict(self.collect())
+
+
+class MetricsRegistry:
+    """
+    Set of metrics rendered together, optionally shared across processes.
+
+    Attributes:
+        multiprocess_dir (str): Directory of per-process snapshots, None for a single process
+        flush_interval (float): Seconds between snapshot writes in multi-process mode
+    """
+
+    def __init__(self, multiprocess_dir=None, flush_interval=5.0):
+        """
+        Initialize an empty registry.
+
+        Args:
+            multiprocess_dir (str, optional): Directory shared by all worker processes;
+                                              clear it when the server starts
+            flush_interval (float): Seconds between snapshot writes in multi-process mode
+        """
+        self.multiprocess_dir = multiprocess_dir or None
+        self.flush_interval = flush_interval
+        self._metrics = []
+        self._flusher = None
+        self._flusher_pid = None
+        self._lock = threading.Lock()
+
+    def counter(self, name, help, labelnames=()):
+        """Create and register a Counter."""
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        """Create and register a Histogram."""
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def collected_counter(self, name, help, labelnames, collect):
+        """Create and register a CollectedCounter."""
+        return self._register(CollectedCounter(name, help, labelnames, collect))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def snapshot(self):
+        """
+        Return the current values of all metrics in a JSON-serializable form.
+
+        Returns:
+            dict: Metric name -> kind, help, label names, buckets and [labels, value] samples
+        """
+        snapshot = {}
+        for metric in self._metrics:
+            try:
+                samples = metric.samples()
+            except Exception:
+                logger.exception("Collecting metric %s failed", metric.name)
+                continue
+            snapshot[metric.name] = {
+                "kind": metric.kind,
+                "help": metric.help,
+                "labelnames": list(metric.labelnames),
+                "buckets": list(getattr(metric, "buckets", ())),
+                "samples": [[list(labels), value] for labels, value in samples.items()],
+            }
+        return snapshot
+
+    def start(self):
+        """
+        Start writing this process's snapshot in multi-process mode.
+
+        Safe to call in every worker after a fork; a no-op without a
+        multi-process directory or when already running in this process.
+        """
+        if self.multiprocess_dir is None:
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            os.makedirs(self.multiprocess_dir, exist_ok=True)
+            self._flusher_pid = os.getpid()
+            self._flusher = threading.Thread(target=self._flush_periodically, name="metrics-flusher", daemon=True)
+            self._flusher.start()
+        atexit.register(self.write_snapshot)
+
+    def _flush_periodically(self):
+        event = threading.Event()
+        while not event.wait(self.flush_interval):
+            self.write_snapshot()
+
+    def _snapshot_path(self, pid=None):
+        return os.path.join(self.multiprocess_dir, f"metrics-{pid or os.getpid()}.json")
+
+    def write_snapshot(self):
+        """Atomically write this process's snapshot to the multi-process directory."""
+        if self.multiprocess_dir is None:
+            return
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.multiprocess_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as snapshot_file:
+                json.dump(self.snapshot(), snapshot_file)
+            os.replace(temp_path, self._snapshot_path())
+        except OSError as error:
+            logger.warning("Writing the metrics snapshot failed: %s", error)
+
+    def _combined_snapshot(self):
+        """This process's live snapshot plus the latest snapshots of the other processes."""
+        combined = self.snapshot()
+        if self.multiprocess_dir is None:
+            return combined
+        own_path = self._snapshot_path()
+        for path in glob.glob(os.path.join(self.multiprocess_dir, "metrics-*.json")):
+            if path == own_path:
+                continue
+            try:
+                with open(path) as snapshot_file:
+                    other = json.load(snapshot_file)
+            except (OSError, ValueError):
+                continue
+            _merge_snapshot(combined, other)
+        return combined
+
+    def render(self):
+        """
+        Render all metrics in the Prometheus text exposition format (version 0.0.4).
+
+        Returns:
+            str: Exposition text
+        """
+        lines = []
+        for name, metric in sorted(self._combined_snapshot().items()):
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['kind']}")
+            labelnames = metric["labelnames"]
+            for labels, value in sorted(metric["samples"], key=lambda sample: sample[0]):
+                pairs = list(zip(labelnames, labels))
+                if metric["kind"] != "histogram":
+                    lines.append(f"{name}{_format_labels(pairs)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric["buckets"] + [math.inf], value[:-1]):
+                    cumulative += count
+                    le = "+Inf" if bound == math.inf else _format_value(bound)
+                    lines.append(f"{name}_bucket{_format_labels(pairs + [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(pairs)} {_format_value(value[-1])}")
+                lines.append(f"{name}_count{_format_labels(pairs)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _merge_snapshot(total, other):
+    """Add the samples of another process's snapshot to total."""
+    for name, metric in other.items():
+        target = total.setdefault(name, dict(metric, samples=[]))
+        if target["kind"] != metric["kind"] or target["buckets"] != metric["buckets"]:
+            continue
+        series = {tuple(labels): value for labels, value in target["samples"]}
+        for labels, value in metric["samples"]:
+            labels = tuple(labels)
+            if labels not in series:
+                series[labels] = value
+            elif isinstance(value, list):
+                series[labels] = [a + b for a, b in zip(series[labels], value)]
+            else:
+                series[labels] += value
+        target["samples"] = [[list(labels), value] for labels, value in series.items()]
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class BotMetrics(MetricsRegistry):
+    """
+    The bot's metrics.
+
+    Stage names of the message pipeline are reported under the name of the
+    client method they time (generate -> generate_reply, send -> send_message).
+    """
+
+    STAGE_NAMES = {"generate": "generate_reply", "send": "send_message", "send_part": "send_message_part"}
+
+    def __init__(self, multiprocess_dir=None, flush_interval=5.0):
+        super().__init__(multiprocess_dir, flush_interval)
+        self.stage_seconds = self.histogram(
+            "whatsapp_bot_stage_duration_seconds",
+            "Duration of webhook processing stages (unpack_messages, queue_wait, generate_reply, send_message, "
+            "send_message_part, first_segment)",
+            ("stage",))
+        self.tokens = self.histogram(
+            "whatsapp_bot_generate_reply_tokens",
+            "Tokens per completion request, reported by OpenAI or estimated when streaming",
+            ("kind",), TOKEN_BUCKETS)
+        self.messages = self.counter("whatsapp_bot_messages_total", "Inbound messages by type", ("type",))
+        self.retryable_errors = self.counter(
+            "whatsapp_bot_retryable_errors_total", "Webhook requests answered with 503 after a RetryableError")
+        self._clients = []
+        self.collected_counter("whatsapp_bot_upstream_retries_total", "Retried upstream calls",
+                               ("upstream",), lambda: self._policy_counter("retries"))
+        self.collected_counter("whatsapp_bot_upstream_failures_total", "Upstream calls failed after all retries",
+                               ("upstream",), lambda: self._policy_counter("failed"))
+        self.collected_counter("whatsapp_bot_reply_cache_requests_total", "Reply cache lookups by result",
+                               ("result",), self._cache_counters)
+        self.tier_seconds = self.histogram(
+            "whatsapp_bot_model_tier_duration_seconds",
+            "Duration of completions (retries included) by model tier", ("tier",))
+        self.collected_counter("whatsapp_bot_model_routing_decisions_total", "Messages routed to each model tier",
+                               ("tier",), self._routing_counters)
+        self.collected_counter("whatsapp_bot_faq_requests_total", "FAQ fast path lookups by result",
+                               ("result",), self._faq_counters)
+
+    def track_clients(self, ai_client, whatsapp_client):
+        """
+        Report the retry, reply cache, routing and FAQ counters of the service clients.
+
+        Args:
+            ai_client: AI client, possibly with retry_policy, reply_cache, router and faq attributes
+            whatsapp_client: WhatsApp client, possibly with a retry_policy attribute
+        """
+        self._clients = [("openai", ai_client), ("whatsapp", whatsapp_client)]
+
+    def _policy_counter(self, counter):
+        samples = {}
+        for upstream, client in self._clients:
+            policy = getattr(client, "retry_policy", None)
+            if policy is not None:
+                samples[(upstream,)] = policy.stats()[counter]
+        return samples
+
+    def _cache_counters(self):
+        for upstream, client in self._clients:
+            reply_cache = getattr(client, "reply_cache", None)
+            if reply_cache is not None:
+                stats = reply_cache.stats()
+                return {("hit",): stats["hits"], ("miss",): stats["misses"]}
+        return {}
+
+    def _routing_counters(self):
+        for upstream, client in self._clients:
+            router = getattr(client, "router", None)
+            if router is not None:
+                return {(tier,): count for tier, count in router.stats()["decisions"].items()}
+        return {}
+
+    def _faq_counters(self):
+        for upstream, client in self._clients:
+            faq = getattr(client, "faq", None)
+            if faq is not None:
+                stats = faq.stats()
+                return {("exact",): stats["exact"], ("fuzzy",): stats["fuzzy"], ("miss",): stats["misses"]}
+        return {}
+
+    def observe_stage(self, stage, duration):
+        """Record the duration of a pipeline stage in seconds."""
+        self.stage_seconds.observe(duration, self.STAGE_NAMES.get(stage, stage))
+
+    def observe_tokens(self, prompt_tokens, completion_tokens):
+        """Record the prompt and completion tokens of one completion."""
+        self.tokens.observe(prompt_tokens, "prompt")
+        self.tokens.observe(completion_tokens, "completion")
+
+    def observe_tier(self, tier, duration):
+        """Record the duration of one completion of a model tier in seconds."""
+        self.tier_seconds.observe(duration, tier)
+
+    def count_message(self, message_type):
+        """Count one inbound message of the given type."""
+        self.messages.inc(message_type)
+
+    def count_retryable_error(self):
+        """Count one webhook request answered with 503."""
+        self.retryable_errors.inc()
@@ -0,0 +1,562 @@
+"""
+Durable Reply Outbox
+
+This module provides an optional durable queue between reply generation and
+delivery. Generated replies are committed to a local SQLite database before
+the webhook is acknowledged, and a sender pool delivers them to the Graph
+API. A reply that was paid for is therefore not lost when the process dies
+or the Graph API is briefly down, and a redelivered message whose reply is
+already queued is not sent to OpenAI again.
+
+The outbox supports:
+- SQLite in WAL mode with synchronous commits, shared by every process
+  pointing at the same file
+- Group commit: a writer thread commits all rows added while the previous
+  commit was running in one transaction, so concurrent writers share fsyncs
+- Per-recipient ordering: only the oldest pending reply of a recipient can
+  be sent, so replies arrive in the order they were generated
+- Leased claims, so replies held by a process that died are picked up again
+  (at-least-once delivery) when a sender pool starts or the lease expires
+- Retries with exponential backoff and full jitter, and a dead state for
+  replies that keep failing
+- A command line to inspect, requeue and purge the queue
+
+Example:
+    outbox = Outbox("state/outbox.sqlite3")
+    sender = OutboxSender(app, outbox, whatsapp_client, concurrency=4)
+    sender.start()
+    outbox.add("wamid.123", "70000000000", "Hello!")
+
+    python -m app.outbox stats
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from app.errors import RetryableError
+
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+SENT = "sent"
+DEAD = "dead"
+STATES = (PENDING, SENT, DEAD)
+
+
+def _process_alive(pid):
+    """Tell whether another process with this id is running on this host."""
+    if pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class _PendingWrite:
+    """Row waiting for the writer thread, with the outcome of its commit."""
+
+    __slots__ = ("row", "done", "error")
+
+    def __init__(self, row):
+        self.row = row
+        self.done = threading.Event()
+        self.error = None
+
+
+class Outbox:
+    """
+    Durable queue of outbound replies in a SQLite database.
+
+    Each thread gets its own connection. Rows are written by a single writer
+    thread (group commit); claims and results are written by the sender.
+
+    Attributes:
+        path (str): Path to the SQLite database file
+        max_batch (int): Maximum rows committed in one transaction
+        lease_seconds (float): Time a claimed reply is reserved for its sender
+        retention_seconds (float): How long sent replies are kept for inspection
+    """
+
+    # Sent rows past their retention are purged once every this many result writes
+    PURGE_EVERY = 100
+
+    def __init__(self, path, max_batch=256, lease_seconds=60.0, retention_seconds=86400.0):
+        """
+        Open the database and create its table if needed.
+
+        Args:
+            path (str): Path to the SQLite database file
+            max_batch (int): Maximum rows committed in one transaction
+            lease_seconds (float): Time a claimed reply is reserved for its sender
+            retention_seconds (float): How long sent replies are kept for inspection
+        """
+        self.path = path
+        self.max_batch = max_batch
+        self.lease_seconds = lease_seconds
+        self.retention_seconds = retention_seconds
+        self._local = threading.local()
+        self._writes = []
+        self._condition = threading.Condition()
+        self._writer = None
+        self._new_rows = threading.Event()
+        self._counters = {"added": 0, "commits": 0}
+        self._result_writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, message_id TEXT UNIQUE, recipient TEXT NOT NULL, "
+                "body TEXT NOT NULL, state TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+                "available_at REAL NOT NULL, lease_owner INTEGER, created_at REAL NOT NULL, "
+                "updated_at REAL NOT NULL, last_error TEXT)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS outbox_queue ON outbox (state, recipient, id)")
+
+    def _connection(self):
+        """Return this thread's connection, opening it on first use."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # autocommit mode, transactions are started explicitly
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=FULL")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        """Run a block in a write transaction, taking the write lock up front."""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def add(self, message_id, recipient, body):
+        """
+        Queue a reply and wait until it is committed.
+
+        The row is committed together with the rows other threads add at the
+        same time. A reply for a message id that is already queued is ignored.
+
+        Args:
+            message_id (str): Id of the message being answered (None = no deduplication)
+            recipient (str): Recipient WhatsApp id
+            body (str): Reply text
+
+        Raises:
+            RetryableError: If the commit failed, so WhatsApp redelivers the message
+        """
+        self.add_many([(message_id, recipient, body)])
+
+    def add_many(self, rows):
+        """
+        Queue several replies and wait until all of them are committed.
+
+        The rows are queued together, so they keep their order in the queue
+        (e.g. the parts of a long reply) and usually share one commit.
+
+        Args:
+            rows (list[tuple]): (message_id, recipient, body) of each reply, in sending order
+
+        Raises:
+            RetryableError: If a commit failed, so WhatsApp redelivers the message
+        """
+        writes = [_PendingWrite(row) for row in rows]
+        with self._condition:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="outbox-writer", daemon=True)
+                self._writer.start()
+            self._writes.extend(writes)
+            self._condition.notify()
+        for write in writes:
+            write.done.wait()
+            if write.error is not None:
+                raise RetryableError(f"Outbox write failed: {write.error}")
+
+    def _write_loop(self):
+        """Writer thread: commit everything queued since the previous commit in one transaction."""
+        while True:
+            with self._condition:
+                while not self._writes:
+                    self._condition.wait()
+                batch, self._writes = self._writes[:self.max_batch], self._writes[self.max_batch:]
+            now = time.time()
+            error = None
+            try:
+                with self._transaction() as connection:
+                    connection.executemany(
+                        "INSERT OR IGNORE INTO outbox (message_id, recipient, body, state, available_at, "
+                        "created_at, updated_at) VALUES (?, ?, ?, 'pending', ?, ?, ?)",
+                        [(*write.row, now, now, now) for write in batch],
+                    )
+                self._counters["commits"] += 1
+                self._counters["added"] += len(batch)
+                self._new_rows.set()
+            except sqlite3.Error as sqlite_error:
+                logger.error("Outbox commit of %d row(s) failed: %s", len(batch), sqlite_error)
+                error = sqlite_error
+            for write in batch:
+                write.error = error
+                write.done.set()
+
+    def contains(self, message_id):
+        """
+        Tell whether a reply to a message is queued or was sent.
+
+        Args:
+            message_id (str): Id of the answered message
+
+        Returns:
+            bool: True if the outbox has a row for the message
+        """
+        if message_id is None:
+            return False
+        row = self._connection().execute("SELECT 1 FROM outbox WHERE message_id = ?", (message_id,)).fetchone()
+        return row is not None
+
+    def wait_for_rows(self, timeout):
+        """
+        Wait until rows are committed by this process or the timeout passes.
+
+        Args:
+            timeout (float): Maximum seconds to wait
+
+        Returns:
+            bool: True if new rows were committed
+        """
+        committed = self._new_rows.wait(timeout)
+        self._new_rows.clear()
+        return committed
+
+    def claim(self, limit):
+        """
+        Lease the next due replies, at most one per recipient.
+
+        Only the oldest pending reply of each recipient is eligible, and a
+        leased or backing-off reply keeps the later ones of its recipient
+        waiting. The attempt counter is increased when a reply is claimed.
+
+        Args:
+            limit (int): Maximum number of replies
+
+        Returns:
+            list[tuple]: (id, message_id, recipient, body, attempts) rows
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT id, message_id, recipient, body, attempts + 1 FROM outbox "
+                "WHERE id IN (SELECT MIN(id) FROM outbox WHERE state = 'pending' GROUP BY recipient) "
+                "AND available_at <= ? ORDER BY id LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            connection.executemany(
+                "UPDATE outbox SET attempts = attempts + 1, available_at = ?, lease_owner = ?, updated_at = ? "
+                "WHERE id = ?",
+                [(now + self.lease_seconds, os.getpid(), now, row[0]) for row in rows],
+            )
+        return rows
+
+    def record_results(self, sent=(), retry=(), dead=()):
+        """
+        Write the outcome of a round of sends in one transaction.
+
+        Args:
+            sent (Iterable[int]): Ids of delivered replies
+            retry (Iterable[tuple]): (id, delay_seconds, error) of replies to try again
+            dead (Iterable[tuple]): (id, error) of replies that are given up
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            connection.executemany("UPDATE outbox SET state = 'sent', lease_owner = NULL, updated_at = ?, "
+                                   "last_error = NULL WHERE id = ?", [(now, row_id) for row_id in sent])
+            connection.executemany("UPDATE outbox SET available_at = ?, lease_owner = NULL, updated_at = ?, "
+                                   "last_error = ? WHERE id = ?",
+                                   [(now + delay, now, error, row_id) for row_id, delay, error in retry])
+            connection.executemany("UPDATE outbox SET state = 'dead', lease_owner = NULL, updated_at = ?, "
+                                   "last_error = ? WHERE id = ?", [(now, error, row_id) for row_id, error in dead])
+            self._result_writes += 1
+            if self._result_writes % self.PURGE_EVERY == 0:
+                connection.execute("DELETE FROM outbox WHERE state = 'sent' AND updated_at < ?",
+                                   (now - self.retention_seconds,))
+
+    def release_leases(self):
+        """
+        Make the replies leased by processes that no longer run due again, for startup recovery.
+
+        Leases of live processes sharing the file are left alone; a process
+        id reused by this process counts as dead.
+
+        Returns:
+            int: Number of pending replies
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            owners = [row[0] for row in connection.execute(
+                "SELECT DISTINCT lease_owner FROM outbox WHERE state = 'pending' AND lease_owner IS NOT NULL")]
+            connection.executemany("UPDATE outbox SET available_at = ?, lease_owner = NULL "
+                                   "WHERE state = 'pending' AND lease_owner = ?",
+                                   [(now, owner) for owner in owners if not _process_alive(owner)])
+            return connection.execute("SELECT COUNT(*) FROM outbox WHERE state = 'pending'").fetchone()[0]
+
+    def rows(self, state=None, limit=20):
+        """
+        Return queued replies, oldest first.
+
+        Args:
+            state (str, optional): Only rows in this state
+            limit (int): Maximum number of rows
+
+        Returns:
+            list[dict]: Rows as dicts
+        """
+        query = "SELECT * FROM outbox" + (" WHERE state = ?" if state else "") + " ORDER BY id LIMIT ?"
+        cursor = self._connection().execute(query, ((state,) if state else ()) + (limit,))
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def requeue_dead(self):
+        """
+        Move dead replies back to pending with a fresh attempt counter.
+
+        Returns:
+            int: Number of requeued replies
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            return connection.execute("UPDATE outbox SET state = 'pending', attempts = 0, available_at = ?, "
+                                      "lease_owner = NULL, updated_at = ? WHERE state = 'dead'", (now, now)).rowcount
+
+    def purge(self, state):
+        """
+        Delete replies in a state.
+
+        Args:
+            state (str): "pending", "sent", "dead" or "all"
+
+        Returns:
+            int: Number of deleted rows
+
+        Raises:
+            ValueError: If the state is unknown
+        """
+        if state not in STATES + ("all",):
+            raise ValueError(f"Unknown outbox state: {state}")
+        with self._transaction() as connection:
+            if state == "all":
+                return connection.execute("DELETE FROM outbox").rowcount
+            return connection.execute("DELETE FROM outbox WHERE state = ?", (state,)).rowcount
+
+    def stats(self):
+        """
+        Return queue depth and group commit counters.
+
+        Returns:
+            dict: Rows per state, age of the oldest pending reply, rows added and
+                  commits made by this process, and the mean rows per commit
+        """
+        connection = self._connection()
+        counts = dict(connection.execute("SELECT state, COUNT(*) FROM outbox GROUP BY state").fetchall())
+        oldest = connection.execute("SELECT MIN(created_at) FROM outbox WHERE state = 'pending'").fetchone()[0]
+        added, commits = self._counters["added"], self._counters["commits"]
+        return {
+            **{state: counts.get(state, 0) for state in STATES},
+            "oldest_pending_seconds": time.time() - oldest if oldest is not None else None,
+            "added": added,
+            "commits": commits,
+            "rows_per_commit": added / commits if commits else 0.0,
+        }
+
+
+class OutboxSender:
+    """
+    Pool of threads that deliver the replies queued in an outbox.
+
+    A dispatcher thread claims up to `concurrency` due replies, sends them in
+    parallel over the WhatsApp client's pooled connections and records all
+    outcomes in one transaction.
+
+    Attributes:
+        app (Flask): Application whose context is pushed while sending
+        outbox (Outbox): Queue of replies
+        whatsapp_client (WhatsAppClient): Client used to deliver replies
+        concurrency (int): Replies sent in parallel
+        max_attempts (int): Attempts before a reply is marked dead
+        base_delay (float): Backoff after the first failed attempt in seconds
+        max_delay (float): Upper bound of a single backoff in seconds
+        poll_interval (float): Seconds between checks for due retries and rows of other processes
+    """
+
+    def __init__(self, app, outbox, whatsapp_client, concurrency=4, max_attempts=10, base_delay=1.0,
+                 max_delay=300.0, poll_interval=1.0):
+        """
+        Initialize the sender without starting it.
+
+        Args:
+            app (Flask): Application whose context is pushed while sending
+            outbox (Outbox): Queue of replies
+            whatsapp_client (WhatsAppClient): Client used to deliver replies
+            concurrency (int): Replies sent in parallel
+            max_attempts (int): Attempts before a reply is marked dead
+            base_delay (float): Backoff after the first failed attempt in seconds
+            max_delay (float): Upper bound of a single backoff in seconds
+            poll_interval (float): Seconds between checks for due retries and rows of other processes
+        """
+        self.app = app
+        self.outbox = outbox
+        self.whatsapp_client = whatsapp_client
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+        self._counters = {"sent": 0, "retried": 0, "dead": 0}
+
+    def start(self):
+        """Recover leased replies and start delivering. Calling it on a running sender does nothing."""
+        if self._thread is not None:
+            return
+        pending = self.outbox.release_leases()
+        if pending:
+            logger.info("Outbox recovered %d pending reply(ies)", pending)
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop after the current round of sends; unsent replies stay queued.
+
+        Args:
+            timeout (float, optional): Maximum seconds to wait for the round
+        """
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stopping.set()
+        thread.join(timeout)
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _get_executor(self):
+        """Create the sender thread pool on first use."""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="outbox-sender")
+            return self._executor
+
+    def _run(self):
+        """Dispatcher loop: claim, send and record until stopped."""
+        while not self._stopping.is_set():
+            try:
+                delivered = self.deliver_due()
+            except sqlite3.Error as error:
+                logger.error("Outbox delivery round failed: %s", error)
+                delivered = 0
+            if not delivered:
+                self.outbox.wait_for_rows(self.poll_interval)
+
+    def deliver_due(self):
+        """
+        Run one round: send up to `concurrency` due replies and record the outcomes.
+
+        Returns:
+            int: Number of claimed replies
+        """
+        rows = self.outbox.claim(self.concurrency)
+        if not rows:
+            return 0
+        outcomes = list(self._get_executor().map(self._send, rows))
+        sent, retry, dead = [], [], []
+        for (row_id, message_id, _, _, attempts), error in zip(rows, outcomes):
+            if error is None:
+                sent.append(row_id)
+            elif isinstance(error, RetryableError) and attempts < self.max_attempts:
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempts - 1)))
+                retry.append((row_id, delay, str(error)))
+            else:
+                logger.error("Giving up on reply to %s after %d attempt(s): %s", message_id, attempts, error)
+                dead.append((row_id, str(error)))
+        self.outbox.record_results(sent, retry, dead)
+        self._counters["sent"] += len(sent)
+        self._counters["retried"] += len(retry)
+        self._counters["dead"] += len(dead)
+        return len(rows)
+
+    def _send(self, row):
+        """Send one reply, returning the raised exception instead of raising it."""
+        _, message_id, recipient, body, _ = row
+        try:
+            with self.app.app_context():
+                self.whatsapp_client.send_message(body, recipient)
+        except Exception as error:
+            if not isinstance(error, RetryableError):
+                logger.exception("Unhandled exception sending reply to %s:", message_id)
+            return error
+        return None
+
+    def stats(self):
+        """
+        Return the outbox state and this process's delivery counters.
+
+        Returns:
+            dict: Outbox stats plus sent, retried and dead counters
+        """
+        return {**self.outbox.stats(), "delivery": dict(self._counters)}
+
+
+def main(argv=None):
+    """Inspect, requeue or purge an outbox database."""
+    from app.config import Config
+
+    parser = argparse.ArgumentParser(description="Inspect or purge the reply outbox.")
+    parser.add_argument("--path", default=Config.OUTBOX_SQLITE_PATH, help="outbox database file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="print rows per state and the age of the oldest pending reply")
+    show = commands.add_parser("list", help="print queued replies, oldest first")
+    show.add_argument("--state", choices=STATES, help="only rows in this state")
+    show.add_argument("--limit", type=int, default=20)
+    commands.add_parser("requeue", help="move dead replies back to pending")
+    purge = commands.add_parser("purge", help="delete replies")
+    purge.add_argument("state", choices=STATES + ("all",))
+    args = parser.parse_args(argv)
+
+    outbox = Outbox(args.path)
+    if args.command == "stats":
+        print(json.dumps(outbox.stats(), indent=2))
+    elif args.command == "list":
+        for row in outbox.rows(args.state, args.limit):
+            print(json.dumps(row, ensure_ascii=False))
+    elif args.command == "requeue":
+        print(f"requeued {outbox.requeue_dead()} reply(ies)")
+    else:
+        print(f"deleted {outbox.purge(args.state)} reply(ies)")
+
+
+if __name__ == "__main__":
+    main()
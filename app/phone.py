@@ -0,0 +1,176 @@
+"""
+Phone Number Normalization
+
+This module turns the sender ids of incoming webhooks (and any other phone
+number the bot is asked to message) into the number format the Graph API
+expects.
+
+The normalizer supports:
+- E.164 normalization with the phonenumbers library, trying the number as
+  international first and then each configured default region
+- Country-specific rewrite rules as data: built-in named rules and rules
+  loaded from a JSON file
+- A bounded LRU cache, since the same senders write again and again
+- Lazy loading of phonenumbers and its metadata on the first lookup
+
+Numbers that phonenumbers does not consider valid are passed through as
+digits; WhatsApp ids are authoritative, and test numbers are often invalid.
+
+Example:
+    normalizer = PhoneNormalizer(default_regions=("KZ",), rules=[BUILTIN_RULES["kz_trunk_prefix"]])
+    normalizer.normalize("77012345678")  # "787012345678"
+    normalizer.normalize("8 701 234 56 78")  # "787012345678"
+"""
+
+import json
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+
+_NON_DIGITS = re.compile(r"\D")
+
+
+@dataclass(frozen=True)
+class RewriteRule:
+    """
+    Country-specific rewrite of a normalized number.
+
+    Attributes:
+        name (str): Rule name used in configuration
+        region (str): ISO 3166 region the number must belong to (e.g., "KZ")
+        pattern (str): Regular expression matched against the E.164 digits without "+"
+        replacement (str): Replacement template (re.sub syntax)
+    """
+
+    name: str
+    region: str
+    pattern: str
+    replacement: str
+
+    def apply(self, region, digits):
+        """Return the rewritten digits, or the digits unchanged if the rule does not match."""
+        if region != self.region:
+            return digits
+        return re.sub(self.pattern, self.replacement, digits, count=1)
+
+
+BUILTIN_RULES = {
+    # Kazakhstan numbers are delivered with the "8" trunk prefix after the country code
+    "kz_trunk_prefix": RewriteRule("kz_trunk_prefix", "KZ", r"^7(\d{10})$", r"78\1"),
+}
+
+
+def load_rules(names, path=None):
+    """
+    Resolve the configured rewrite rules.
+
+    Args:
+        names (str): Comma-separated names of built-in or file rules, in the order they apply
+        path (str, optional): JSON file with a list of {"name", "region", "pattern", "replacement"} objects
+
+    Returns:
+        list[RewriteRule]: Rules in application order
+
+    Raises:
+        ValueError: If a name is unknown or the rules file is malformed
+    """
+    available = dict(BUILTIN_RULES)
+    if path:
+        try:
+            with open(path) as rules_file:
+                for item in json.load(rules_file):
+                    rule = RewriteRule(item["name"], item["region"], item["pattern"], item["replacement"])
+                    available[rule.name] = rule
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            raise ValueError(f"Invalid phone rewrite rules file {path}: {error}")
+    rules = []
+    for name in (name.strip() for name in names.split(",")):
+        if not name:
+            continue
+        if name not in available:
+            raise ValueError(f"Unknown phone rewrite rule: {name}")
+        rules.append(available[name])
+    return rules
+
+
+class PhoneNormalizer:
+    """
+    Memoized phone number normalizer.
+
+    Attributes:
+        default_regions (tuple): Regions tried, in order, for numbers without a valid country code
+        rules (list[RewriteRule]): Rewrite rules applied after normalization
+    """
+
+    def __init__(self, default_regions=(), rules=(), cache_size=10000):
+        """
+        Initialize the normalizer; phonenumbers is imported on the first lookup.
+
+        Args:
+            default_regions (Iterable[str]): ISO regions for numbers without a valid country code
+            rules (Iterable[RewriteRule]): Rewrite rules applied in order
+            cache_size (int): Maximum number of memoized numbers
+        """
+        self.default_regions = tuple(region.strip().upper() for region in default_regions if region.strip())
+        self.rules = list(rules)
+        self._phonenumbers = None
+        self._cached = lru_cache(maxsize=cache_size)(self._normalize)
+
+    def normalize(self, raw_number):
+        """
+        Normalize a phone number for the Graph API.
+
+        Args:
+            raw_number (str): WhatsApp id or phone number, with or without "+" and separators
+
+        Returns:
+            str: E.164 digits without "+", after the rewrite rules
+
+        Raises:
+            ValueError: If the number contains no digits
+        """
+        return self._cached(raw_number)
+
+    def _normalize(self, raw_number):
+        digits = _NON_DIGITS.sub("", raw_number or "")
+        if not digits:
+            raise ValueError(f"Invalid phone number: {raw_number!r}")
+        number = self._parse(digits, international=raw_number.lstrip().startswith("+"))
+        if number is None:
+            return digits
+        phonenumbers = self._phonenumbers
+        normalized = phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164)[1:]
+        region = phonenumbers.region_code_for_number(number)
+        for rule in self.rules:
+            normalized = rule.apply(region, normalized)
+        return normalized
+
+    def _parse(self, digits, international):
+        """Return the first valid parse of the number, or None."""
+        if self._phonenumbers is None:
+            import phonenumbers
+
+            self._phonenumbers = phonenumbers
+        phonenumbers = self._phonenumbers
+        candidates = [("+" + digits, None)]
+        if not international:
+            candidates += [(digits, region) for region in self.default_regions]
+        for text, region in candidates:
+            try:
+                number = phonenumbers.parse(text, region)
+            except phonenumbers.NumberParseException:
+                continue
+            if phonenumbers.is_valid_number(number):
+                return number
+        return None
+
+    def stats(self):
+        """
+        Return cache counters.
+
+        Returns:
+            dict: Hits, misses and cached numbers
+        """
+        info = self._cached.cache_info()
+        return {"hits": info.hits, "misses": info.misses, "entries": info.currsize}
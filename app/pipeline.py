@@ -0,0 +1,500 @@
+"""
+Message Processing Pipeline
+
+This module contains the reply pipeline shared by the webhook route and the
+background worker pool. A single incoming WhatsApp message goes through two
+stages: reply generation with the AI client and delivery with the WhatsApp
+client.
+
+The pipeline supports:
+- Running the generate/send stages for a single message
+- Concurrent fan-out across senders with in-order processing per sender
+- Streaming mode that delivers reply segments while generation continues
+- An asyncio variant for the ASGI serving mode
+- Skipping messages that were already processed (optional deduplicator)
+- Per-stage timing statistics (count, total and max duration)
+- message_id and sender correlation fields on the records logged per message
+- Optional per-stage latency histograms in a metrics registry
+- Optional durable outbox: replies are committed locally and delivered by
+  the outbox sender instead of being sent inline
+
+Example:
+    processor = MessageProcessor(whatsapp_client, ai_client)
+    processor.process_batch(messages)
+    processor.stats()  # {"generate": {...}, "send": {...}}
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from app.delivery import AsyncReplyDelivery, ReplyDelivery
+from app.errors import RetryableError
+from app.logging_setup import log_context
+from app.messages import group_by_sender
+from app.segmenter import split_reply
+
+
+logger = logging.getLogger(__name__)
+
+
+class StageStats:
+    """
+    Thread-safe timing aggregate for named pipeline stages.
+
+    Each stage keeps a count, the total and the maximum duration in seconds,
+    which is enough to derive the average without storing every sample.
+    """
+
+    def __init__(self):
+        """Initialize an empty stats aggregate."""
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def record(self, stage, duration):
+        """
+        Record a single stage duration.
+
+        Args:
+            stage (str): Stage name (e.g., "generate", "send")
+            duration (float): Duration of the stage in seconds
+        """
+        with self._lock:
+            count, total, maximum = self._stages.get(stage, (0, 0.0, 0.0))
+            self._stages[stage] = (count + 1, total + duration, max(maximum, duration))
+
+    def snapshot(self):
+        """
+        Return a copy of the aggregated timings.
+
+        Returns:
+            dict: Mapping of stage name to count, total, average and max seconds
+        """
+        with self._lock:
+            stages = dict(self._stages)
+        return {
+            stage: {
+                "count": count,
+                "total_seconds": total,
+                "avg_seconds": total / count if count else 0.0,
+                "max_seconds": maximum,
+            }
+            for stage, (count, total, maximum) in stages.items()
+        }
+
+
+class MessageProcessor:
+    """
+    Generates and delivers the replies to incoming WhatsApp messages.
+
+    Attributes:
+        whatsapp_client (WhatsAppClient): Client used to deliver replies
+        ai_client (AIClient): Client used to generate replies
+        deduplicator (MessageDeduplicator): Optional guard against redelivered messages
+        max_concurrency (int): Maximum number of senders processed in parallel
+        timings (StageStats): Per-stage timing statistics
+        metrics (BotMetrics): Optional registry of stage latency histograms
+        outbox (Outbox): Optional durable queue that replies are written to instead of being sent
+        media (MediaHandler): Optional handler turning media messages into text for the model
+        delivery (ReplyDelivery): Splits replies into WhatsApp-sized parts and sends them in order
+    """
+
+    delivery_class = ReplyDelivery
+
+    def __init__(self, whatsapp_client, ai_client, deduplicator=None, max_concurrency=8, metrics=None, outbox=None,
+                 media=None, max_part_chars=4096):
+        """
+        Initialize the processor with its service clients.
+
+        Args:
+            whatsapp_client (WhatsAppClient): Client used to deliver replies
+            ai_client (AIClient): Client used to generate replies
+            deduplicator (MessageDeduplicator, optional): Guard against redelivered messages
+            max_concurrency (int): Maximum number of senders processed in parallel
+            metrics (BotMetrics, optional): Registry of stage latency histograms
+            outbox (Outbox, optional): Durable queue that replies are written to instead of being sent
+            media (MediaHandler, optional): Handler turning media messages into text; media is skipped without it
+            max_part_chars (int): Maximum length of one WhatsApp message, longer replies are split
+        """
+        self.delivery = self.delivery_class(whatsapp_client, outbox, max_part_chars, record_stage=self.record_stage)
+        self.ai_client = ai_client
+        self.deduplicator = deduplicator
+        self.max_concurrency = max_concurrency
+        self.timings = StageStats()
+        self.metrics = metrics
+        self.outbox = outbox
+        self.media = media
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def whatsapp_client(self):
+        """WhatsAppClient: Client used to deliver replies, shared with the delivery."""
+        return self.delivery.whatsapp_client
+
+    @whatsapp_client.setter
+    def whatsapp_client(self, client):
+        self.delivery.whatsapp_client = client
+
+    def claim(self, message):
+        """
+        Claim a message before processing or enqueueing it.
+
+        Args:
+            message (InboundMessage): Message extracted from the webhook payload
+
+        Returns:
+            bool: False if the message was already processed and must be skipped
+        """
+        if self.deduplicator is None:
+            return True
+        return self.deduplicator.claim(message.id)
+
+    def release(self, message):
+        """
+        Release the claim on a message that will not be processed now.
+
+        Args:
+            message (InboundMessage): Message extracted from the webhook payload
+        """
+        if self.deduplicator is not None:
+            for message_id in message.all_ids:
+                self.deduplicator.release(message_id)
+
+    def process(self, message):
+        """
+        Generate a reply for a message and send it back to the sender.
+
+        Args:
+            message (InboundMessage): Message extracted from the webhook payload
+
+        Raises:
+            RetryableError: If reply generation or delivery fails in a retryable way
+
+        Note:
+            If processing fails, the claim taken by claim() is released so the
+            redelivered message is processed again.
+        """
+        try:
+            with log_context(message_id=message.id, sender=message.sender):
+                self._process(message)
+        except Exception:
+            self.release(message)
+            raise
+
+    def process_sequence(self, messages, on_processed=None):
+        """
+        Process messages from one sender strictly in order.
+
+        Processing stops at the first failure and the claims of the remaining
+        messages are released, so a redelivery keeps the original order.
+
+        Args:
+            messages (list[InboundMessage]): One sender's messages in arrival order
+            on_processed (callable, optional): Called with each message once it has been processed
+
+        Raises:
+            RetryableError: If one of the messages fails in a retryable way
+        """
+        for index, message in enumerate(messages):
+            try:
+                self.process(message)
+            except Exception:
+                for unprocessed in messages[index + 1:]:
+                    self.release(unprocessed)
+                raise
+            if on_processed is not None:
+                on_processed(message)
+
+    def process_batch(self, messages):
+        """
+        Process a webhook batch, running independent senders concurrently.
+
+        Messages of the same sender are processed in order; different senders
+        run in parallel on a shared thread pool bounded by max_concurrency, so
+        the wall time of a batch approaches its slowest sender instead of the
+        sum of all replies.
+
+        Args:
+            messages (list[InboundMessage]): Messages in payload order
+
+        Raises:
+            RetryableError: If any sender failed in a retryable way (raised
+                            after every sender has finished)
+        """
+        groups = list(group_by_sender(messages).values())
+        if len(groups) <= 1 or self.max_concurrency <= 1:
+            errors = [self._run_sequence(group) for group in groups]
+        else:
+            executor = self._get_executor()
+            # copy the context so current_app is available in the pool threads
+            futures = [executor.submit(contextvars.copy_context().run, self._run_sequence, group)
+                       for group in groups]
+            errors = [future.result() for future in futures]
+
+        errors = [error for error in errors if error is not None]
+        if errors:
+            raise errors[0]
+
+    def _run_sequence(self, messages):
+        """Run process_sequence and return the raised exception instead of raising it."""
+        try:
+            self.process_sequence(messages)
+        except Exception as error:
+            return error
+        return None
+
+    def _get_executor(self):
+        """Create the shared sender thread pool on first use."""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                    thread_name_prefix="whatsapp-sender")
+            return self._executor
+
+    def _process(self, message):
+        """Run the generate and send stages for a message."""
+        if not self.supports(message):
+            current_app.logger.info("Skipping unsupported %s message %s", message.type, message.id)
+            return
+        if self.outbox is not None and self.outbox.contains(message.id):
+            # the reply survived a crash before the webhook was acknowledged, don't pay for it twice
+            current_app.logger.info("Reply to %s is already in the outbox", message.id)
+            return
+        if self.delivery.resume(message.id):
+            # a part of the reply failed before, the earlier parts already reached the user
+            current_app.logger.info("Sent the remaining parts of the reply to %s", message.id)
+            return
+
+        text = message.text
+        if text is None:
+            started = time.perf_counter()
+            text = self.media.to_text(message)
+            self.record_stage("media", time.perf_counter() - started)
+            if text is None:
+                current_app.logger.info("Media processor skipped message %s", message.id)
+                return
+
+        if getattr(self.ai_client, "streaming", False):
+            self._process_streaming(message, text)
+            return
+
+        started = time.perf_counter()
+        reply_message = self.ai_client.generate_reply(text, message.sender)
+        self.record_stage("generate", time.perf_counter() - started)
+        self._deliver(message.id, reply_message, message.sender)
+
+    def _deliver(self, key, text, recipient, **options):
+        """Send a reply, or commit it to the outbox for the outbox sender, split into parts if it is long."""
+        self.delivery.deliver(key, text, recipient, **options)
+
+    def supports(self, message):
+        """
+        Check whether a message can be answered.
+
+        Text messages and interactive replies carry text; media messages
+        are answered when a media handler is configured.
+
+        Args:
+            message (InboundMessage): Message extracted from the webhook payload
+
+        Returns:
+            bool: True if the message is answered, False if it is skipped
+        """
+        return message.text is not None or (message.kind == "media" and self.media is not None)
+
+    def _process_streaming(self, message, text):
+        """
+        Send reply segments while the model is still generating the rest.
+
+        Once the first segment has been delivered the user already has part
+        of the answer. When a later segment cannot be sent, the rest of the
+        stream is still read and kept with the unsent parts under the message
+        id, and the error is raised: the redelivery resumes the reply instead
+        of sending the delivered part again. A stream cut by the model after
+        the first segment has nothing left to resume and is only logged.
+        """
+        started = time.perf_counter()
+        delivered = 0
+        segments = iter(self.ai_client.stream_reply(text, message.sender))
+        while True:
+            try:
+                segment = next(segments, None)
+            except RetryableError as error:
+                if delivered == 0:
+                    raise
+                current_app.logger.warning("Streaming reply to %s cut after %d segment(s): %s",
+                                           message.id, delivered, error)
+                break
+            if segment is None:
+                break
+            if delivered == 0:
+                self.record_stage("first_segment", time.perf_counter() - started)
+            key = message.id if delivered == 0 or message.id is None else f"{message.id}#{delivered}"
+            try:
+                self._deliver(key, segment, message.sender, resume_key=message.id, continued=delivered > 0)
+            except RetryableError:
+                if delivered > 0:
+                    self.delivery.keep(message.id, message.sender, self._rest_of_stream(segments))
+                raise
+            delivered += 1
+        self.record_stage("generate", time.perf_counter() - started)
+
+    def _rest_of_stream(self, segments):
+        """Read the segments not generated yet, as parts, up to the end or a failure of the stream."""
+        parts = []
+        try:
+            for segment in segments:
+                parts.extend(split_reply(segment, self.delivery.max_part_chars) or [segment])
+        except RetryableError as error:
+            current_app.logger.warning("Stream of an interrupted reply cut: %s", error)
+        return parts
+
+    def record_stage(self, stage, duration):
+        """Record a stage duration in the timing stats and the metrics."""
+        self.timings.record(stage, duration)
+        if self.metrics is not None:
+            self.metrics.observe_stage(stage, duration)
+
+    def stats(self):
+        """
+        Return per-stage timing statistics.
+
+        Returns:
+            dict: Mapping of stage name to timing aggregate
+        """
+        return self.timings.snapshot()
+
+    def dedup_stats(self):
+        """
+        Return deduplication counters.
+
+        Returns:
+            dict: Claimed/duplicate counters, or None without a deduplicator
+        """
+        return self.deduplicator.stats() if self.deduplicator is not None else None
+
+
+class AsyncMessageProcessor(MessageProcessor):
+    """
+    Asyncio version of MessageProcessor for the ASGI serving mode.
+
+    Works with AsyncWhatsAppClient and AsyncAIClient. Instead of a thread
+    pool, senders run as coroutines and a semaphore bounds the number of
+    conversations in flight across all requests of the process.
+
+    Attributes:
+        max_in_flight (int): Maximum number of messages processed concurrently
+    """
+
+    delivery_class = AsyncReplyDelivery
+
+    def __init__(self, whatsapp_client, ai_client, deduplicator=None, max_in_flight=500, metrics=None, media=None,
+                 max_part_chars=4096):
+        """
+        Initialize the processor with its async service clients.
+
+        Args:
+            whatsapp_client (AsyncWhatsAppClient): Client used to deliver replies
+            ai_client (AsyncAIClient): Client used to generate replies
+            deduplicator (MessageDeduplicator, optional): Guard against redelivered messages
+            max_in_flight (int): Maximum number of messages processed concurrently
+            metrics (BotMetrics, optional): Registry of stage latency histograms
+            media (MediaHandler, optional): Handler turning media messages into text; media is skipped without it
+            max_part_chars (int): Maximum length of one WhatsApp message, longer replies are split
+        """
+        super().__init__(whatsapp_client, ai_client, deduplicator, max_concurrency=max_in_flight, metrics=metrics,
+                         media=media, max_part_chars=max_part_chars)
+        self.max_in_flight = max_in_flight
+        self._semaphore = None
+
+    async def process(self, message):
+        """
+        Generate a reply for a message and send it back to the sender.
+
+        Args:
+            message (InboundMessage): Message extracted from the webhook payload
+
+        Raises:
+            RetryableError: If reply generation or delivery fails in a retryable way
+        """
+        if self._semaphore is None:
+            import asyncio
+
+            # created lazily so it binds to the running event loop
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        try:
+            async with self._semaphore:
+                with log_context(message_id=message.id, sender=message.sender):
+                    await self._process(message)
+        except Exception:
+            self.release(message)
+            raise
+
+    async def process_sequence(self, messages):
+        """
+        Process messages from one sender strictly in order.
+
+        Args:
+            messages (list[InboundMessage]): One sender's messages in arrival order
+
+        Raises:
+            RetryableError: If one of the messages fails in a retryable way
+        """
+        for index, message in enumerate(messages):
+            try:
+                await self.process(message)
+            except Exception:
+                for unprocessed in messages[index + 1:]:
+                    self.release(unprocessed)
+                raise
+
+    async def process_batch(self, messages):
+        """
+        Process a webhook batch, running independent senders concurrently.
+
+        Args:
+            messages (list[InboundMessage]): Messages in payload order
+
+        Raises:
+            RetryableError: If any sender failed in a retryable way (raised
+                            after every sender has finished)
+        """
+        import asyncio
+
+        groups = list(group_by_sender(messages).values())
+        results = await asyncio.gather(*(self.process_sequence(group) for group in groups),
+                                       return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            raise errors[0]
+
+    async def _process(self, message):
+        """Run the generate and send stages for a message."""
+        if not self.supports(message):
+            logger.info("Skipping unsupported %s message %s", message.type, message.id)
+            return
+        if await self.delivery.resume(message.id):
+            logger.info("Sent the remaining parts of the reply to %s", message.id)
+            return
+
+        text = message.text
+        if text is None:
+            import asyncio
+
+            # downloads block on the network and the disk, keep them off the event loop
+            started = time.perf_counter()
+            text = await asyncio.to_thread(self.media.to_text, message)
+            self.record_stage("media", time.perf_counter() - started)
+            if text is None:
+                logger.info("Media processor skipped message %s", message.id)
+                return
+
+        started = time.perf_counter()
+        reply_message = await self.ai_client.generate_reply(text, message.sender)
+        self.record_stage("generate", time.perf_counter() - started)
+        await self.delivery.deliver(message.id, reply_message, message.sender)
@@ -0,0 +1,566 @@
+"""
+Client-Side Rate Limiting
+
+This module keeps the bot under the rate limits of OpenAI and the Graph API
+instead of discovering them through 429 responses. Each upstream gets a
+RateLimiter made of token buckets: one for requests per second and, for
+OpenAI, one for tokens per minute.
+
+The rate limiter supports:
+- Token buckets that are safe to share between threads
+- A SQLite bucket shared by every gunicorn worker on the same host
+- Pausing all callers for the Retry-After (or rate-limit reset) time of a 429
+- AIMD adaptation: the rate is halved on every 429 and recovers additively
+  on successful calls, up to the configured rate
+- Bounded waiting: a call that would wait longer than max_wait fails fast
+  with RateLimitError (a RetryableError) instead of tying up a worker
+
+Example:
+    limiter = RateLimiter("openai", TokenBucket(rate=5), TokenBucket(rate=90000 / 60, capacity=90000))
+    limiter.acquire(tokens=350)
+    ...
+    limiter.on_rate_limited(response.headers)
+"""
+
+import email.utils
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from app.errors import RateLimitError
+
+
+# OpenAI reset durations look like "1s", "6m0s", "20ms" or "1h2m3.5s"
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def _header(headers, name):
+    """Read a header from any mapping, ignoring case."""
+    if not headers:
+        return None
+    value = headers.get(name)
+    if value is None:
+        lowered = name.lower()
+        for key, candidate in headers.items():
+            if key.lower() == lowered:
+                return candidate
+    return value
+
+
+def parse_duration(value):
+    """
+    Parse a duration such as "1s", "6m0s" or "250ms" into seconds.
+
+    Args:
+        value (str): Duration string
+
+    Returns:
+        float: Seconds, or None if the value is not a duration
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts or "".join(number + unit for number, unit in parts) != value:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def parse_retry_after(value, now=None):
+    """
+    Parse a Retry-After header (delay in seconds or HTTP date).
+
+    Args:
+        value (str): Header value
+        now (float, optional): Current Unix time, for tests
+
+    Returns:
+        float: Seconds to wait, or None if the value is invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    return max(0.0, retry_at.timestamp() - (time.time() if now is None else now))
+
+
+def rate_limit_delay(headers):
+    """
+    Find out from response headers how long the API asks us to back off.
+
+    Understands Retry-After, retry-after-ms, OpenAI's x-ratelimit-remaining-* /
+    x-ratelimit-reset-* pairs and the Graph API X-Business-Use-Case-Usage header.
+
+    Args:
+        headers (Mapping): Response headers
+
+    Returns:
+        float: Seconds to wait, or None if the headers do not say
+    """
+    delay = parse_retry_after(_header(headers, "Retry-After"))
+    if delay is not None:
+        return delay
+    milliseconds = _header(headers, "retry-after-ms")
+    if milliseconds:
+        try:
+            return max(0.0, float(milliseconds) / 1000)
+        except ValueError:
+            pass
+
+    delays = []
+    for kind in ("requests", "tokens"):
+        if _header(headers, f"x-ratelimit-remaining-{kind}") == "0":
+            reset = parse_duration(_header(headers, f"x-ratelimit-reset-{kind}"))
+            if reset is not None:
+                delays.append(reset)
+    if delays:
+        return max(delays)
+
+    usage = _header(headers, "X-Business-Use-Case-Usage")
+    if usage:
+        try:
+            minutes = [
+                entry.get("estimated_time_to_regain_access", 0)
+                for entries in json.loads(usage).values()
+                for entry in entries
+            ]
+        except (ValueError, AttributeError, TypeError):
+            minutes = []
+        if minutes and max(minutes) > 0:
+            return max(minutes) * 60.0
+    return None
+
+
+class TokenBucket:
+    """
+    Thread-safe in-process token bucket.
+
+    Tokens refill continuously at rate per second up to capacity. A rate of
+    0 disables the limit; the bucket can still be paused after a 429.
+
+    Attributes:
+        rate (float): Refill rate in tokens per second (0 = unlimited)
+        capacity (float): Maximum burst size in tokens
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        Initialize a full bucket.
+
+        Args:
+            rate (float): Refill rate in tokens per second (0 = unlimited)
+            capacity (float, optional): Maximum burst size, defaults to one second of tokens
+        """
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._rate = rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self._rate
+
+    def _refill(self, now):
+        """Add the tokens accumulated since the last update."""
+        if self._rate > 0:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self._rate)
+        self._updated_at = now
+
+    def try_take(self, amount=1):
+        """
+        Take tokens if available.
+
+        Args:
+            amount (float): Tokens to take, clamped to the capacity
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise seconds until they may be
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._paused_until > now:
+                return self._paused_until - now
+            if self._rate <= 0:
+                return 0.0
+            self._refill(now)
+            amount = min(amount, self.capacity)
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self._rate
+
+    def give_back(self, amount=1):
+        """Return tokens taken for a call that was not made, up to the capacity."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + min(amount, self.capacity))
+
+    def pause(self, seconds):
+        """Refuse all tokens for the given number of seconds."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def set_rate(self, rate):
+        """Change the refill rate, keeping the tokens accumulated so far."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._rate = rate
+
+
+class SQLiteTokenBucket:
+    """
+    Token bucket whose state lives in a SQLite database file.
+
+    Every process that opens the same file and bucket name shares one
+    budget, so several gunicorn workers together stay under the provider
+    limit. Each take is a single short IMMEDIATE transaction.
+
+    Attributes:
+        path (str): Path to the SQLite database file
+        name (str): Bucket name, unique per limit
+        capacity (float): Maximum burst size in tokens
+    """
+
+    def __init__(self, path, name, rate, capacity=None):
+        """
+        Initialize the bucket, creating or resetting its shared row.
+
+        Args:
+            path (str): Path to the SQLite database file
+            name (str): Bucket name, unique per limit
+            rate (float): Refill rate in tokens per second (0 = unlimited)
+            capacity (float, optional): Maximum burst size, defaults to one second of tokens
+        """
+        self.path = path
+        self.name = name
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, "
+            "rate REAL NOT NULL, paused_until REAL NOT NULL)"
+        )
+        connection.execute(
+            "INSERT INTO buckets (name, tokens, updated_at, rate, paused_until) VALUES (?, ?, ?, ?, 0) "
+            "ON CONFLICT(name) DO UPDATE SET rate = excluded.rate",
+            (name, self.capacity, time.time(), rate),
+        )
+
+    def _connection(self):
+        """Return this thread's connection, opening it on first use."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _transaction(self, update):
+        """Run update(state) -> (new state, result) on the bucket row atomically."""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT tokens, updated_at, rate, paused_until FROM buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            state, result = update(list(row), time.time())
+            connection.execute(
+                "UPDATE buckets SET tokens = ?, updated_at = ?, rate = ?, paused_until = ? WHERE name = ?",
+                (*state, self.name),
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return result
+
+    def _refilled(self, state, now):
+        """Return the state with the tokens accumulated since its last update."""
+        tokens, updated_at, rate, paused_until = state
+        if rate > 0:
+            tokens = min(self.capacity, tokens + max(0.0, now - updated_at) * rate)
+        return [tokens, now, rate, paused_until]
+
+    @property
+    def rate(self):
+        row = self._connection().execute("SELECT rate FROM buckets WHERE name = ?", (self.name,)).fetchone()
+        return row[0]
+
+    def try_take(self, amount=1):
+        """
+        Take tokens if available.
+
+        Args:
+            amount (float): Tokens to take, clamped to the capacity
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise seconds until they may be
+        """
+        def update(state, now):
+            if state[3] > now:
+                return state, state[3] - now
+            if state[2] <= 0:
+                return state, 0.0
+            state = self._refilled(state, now)
+            needed = min(amount, self.capacity)
+            if state[0] >= needed:
+                state[0] -= needed
+                return state, 0.0
+            return state, (needed - state[0]) / state[2]
+
+        return self._transaction(update)
+
+    def give_back(self, amount=1):
+        """Return tokens taken for a call that was not made, up to the capacity."""
+        def update(state, now):
+            state = self._refilled(state, now)
+            state[0] = min(self.capacity, state[0] + min(amount, self.capacity))
+            return state, None
+
+        self._transaction(update)
+
+    def pause(self, seconds):
+        """Refuse all tokens, in every process, for the given number of seconds."""
+        def update(state, now):
+            state[3] = max(state[3], now + seconds)
+            return state, None
+
+        self._transaction(update)
+
+    def set_rate(self, rate):
+        """Change the shared refill rate, keeping the tokens accumulated so far."""
+        def update(state, now):
+            state = self._refilled(state, now)
+            state[2] = rate
+            return state, None
+
+        self._transaction(update)
+
+
+class RateLimiter:
+    """
+    Rate limiter of one upstream API.
+
+    Combines a request bucket and an optional token bucket, waits for them
+    before each call, and reacts to 429 responses by pausing and halving the
+    rate (AIMD). Successful calls raise the rate again in steps of a
+    twentieth of the configured rate.
+
+    Attributes:
+        name (str): Upstream name used in errors and stats
+        requests (TokenBucket | SQLiteTokenBucket): Requests per second bucket
+        tokens (TokenBucket | SQLiteTokenBucket): Tokens bucket, or None
+        max_wait (float): Longest a call waits before failing with RateLimitError
+        default_backoff (float): Pause after a 429 that has no usable headers
+    """
+
+    # Rates never drop below this fraction of the configured rate
+    MIN_RATE_FRACTION = 0.1
+    # Additive increase per successful call, as a fraction of the configured rate
+    INCREASE_FRACTION = 0.05
+
+    def __init__(self, name, requests, tokens=None, max_wait=10.0, default_backoff=1.0):
+        """
+        Initialize the limiter.
+
+        Args:
+            name (str): Upstream name used in errors and stats
+            requests (TokenBucket | SQLiteTokenBucket): Requests per second bucket
+            tokens (TokenBucket | SQLiteTokenBucket, optional): Tokens bucket
+            max_wait (float): Longest a call waits before failing with RateLimitError
+            default_backoff (float): Pause after a 429 that has no usable headers
+        """
+        self.name = name
+        self.requests = requests
+        self.tokens = tokens
+        self.max_wait = max_wait
+        self.default_backoff = default_backoff
+        self._buckets = [bucket for bucket in (requests, tokens) if bucket is not None]
+        self._configured = {id(bucket): bucket.rate for bucket in self._buckets}
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "delayed": 0, "rejected": 0, "rate_limited": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _waits(self, tokens, taken):
+        """
+        Take from each bucket in turn, yielding the time to wait whenever one is empty.
+
+        Every (bucket, amount) taken is appended to taken, so a rejected call
+        can return it.
+        """
+        for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+            if bucket is None or not amount:
+                continue
+            wait = bucket.try_take(amount)
+            while wait:
+                yield wait
+                wait = bucket.try_take(amount)
+            taken.append((bucket, amount))
+
+    def _check_budget(self, waited, wait, taken):
+        """Fail fast if waiting would exceed max_wait, returning the tokens already taken."""
+        if waited + wait > self.max_wait:
+            # e.g. the request token, when the tokens bucket is the one that is short
+            for bucket, amount in taken:
+                bucket.give_back(amount)
+            self._count("rejected")
+            raise RateLimitError(f"{self.name} rate limit: would wait {waited + wait:.1f}s")
+
+    def _acquired(self, waited):
+        self._count("calls")
+        if waited:
+            self._count("delayed")
+
+    def acquire(self, tokens=0):
+        """
+        Block until a request (and its tokens) fits the limits.
+
+        Args:
+            tokens (int): Estimated tokens of the request, for the tokens bucket
+
+        Raises:
+            RateLimitError: If the wait would exceed max_wait
+        """
+        waited = 0.0
+        taken = []
+        for wait in self._waits(tokens, taken):
+            self._check_budget(waited, wait, taken)
+            time.sleep(wait)
+            waited += wait
+        self._acquired(waited)
+
+    async def acquire_async(self, tokens=0):
+        """Asyncio version of acquire, sleeping without blocking the event loop."""
+        # imported here, the sync serving mode does not load asyncio at all
+        import asyncio
+
+        waited = 0.0
+        taken = []
+        for wait in self._waits(tokens, taken):
+            self._check_budget(waited, wait, taken)
+            await asyncio.sleep(wait)
+            waited += wait
+        self._acquired(waited)
+
+    def on_rate_limited(self, headers=None):
+        """
+        React to a 429: pause every caller and halve the rates.
+
+        Args:
+            headers (Mapping, optional): Headers of the rate limited response
+        """
+        self._count("rate_limited")
+        delay = rate_limit_delay(headers)
+        self.requests.pause(self.default_backoff if delay is None else delay)
+        for bucket in self._buckets:
+            configured = self._configured[id(bucket)]
+            if configured > 0:
+                bucket.set_rate(max(configured * self.MIN_RATE_FRACTION, bucket.rate / 2))
+
+    def on_success(self, headers=None):
+        """
+        React to a successful call: honor exhausted-quota headers and recover the rates.
+
+        Args:
+            headers (Mapping, optional): Headers of the response
+        """
+        delay = rate_limit_delay(headers) if headers else None
+        if delay:
+            self.requests.pause(delay)
+        for bucket in self._buckets:
+            configured = self._configured[id(bucket)]
+            rate = bucket.rate
+            if 0 < rate < configured:
+                bucket.set_rate(min(configured, rate + configured * self.INCREASE_FRACTION))
+
+    def stats(self):
+        """
+        Return limiter counters and current rates.
+
+        Returns:
+            dict: Counters plus the current requests and tokens rates
+        """
+        with self._lock:
+            stats = dict(self._counters)
+        stats["requests_per_second"] = self.requests.rate
+        stats["tokens_per_second"] = self.tokens.rate if self.tokens is not None else None
+        return stats
+
+
+def create_rate_limiter(name, backend, requests_per_second, tokens_per_minute=0, max_wait=10.0, sqlite_path=None):
+    """
+    Build a rate limiter from configuration values.
+
+    Args:
+        name (str): Upstream name, also the bucket name prefix in SQLite
+        backend (str): "memory" or "sqlite"
+        requests_per_second (float): Request rate (0 = unlimited)
+        tokens_per_minute (float): Token rate (0 = no tokens bucket)
+        max_wait (float): Longest a call waits before failing
+        sqlite_path (str, optional): Database path for the sqlite backend
+
+    Returns:
+        RateLimiter: Configured limiter
+
+    Raises:
+        ValueError: If the backend name is unknown
+    """
+    if backend == "memory":
+        def bucket(suffix, rate, capacity=None):
+            return TokenBucket(rate, capacity)
+    elif backend == "sqlite":
+        def bucket(suffix, rate, capacity=None):
+            return SQLiteTokenBucket(sqlite_path, f"{name}:{suffix}", rate, capacity)
+    else:
+        raise ValueError(f"Unknown rate limit backend: {backend}")
+
+    requests = bucket("requests", requests_per_second)
+    tokens = None
+    if tokens_per_minute > 0:
+        tokens = bucket("tokens", tokens_per_minute / 60.0, tokens_per_minute)
+    return RateLimiter(name, requests, tokens, max_wait)
+
+
+def rate_limit_stats(ai_client, whatsapp_client):
+    """
+    Collect the rate limiter stats of both clients.
+
+    Args:
+        ai_client: AI client, possibly with a rate_limiter attribute
+        whatsapp_client: WhatsApp client, possibly with a rate_limiter attribute
+
+    Returns:
+        dict: Limiter stats per upstream, None for clients without a limiter
+    """
+    stats = {}
+    for name, client in (("openai", ai_client), ("whatsapp", whatsapp_client)):
+        limiter = getattr(client, "rate_limiter", None)
+        stats[name] = limiter.stats() if limiter is not None else None
+    return stats
@@ -0,0 +1,149 @@
+"""
+AI Reply Cache
+
+This module caches AI-generated replies for messages that are asked over and
+over again ("hi", "what are your hours", "price?"), so they are answered from
+memory instead of a full OpenAI round-trip.
+
+The cache supports:
+- Message normalization (Unicode form, case, punctuation and whitespace)
+- Keys that include the model, temperature and prompt version, so changing
+  any of them never serves a stale reply
+- LRU + TTL eviction and a size cap in bytes through app.stores
+- A shared SQLite backend for multiple gunicorn workers
+- Hit/miss counters
+
+Example:
+    cache = ReplyCache(MemoryTTLStore(max_entries=10000, max_bytes=10_000_000), ttl=3600)
+    reply = cache.get("Hi!", "gpt-3.5-turbo", 0.7, "1")
+    if reply is None:
+        reply = ...  # call the model
+        cache.set("Hi!", "gpt-3.5-turbo", 0.7, "1", reply)
+"""
+
+import hashlib
+import re
+import threading
+import unicodedata
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_message(text):
+    """
+    Normalize a message so trivially different spellings share a cache entry.
+
+    Applies NFKC Unicode normalization, case folding, drops punctuation and
+    symbols, and collapses whitespace. "  What are your HOURS?? " and
+    "what are your hours" normalize to the same string.
+
+    Args:
+        text (str): Raw message text
+
+    Returns:
+        str: Normalized message text
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = "".join(
+        " " if unicodedata.category(char)[0] in ("P", "S") else char for char in text
+    )
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class ReplyCache:
+    """
+    Cache of AI replies keyed by normalized message and generation settings.
+
+    Attributes:
+        store (MemoryTTLStore | SQLiteTTLStore): Backing store for cached replies
+        ttl (float): Seconds a cached reply stays valid
+    """
+
+    def __init__(self, store, ttl=3600):
+        """
+        Initialize the reply cache.
+
+        Args:
+            store (MemoryTTLStore | SQLiteTTLStore): Backing store for cached replies
+            ttl (float): Seconds a cached reply stays valid
+        """
+        self.store = store
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def make_key(message, model, temperature, prompt_version):
+        """
+        Build the cache key for a message and its generation settings.
+
+        Args:
+            message (str): Raw message text
+            model (str): OpenAI model name
+            temperature (float): Sampling temperature
+            prompt_version (str): Version of the prompt template
+
+        Returns:
+            str: Cache key, or None if the message is empty after normalization
+        """
+        normalized = normalize_message(message)
+        if not normalized:
+            return None
+        raw_key = f"{model}\x1f{temperature}\x1f{prompt_version}\x1f{normalized}"
+        return hashlib.blake2b(raw_key.encode(), digest_size=16).hexdigest()
+
+    def get(self, message, model, temperature, prompt_version):
+        """
+        Look up a cached reply.
+
+        Args:
+            message (str): Raw message text
+            model (str): OpenAI model name
+            temperature (float): Sampling temperature
+            prompt_version (str): Version of the prompt template
+
+        Returns:
+            str: Cached reply, or None on a miss
+        """
+        key = self.make_key(message, model, temperature, prompt_version)
+        reply = self.store.get(key) if key is not None else None
+        with self._lock:
+            if reply is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return reply
+
+    def set(self, message, model, temperature, prompt_version, reply):
+        """
+        Cache a generated reply.
+
+        Args:
+            message (str): Raw message text
+            model (str): OpenAI model name
+            temperature (float): Sampling temperature
+            prompt_version (str): Version of the prompt template
+            reply (str): Generated reply
+        """
+        key = self.make_key(message, model, temperature, prompt_version)
+        if key is not None:
+            self.store.set(key, reply, self.ttl)
+
+    def stats(self):
+        """
+        Return cache counters.
+
+        Returns:
+            dict: Hits, misses, hit rate and number of cached replies
+        """
+        with self._lock:
+            hits, misses = self._hits, self._misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": len(self.store),
+        }
@@ -0,0 +1,321 @@
+"""
+Retries and Circuit Breaking
+
+This module absorbs transient upstream failures inside the process instead
+of answering the whole webhook with a 503 and waiting for WhatsApp's slow
+redelivery schedule. Each upstream (OpenAI, Graph API) gets a RetryPolicy
+and a CircuitBreaker.
+
+The module supports:
+- Retries of RetryableError with exponential backoff and full jitter
+- A per-call deadline covering all attempts and backoff sleeps; each attempt
+  gets the remaining time as its request timeout
+- A circuit breaker that fails fast with CircuitOpenError after repeated
+  failures and lets a single probe call through after a cool-down
+- Sync and asyncio variants of the same policy
+- Counters of calls, retries and breaker state for /stats
+
+Rate limit errors are retried (the rate limiter already waits out
+Retry-After) but do not count as failures for the breaker, since a
+throttling upstream is alive. An open breaker is never retried.
+
+Example:
+    policy = RetryPolicy("openai", max_attempts=3, base_delay=0.2, deadline=30)
+    breaker = CircuitBreaker("openai", failure_threshold=5, reset_timeout=30)
+    reply = policy.call(lambda timeout: complete(messages, timeout), breaker)
+"""
+
+import logging
+import random
+import threading
+import time
+
+from app.errors import CircuitOpenError, RateLimitError, RetryableError
+
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker of one upstream.
+
+    Closed: calls go through and consecutive failures are counted. Open:
+    calls fail immediately until reset_timeout has passed. Half-open: one
+    probe call goes through; its success closes the breaker, its failure
+    opens it again.
+
+    Attributes:
+        name (str): Upstream name used in errors and stats
+        failure_threshold (int): Consecutive failures that open the breaker
+        reset_timeout (float): Seconds the breaker stays open before a probe
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        """
+        Initialize a closed breaker.
+
+        Args:
+            name (str): Upstream name used in errors and stats
+            failure_threshold (int): Consecutive failures that open the breaker
+            reset_timeout (float): Seconds the breaker stays open before a probe
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self._counters = {"opened": 0, "rejected": 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now):
+        """Move an open breaker to half-open once its cool-down has passed."""
+        if self._state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+        return self._state
+
+    def before_call(self):
+        """
+        Let a call through or fail fast.
+
+        Raises:
+            CircuitOpenError: If the breaker is open, or half-open with a probe in flight
+        """
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self._counters["rejected"] += 1
+        raise CircuitOpenError(f"{self.name} circuit breaker is open")
+
+    def on_success(self):
+        """Record a successful call, closing the breaker."""
+        with self._lock:
+            self._probe_in_flight = False
+            self._failures = 0
+            self._state = self.CLOSED
+
+    def on_failure(self):
+        """Record a failed call, opening the breaker at the threshold or after a failed probe."""
+        with self._lock:
+            self._probe_in_flight = False
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._counters["opened"] += 1
+                    logger.warning("%s circuit breaker opened after %d failures", self.name, self._failures)
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def on_neutral(self):
+        """Record a call that says nothing about the upstream's health (e.g. a 429)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def stats(self):
+        """
+        Return the breaker state and counters.
+
+        Returns:
+            dict: State, consecutive failures, times opened and rejected calls
+        """
+        with self._lock:
+            return {
+                "state": self._current_state(time.monotonic()),
+                "consecutive_failures": self._failures,
+                **self._counters,
+            }
+
+
+class RetryPolicy:
+    """
+    Retry policy with exponential backoff, full jitter and a deadline.
+
+    Attempt n (from 0) is followed by a sleep drawn uniformly from
+    [0, min(max_delay, base_delay * 2 ** n)], which spreads the retries of
+    many workers instead of having them hit a recovering upstream together.
+
+    Attributes:
+        name (str): Upstream name used in logs and stats
+        max_attempts (int): Maximum attempts per call, including the first
+        base_delay (float): Backoff of the first retry in seconds
+        max_delay (float): Upper bound of a single backoff in seconds
+        deadline (float): Seconds a call may take over all attempts (None = unbounded)
+    """
+
+    def __init__(self, name, max_attempts=3, base_delay=0.2, max_delay=2.0, deadline=None):
+        """
+        Initialize the policy.
+
+        Args:
+            name (str): Upstream name used in logs and stats
+            max_attempts (int): Maximum attempts per call, including the first
+            base_delay (float): Backoff of the first retry in seconds
+            max_delay (float): Upper bound of a single backoff in seconds
+            deadline (float, optional): Seconds a call may take over all attempts
+        """
+        self.name = name
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "retries": 0, "failed": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _remaining(self, started):
+        """Seconds left until the deadline, or None without one."""
+        if self.deadline is None:
+            return None
+        return self.deadline - (time.monotonic() - started)
+
+    def _start_attempt(self, started, breaker):
+        """Check the breaker and the deadline, return the time left for the attempt."""
+        if breaker is not None:
+            breaker.before_call()
+        return self._remaining(started)
+
+    @staticmethod
+    def _record(breaker, error=None):
+        """Report an attempt's outcome to the breaker."""
+        if breaker is None:
+            return
+        if error is None:
+            breaker.on_success()
+        elif isinstance(error, RetryableError) and not isinstance(error, RateLimitError):
+            breaker.on_failure()
+        else:
+            breaker.on_neutral()
+
+    def _backoff(self, attempt, started, error):
+        """
+        Decide whether to retry after a failed attempt.
+
+        Returns:
+            float: Seconds to sleep before the next attempt, or None to give up
+        """
+        if isinstance(error, CircuitOpenError) or attempt + 1 >= self.max_attempts:
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        remaining = self._remaining(started)
+        if remaining is not None and remaining <= delay:
+            return None
+        self._count("retries")
+        logger.warning("%s call failed (%s), retry %d in %.2fs", self.name, error, attempt + 1, delay)
+        return delay
+
+    def call(self, func, breaker=None):
+        """
+        Call func with retries.
+
+        Args:
+            func (callable): Called with the seconds left until the deadline (or None)
+            breaker (CircuitBreaker, optional): Breaker of the called upstream
+
+        Returns:
+            Whatever func returns
+
+        Raises:
+            RetryableError: The last error once attempts or the deadline are exhausted
+            CircuitOpenError: If the breaker is open
+        """
+        self._count("calls")
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                result = func(self._start_attempt(started, breaker))
+            except CircuitOpenError:
+                self._count("failed")
+                raise
+            except RetryableError as error:
+                self._record(breaker, error)
+                delay = self._backoff(attempt, started, error)
+                if delay is None:
+                    self._count("failed")
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException as error:
+                self._record(breaker, error)
+                raise
+            self._record(breaker)
+            return result
+
+    async def acall(self, func, breaker=None):
+        """Asyncio version of call; func is a coroutine function."""
+        self._count("calls")
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                result = await func(self._start_attempt(started, breaker))
+            except CircuitOpenError:
+                self._count("failed")
+                raise
+            except RetryableError as error:
+                self._record(breaker, error)
+                delay = self._backoff(attempt, started, error)
+                if delay is None:
+                    self._count("failed")
+                    raise
+                import asyncio
+
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException as error:
+                self._record(breaker, error)
+                raise
+            self._record(breaker)
+            return result
+
+    def stats(self):
+        """
+        Return call and retry counters.
+
+        Returns:
+            dict: Calls, retries and calls that failed after all attempts
+        """
+        with self._lock:
+            return dict(self._counters)
+
+
+def resilience_stats(ai_client, whatsapp_client):
+    """
+    Collect the retry and circuit breaker stats of both clients.
+
+    Args:
+        ai_client: AI client, possibly with retry_policy and circuit_breaker attributes
+        whatsapp_client: WhatsApp client, possibly with retry_policy and circuit_breaker attributes
+
+    Returns:
+        dict: Retry and breaker stats per upstream, None where a client has neither
+    """
+    stats = {}
+    for name, client in (("openai", ai_client), ("whatsapp", whatsapp_client)):
+        policy = getattr(client, "retry_policy", None)
+        breaker = getattr(client, "circuit_breaker", None)
+        stats[name] = {
+            "retries": policy.stats() if policy is not None else None,
+            "circuit_breaker": breaker.stats() if breaker is not None else None,
+        }
+    return stats
@@ -0,0 +1,437 @@
+"""
+Knowledge Base Retrieval
+
+This module gives the model business context: a directory of documents
+(catalog, policies, opening hours) is indexed offline into a compact BM25
+inverted index, and for each message the best matching snippets are added to
+the prompt, within a token budget.
+
+The retrieval stage supports:
+- An offline builder (python -m app.retrieval build) that splits .md/.txt
+  documents into paragraph chunks and writes a single index file atomically
+- Incremental rebuilds: chunks of files whose size and modification time
+  did not change are taken from the previous index instead of re-reading
+  and re-chunking the documents
+- A read-only, memory-mapped index at runtime: only the vocabulary is
+  loaded, postings and chunk texts stay in the page cache
+  and are shared by all worker processes
+- BM25 impacts (the score contribution of a term to a chunk) computed at
+  build time and stored with each posting, best first, so a query only
+  adds up floats, and only the first MAX_POSTINGS_PER_TERM postings of very
+  common terms; a query takes well under a millisecond
+- Top-k snippets packed under a token budget
+
+Index file layout:
+    8-byte magic, 8-byte little-endian meta length, JSON meta (vocabulary,
+    files, section offsets, BM25 parameters), then 8-byte aligned sections:
+    posting chunks (uint32), posting impacts (float32), chunk files (uint32),
+    chunk text offsets (uint64) and the UTF-8 text.
+
+Example:
+    python -m app.retrieval build --docs knowledge/ --index state/knowledge.index
+    retriever = Retriever(KnowledgeIndex("state/knowledge.index"), top_k=3, token_budget=300)
+    snippets = retriever.context("Do you have the blue jacket in XL?")
+"""
+
+import argparse
+import heapq
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import uuid
+from array import array
+from collections import Counter
+
+from app.conversations import estimate_tokens
+from app.faq import STOP_WORDS
+from app.reply_cache import normalize_message
+
+
+MAGIC = b"WABM25\x00\x01"
+DOCUMENT_SUFFIXES = (".md", ".txt")
+# Postings read per query term; only terms found in more chunks than this are cut,
+# and their lowest-impact chunks would barely change the ranking
+MAX_POSTINGS_PER_TERM = 256
+_HEADER = struct.Struct("<8sQ")
+
+
+def _stem(word):
+    """Strip English plural endings, so "refunds" finds "refund"; queries and documents are stemmed alike."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    """
+    Split a text into index terms.
+
+    Args:
+        text (str): Document or query text
+
+    Returns:
+        list[str]: Normalized, plural-stripped words without stop words
+    """
+    return [_stem(word) for word in normalize_message(text).split() if word not in STOP_WORDS]
+
+
+def chunk_document(text, chunk_chars=800):
+    """
+    Split a document into chunks of whole paragraphs.
+
+    Consecutive paragraphs are merged up to chunk_chars; a longer paragraph
+    is split between words.
+
+    Args:
+        text (str): Document text
+        chunk_chars (int): Target maximum chunk length
+
+    Returns:
+        list[str]: Chunks in document order
+    """
+    chunks, current = [], ""
+    for paragraph in (" ".join(block.split()) for block in text.split("\n\n")):
+        if not paragraph:
+            continue
+        while len(paragraph) > chunk_chars:
+            cut = paragraph.rfind(" ", 0, chunk_chars)
+            cut = cut if cut > 0 else chunk_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(paragraph[:cut])
+            paragraph = paragraph[cut:].lstrip()
+        if current and len(current) + 1 + len(paragraph) > chunk_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _aligned(buffer, fill=b"\x00"):
+    """Pad a bytearray to a multiple of 8 bytes and return its length."""
+    buffer.extend(fill * (-len(buffer) % 8))
+    return len(buffer)
+
+
+def build_index(docs_dir, index_path, chunk_chars=800, k1=1.2, b=0.75):
+    """
+    Build or incrementally update the index of a document directory.
+
+    Args:
+        docs_dir (str): Directory searched recursively for .md and .txt files
+        index_path (str): Index file, replaced atomically
+        chunk_chars (int): Target maximum chunk length
+        k1 (float): BM25 term frequency saturation
+        b (float): BM25 length normalization
+
+    Returns:
+        dict: Files, files reused from the previous index, chunks and terms
+    """
+    previous = None
+    if os.path.exists(index_path):
+        try:
+            previous = KnowledgeIndex(index_path)
+        except ValueError:
+            previous = None
+        if previous is not None and previous.meta["chunk_chars"] != chunk_chars:
+            previous.close()
+            previous = None
+
+    files, chunks, reused = [], [], 0
+    for root, directories, names in os.walk(docs_dir):
+        directories.sort()
+        for name in sorted(names):
+            if not name.endswith(DOCUMENT_SUFFIXES):
+                continue
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, docs_dir)
+            stat = os.stat(path)
+            signature = [stat.st_mtime_ns, stat.st_size]
+            file_chunks = previous.file_chunks(relative, signature) if previous is not None else None
+            if file_chunks is None:
+                with open(path, encoding="utf-8") as document:
+                    file_chunks = chunk_document(document.read(), chunk_chars)
+            else:
+                reused += 1
+            files.append({"path": relative, "signature": signature})
+            chunks.extend((len(files) - 1, text) for text in file_chunks)
+    if previous is not None:
+        previous.close()
+
+    postings, lengths = {}, []
+    for chunk_id, (_, text) in enumerate(chunks):
+        terms = tokenize(text)
+        lengths.append(len(terms))
+        for term, frequency in Counter(terms).items():
+            postings.setdefault(term, []).append((chunk_id, frequency))
+    average_length = sum(lengths) / len(lengths) if lengths else 1.0
+
+    norms = [k1 * (1 - b + b * length / (average_length or 1.0)) for length in lengths]
+    vocabulary, posting_chunks, posting_impacts = {}, array("I"), array("f")
+    for term in sorted(postings):
+        frequency = len(postings[term])
+        idf = math.log(1 + (len(chunks) - frequency + 0.5) / (frequency + 0.5))
+        impacts = sorted(((idf * tf * (k1 + 1) / (tf + norms[chunk_id]), chunk_id) for chunk_id, tf in postings[term]),
+                         reverse=True)
+        vocabulary[term] = [len(posting_chunks), frequency]
+        posting_chunks.extend(chunk_id for _, chunk_id in impacts)
+        posting_impacts.extend(impact for impact, _ in impacts)
+    chunk_files = array("I", (file_index for file_index, _ in chunks))
+    text_offsets, text = array("Q"), bytearray()
+    for _, chunk_text in chunks:
+        text_offsets.append(len(text))
+        text.extend(chunk_text.encode())
+    text_offsets.append(len(text))
+
+    body, sections = bytearray(), {}
+    for name, values in (("posting_chunks", posting_chunks), ("posting_impacts", posting_impacts),
+                         ("chunk_files", chunk_files), ("text_offsets", text_offsets), ("text", text)):
+        start = len(body)
+        body.extend(values.tobytes() if isinstance(values, array) else values)
+        sections[name] = [start, len(body) - start]
+        _aligned(body)
+    meta = {"version": uuid.uuid4().hex, "byteorder": sys.byteorder, "k1": k1, "b": b, "chunk_chars": chunk_chars,
+            "chunks": len(chunks), "files": files, "vocabulary": vocabulary, "sections": sections}
+    meta_bytes = bytearray(json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode())
+    _aligned(meta_bytes, b" ")
+
+    directory = os.path.dirname(index_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as index_file:
+        index_file.write(_HEADER.pack(MAGIC, len(meta_bytes)))
+        index_file.write(meta_bytes)
+        index_file.write(body)
+    os.replace(temp_path, index_path)
+    return {"files": len(files), "reused_files": reused, "chunks": len(chunks), "terms": len(vocabulary)}
+
+
+class KnowledgeIndex:
+    """
+    Read-only, memory-mapped BM25 index.
+
+    Attributes:
+        path (str): Index file
+        meta (dict): Index metadata (version, files, vocabulary, BM25 parameters)
+        version (str): Random id of the build, changes with every rebuild
+    """
+
+    def __init__(self, path):
+        """
+        Map an index file.
+
+        Args:
+            path (str): Index file written by build_index
+
+        Raises:
+            ValueError: If the file is missing, not an index or built on a machine of another byte order
+        """
+        self.path = path
+        try:
+            with open(path, "rb") as index_file:
+                self._map = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as error:
+            raise ValueError(f"Cannot open knowledge index {path}: {error}")
+        try:
+            magic, meta_length = _HEADER.unpack_from(self._map)
+            if magic != MAGIC:
+                raise ValueError("not a knowledge index")
+            self.meta = json.loads(self._map[_HEADER.size:_HEADER.size + meta_length])
+            if self.meta["byteorder"] != sys.byteorder:
+                raise ValueError("built on a machine with another byte order, rebuild it")
+        except (struct.error, ValueError, KeyError) as error:
+            self._map.close()
+            raise ValueError(f"Invalid knowledge index {path}: {error}")
+        self.version = self.meta["version"]
+        self._vocabulary = self.meta.pop("vocabulary")
+        base = _HEADER.size + meta_length
+        view = memoryview(self._map)
+        self._views = {}
+        for name, code in (("posting_chunks", "I"), ("posting_impacts", "f"), ("chunk_files", "I"),
+                           ("text_offsets", "Q"), ("text", "B")):
+            start, length = self.meta["sections"][name]
+            self._views[name] = view[base + start:base + start + length].cast(code)
+        view.release()
+        self._posting_chunks = self._views["posting_chunks"]
+        self._posting_impacts = self._views["posting_impacts"]
+        self._text_offsets = self._views["text_offsets"]
+        self._text = self._views["text"]
+        self._chunks = self.meta["chunks"]
+        self._file_chunk_ids = None
+
+    def __len__(self):
+        return self._chunks
+
+    def search(self, text, top_k=3):
+        """
+        Find the chunks that best match a text.
+
+        Args:
+            text (str): Query, e.g. an incoming message
+            top_k (int): Maximum number of chunks
+
+        Returns:
+            list[tuple[float, int]]: (BM25 score, chunk id), best first
+        """
+        scores = {}
+        get = scores.get
+        for term in set(tokenize(text)):
+            entry = self._vocabulary.get(term)
+            if entry is None:
+                continue
+            start, frequency = entry
+            end = start + min(frequency, MAX_POSTINGS_PER_TERM)
+            for chunk_id, impact in zip(self._posting_chunks[start:end], self._posting_impacts[start:end]):
+                scores[chunk_id] = get(chunk_id, 0.0) + impact
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [(score, chunk_id) for chunk_id, score in best]
+
+    def chunk_text(self, chunk_id):
+        """Return the text of a chunk."""
+        return bytes(self._text[self._text_offsets[chunk_id]:self._text_offsets[chunk_id + 1]]).decode()
+
+    def chunk_source(self, chunk_id):
+        """Return the document path of a chunk, relative to the indexed directory."""
+        return self.meta["files"][self._views["chunk_files"][chunk_id]]["path"]
+
+    def file_chunks(self, path, signature):
+        """
+        Return the chunk texts of a document if it is unchanged since the build.
+
+        Args:
+            path (str): Document path relative to the indexed directory
+            signature (list): [modification time in ns, size] of the document now
+
+        Returns:
+            list[str]: Chunk texts, or None if the document is new or changed
+        """
+        if self._file_chunk_ids is None:
+            self._file_chunk_ids = {}
+            for chunk_id, file_index in enumerate(self._views["chunk_files"]):
+                self._file_chunk_ids.setdefault(self.meta["files"][file_index]["path"], []).append(chunk_id)
+            self._signatures = {item["path"]: item["signature"] for item in self.meta["files"]}
+        if self._signatures.get(path) != signature:
+            return None
+        return [self.chunk_text(chunk_id) for chunk_id in self._file_chunk_ids.get(path, ())]
+
+    def close(self):
+        """Unmap the index file."""
+        for view in self._views.values():
+            view.release()
+        self._views = {}
+        self._map.close()
+
+
+class Retriever:
+    """
+    Retrieval stage of the prompt: the best snippets of a message within a token budget.
+
+    Attributes:
+        index (KnowledgeIndex): Memory-mapped index
+        top_k (int): Maximum number of snippets
+        token_budget (int): Maximum estimated tokens of all snippets together
+    """
+
+    def __init__(self, index, top_k=3, token_budget=300):
+        """
+        Initialize the retriever.
+
+        Args:
+            index (KnowledgeIndex): Memory-mapped index
+            top_k (int): Maximum number of snippets
+            token_budget (int): Maximum estimated tokens of all snippets together
+        """
+        self.index = index
+        self.top_k = top_k
+        self.token_budget = token_budget
+        self._lock = threading.Lock()
+        self._queries = 0
+        self._with_context = 0
+        self._snippets = 0
+        self._seconds = 0.0
+
+    @property
+    def version(self):
+        """Build id of the index, part of the reply cache key."""
+        return self.index.version
+
+    def context(self, text):
+        """
+        Return the snippets to add to the prompt of a message.
+
+        Snippets are taken best first; one that does not fit in the remaining
+        budget is skipped in favor of smaller, lower ranked ones.
+
+        Args:
+            text (str): Incoming message
+
+        Returns:
+            list[str]: Snippet texts, best first; empty if nothing matches
+        """
+        started = time.perf_counter()
+        snippets, budget = [], self.token_budget
+        for _, chunk_id in self.index.search(text, self.top_k):
+            snippet = self.index.chunk_text(chunk_id)
+            tokens = estimate_tokens(snippet)
+            if tokens <= budget:
+                snippets.append(snippet)
+                budget -= tokens
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._queries += 1
+            self._with_context += bool(snippets)
+            self._snippets += len(snippets)
+            self._seconds += elapsed
+        return snippets
+
+    def stats(self):
+        """
+        Return retrieval counters.
+
+        Returns:
+            dict: Index size and version, queries, queries with context, snippets and average latency
+        """
+        with self._lock:
+            queries, with_context, snippets, seconds = self._queries, self._with_context, self._snippets, self._seconds
+        return {"index_version": self.index.version, "chunks": len(self.index), "queries": queries,
+                "with_context": with_context, "snippets": snippets,
+                "avg_seconds": seconds / queries if queries else 0.0}
+
+
+def main(argv=None):
+    """Build or query a knowledge index."""
+    from app.config import Config
+
+    parser = argparse.ArgumentParser(description="Build or query the knowledge base index.")
+    parser.add_argument("--index", default=Config.RETRIEVAL_INDEX_PATH or "state/knowledge.index",
+                        help="index file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="index a document directory, reusing unchanged files")
+    build.add_argument("--docs", required=True, help="directory of .md and .txt documents")
+    build.add_argument("--chunk-chars", type=int, default=800, help="target maximum chunk length")
+    query = commands.add_parser("query", help="print the best chunks of a query")
+    query.add_argument("text")
+    query.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        print(json.dumps(build_index(args.docs, args.index, args.chunk_chars)))
+        return
+    index = KnowledgeIndex(args.index)
+    for score, chunk_id in index.search(args.text, args.top_k):
+        print(f"{score:6.2f}  {index.chunk_source(chunk_id)}: {index.chunk_text(chunk_id)[:200]!r}")
+
+
+if __name__ == "__main__":
+    main()
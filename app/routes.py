@@ -9,18 +9,30 @@ The webhook endpoint handles:
 - Webhook verification (GET requests)
 - Message processing (POST requests)
 - AI response generation and message sending
+- Ack-first mode that hands messages to the background worker pool, or
+  to the sender's worker process in sharded mode
+- Processing statistics (GET /stats)
+- Prometheus metrics (GET /metrics)
 
 Example:
     The webhook endpoint is automatically registered when the Flask app is created.
     WhatsApp will send webhook requests to this endpoint for message delivery.
 """
 
-from flask import Blueprint, current_app, request, jsonify
+import time
+
+from flask import Blueprint, Response, current_app, request, jsonify
 from app.errors import RetryableError
+from app.logging_setup import logging_stats
+from app.messages import group_by_sender
+from app.rate_limit import rate_limit_stats
+from app.resilience import resilience_stats
 
 
 # Blueprints
 webhook_verification_blueprint = Blueprint("webhook_verification_blueprint", __name__)
+stats_blueprint = Blueprint("stats_blueprint", __name__)
+metrics_blueprint = Blueprint("metrics_blueprint", __name__)
 
 
 @webhook_verification_blueprint.route("/", methods=["GET", "POST"])
@@ -46,23 +58,97 @@ def webhook_whatsapp():
         POST: JSON response with status confirmation
 
     Note:
-        This endpoint processes all message types but currently only handles
-        text messages. Other message types (media, location, etc.) are ignored.
+        Text messages and interactive replies (tapped buttons and list rows)
+        are answered; media and other message types are skipped.
     """
     # made for whatsapp checking webhooks
     if request.method == "GET":
         return current_app.whatsapp_client.verify_webhook(request) 
 
-    # unpack the webhook notifications, you can filter by update type later, this boilerplate is only for messages update
+    # unpack the webhook notifications from the raw body, status-only updates are skipped without parsing
     # add the try except block to ensure error code is sent to whatsapp only once 
     try:
-        messages = current_app.whatsapp_client.unpack_messages(request.get_json()) 
-        for message in messages: 
-            parsed_message = message["text"]["body"] 
-            reply_message = current_app.ai_client.generate_reply(parsed_message)    
-            receiver_phone_number = message["from"]   
-            current_app.whatsapp_client.send_message(reply_message, receiver_phone_number)   
+        started = time.perf_counter()
+        messages = current_app.whatsapp_client.decode_messages(request.get_data())
+        processor = current_app.message_processor
+        if current_app.metrics is not None:
+            current_app.metrics.observe_stage("unpack_messages", time.perf_counter() - started)
+            for message in messages:
+                current_app.metrics.count_message(message.type)
+        # skip messages that were already answered in an earlier delivery of this payload
+        messages = [message for message in messages if processor.claim(message)]
+        # debounce bursts of short messages per sender before they reach the workers
+        if current_app.coalescer is not None:
+            for message in messages:
+                current_app.coalescer.add(message)
+            return jsonify({"status": "accepted"}), 200
+        # ack-first mode: hand the messages to the background workers and return right away
+        if current_app.worker_pool is not None:
+            groups = list(group_by_sender(messages).values())
+            for index, sender_messages in enumerate(groups):
+                try:
+                    current_app.worker_pool.submit(sender_messages)
+                except RetryableError:
+                    # nothing from here on was enqueued, let the redelivery handle it
+                    for unqueued in groups[index:]:
+                        for message in unqueued:
+                            processor.release(message)
+                    raise
+            return jsonify({"status": "accepted"}), 200
+        processor.process_batch(messages)
     except RetryableError as error: 
         raise error 
     
     return jsonify({"status": "ok"}), 200 
+
+
+@stats_blueprint.route("/stats", methods=["GET"])
+def processing_stats():
+    """
+    Expose message processing statistics.
+
+    Returns:
+        JSON with the per-stage timings and, in background mode, the worker
+        pool queue depth, worker count and message counters (per worker
+        process in sharded mode), plus the
+        dedup, coalescer, reply cache, model routing, FAQ fast path,
+        retrieval, media download, reply delivery, rate limiter, retry,
+        circuit breaker, logging queue and outbox stats.
+    """
+    processor = current_app.message_processor
+    if current_app.worker_pool is not None:
+        stats = {"mode": current_app.config["MESSAGE_PROCESSING_MODE"], **current_app.worker_pool.stats()}
+    else:
+        stats = {"mode": "inline", "stages": processor.stats()}
+    stats["dedup"] = processor.dedup_stats()
+    stats["coalescer"] = current_app.coalescer.stats() if current_app.coalescer is not None else None
+    reply_cache = getattr(processor.ai_client, "reply_cache", None)
+    stats["reply_cache"] = reply_cache.stats() if reply_cache is not None else None
+    router = getattr(processor.ai_client, "router", None)
+    stats["routing"] = router.stats() if router is not None else None
+    faq = getattr(processor.ai_client, "faq", None)
+    stats["faq"] = faq.stats() if faq is not None else None
+    retriever = getattr(processor.ai_client, "retriever", None)
+    stats["retrieval"] = retriever.stats() if retriever is not None else None
+    stats["media"] = processor.media.stats() if processor.media is not None else None
+    stats["delivery"] = processor.delivery.stats()
+    stats["rate_limits"] = rate_limit_stats(processor.ai_client, processor.whatsapp_client)
+    stats["resilience"] = resilience_stats(processor.ai_client, processor.whatsapp_client)
+    stats["logging"] = logging_stats()
+    stats["outbox"] = current_app.outbox_sender.stats() if current_app.outbox_sender is not None else None
+    return jsonify(stats), 200
+
+
+@metrics_blueprint.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """
+    Expose metrics in the Prometheus text format.
+
+    Returns:
+        Stage latency and token histograms plus message, retry, 503 and
+        reply cache counters, summed over all worker processes when
+        METRICS_MULTIPROC_DIR is set; 404 if metrics are disabled.
+    """
+    if current_app.metrics is None:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(current_app.metrics.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,253 @@
+"""
+Model Routing
+
+This module picks the model and token budget of each completion. Most
+WhatsApp traffic is small talk ("thanks", "ok", "hi") that a small, fast
+model answers as well as the configured one, at a fraction of the latency
+and cost; detailed questions still go to the configured model.
+
+The router supports:
+- Model tiers: a model name and a max_tokens budget each
+- A cheap local classifier over length, script (language) and keyword
+  features, run on every message in microseconds
+- Pluggable classifiers: any object with a classify(text) method returning
+  a tier name, loaded from a "module:attribute" path
+- Per-tier routing decisions and completion latency for /stats
+
+Example:
+    router = ModelRouter([ModelTier("fast", "gpt-4o-mini", 60), ModelTier("default", "gpt-4o", 150)],
+                         HeuristicClassifier(simple_max_chars=40))
+    tier = router.route("thanks!")  # the fast tier
+"""
+
+import importlib
+import re
+import threading
+import unicodedata
+from dataclasses import dataclass
+
+from app.pipeline import StageStats
+
+
+FAST = "fast"
+DEFAULT = "default"
+
+# Small talk the fast tier answers well, in the languages the bot sees most
+SMALL_TALK = frozenset("""
+    hi hello hey yo thanks thank thx ty ok okay k sure yes no yep nope bye goodbye great cool nice good
+    morning evening night welcome please got it fine perfect
+    hola gracias adios vale bien si buenos buenas dias
+    salut merci oui non bonjour bonsoir
+    hallo danke tschuss ja nein
+    ola obrigado obrigada sim tchau
+    привет спасибо пока да нет ок хорошо здравствуйте добрый день
+    salem rakhmet raqmet
+""".split())
+
+# Words that ask for facts, advice or a transaction, which need the configured model
+COMPLEX_KEYWORDS = frozenset("""
+    price cost how why explain compare order refund return delivery shipping invoice payment
+    problem issue error broken complaint cancel account address schedule available recommend
+    precio cuanto como por pedido envio
+    prix commande livraison pourquoi comment
+    preis bestellung lieferung warum wie
+    цена стоимость сколько как почему заказ доставка оплата возврат проблема
+""".split())
+
+_WORDS = re.compile(r"\w+")
+
+
+@dataclass(frozen=True)
+class ModelTier:
+    """
+    Model and token budget of a class of messages.
+
+    Attributes:
+        name (str): Tier name returned by classifiers (e.g., "fast", "default")
+        model (str): OpenAI model name
+        max_tokens (int): Maximum number of tokens of a reply
+    """
+
+    name: str
+    model: str
+    max_tokens: int
+
+
+def scripts_of(text):
+    """
+    Return the writing systems of the letters in a text.
+
+    Args:
+        text (str): Message text
+
+    Returns:
+        set[str]: Lower-case script names such as "latin", "cyrillic", "arabic", "cjk"
+    """
+    scripts = set()
+    for char in text:
+        if char.isascii():
+            if char.isalpha():
+                scripts.add("latin")
+            continue
+        if not char.isalpha():
+            continue
+        name = unicodedata.name(char, "")
+        script = name.split(" ", 1)[0].lower()
+        scripts.add("cjk" if script in ("cjk", "hiragana", "katakana", "hangul") else script)
+    return scripts
+
+
+class HeuristicClassifier:
+    """
+    Feature-based classifier choosing between the fast and the default tier.
+
+    A message goes to the fast tier if it is short, written in a script the
+    fast model handles well, and does not ask for anything (no complex
+    keyword, no question mark). Pure small talk ("ok thanks?", "hi hi hi")
+    up to twice the length limit goes to the fast tier as well.
+
+    Attributes:
+        simple_max_chars (int): Longest message considered simple
+        fast_scripts (frozenset): Scripts the fast model is trusted with
+    """
+
+    def __init__(self, simple_max_chars=40, fast_scripts=("latin", "cyrillic")):
+        """
+        Initialize the classifier.
+
+        Args:
+            simple_max_chars (int): Longest message considered simple
+            fast_scripts (Iterable[str]): Scripts the fast model is trusted with
+        """
+        self.simple_max_chars = simple_max_chars
+        self.fast_scripts = frozenset(script.strip().lower() for script in fast_scripts if script.strip())
+
+    def classify(self, text):
+        """
+        Choose the tier of a message.
+
+        Args:
+            text (str): Message text
+
+        Returns:
+            str: FAST or DEFAULT
+        """
+        text = text.strip()
+        if not text or len(text) > 2 * self.simple_max_chars:
+            return DEFAULT
+        if not scripts_of(text) <= self.fast_scripts:
+            return DEFAULT
+        words = [word.lower() for word in _WORDS.findall(text)]
+        if any(word in COMPLEX_KEYWORDS for word in words):
+            return DEFAULT
+        if words and all(word in SMALL_TALK for word in words):
+            return FAST
+        if len(text) > self.simple_max_chars or "?" in text:
+            return DEFAULT
+        return FAST
+
+
+def load_classifier(path):
+    """
+    Load a custom classifier.
+
+    Args:
+        path (str): "module:attribute" of a class or factory called without
+                    arguments, returning an object with a classify(text) method
+
+    Returns:
+        object: Classifier instance
+
+    Raises:
+        ValueError: If the path cannot be imported or the object has no classify method
+    """
+    module_name, _, attribute = path.partition(":")
+    try:
+        classifier = getattr(importlib.import_module(module_name), attribute)()
+    except (ImportError, AttributeError, ValueError, TypeError) as error:
+        raise ValueError(f"Invalid routing classifier {path}: {error}")
+    if not callable(getattr(classifier, "classify", None)):
+        raise ValueError(f"Routing classifier {path} has no classify method")
+    return classifier
+
+
+class ModelRouter:
+    """
+    Chooses the model tier of each message and reports per-tier statistics.
+
+    Attributes:
+        tiers (dict): Tier name to ModelTier
+        classifier: Object with a classify(text) method returning a tier name
+        default_tier (str): Tier used for unknown classifier answers and classifier errors
+    """
+
+    def __init__(self, tiers, classifier, default_tier=DEFAULT):
+        """
+        Initialize the router.
+
+        Args:
+            tiers (Iterable[ModelTier]): Available tiers
+            classifier: Object with a classify(text) method returning a tier name
+            default_tier (str): Tier used for unknown classifier answers and classifier errors
+
+        Raises:
+            ValueError: If the default tier is not among the tiers
+        """
+        self.tiers = {tier.name: tier for tier in tiers}
+        if default_tier not in self.tiers:
+            raise ValueError(f"Unknown default model tier: {default_tier}")
+        self.classifier = classifier
+        self.default_tier = default_tier
+        self.latency = StageStats()
+        self._lock = threading.Lock()
+        self._decisions = dict.fromkeys(self.tiers, 0)
+        self._errors = 0
+
+    def route(self, text):
+        """
+        Choose the tier of a message and count the decision.
+
+        Args:
+            text (str): Message text
+
+        Returns:
+            ModelTier: Chosen tier
+        """
+        try:
+            name = self.classifier.classify(text)
+        except Exception:
+            name = None
+        tier = self.tiers.get(name)
+        with self._lock:
+            if tier is None:
+                self._errors += 1
+                tier = self.tiers[self.default_tier]
+            self._decisions[tier.name] += 1
+        return tier
+
+    def record_latency(self, tier, duration):
+        """
+        Record the duration of a completion of a tier.
+
+        Args:
+            tier (ModelTier): Tier of the completion
+            duration (float): Seconds from request to full reply, retries included
+        """
+        self.latency.record(tier.name, duration)
+
+    def stats(self):
+        """
+        Return routing decisions and per-tier latency.
+
+        Returns:
+            dict: Tier models, decision counters, unknown/failed classifications and latency aggregates
+        """
+        with self._lock:
+            decisions = dict(self._decisions)
+            errors = self._errors
+        return {
+            "tiers": {name: {"model": tier.model, "max_tokens": tier.max_tokens} for name, tier in self.tiers.items()},
+            "decisions": decisions,
+            "classifier_errors": errors,
+            "latency": self.latency.snapshot(),
+        }
@@ -0,0 +1,254 @@
+"""
+Fair Scheduling
+
+This module provides the queue between the webhook front end and the
+background workers. Instead of serving batches in arrival order, it queues
+each sender separately and serves senders in weighted fair order, so a
+spamming number or a misbehaving bot gets its share of the workers and no
+more, while other customers keep being answered.
+
+The scheduler supports:
+- Weighted fair queuing with virtual finish tags: each sender's batches are
+  served at a rate proportional to its weight, whatever it submits
+- Per-sender concurrency caps (1 by default, which also keeps each sender's
+  replies in order across workers)
+- Per-sender backlog caps, so one sender cannot fill the whole queue
+- Priority classes such as VIP numbers, configured as weights
+- Queue backlog, per-class wait times and the senders with the largest backlog
+
+Example:
+    scheduler = FairScheduler(max_queue_size=1000, classes=parse_priority_classes("vip=4:77010000000"))
+    scheduler.put("77010000000", batch)
+    sender, batch = scheduler.get()
+    ...
+    scheduler.done(sender)
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+from app.errors import RetryableError
+from app.pipeline import StageStats
+
+
+DEFAULT_CLASS = "default"
+
+
+def parse_priority_classes(spec):
+    """
+    Parse the priority classes setting.
+
+    Args:
+        spec (str): Classes separated by ";", each "name=weight:sender,sender",
+                    e.g. "vip=4:77010000000,77020000000;bulk=0.25:77990000000"
+
+    Returns:
+        dict: Sender id -> (class name, weight)
+
+    Raises:
+        ValueError: If a class is malformed or its weight is not positive
+    """
+    classes = {}
+    for item in (item.strip() for item in spec.split(";")):
+        if not item:
+            continue
+        try:
+            head, senders = item.split(":", 1)
+            name, weight = head.split("=", 1)
+            weight = float(weight)
+        except ValueError:
+            raise ValueError(f"Invalid priority class {item!r}, expected name=weight:sender,sender")
+        if weight <= 0:
+            raise ValueError(f"Priority class {name.strip()} needs a positive weight")
+        for sender in (sender.strip().lstrip("+") for sender in senders.split(",")):
+            if sender:
+                classes[sender] = (name.strip(), weight)
+    return classes
+
+
+class _SenderQueue:
+    """Queued batches and scheduling state of one sender."""
+
+    __slots__ = ("name", "weight", "items", "running", "last_finish", "waited", "served")
+
+    def __init__(self, name, weight):
+        self.name = name
+        self.weight = weight
+        self.items = deque()
+        self.running = 0
+        self.last_finish = 0.0
+        self.waited = 0.0
+        self.served = 0
+
+
+class FairScheduler:
+    """
+    Thread-safe weighted fair queue of sender batches.
+
+    Every batch gets a virtual finish tag, start + cost / weight, where start
+    is the later of the scheduler's virtual time and the sender's previous
+    finish tag; the eligible batch with the smallest tag is served next. A
+    sender that was idle starts at the current virtual time, so it cannot
+    save up credit, and a sender that submits a lot only pushes its own tags
+    further out.
+
+    Attributes:
+        max_queue_size (int): Maximum queued batches in total (0 = unbounded)
+        max_per_sender (int): Maximum batches of one sender processed at once
+        max_queued_per_sender (int): Maximum queued batches of one sender (0 = unbounded)
+        classes (dict): Sender id -> (class name, weight)
+    """
+
+    def __init__(self, max_queue_size=1000, max_per_sender=1, max_queued_per_sender=0, classes=None):
+        """
+        Initialize an empty scheduler.
+
+        Args:
+            max_queue_size (int): Maximum queued batches in total (0 = unbounded)
+            max_per_sender (int): Maximum batches of one sender processed at once
+            max_queued_per_sender (int): Maximum queued batches of one sender (0 = unbounded)
+            classes (dict, optional): Sender id -> (class name, weight), see parse_priority_classes
+        """
+        self.max_queue_size = max_queue_size
+        self.max_per_sender = max_per_sender
+        self.max_queued_per_sender = max_queued_per_sender
+        self.classes = classes or {}
+        self._condition = threading.Condition()
+        self._senders = {}
+        # (finish tag, sequence, sender) of the head batch of every sender that may run now
+        self._ready = []
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._queued = 0
+        self._running = 0
+        self._closed = False
+        self._rejected = 0
+        self._waits = StageStats()
+
+    def put(self, sender, item, cost=1.0):
+        """
+        Queue a batch of a sender.
+
+        Args:
+            sender (str): Sender WhatsApp id
+            item: Batch to hand to a worker
+            cost (float): Work of the batch, e.g. its number of messages
+
+        Raises:
+            RetryableError: If the queue or the sender's backlog is full, so WhatsApp redelivers later
+        """
+        with self._condition:
+            if self.max_queue_size and self._queued >= self.max_queue_size:
+                self._rejected += 1
+                raise RetryableError("Worker queue is full")
+            state = self._senders.get(sender)
+            if state is None:
+                name, weight = self.classes.get(sender, (DEFAULT_CLASS, 1.0))
+                state = self._senders[sender] = _SenderQueue(name, weight)
+            if self.max_queued_per_sender and len(state.items) >= self.max_queued_per_sender:
+                self._rejected += 1
+                raise RetryableError(f"Too many queued batches of sender {sender}")
+            start = max(self._virtual_time, state.last_finish)
+            state.last_finish = start + cost / state.weight
+            state.items.append((start, state.last_finish, time.monotonic(), item))
+            self._queued += 1
+            if len(state.items) == 1 and state.running < self.max_per_sender:
+                self._push_ready(sender, state)
+                self._condition.notify()
+
+    def get(self):
+        """
+        Wait for the next batch in fair order.
+
+        Returns:
+            tuple: (sender, batch), or None once the scheduler is closed and drained
+        """
+        with self._condition:
+            while not self._ready:
+                if self._closed and not self._queued:
+                    return None
+                self._condition.wait()
+            _, _, sender = heapq.heappop(self._ready)
+            state = self._senders[sender]
+            start, _, enqueued_at, item = state.items.popleft()
+            self._virtual_time = max(self._virtual_time, start)
+            self._queued -= 1
+            self._running += 1
+            state.running += 1
+            waited = time.monotonic() - enqueued_at
+            state.waited += waited
+            state.served += 1
+            self._waits.record(state.name, waited)
+            if state.items and state.running < self.max_per_sender:
+                self._push_ready(sender, state)
+            return sender, item
+
+    def done(self, sender):
+        """
+        Mark a batch of a sender as processed, letting its next batch run.
+
+        Args:
+            sender (str): Sender WhatsApp id passed with the batch by get()
+        """
+        with self._condition:
+            state = self._senders[sender]
+            state.running -= 1
+            self._running -= 1
+            if state.items and state.running == self.max_per_sender - 1:
+                self._push_ready(sender, state)
+            elif not state.items and not state.running:
+                # forget idle senders; a returning sender starts at the current virtual time
+                del self._senders[sender]
+            # wakes a worker for the released batch as well as join()
+            self._condition.notify_all()
+
+    def _push_ready(self, sender, state):
+        """Make the head batch of a sender eligible (condition held)."""
+        heapq.heappush(self._ready, (state.items[0][1], next(self._sequence), sender))
+
+    def close(self):
+        """Let get() return None to every worker once the queued batches are handed out."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def join(self):
+        """Block until no batch is queued or being processed."""
+        with self._condition:
+            while self._queued or self._running:
+                self._condition.wait()
+
+    def qsize(self):
+        """Return the number of queued batches."""
+        with self._condition:
+            return self._queued
+
+    def stats(self, top=10):
+        """
+        Return the backlog, per-class wait times and the senders with the most queued batches.
+
+        Args:
+            top (int): Number of senders listed
+
+        Returns:
+            dict: Backlog counters, wait time aggregates per class and per-sender details
+        """
+        now = time.monotonic()
+        with self._condition:
+            busiest = heapq.nlargest(top, self._senders.items(), key=lambda pair: (len(pair[1].items), pair[1].running))
+            senders = [{
+                "sender": sender,
+                "class": state.name,
+                "queued": len(state.items),
+                "running": state.running,
+                "oldest_wait_seconds": now - state.items[0][2] if state.items else 0.0,
+                "avg_wait_seconds": state.waited / state.served if state.served else 0.0,
+            } for sender, state in busiest if state.items or state.running]
+            stats = {"queued": self._queued, "running": self._running, "active_senders": len(self._senders),
+                     "rejected": self._rejected}
+        stats["wait_by_class"] = self._waits.snapshot()
+        stats["senders"] = senders
+        return stats
@@ -0,0 +1,151 @@
+"""
+Reply Segmentation
+
+This module cuts a streamed model completion into WhatsApp-sized segments at
+paragraph or sentence boundaries, so finished parts of a long answer can be
+sent to the user while the rest is still being generated, and splits complete
+replies that are longer than a WhatsApp message allows.
+
+The segmenter supports:
+- Incremental feeding with arbitrary token fragments
+- Paragraph boundaries first, sentence boundaries second
+- A minimum segment length, so short sentences are grouped together
+- A maximum segment length with a fallback cut at the last whitespace
+- split_reply: as few parts as possible for a complete reply, each cut at
+  the most natural boundary within the length limit
+
+Example:
+    segmenter = SentenceSegmenter(min_chars=80, max_chars=1000)
+    for token in stream:
+        for segment in segmenter.feed(token):
+            send(segment)
+    tail = segmenter.flush()
+
+    parts = split_reply(reply, max_chars=4096)
+"""
+
+import re
+
+
+# End of a sentence: terminal punctuation, optional closing quotes/brackets, then whitespace
+_SENTENCE_END = re.compile(r"[.!?…。！？][\"'”’)\]]*\s+")
+_PARAGRAPH_END = re.compile(r"\n\s*\n")
+_LINE_END = re.compile(r"\n")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class SentenceSegmenter:
+    """
+    Incrementally splits streamed text into complete segments.
+
+    Attributes:
+        min_chars (int): Minimum length of a sentence-boundary segment
+        max_chars (int): Maximum length of any segment
+    """
+
+    def __init__(self, min_chars=80, max_chars=1000):
+        """
+        Initialize an empty segmenter.
+
+        Args:
+            min_chars (int): Minimum length of a sentence-boundary segment
+            max_chars (int): Maximum length of any segment
+        """
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._buffer = ""
+
+    def feed(self, text):
+        """
+        Add streamed text and return the segments completed by it.
+
+        Args:
+            text (str): Next fragment of the completion
+
+        Returns:
+            list[str]: Complete segments, possibly empty
+        """
+        self._buffer += text
+        segments = []
+        while True:
+            cut = self._find_cut()
+            if cut is None:
+                break
+            segment, self._buffer = self._buffer[:cut].strip(), self._buffer[cut:].lstrip()
+            if segment:
+                segments.append(segment)
+        return segments
+
+    def flush(self):
+        """
+        Return the remaining text once the stream has ended.
+
+        Returns:
+            str: Remaining segment, or "" if nothing is buffered
+        """
+        segment, self._buffer = self._buffer.strip(), ""
+        return segment
+
+    def _find_cut(self):
+        """Return the index where the next segment ends, or None if it is not complete yet."""
+        buffer = self._buffer
+        window = buffer[:self.max_chars + 1]
+
+        paragraph = _PARAGRAPH_END.search(window)
+        if paragraph is not None and buffer[:paragraph.start()].strip():
+            return paragraph.end()
+
+        cut = None
+        for match in _SENTENCE_END.finditer(window):
+            if match.end() >= self.min_chars:
+                cut = match.end()
+                break
+        if cut is not None:
+            return cut
+
+        if len(buffer) > self.max_chars:
+            # no boundary in reach, cut at the last whitespace (or hard cut)
+            whitespace = window.rfind(" ", 0, self.max_chars)
+            return whitespace + 1 if whitespace > 0 else self.max_chars
+        return None
+
+
+def split_reply(text, max_chars=4096):
+    """
+    Split a complete reply into parts of at most max_chars characters.
+
+    Each part is filled as far as possible and cut at the last paragraph
+    break in reach, else the last line break, sentence end or whitespace. A
+    boundary in the first half of the part is not used, so a short first
+    paragraph does not become a message of its own; text without any
+    boundary is cut hard.
+
+    Args:
+        text (str): Complete reply
+        max_chars (int): Maximum length of a part
+
+    Returns:
+        list[str]: Stripped parts in order, empty for a blank reply
+    """
+    parts = []
+    text = text.strip()
+    while len(text) > max_chars:
+        cut = _best_cut(text, max_chars)
+        parts.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text:
+        parts.append(text)
+    return parts
+
+
+def _best_cut(text, max_chars):
+    """Return the index the next part of a reply longer than max_chars ends at."""
+    window = text[:max_chars + 1]
+    for boundary in (_PARAGRAPH_END, _LINE_END, _SENTENCE_END, _WHITESPACE):
+        cut = None
+        for match in boundary.finditer(window):
+            if max_chars // 2 <= len(window[:match.end()].rstrip()) <= max_chars:
+                cut = match.end()
+        if cut is not None:
+            return cut
+    return max_chars
@@ -0,0 +1,332 @@
+"""
+Service Construction
+
+This module builds the optional pipeline components from configuration
+values. It is shared by the Flask application factory (app/__init__.py) and
+the ASGI entry point (app/asgi.py), so both serving modes are configured by
+the same environment variables.
+
+Example:
+    config = config_to_dict(Config)
+    deduplicator = build_deduplicator(config)
+"""
+
+import os
+
+from app.conversations import ConversationStore
+from app.dedup import MessageDeduplicator
+from app.dispatcher import ShardedDispatcher
+from app.faq import FaqEngine
+from app.media import MediaDownloader, MediaHandler, load_media_processor
+from app.metrics import BotMetrics
+from app.outbox import Outbox, OutboxSender
+from app.phone import PhoneNormalizer, load_rules
+from app.rate_limit import create_rate_limiter
+from app.reply_cache import ReplyCache
+from app.resilience import CircuitBreaker, RetryPolicy
+from app.retrieval import KnowledgeIndex, Retriever
+from app.routing import DEFAULT, FAST, HeuristicClassifier, ModelRouter, ModelTier, load_classifier
+from app.scheduling import FairScheduler, parse_priority_classes
+from app.stores import create_store
+
+
+def config_to_dict(config_class):
+    """
+    Read the upper-case settings of a configuration class into a dict.
+
+    Args:
+        config_class (type): Configuration class (e.g., Config)
+
+    Returns:
+        dict: Setting name to value, like Flask's app.config
+    """
+    return {name: getattr(config_class, name) for name in dir(config_class) if name.isupper()}
+
+
+def build_reply_cache(config):
+    """
+    Build the reply cache, or None if it is disabled.
+
+    Args:
+        config (Mapping): Application configuration
+
+    Returns:
+        ReplyCache: Configured reply cache, or None
+    """
+    if config["REPLY_CACHE_BACKEND"] == "none":
+        return None
+    store = create_store(config["REPLY_CACHE_BACKEND"], int(config["REPLY_CACHE_MAX_ENTRIES"]),
+                         float(config["REPLY_CACHE_TTL_SECONDS"]), config["REPLY_CACHE_SQLITE_PATH"],
+                         int(config["REPLY_CACHE_MAX_BYTES"]))
+    return ReplyCache(store, float(config["REPLY_CACHE_TTL_SECONDS"]))
+
+
+def build_conversations(config):
+    """
+    Build the conversation memory, or None if it is disabled.
+
+    Args:
+        config (Mapping): Application configuration
+
+    Returns:
+        ConversationStore: Configured conversation store, or None
+    """
+    if config["CONVERSATION_MEMORY_ENABLED"].lower() != "true":
+        return None
+    return ConversationStore(int(config["CONVERSATION_MAX_TURNS"]), int(config["CONVERSATION_TOKEN_BUDGET"]),
+                             int(config["CONVERSATION_SUMMARY_TOKENS"]),
+                             float(config["CONVERSATION_IDLE_TTL_SECONDS"]),
+                             int(config["CONVERSATION_MAX_CONVERSATIONS"]))
+
+
+def build_router(config):
+    """
+    Build the model router, or None if routing is disabled.
+
+    Args:
+        config (Mapping): Application configuration
+
+    Returns:
+        ModelRouter: Router between the fast tier and the configured model, or None
+
+    Raises:
+        ValueError: If the custom classifier cannot be loaded
+    """
+    if config["MODEL_ROUTING_ENABLED"].lower() != "true":
+        return None
+    tiers = [ModelTier(FAST, config["MODEL_ROUTING_FAST_MODEL"], int(config["MODEL_ROUTING_FAST_MAX_TOKENS"])),
+             ModelTier(DEFAULT, config["OPENAI_MODEL"], int(config["OPENAI_MAX_TOKENS"]))]
+    if config["MODEL_ROUTING_CLASSIFIER"]:
+        classifier = load_classifier(config["MODEL_ROUTING_CLASSIFIER"])
+    else:
+        classifier = HeuristicClassifier(int(config["MODEL_ROUTING_SIMPLE_MAX_CHARS"]),
+                                         config["MODEL_ROUTING_FAST_SCRIPTS"].split(","))
+    return ModelRouter(tiers, classifier)
+
+
+def build_faq(config):
+    """
+    Build the FAQ fast path, or None if no FAQ file is configured.
+
+    Args:
+        config (Mapping): Application configuration
+
+    Returns:
+        FaqEngine: FAQ engine on the configured file, or None
+
+    Raises:
+        ValueError: If the FAQ file cannot be read or is malformed
+    """
+    if not config["FAQ_FILE"]:
+        return None
+    return FaqEngine(config["FAQ_FILE"], float(config["FAQ_MIN_COVERAGE"]), float(config["FAQ_FUZZY_CUTOFF"]),
+                     float(config["FAQ_RELOAD_SECONDS"]))
+
+
+def build_retriever(config):
+    """
+    Build the knowledge base retrieval stage, or None if no index is configured.
+
+    Args:
+        config (Mapping): Application configuration
+
+    Returns:
+        Retriever: Retriever on the memory-mapped index, or None
+
+    Raises:
+        ValueError: If the index file cannot be opened or is invalid
+    """
+    if not config["RETRIEVAL_INDEX_PATH"]:
+        return None
+    return Retriever(KnowledgeIndex(config["RETRIEVAL_INDEX_PATH"]), int(config["RETRIEVAL_TOP_K"]),
+                     int(config["RETRIEVAL_TOKEN_BUDGET"]))
+
+
+def build_media(config, whatsapp_client):
+    """
+    Build the media message handler, or None if media messages are skipped.
+
+    Args:
+        config (Mapping): Application configuration
+        whatsapp_client (WhatsAppClient): Client whose session downloads the media
+
+    Returns:
+        MediaHandler: Handler with the configured limits and processor, or None
+
+    Raises:
+        ValueError: If the custom processor cannot be loaded
+    """
+    if config["MEDIA_ENABLED"].lower() != "true":
+        return None
+    processor = load_media_processor(config["MEDIA_PROCESSOR"]) if config["MEDIA_PROCESSOR"] else None
+    downloader = MediaDownloader(whatsapp_client, int(config["MEDIA_MAX_BYTES"]),
+                                 int(config["MEDIA_MAX_CONCURRENT_DOWNLOADS"]), int(config["MEDIA_CHUNK_BYTES"]),
+                                 int(config["MEDIA_SPOOL_BYTES"]))
+    return MediaHandler(downloader, processor)
+
+
+def build_deduplicator(config):
+    """
+    Build the message deduplicator, or None if it is disabled.
+
+    Args:
+        config (Mapping): Application configuration
+
+    Returns:
+        MessageDeduplicator: Configured deduplicator, or None
+    """
+    if config["DEDUP_BACKEND"] == "none":
+        return None
+    store = create_store(config["DEDUP_BACKEND"], int(config["DEDUP_MAX_ENTRIES"]),
+                         float(config["DEDUP_TTL_SECONDS"]), config["DEDUP_SQLITE_PATH"])
+    return MessageDeduplicator(store, float(config["DEDUP_TTL_SECONDS"]))
+
+
+def build_rate_limiters(config):
+    """
+    Build the OpenAI and Graph API rate limiters.
+
+    Args:
+        config (Mapping): Application configuration
+
+    Returns:
+        tuple: (OpenAI RateLimiter, WhatsApp RateLimiter)
+    """
+    return build_rate_limiter(config, "openai"), build_rate_limiter(config, "whatsapp")
+
+
+def build_rate_limiter(config, name):
+    """
+    Build the rate limiter of one upstream.
+
+    Args:
+        config (Mapping): Application configuration
+        name (str): "openai" or "whatsapp"
+
+    Returns:
+        RateLimiter: Limiter of the upstream's requests (and tokens for OpenAI)
+    """
+    backend, path = config["RATE_LIMIT_BACKEND"], config["RATE_LIMIT_SQLITE_PATH"]
+    max_wait = float(config["RATE_LIMIT_MAX_WAIT_SECONDS"])
+    if name == "openai":
+        return create_rate_limiter("openai", backend, float(config["OPENAI_RATE_LIMIT_RPS"]),
+                                   float(config["OPENAI_RATE_LIMIT_TPM"]), max_wait, path)
+    return create_rate_limiter("whatsapp", backend, float(config["WHATSAPP_RATE_LIMIT_RPS"]), 0, max_wait, path)
+
+
+def build_resilience(config, name):
+    """
+    Build the retry policy and circuit breaker of one upstream.
+
+    Args:
+        config (Mapping): Application configuration
+        name (str): "openai" or "whatsapp"
+
+    Returns:
+        tuple: (RetryPolicy, CircuitBreaker or None if disabled)
+    """
+    policy = RetryPolicy(name, int(config["RETRY_MAX_ATTEMPTS"]), float(config["RETRY_BASE_DELAY_SECONDS"]),
+                         float(config["RETRY_MAX_DELAY_SECONDS"]),
+                         float(config[f"{name.upper()}_DEADLINE_SECONDS"]))
+    breaker = None
+    if int(config["CIRCUIT_BREAKER_FAILURES"]) > 0:
+        breaker = CircuitBreaker(name, int(config["CIRCUIT_BREAKER_FAILURES"]),
+                                 float(config["CIRCUIT_BREAKER_RESET_SECONDS"]))
+    return policy, breaker
+
+
+def build_metrics(config):
+    """
+    Build the metrics registry, or None if metrics are disabled.
+
+    Args:
+        config (Mapping): Application configuration
+
+    Returns:
+        BotMetrics: Metrics registry, or None
+    """
+    if config["METRICS_ENABLED"].lower() != "true":
+        return None
+    return BotMetrics(config["METRICS_MULTIPROC_DIR"] or None, float(config["METRICS_FLUSH_SECONDS"]))
+
+
+def build_phone_normalizer(config):
+    """
+    Build the recipient phone number normalizer.
+
+    Args:
+        config (Mapping): Application configuration
+
+    Returns:
+        PhoneNormalizer: Normalizer with the configured default regions and rewrite rules
+    """
+    rules = load_rules(config["PHONE_REWRITE_RULES"], config["PHONE_REWRITE_RULES_FILE"] or None)
+    return PhoneNormalizer(config["PHONE_DEFAULT_REGIONS"].split(","), rules, int(config["PHONE_CACHE_SIZE"]))
+
+
+def build_outbox(config):
+    """
+    Build the durable reply outbox, or None if it is disabled.
+
+    Args:
+        config (Mapping): Application configuration
+
+    Returns:
+        Outbox: Outbox on the configured database file, or None
+    """
+    if config["OUTBOX_ENABLED"].lower() != "true":
+        return None
+    return Outbox(config["OUTBOX_SQLITE_PATH"], int(config["OUTBOX_MAX_BATCH"]), float(config["OUTBOX_LEASE_SECONDS"]),
+                  float(config["OUTBOX_RETENTION_SECONDS"]))
+
+
+def build_outbox_sender(config, app, outbox, whatsapp_client):
+    """
+    Build the sender pool that delivers the outbox replies.
+
+    Args:
+        config (Mapping): Application configuration
+        app (Flask): Application whose context is pushed while sending
+        outbox (Outbox): Outbox to drain
+        whatsapp_client (WhatsAppClient): Client used to deliver replies
+
+    Returns:
+        OutboxSender: Sender pool, not started
+    """
+    return OutboxSender(app, outbox, whatsapp_client, int(config["OUTBOX_SENDER_CONCURRENCY"]),
+                        int(config["OUTBOX_MAX_ATTEMPTS"]), float(config["OUTBOX_RETRY_BASE_DELAY_SECONDS"]),
+                        float(config["OUTBOX_RETRY_MAX_DELAY_SECONDS"]))
+
+
+def build_dispatcher(config, processor):
+    """
+    Build the sender-affinity dispatcher of the sharded processing mode.
+
+    Args:
+        config (Mapping): Application configuration
+        processor (MessageProcessor): Front end processor whose claims are released on failure
+
+    Returns:
+        ShardedDispatcher: Dispatcher, not started
+    """
+    processes = int(config["SHARD_PROCESSES"]) or os.cpu_count() or 1
+    return ShardedDispatcher(config, processor, processes, int(config["SHARD_THREADS"]),
+                             int(config["SHARD_QUEUE_MAXSIZE"]))
+
+
+def build_scheduler(config):
+    """
+    Build the fair scheduler queueing sender batches for the background workers.
+
+    Args:
+        config (Mapping): Application configuration
+
+    Returns:
+        FairScheduler: Scheduler with the configured caps and priority classes
+
+    Raises:
+        ValueError: If the priority classes are malformed
+    """
+    return FairScheduler(int(config["WORKER_QUEUE_MAXSIZE"]), int(config["SCHEDULER_MAX_PER_SENDER"]),
+                         int(config["SCHEDULER_MAX_QUEUED_PER_SENDER"]),
+                         parse_priority_classes(config["SCHEDULER_PRIORITY_CLASSES"]))
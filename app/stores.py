@@ -0,0 +1,378 @@
+"""
+Key-Value Stores with TTL
+
+This module provides the small key-value stores used for state that must
+expire on its own, such as already processed WhatsApp message ids. Both
+backends share the same interface so the features built on top of them can
+switch between a per-process store and one shared by every gunicorn worker.
+
+The stores support:
+- In-memory LRU store with TTL, a bounded number of entries and an optional
+  size cap in bytes (O(1) operations)
+- SQLite store shared between processes on the same host, with the same
+  entry and size caps enforced by evicting the oldest writes
+- Atomic "add if absent" for claim/lock style usage
+
+Example:
+    store = MemoryTTLStore(max_entries=10000, default_ttl=3600)
+    store.add("wamid.123", "1")  # True, key claimed
+    store.add("wamid.123", "1")  # False, already present
+
+    shared = SQLiteTTLStore("state/dedup.sqlite3", default_ttl=3600)
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryTTLStore:
+    """
+    Thread-safe in-memory LRU store whose entries expire after a TTL.
+
+    Entries live in an OrderedDict ordered by last access, so lookups,
+    inserts and evictions of the least recently used entry are all O(1).
+    Expired entries are dropped lazily when they are read or reach the
+    front of the LRU order.
+
+    Attributes:
+        max_entries (int): Maximum number of entries kept in memory
+        default_ttl (float): TTL in seconds used when none is given (None = no expiry)
+        max_bytes (int): Maximum total size of keys and values (None = unlimited)
+    """
+
+    def __init__(self, max_entries=10000, default_ttl=None, max_bytes=None):
+        """
+        Initialize an empty store.
+
+        Args:
+            max_entries (int): Maximum number of entries kept in memory
+            default_ttl (float, optional): TTL in seconds used when none is given
+            max_bytes (int, optional): Maximum total size of keys and values in bytes
+        """
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size_of(key, value):
+        """Approximate the memory taken by an entry in bytes."""
+        return sys.getsizeof(key) + sys.getsizeof(value)
+
+    @property
+    def size_bytes(self):
+        """Approximate total size of the stored keys and values in bytes."""
+        return self._bytes
+
+    def _remove(self, key):
+        """Remove an entry and update the byte counter."""
+        value, _ = self._entries.pop(key)
+        self._bytes -= self._size_of(key, value)
+
+    def _expires_at(self, ttl):
+        """Compute the absolute expiry time for a TTL (None = never)."""
+        ttl = self.default_ttl if ttl is None else ttl
+        return time.monotonic() + ttl if ttl is not None else None
+
+    def _live_value(self, key, now):
+        """Return the entry for a key if it has not expired, dropping it otherwise."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            self._remove(key)
+            return None
+        return entry
+
+    def _insert(self, key, value, expires_at, now):
+        """Insert an entry and evict expired or least recently used ones."""
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, expires_at)
+        self._bytes += self._size_of(key, value)
+        while self._entries:
+            oldest_key, (_, oldest_expiry) = next(iter(self._entries.items()))
+            expired = oldest_expiry is not None and oldest_expiry <= now
+            over_bytes = self.max_bytes is not None and self._bytes > self.max_bytes
+            if not expired and not over_bytes and len(self._entries) <= self.max_entries:
+                break
+            self._remove(oldest_key)
+
+    def get(self, key):
+        """
+        Return the value stored for a key.
+
+        Args:
+            key (str): Entry key
+
+        Returns:
+            Stored value, or None if the key is missing or expired
+        """
+        with self._lock:
+            entry = self._live_value(key, time.monotonic())
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        """
+        Store a value, replacing any existing one.
+
+        Args:
+            key (str): Entry key
+            value: Value to store
+            ttl (float, optional): TTL in seconds, defaults to default_ttl
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._insert(key, value, self._expires_at(ttl), now)
+
+    def add(self, key, value, ttl=None):
+        """
+        Store a value only if the key is missing or expired.
+
+        Args:
+            key (str): Entry key
+            value: Value to store
+            ttl (float, optional): TTL in seconds, defaults to default_ttl
+
+        Returns:
+            bool: True if the value was stored, False if the key already exists
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._live_value(key, now) is not None:
+                return False
+            self._insert(key, value, self._expires_at(ttl), now)
+            return True
+
+    def delete(self, key):
+        """
+        Remove a key if present.
+
+        Args:
+            key (str): Entry key
+        """
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteTTLStore:
+    """
+    Key-value store with TTL backed by a SQLite database file.
+
+    Every gunicorn worker that points at the same file sees the same keys,
+    which makes it a lightweight local stand-in for Redis. Each thread gets
+    its own connection and the database runs in WAL mode so readers never
+    block the writer.
+
+    The caps are shared by all processes. When the table exceeds one, the
+    expired rows are purged, then the least recently written ones. Reads do
+    not refresh an entry, since a write per cache hit would serialize the
+    workers on the database lock. Counting the rows and their size scans
+    the table, so the caps are checked once every CAP_CHECK_EVERY writes of
+    a process and may be exceeded by that many rows in between.
+
+    Attributes:
+        path (str): Path to the SQLite database file
+        default_ttl (float): TTL in seconds used when none is given (None = no expiry)
+        max_entries (int): Maximum number of rows (None = unlimited)
+        max_bytes (int): Maximum total size of keys and values in bytes (None = unlimited)
+    """
+
+    # Expired rows are purged once every this many writes
+    PURGE_EVERY = 1000
+    # The entry and size caps are enforced once every this many writes
+    CAP_CHECK_EVERY = 100
+
+    def __init__(self, path, default_ttl=None, max_entries=None, max_bytes=None):
+        """
+        Initialize the store and create its table if needed.
+
+        Args:
+            path (str): Path to the SQLite database file
+            default_ttl (float, optional): TTL in seconds used when none is given
+            max_entries (int, optional): Maximum number of rows
+            max_bytes (int, optional): Maximum total size of keys and values in bytes
+        """
+        self.path = path
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS kv ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+
+    def _connection(self):
+        """Return this thread's connection, opening it on first use."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _expires_at(self, ttl):
+        """Compute the absolute expiry time for a TTL (None = never)."""
+        ttl = self.default_ttl if ttl is None else ttl
+        return time.time() + ttl if ttl is not None else None
+
+    def _after_write(self, connection):
+        """Purge expired rows every PURGE_EVERY writes and enforce the caps every CAP_CHECK_EVERY writes."""
+        with self._lock:
+            self._writes += 1
+            writes = self._writes
+        capped = self.max_entries is not None or self.max_bytes is not None
+        if capped and writes % self.CAP_CHECK_EVERY == 0:
+            self._enforce_caps(connection)
+        elif writes % self.PURGE_EVERY == 0:
+            connection.execute("DELETE FROM kv WHERE expires_at <= ?", (time.time(),))
+
+    def _over_caps(self, connection):
+        """Return whether the table holds more rows or bytes than the caps allow."""
+        entries, size = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(length(CAST(key AS BLOB)) + length(CAST(value AS BLOB))), 0) FROM kv"
+        ).fetchone()
+        return ((self.max_entries is not None and entries > self.max_entries)
+                or (self.max_bytes is not None and size > self.max_bytes)), entries, size
+
+    def _enforce_caps(self, connection):
+        """Delete expired rows, then the oldest writes, until the table fits the caps."""
+        over, _, _ = self._over_caps(connection)
+        if not over:
+            return
+        connection.execute("DELETE FROM kv WHERE expires_at <= ?", (time.time(),))
+        over, entries, size = self._over_caps(connection)
+        if not over:
+            return
+        # INSERT OR REPLACE gives a rewritten key a new rowid, so rowid order is write order
+        excess_entries = entries - self.max_entries if self.max_entries is not None else 0
+        excess_bytes = size - self.max_bytes if self.max_bytes is not None else 0
+        cutoff = None
+        rows = connection.execute(
+            "SELECT rowid, length(CAST(key AS BLOB)) + length(CAST(value AS BLOB)) FROM kv ORDER BY rowid")
+        for cutoff, row_bytes in rows:
+            excess_entries -= 1
+            excess_bytes -= row_bytes
+            if excess_entries <= 0 and excess_bytes <= 0:
+                break
+        rows.close()
+        connection.execute("DELETE FROM kv WHERE rowid <= ?", (cutoff,))
+
+    def get(self, key):
+        """
+        Return the value stored for a key.
+
+        Args:
+            key (str): Entry key
+
+        Returns:
+            str: Stored value, or None if the key is missing or expired
+        """
+        row = self._connection().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl=None):
+        """
+        Store a value, replacing any existing one.
+
+        Args:
+            key (str): Entry key
+            value (str): Value to store
+            ttl (float, optional): TTL in seconds, defaults to default_ttl
+        """
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, self._expires_at(ttl)),
+            )
+            self._after_write(connection)
+
+    def add(self, key, value, ttl=None):
+        """
+        Store a value only if the key is missing or expired.
+
+        The check and the write happen in a single statement, so two processes
+        racing for the same key cannot both succeed.
+
+        Args:
+            key (str): Entry key
+            value (str): Value to store
+            ttl (float, optional): TTL in seconds, defaults to default_ttl
+
+        Returns:
+            bool: True if the value was stored, False if the key already exists
+        """
+        with self._connection() as connection:
+            cursor = connection.execute(
+                "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+                "WHERE kv.expires_at IS NOT NULL AND kv.expires_at <= ?",
+                (key, value, self._expires_at(ttl), time.time()),
+            )
+            self._after_write(connection)
+            return cursor.rowcount == 1
+
+    def delete(self, key):
+        """
+        Remove a key if present.
+
+        Args:
+            key (str): Entry key
+        """
+        with self._connection() as connection:
+            connection.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def __len__(self):
+        row = self._connection().execute(
+            "SELECT COUNT(*) FROM kv WHERE expires_at IS NULL OR expires_at > ?", (time.time(),)
+        ).fetchone()
+        return row[0]
+
+
+def create_store(backend, max_entries=10000, default_ttl=None, sqlite_path=None, max_bytes=None):
+    """
+    Build a store from configuration values.
+
+    Args:
+        backend (str): "memory" or "sqlite"
+        max_entries (int): Maximum number of entries
+        default_ttl (float, optional): Default TTL in seconds
+        sqlite_path (str, optional): Database path for the sqlite backend
+        max_bytes (int, optional): Size cap in bytes
+
+    Returns:
+        MemoryTTLStore | SQLiteTTLStore: Configured store
+
+    Raises:
+        ValueError: If the backend name is unknown
+    """
+    if backend == "memory":
+        return MemoryTTLStore(max_entries=max_entries, default_ttl=default_ttl, max_bytes=max_bytes)
+    if backend == "sqlite":
+        return SQLiteTTLStore(sqlite_path, default_ttl=default_ttl, max_entries=max_entries, max_bytes=max_bytes)
+    raise ValueError(f"Unknown store backend: {backend}")
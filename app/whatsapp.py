@@ -8,8 +8,13 @@ webhook payloads.
 The client supports:
 - Webhook verification for WhatsApp Business API setup
 - Message sending to WhatsApp users
-- Message extraction from incoming webhooks
-- Phone number formatting (to be implemented)
+- Message extraction from every entry and change of incoming webhooks,
+  decoded from the raw body with status-only updates skipped early
+- Memoized E.164 phone number normalization with country rewrite rules
+- Pooled keep-alive HTTP session with connect/read timeouts, created on the
+  first send of each process (requests is imported then, not at start-up)
+- Optional client-side rate limiting, with 429s treated as retryable
+- Retries with jittered backoff and an optional circuit breaker
 
 Example:
     client = WhatsAppClient(
@@ -20,11 +25,14 @@ Example:
     )
 """
 
-import requests 
-from app.errors import RetryableError
-
-import phonenumbers
-from phonenumbers import PhoneNumberFormat, NumberParseException
+import json
+import os
+import threading
+from app.errors import RateLimitError, RetryableError
+from app.lazy import after_fork
+from app.decoding import decode_webhook, extract_messages, iter_messages
+from app.phone import PhoneNormalizer
+from app.resilience import RetryPolicy
 
 
 class WhatsAppClient:
@@ -40,9 +48,23 @@ class WhatsAppClient:
         webhook_verify_token (str): Token for webhook verification
         access_token (str): Access token for API authentication
         phone_number_id (str): WhatsApp phone number ID for sending messages
+        messages_url (str): Precomputed Graph API endpoint for sending messages
+        timeout (tuple): Connect and read timeouts in seconds
+        headers (dict): Headers of every Graph API request
+        pool_size (int): Maximum number of kept-alive connections to the API host
+        session (requests.Session): Pooled keep-alive session reused for every call of this process
+        rate_limiter (RateLimiter): Optional limiter of outgoing messages
+        retry_policy (RetryPolicy): Retries of failed sends (a single attempt by default)
+        circuit_breaker (CircuitBreaker): Optional breaker failing fast while the Graph API is down
+        phone_normalizer (PhoneNormalizer): Normalizer of recipient numbers
     """
 
-    def __init__(self, api_url, webhook_verify_token, access_token, phone_number_id):
+    # Graph API error codes of throughput and rate limits, reported with HTTP 400
+    RATE_LIMIT_ERROR_CODES = frozenset({4, 80007, 130429, 131056})
+
+    def __init__(self, api_url, webhook_verify_token, access_token, phone_number_id,
+                 pool_size=10, connect_timeout=3.05, read_timeout=10.0, rate_limiter=None,
+                 retry_policy=None, circuit_breaker=None, phone_normalizer=None):
         """
         Initialize WhatsApp client with API credentials.
 
@@ -52,11 +74,63 @@ class WhatsAppClient:
             webhook_verify_token (str): Token used for webhook verification
             access_token (str): Access token for API authentication
             phone_number_id (str): WhatsApp phone number ID for sending messages
+            pool_size (int): Maximum number of kept-alive connections to the API host
+            connect_timeout (float): Seconds to wait for a TCP/TLS connection
+            read_timeout (float): Seconds to wait for the API response
+            rate_limiter (RateLimiter, optional): Limiter of outgoing messages
+            retry_policy (RetryPolicy, optional): Retries of failed sends
+            circuit_breaker (CircuitBreaker, optional): Breaker of the Graph API
+            phone_normalizer (PhoneNormalizer, optional): Normalizer of recipient numbers,
+                                                          plain E.164 by default
         """
         self.api_url = api_url 
         self.webhook_verify_token = webhook_verify_token
         self.access_token = access_token
         self.phone_number_id = phone_number_id
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy("whatsapp", max_attempts=1)
+        self.circuit_breaker = circuit_breaker
+        self.phone_normalizer = phone_normalizer if phone_normalizer is not None else PhoneNormalizer()
+
+        # Precomputed once, every reply goes to the same endpoint with the same headers
+        self.messages_url = f"{self.api_url}/{self.phone_number_id}/messages"
+        self.timeout = (connect_timeout, read_timeout)
+        self.headers = {
+            "Authorization": f"Bearer {self.access_token}",
+            "Content-Type": "application/json",
+            "Connection": "keep-alive",
+        }
+        self.pool_size = pool_size
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+        # the lock may be held by another thread of the parent when a worker is forked
+        after_fork(self, WhatsAppClient._reset_session_lock)
+
+    @property
+    def session(self):
+        """
+        requests.Session: Pooled keep-alive session, created on first use.
+
+        A process forked after that creates its own, so workers never share
+        the parent's connections.
+        """
+        if self._session_pid != os.getpid():
+            with self._session_lock:
+                if self._session_pid != os.getpid():
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    session.headers.update(self.headers)
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session, self._session_pid = session, os.getpid()
+        return self._session
+
+    def _reset_session_lock(self):
+        self._session_lock = threading.Lock()
 
     def verify_webhook(self, request): 
         """
@@ -75,8 +149,24 @@ class WhatsAppClient:
         Raises:
             PermissionError: If verification token doesn't match
         """
-        if request.args.get("hub.verify_token") == self.webhook_verify_token:
-            return request.args.get("hub.challenge") 
+        return self.verify_token(request.args.get("hub.verify_token"), request.args.get("hub.challenge"))
+
+    def verify_token(self, verify_token, challenge):
+        """
+        Verify a webhook subscription request from its query parameters.
+
+        Args:
+            verify_token (str): The hub.verify_token query parameter
+            challenge (str): The hub.challenge query parameter
+
+        Returns:
+            str: Challenge string to be returned to WhatsApp
+
+        Raises:
+            PermissionError: If verification token doesn't match
+        """
+        if verify_token == self.webhook_verify_token:
+            return challenge
         raise PermissionError("Webhook verification token mismatch")
 
     def unpack_messages(self, json_request): 
@@ -84,8 +174,8 @@ class WhatsAppClient:
         Extract messages from WhatsApp webhook JSON payload.
 
         Parses the complex nested JSON structure from WhatsApp webhooks to
-        extract individual messages. This handles the specific format used
-        by WhatsApp Business API webhooks.
+        extract individual messages. Every entry and every change of a batched
+        webhook is walked, so no message is dropped.
 
         Args:
             json_request (dict): JSON payload from WhatsApp webhook
@@ -96,60 +186,77 @@ class WhatsAppClient:
         Raises:
             RetryableError: If JSON structure is invalid or missing expected fields
         """
-        try: 
-            update_payload = json_request["entry"][0]["changes"][0]["value"]
-            if "messages" in update_payload: 
-                return update_payload["messages"] 
-            else: 
-                return [] 
-        except (KeyError, IndexError, TypeError) as error: 
-            raise RetryableError(f"Error during json extraction: {error}") 
+        return [message for message, _ in iter_messages(json_request)]
+
+    def extract_messages(self, json_request):
+        """
+        Extract typed messages from every entry and change of a webhook payload.
+
+        Args:
+            json_request (dict): JSON payload from WhatsApp webhook
+
+        Returns:
+            list[InboundMessage]: Flat list of messages in payload order
+
+        Raises:
+            RetryableError: If JSON structure is invalid or missing expected fields
+        """
+        return extract_messages(json_request)
+
+    def decode_messages(self, body):
+        """
+        Decode typed messages from a raw webhook body.
+
+        Status-only updates are recognized without parsing the JSON.
+
+        Args:
+            body (bytes): Raw request body
+
+        Returns:
+            list[InboundMessage]: Flat list of messages in payload order
+
+        Raises:
+            ValueError: If the body is not valid JSON
+            RetryableError: If JSON structure is invalid or missing expected fields
+        """
+        return decode_webhook(body)
 
     def format_wa_phone_number(self, raw_wa_id: str) -> str:
         """
-        Format WhatsApp phone number to international format.
+        Format a WhatsApp id or phone number for the Graph API.
 
-        Converts WhatsApp phone number ID to properly formatted international
-        phone number format for Kazakhstan numbers.
+        Normalizes the number to E.164 and applies the configured
+        country-specific rewrite rules; results are memoized.
 
         Args:
-            raw_wa_id (str): Raw WhatsApp phone number ID
+            raw_wa_id (str): Raw WhatsApp id or phone number
 
         Returns:
-            str: Formatted international phone number for Kazakhstan numbers
+            str: E.164 digits without "+", after the rewrite rules
 
-        Note:
-            This method is currently a placeholder and needs implementation.
+        Raises:
+            ValueError: If the number contains no digits
         """
-        try:
-            raw_wa_id = raw_wa_id[0] + str(8) + raw_wa_id[1:] 
-            return raw_wa_id 
-        except Exception as error:
-            raise RetryableError(f"Error during number formating: {error}") 
+        return self.phone_normalizer.normalize(raw_wa_id)
 
     def send_message(self, message_text, receiver_phone_number): 
         """
         Send text message to WhatsApp user.
 
         Sends a text message to a specific WhatsApp user using the WhatsApp
-        Business API. Handles API errors and retryable failures appropriately.
+        Business API. Handles API errors and retryable failures appropriately;
+        transient failures are retried with backoff within the call's deadline.
 
         Args:
             message_text (str): Text content to send
             receiver_phone_number (str): Recipient's phone number
 
         Raises:
-            RetryableError: If API returns 5xx errors or network issues occur
+            RetryableError: If API returns 5xx or rate limit errors, the rate limiter
+                            would wait too long, or network issues occur, and the
+                            retry policy gives up
+            CircuitOpenError: If the Graph API circuit breaker is open
         """
-        from flask import current_app
-
-        url = f"{self.api_url}/{self.phone_number_id}/messages"
-
-        headers = {
-            "Authorization": f"Bearer {self.access_token}",
-            "Content-Type": "application/json"
-        }
-
         payload = {
             "messaging_product": "whatsapp",
             "to": self.format_wa_phone_number(receiver_phone_number),
@@ -159,14 +266,60 @@ class WhatsAppClient:
                 "body": message_text
             }
         }
+        self.retry_policy.call(lambda timeout: self._post_message(payload, timeout), self.circuit_breaker)
+
+    def _post_message(self, payload, timeout=None):
+        """
+        Post one message payload to the Graph API (a single attempt).
+
+        Args:
+            payload (dict): Graph API message payload
+            timeout (float, optional): Seconds left until the call's deadline
+        """
+        from flask import current_app
+        from requests import RequestException
+
+        session = self.session
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        connect_timeout, read_timeout = self.timeout
+        if timeout is not None:
+            read_timeout = max(0.001, min(read_timeout, timeout))
         try: 
-            response = requests.post(url, headers=headers, json=payload) 
+            response = session.post(self.messages_url, json=payload, timeout=(connect_timeout, read_timeout)) 
+            if self.is_rate_limited(response.status_code, response.content):
+                if self.rate_limiter is not None:
+                    self.rate_limiter.on_rate_limited(response.headers)
+                raise RateLimitError(f"WhatsApp API rate limited: {response.status_code}")
+            if self.rate_limiter is not None and response.ok:
+                self.rate_limiter.on_success(response.headers)
             if not response.ok: 
                 if 500 <= response.status_code < 600:
                     raise RetryableError(f"WhatsApp API 5xx error: {response.status_code}")
 
                 current_app.logger.warning(
-                    f"WhatsApp API non-retryable error ({response.status_code}): {response.text}"
+                    "WhatsApp API non-retryable error (%s): %s", response.status_code, response.text
                 ) 
-        except requests.RequestException as error: 
+        except RequestException as error: 
             raise RetryableError(f"Error sending message: {error}") 
+
+    def is_rate_limited(self, status_code, body):
+        """
+        Tell whether a Graph API response reports a rate or throughput limit.
+
+        Args:
+            status_code (int): HTTP status code
+            body (bytes): Response body
+
+        Returns:
+            bool: True for 429s and rate limit error codes
+        """
+        if status_code == 429:
+            return True
+        if status_code != 400:
+            return False
+        try:
+            code = json.loads(body)["error"]["code"]
+        except (ValueError, KeyError, TypeError):
+            return False
+        return code in self.RATE_LIMIT_ERROR_CODES
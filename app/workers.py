@@ -0,0 +1,185 @@
+"""
+Background Worker Pool
+
+This module provides the in-process worker pool used by the ack-first webhook
+mode. The webhook route only validates the payload and enqueues the messages;
+a fixed number of worker threads then generate and send the replies, so the
+HTTP response is returned to WhatsApp before any OpenAI round-trip happens.
+
+The pool supports:
+- Bounded work queue with a configurable maximum size, served in weighted
+  fair order across senders (app.scheduling)
+- Configurable number of worker threads
+- Queue depth, worker count and per-stage timing statistics
+- Graceful shutdown that drains already queued messages
+
+Example:
+    pool = WorkerPool(app, app.message_processor, size=4, max_queue_size=1000)
+    pool.start()
+    pool.submit(sender_messages)
+    pool.stats()
+"""
+
+import threading
+import time
+
+from app.errors import RetryableError
+from app.scheduling import FairScheduler
+
+
+class WorkerPool:
+    """
+    Fixed-size pool of threads that process queued WhatsApp messages.
+
+    Attributes:
+        app (Flask): Application whose context is pushed for every message
+        processor (MessageProcessor): Pipeline used to handle a message
+        size (int): Number of worker threads
+        max_queue_size (int): Maximum number of queued messages (0 = unbounded)
+        scheduler (FairScheduler): Queue of sender batches, served in fair order
+    """
+
+    def __init__(self, app, processor, size=4, max_queue_size=1000, scheduler=None):
+        """
+        Initialize the worker pool without starting it.
+
+        Args:
+            app (Flask): Application whose context is pushed for every message
+            processor (MessageProcessor): Pipeline used to handle a message
+            size (int): Number of worker threads
+            max_queue_size (int): Maximum number of queued messages (0 = unbounded)
+            scheduler (FairScheduler, optional): Queue of sender batches; by default a fair
+                                                 scheduler of max_queue_size with one batch per sender at a time
+        """
+        self.app = app
+        self.processor = processor
+        self.size = size
+        self.max_queue_size = max_queue_size
+        self.scheduler = scheduler if scheduler is not None else FairScheduler(max_queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._processed = 0
+        self._failed = 0
+
+    def start(self):
+        """Start the worker threads. Calling it on a running pool does nothing."""
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.size):
+                thread = threading.Thread(
+                    target=self._run, name=f"whatsapp-worker-{index}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """
+        Stop the worker threads after the queued messages are processed.
+
+        Args:
+            timeout (float, optional): Maximum seconds to wait for each thread
+        """
+        with self._lock:
+            threads, self._threads = self._threads, []
+        self.scheduler.close()
+        for thread in threads:
+            thread.join(timeout)
+
+    def submit(self, messages):
+        """
+        Enqueue one sender's messages for background processing.
+
+        The messages are processed in order by a single worker; batches of
+        different senders are taken in fair order, not in arrival order.
+
+        Args:
+            messages (list[InboundMessage]): One sender's messages in arrival order
+
+        Raises:
+            RetryableError: If the queue or the sender's backlog is full, so WhatsApp redelivers later
+        """
+        self.scheduler.put(messages[0].sender, (messages, time.perf_counter()), len(messages))
+
+    def submit_detached(self, messages):
+        """
+        Enqueue messages from outside a webhook request (e.g., the coalescer).
+
+        There is no request to answer with a 503 here, so a full queue is
+        logged and the message claims are released instead.
+
+        Args:
+            messages (list[InboundMessage]): One sender's messages in arrival order
+        """
+        try:
+            self.submit(messages)
+        except RetryableError as error:
+            self.app.logger.warning("Dropping %d message(s): %s", len(messages), error)
+            for message in messages:
+                self.processor.release(message)
+
+    def _run(self):
+        """Worker thread loop: process batches until the scheduler is closed and drained."""
+        while True:
+            scheduled = self.scheduler.get()
+            if scheduled is None:
+                return
+            sender, (messages, enqueued_at) = scheduled
+            try:
+                self.processor.record_stage("queue_wait", time.perf_counter() - enqueued_at)
+                self._handle(messages)
+            finally:
+                self.scheduler.done(sender)
+
+    def _handle(self, messages):
+        """
+        Process one sender's messages inside the application context.
+
+        Errors are logged rather than raised: the webhook has already been
+        acknowledged, so there is nobody left to return a 503 to.
+        """
+        processed = []
+        with self._lock:
+            self._in_flight += 1
+        try:
+            with self.app.app_context():
+                try:
+                    self.processor.process_sequence(messages, processed.append)
+                except RetryableError as error:
+                    self.app.logger.warning("Background processing failed: %s", error)
+                except Exception:
+                    self.app.logger.exception("Unhandled exception in background worker:")
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                # messages after a failure were not processed either, like in the sharded mode
+                self._processed += len(processed)
+                self._failed += len(messages) - len(processed)
+
+    def join(self):
+        """Block until every queued message has been processed."""
+        self.scheduler.join()
+
+    def stats(self):
+        """
+        Return queue, worker and timing statistics.
+
+        Returns:
+            dict: Queue depth, worker count, message counters, stage timings and fair scheduling stats
+        """
+        with self._lock:
+            workers = len(self._threads)
+            in_flight = self._in_flight
+            processed = self._processed
+            failed = self._failed
+        return {
+            "queue_depth": self.scheduler.qsize(),
+            "max_queue_size": self.max_queue_size,
+            "workers": workers,
+            "in_flight": in_flight,
+            "processed": processed,
+            "failed": failed,
+            "stages": self.processor.stats(),
+            "scheduler": self.scheduler.stats(),
+        }
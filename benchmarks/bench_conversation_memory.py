@@ -0,0 +1,56 @@
+"""
+Conversation Memory Benchmark
+
+Measures the memory taken by the conversation store for a number of active
+conversations with full ring buffers, and the time and size of building a
+prompt as conversations grow.
+
+Example:
+    python -m benchmarks.bench_conversation_memory --conversations 10000 --turns 10
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from app.conversations import ConversationStore, estimate_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=10000, help="active conversations")
+    parser.add_argument("--turns", type=int, default=10, help="turns kept per conversation")
+    parser.add_argument("--exchanges", type=int, default=20, help="exchanges recorded per conversation")
+    parser.add_argument("--token-budget", type=int, default=1000, help="history token budget")
+    args = parser.parse_args()
+
+    store = ConversationStore(max_turns=args.turns, token_budget=args.token_budget,
+                              max_conversations=args.conversations)
+    message = "Hello, I would like to know whether you deliver to my district tomorrow."
+    reply = "Yes, we deliver to every district of the city. Orders before 18:00 arrive the next day."
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for index in range(args.conversations):
+        sender = f"7700{index:07d}"
+        for _ in range(args.exchanges):
+            store.record_exchange(sender, message, reply)
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    print(f"{len(store)} conversations x {args.turns} turns: {used / 1024 / 1024:.1f} MiB "
+          f"({used / len(store):.0f} bytes per conversation)")
+
+    sender = "77000000000"
+    iterations = 10000
+    started = time.perf_counter()
+    for _ in range(iterations):
+        messages = store.build_messages(sender, message)
+    elapsed = (time.perf_counter() - started) / iterations
+    prompt_tokens = sum(estimate_tokens(item["content"]) for item in messages)
+    print(f"build_messages: {elapsed * 1e6:.1f} us, {len(messages)} messages, ~{prompt_tokens} tokens "
+          f"(budget {args.token_budget} + new prompt)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Webhook Decoding Benchmark
+
+Compares the previous webhook handling, json.loads of the whole body
+followed by the extraction walk, with app.decoding.decode_webhook on the
+raw body, for a status callback and for a text message payload from
+tests/resources.
+
+Example:
+    python -m benchmarks.bench_decoding --iterations 20000
+"""
+
+import argparse
+import json
+import time
+
+from app.decoding import JSON_BACKEND, decode_webhook, extract_messages
+from benchmarks.harness import RESOURCES
+
+
+def _per_call(iterations, call, body):
+    """Return the mean seconds per call(body)."""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        call(body)
+    return (time.perf_counter() - started) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000, help="decodes per scenario")
+    args = parser.parse_args()
+
+    print(f"JSON backend: {JSON_BACKEND}")
+    for name in ("other_update.json", "text_message_update.json"):
+        body = (RESOURCES / name).read_bytes()
+        before = _per_call(args.iterations, lambda raw: extract_messages(json.loads(raw)), body)
+        after = _per_call(args.iterations, decode_webhook, body)
+        print(f"{name:<28} json.loads + extract {before * 1e6:7.2f} us  decode_webhook {after * 1e6:7.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Multi-Part Delivery Benchmark
+
+Sends --replies long replies of --chars characters through the reply
+delivery to the local Graph API stub with --latency seconds per request,
+split into parts of at most --max-part-chars. Reports the time to the last
+part of a reply, the time per part, the TCP connections opened and whether
+every reply arrived in order, with the client's pooled session and with a
+new connection per part.
+
+Example:
+    python -m benchmarks.bench_delivery --replies 50 --chars 9000 --latency 0.02
+"""
+
+import argparse
+import statistics
+import time
+
+from flask import Flask
+
+from app.delivery import ReplyDelivery
+from app.segmenter import split_reply
+from app.whatsapp import WhatsAppClient
+from benchmarks.stubs import GraphStubServer
+
+
+SENTENCE = "Your order ships from the Almaty warehouse within two working days. "
+
+
+class NewConnectionClient(WhatsAppClient):
+    """Client posting every message on a new connection, without the pooled session."""
+
+    def _post_message(self, payload, timeout=None):
+        import requests
+
+        requests.post(self.messages_url, json=payload, headers=self.headers, timeout=self.timeout)
+
+
+def run(client_class, args):
+    """Return (reply seconds, part seconds, connections, replies in order) of one mode."""
+    reply = (SENTENCE * (args.chars // len(SENTENCE) + 1))[:args.chars]
+    expected = split_reply(reply, args.max_part_chars)
+    timings = {"send": [], "send_part": []}
+    with GraphStubServer(latency=args.latency) as graph, Flask(__name__).app_context():
+        delivery = ReplyDelivery(client_class(graph.url, "token", "access", "123"), max_part_chars=args.max_part_chars,
+                                 record_stage=lambda stage, seconds: timings[stage].append(seconds))
+        for number in range(args.replies):
+            delivery.deliver(f"wamid.{number}", reply, f"7700{number:07d}")
+        in_order = sum(
+            [text for recipient, text in graph.delivered if recipient == f"7700{number:07d}"] == expected
+            for number in range(args.replies))
+        return timings["send"], timings["send_part"], graph.connections, in_order
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--replies", type=int, default=50, help="long replies sent")
+    parser.add_argument("--chars", type=int, default=9000, help="characters per reply")
+    parser.add_argument("--max-part-chars", type=int, default=4096, help="maximum characters per message")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per Graph API request")
+    args = parser.parse_args()
+
+    parts = len(split_reply(SENTENCE * (args.chars // len(SENTENCE) + 1), args.max_part_chars))
+    print(f"{args.replies} replies of {args.chars} characters, about {parts} parts each")
+    print(f"{'mode':<16}{'reply p50':>12}{'part p50':>12}{'connections':>13}{'in order':>10}")
+    for name, client_class in (("pooled", WhatsAppClient), ("new connection", NewConnectionClient)):
+        started = time.perf_counter()
+        replies, parts, connections, in_order = run(client_class, args)
+        print(f"{name:<16}{statistics.median(replies) * 1000:9.1f} ms{statistics.median(parts) * 1000:9.1f} ms"
+              f"{connections:>13}{in_order:>6}/{args.replies}  ({time.perf_counter() - started:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+FAQ Fast Path Benchmark
+
+Measures the time the FAQ engine takes per message for exact hits, fuzzy
+hits and misses (which fall through to the model), on the FAQ of the tests
+and on a generated FAQ with many intents, next to one completion from the
+OpenAI stub server for scale.
+
+Example:
+    python -m benchmarks.bench_faq --intents 500 --iterations 2000
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from app.ai import AIClient
+from app.faq import FaqEngine
+from benchmarks.stubs import OpenAIStubServer
+
+
+TESTS_FAQ = os.path.join(os.path.dirname(__file__), os.pardir, "tests", "resources", "faq.json")
+MESSAGES = {
+    "exact hit": "What are your opening hours?",
+    "fuzzy hit": "openning hourss",
+    "miss": "Can I pay for the order by card when it is delivered tomorrow?",
+}
+
+
+def generated_faq(path, intents):
+    """Write a FAQ with the given number of intents, four patterns each."""
+    items = [{"intent": f"intent{index}",
+              "patterns": [f"product {index} price", f"product {index} size", f"item{index} colour",
+                           f"where is item{index}"],
+              "answer": f"Answer {index}"} for index in range(intents)]
+    items.append({"intent": "hours", "patterns": ["opening hours"], "answer": "9:00 to 18:00"})
+    with open(path, "w") as faq_file:
+        json.dump(items, faq_file)
+
+
+def time_matches(faq, iterations):
+    """Return microseconds per match of every benchmark message."""
+    timings = {}
+    for name, message in MESSAGES.items():
+        started = time.perf_counter()
+        for _ in range(iterations):
+            faq.match(message)
+        timings[name] = (time.perf_counter() - started) / iterations * 1e6
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--intents", type=int, default=500, help="intents of the generated FAQ")
+    parser.add_argument("--iterations", type=int, default=2000, help="matches per message")
+    parser.add_argument("--openai-latency", type=float, default=0.3, help="stub completion latency")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "faq.json")
+        generated_faq(path, args.intents)
+        faqs = [("tests FAQ", FaqEngine(TESTS_FAQ, reload_interval=0)),
+                (f"{args.intents} intents", FaqEngine(path, reload_interval=0))]
+        for name, faq in faqs:
+            timings = time_matches(faq, args.iterations)
+            print(f"{name:<14} " + "  ".join(f"{label} {value:7.1f} us" for label, value in timings.items()))
+
+    with OpenAIStubServer(latency=args.openai_latency) as server:
+        client = AIClient("key", "gpt-3.5-turbo", 0.7, api_base=server.api_base)
+        started = time.perf_counter()
+        client.generate_reply(MESSAGES["exact hit"])
+        print(f"one completion from the stub: {(time.perf_counter() - started) * 1e6:9.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Logging Overhead Benchmark
+
+Measures what a log call costs the thread that makes it: the previous
+synchronous FileHandler set up by logging.basicConfig against the queue
+handler of app.logging_setup (text and JSON output), plus calls filtered
+out by the level with an f-string and with lazy %-style arguments. Files
+are written to a temporary directory. Calls are made in bursts of ten with
+a short pause in between, like a request waiting on the network; the time
+the writer thread needs to drain the queue at the end is reported separately.
+
+Example:
+    python -m benchmarks.bench_logging --records 5000
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from app.config import Config
+from app.logging_setup import configure_logging, log_context, logging_stats, stop_logging
+from app.services import config_to_dict
+
+
+logger = logging.getLogger("bench")
+
+
+def _reset_root():
+    """Remove every handler from the root logger."""
+    stop_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+
+def _time_calls(count, call, burst=10, pause=0.002):
+    """
+    Return the mean seconds per call of call(index).
+
+    Calls are made in bursts separated by a pause, like a request that logs a
+    few lines and then waits on the network; only the calls are timed.
+    """
+    elapsed = 0.0
+    for start in range(0, count, burst):
+        started = time.perf_counter()
+        for index in range(start, min(count, start + burst)):
+            call(index)
+        elapsed += time.perf_counter() - started
+        time.sleep(pause)
+    return elapsed / count
+
+
+def bench_sync_file(path, count):
+    """Synchronous FileHandler, as configured by basicConfig before."""
+    _reset_root()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s",
+                        handlers=[logging.FileHandler(path)])
+    per_call = _time_calls(count, lambda index: logger.info(f"Sent reply to message wamid.{index}"))
+    _reset_root()
+    return per_call, 0.0
+
+
+def bench_queue(path, count, log_format):
+    """Queue handler with a background writer thread."""
+    _reset_root()
+    config = dict(config_to_dict(Config), LOG_LEVEL="INFO", LOG_FORMAT=log_format, LOG_FILE=path,
+                  LOG_ROTATION="none", LOG_QUEUE_SIZE=str(count + 1))
+    configure_logging(config, handlers=[logging.FileHandler(path)])
+    with log_context(message_id="wamid.1", sender="70000000000"):
+        per_call = _time_calls(count, lambda index: logger.info("Sent reply to message wamid.%d", index))
+    dropped = logging_stats()["dropped"]
+    started = time.perf_counter()
+    stop_logging()
+    if dropped:
+        print(f"  warning: {dropped} records dropped")
+    return per_call, time.perf_counter() - started
+
+
+def bench_filtered(count, lazy):
+    """Debug calls below the configured level."""
+    _reset_root()
+    logging.getLogger().setLevel(logging.INFO)
+    payload = {"entry": [{"changes": [{"value": {"messages": [{"id": "wamid.1"}]}}]}]}
+    if lazy:
+        per_call = _time_calls(count, lambda index: logger.debug("Webhook payload %s", payload))
+    else:
+        per_call = _time_calls(count, lambda index: logger.debug(f"Webhook payload {payload}"))
+    return per_call, 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=5000, help="log calls per scenario")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        scenarios = [
+            ("sync FileHandler", lambda: bench_sync_file(os.path.join(directory, "sync.log"), args.records)),
+            ("queue, text", lambda: bench_queue(os.path.join(directory, "text.log"), args.records, "text")),
+            ("queue, json", lambda: bench_queue(os.path.join(directory, "json.log"), args.records, "json")),
+            ("filtered debug, f-string", lambda: bench_filtered(args.records, lazy=False)),
+            ("filtered debug, lazy %s", lambda: bench_filtered(args.records, lazy=True)),
+        ]
+        for name, run in scenarios:
+            per_call, drain = run()
+            print(f"{name:<26} {per_call * 1e6:8.2f} us/call  writer drain {drain * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Media Download Memory Benchmark
+
+Downloads media files of growing size from the local Graph API stub, each in
+a fresh interpreter, and reports the peak RSS the download added to the
+process, with the media downloader (streamed in chunks to a spooled
+temporary file) and with a plain requests download of the whole body into
+memory, which is what resolving and fetching the media naively would do.
+
+Example:
+    python -m benchmarks.bench_media --sizes 1,16,64 --chunk-kb 64
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks.stubs import GraphStubServer
+
+
+# Run in each fresh interpreter; prints the peak RSS before and after the download as JSON
+CHILD = """
+import json, resource, sys, time
+from app.whatsapp import WhatsAppClient
+from app.media import MediaDownloader
+url, media_id, mode, chunk_bytes = sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4])
+client = WhatsAppClient(url, "token", "access", "123")
+client.session  # open the session before the baseline is taken
+import requests
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+started = time.perf_counter()
+if mode == "streamed":
+    with MediaDownloader(client, max_bytes=0, chunk_bytes=chunk_bytes).download(media_id) as media:
+        with media.mapped() as content:
+            size = len(content)
+else:
+    info = client.session.get(f"{url}/{media_id}").json()
+    size = len(client.session.get(info["url"]).content)
+elapsed = time.perf_counter() - started
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"size": size, "seconds": elapsed, "peak_kb": after - before}))
+"""
+
+
+def measure(graph, media_id, mode, chunk_bytes):
+    """Return the child's result of one download."""
+    result = subprocess.run([sys.executable, "-c", CHILD, graph.url, media_id, mode, str(chunk_bytes)],
+                            env={**os.environ, "LOG_FILE": ""}, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1,16,64", help="comma separated media sizes in MB")
+    parser.add_argument("--chunk-kb", type=int, default=64, help="download chunk size of the media downloader")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    with GraphStubServer() as graph:
+        for size in sizes:
+            graph.add_media(f"media-{size}", size * 1024 * 1024, "video/mp4")
+        print(f"{'mode':<10}{'size':>8}{'peak RSS added':>18}{'throughput':>14}")
+        for mode in ("streamed", "in-memory"):
+            for size in sizes:
+                result = measure(graph, f"media-{size}", mode, args.chunk_kb * 1024)
+                assert result["size"] == size * 1024 * 1024
+                print(f"{mode:<10}{size:>5} MB{result['peak_kb'] / 1024:>15.1f} MB"
+                      f"{size / result['seconds']:>9.0f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Reply Outbox Throughput Benchmark
+
+Measures the durable outbox under sustained load in two parts, on a
+temporary database file:
+
+- Writes: worker threads add replies as fast as they can, once with group
+  commit and once with a commit per reply (max_batch=1), reporting replies
+  per second and replies per commit.
+- Delivery: the outbox sender drains the queue through WhatsAppClient into
+  a local Graph API stub with artificial latency, for several sender
+  concurrencies, reporting replies per second.
+
+Example:
+    python -m benchmarks.bench_outbox --writers 16 --replies 4000 --latency 0.02
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from flask import Flask
+
+from app.outbox import Outbox, OutboxSender
+from app.whatsapp import WhatsAppClient
+from benchmarks.stubs import GraphStubServer
+
+
+def bench_writes(path, writers, replies, max_batch):
+    """Add replies from concurrent threads, return (replies/s, replies per commit)."""
+    outbox = Outbox(path, max_batch=max_batch)
+    per_writer = replies // writers
+
+    def write(worker):
+        for index in range(per_writer):
+            outbox.add(f"wamid.{max_batch}.{worker}.{index}", f"7{worker:010d}", "Thanks for your message!")
+
+    threads = [threading.Thread(target=write, args=(worker,)) for worker in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stats = outbox.stats()
+    return per_writer * writers / elapsed, stats["rows_per_commit"]
+
+
+def bench_delivery(path, server, replies, concurrency, recipients):
+    """Queue replies, then time the sender draining them, return replies/s."""
+    outbox = Outbox(path)
+    for index in range(replies):
+        outbox.add(f"wamid.send.{concurrency}.{index}", f"7{index % recipients:010d}", "Thanks for your message!")
+    client = WhatsAppClient(server.url, "verify-token", "access-token", "123456", pool_size=concurrency)
+    sender = OutboxSender(Flask(__name__), outbox, client, concurrency=concurrency)
+    started = time.perf_counter()
+    while sender.deliver_due():
+        pass
+    elapsed = time.perf_counter() - started
+    sender.stop()
+    return replies / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--writers", type=int, default=16, help="threads adding replies")
+    parser.add_argument("--replies", type=int, default=4000, help="replies per write scenario")
+    parser.add_argument("--send-replies", type=int, default=500, help="replies per delivery scenario")
+    parser.add_argument("--latency", type=float, default=0.02, help="Graph API stub latency in seconds")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated sender concurrencies")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, max_batch in (("group commit", 256), ("commit per reply", 1)):
+            rate, per_commit = bench_writes(os.path.join(directory, f"writes-{max_batch}.sqlite3"),
+                                            args.writers, args.replies, max_batch)
+            print(f"writes, {name:<18} {rate:9.0f} replies/s  {per_commit:6.1f} replies/commit")
+
+        with GraphStubServer(latency=args.latency) as server:
+            for concurrency in (int(value) for value in args.concurrency.split(",")):
+                rate = bench_delivery(os.path.join(directory, f"send-{concurrency}.sqlite3"), server,
+                                      args.send_replies, concurrency, recipients=max(64, concurrency))
+                print(f"delivery, concurrency {concurrency:<6} {rate:9.0f} replies/s")
+
+
+if __name__ == "__main__":
+    main()
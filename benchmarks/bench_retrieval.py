@@ -0,0 +1,89 @@
+"""
+Knowledge Base Retrieval Benchmark
+
+Generates a synthetic catalog of documents, builds the BM25 index, rebuilds
+it after changing one document (incremental update), maps it and measures
+the latency of retrieving the prompt snippets of typical customer messages.
+
+Example:
+    python -m benchmarks.bench_retrieval --documents 2000 --queries 5000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from app.retrieval import KnowledgeIndex, Retriever, build_index
+
+
+COLOURS = ["red", "blue", "green", "black", "white", "grey", "yellow", "navy", "beige", "brown"]
+PRODUCTS = ["jacket", "coat", "shirt", "dress", "sneakers", "boots", "backpack", "scarf", "hat", "gloves",
+            "trousers", "skirt", "sweater", "hoodie", "socks"]
+MATERIALS = ["cotton", "wool", "leather", "down", "linen", "fleece", "nylon", "denim"]
+QUERIES = [
+    "How much is the blue jacket?", "do you have black leather boots in size 42", "is the wool sweater warm",
+    "what is your return policy for sneakers", "green backpack price", "can I wash the linen dress",
+    "hello", "delivery to Astana", "are the navy gloves waterproof", "beige coat sizes",
+]
+
+
+def write_documents(directory, count, rng):
+    """Write count catalog documents of a few paragraphs each."""
+    for index in range(count):
+        paragraphs = []
+        for _ in range(rng.randint(2, 5)):
+            colour, product, material = rng.choice(COLOURS), rng.choice(PRODUCTS), rng.choice(MATERIALS)
+            paragraphs.append(
+                f"The {colour} {material} {product} (article {index}-{rng.randint(100, 999)}) costs "
+                f"{rng.randint(5, 90) * 1000} KZT. Available sizes: {rng.randint(36, 40)} to {rng.randint(41, 48)}. "
+                f"Care: wash at {rng.choice([30, 40, 60])} C. Returns accepted within 14 days.")
+        with open(os.path.join(directory, f"product-{index:05d}.md"), "w") as document:
+            document.write("\n\n".join(paragraphs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--documents", type=int, default=2000, help="catalog documents")
+    parser.add_argument("--queries", type=int, default=5000, help="retrievals measured")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--token-budget", type=int, default=300)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as directory:
+        docs = os.path.join(directory, "docs")
+        os.mkdir(docs)
+        write_documents(docs, args.documents, rng)
+        path = os.path.join(directory, "knowledge.index")
+
+        started = time.perf_counter()
+        stats = build_index(docs, path)
+        print(f"full build:        {time.perf_counter() - started:7.2f} s  {stats}")
+        with open(os.path.join(docs, "product-00000.md"), "a") as document:
+            document.write("\n\nNew: a matching red leather hat.")
+        started = time.perf_counter()
+        stats = build_index(docs, path)
+        print(f"incremental build: {time.perf_counter() - started:7.2f} s  {stats}")
+        print(f"index size:        {os.path.getsize(path) / 1024 / 1024:7.2f} MiB")
+
+        started = time.perf_counter()
+        index = KnowledgeIndex(path)
+        print(f"open (mmap):       {(time.perf_counter() - started) * 1000:7.2f} ms")
+        retriever = Retriever(index, args.top_k, args.token_budget)
+        latencies = []
+        for number in range(args.queries):
+            query = QUERIES[number % len(QUERIES)]
+            started = time.perf_counter()
+            retriever.context(query)
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        p50, p99 = latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99) - 1]
+        print(f"context():         p50 {p50 * 1e6:7.1f} us  p99 {p99 * 1e6:7.1f} us  "
+              f"({retriever.stats()['with_context']}/{args.queries} with snippets)")
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Model Routing Benchmark
+
+Generates replies to a typical mix of WhatsApp messages through the OpenAI
+stub server, once with every message on the configured model and once with
+the model router, and reports the median and p95 reply latency, the share of
+messages routed to the fast tier, the reserved reply tokens (the max_tokens
+budget, a proxy for cost) and the per-message cost of the classifier. The
+stub answers the large model after --large-latency seconds and the fast model
+after --fast-latency seconds.
+
+Example:
+    python -m benchmarks.bench_routing --messages 200 --large-latency 0.4 --fast-latency 0.1
+"""
+
+import argparse
+import statistics
+import time
+
+from app.ai import AIClient
+from app.routing import DEFAULT, FAST, HeuristicClassifier, ModelRouter, ModelTier
+from benchmarks.stubs import OpenAIStubServer
+
+
+MESSAGE_MIX = [
+    "hi", "Hello!", "thanks", "thank you so much", "ok", "👍 ok", "good morning", "спасибо", "Привет",
+    "bye, see you", "yes please", "no thanks", "gracias", "merci beaucoup",
+    "What is the price of the large pizza with extra cheese?",
+    "How long does delivery to the city centre usually take?",
+    "I ordered two items yesterday but only one arrived, what should I do?",
+    "Can I return a jacket if it does not fit? I bought it last week.",
+    "сколько стоит доставка в Алматы?",
+    "Do you have the blue model in size 42?",
+]
+
+
+def run(client, messages):
+    """Return the reply latencies of the messages in seconds."""
+    latencies = []
+    for message in messages:
+        started = time.perf_counter()
+        client.generate_reply(message)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def report(name, latencies, reserved_tokens):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<12} p50 {statistics.median(latencies) * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms  "
+          f"reserved reply tokens {reserved_tokens}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200, help="messages generated per scenario")
+    parser.add_argument("--large-latency", type=float, default=0.4, help="stub latency of the configured model")
+    parser.add_argument("--fast-latency", type=float, default=0.1, help="stub latency of the fast model")
+    parser.add_argument("--max-tokens", type=int, default=150, help="max_tokens of the configured model")
+    parser.add_argument("--fast-max-tokens", type=int, default=60, help="max_tokens of the fast model")
+    args = parser.parse_args()
+
+    messages = [MESSAGE_MIX[index % len(MESSAGE_MIX)] for index in range(args.messages)]
+    tiers = [ModelTier(FAST, "fast-model", args.fast_max_tokens), ModelTier(DEFAULT, "large-model", args.max_tokens)]
+    with OpenAIStubServer(model_latency={"large-model": args.large_latency,
+                                         "fast-model": args.fast_latency}) as server:
+        single = AIClient("key", "large-model", 0.7, max_tokens=args.max_tokens, api_base=server.api_base)
+        report("single model", run(single, messages), args.max_tokens * len(messages))
+
+        router = ModelRouter(tiers, HeuristicClassifier())
+        routed = AIClient("key", "large-model", 0.7, max_tokens=args.max_tokens, api_base=server.api_base,
+                          router=router)
+        latencies = run(routed, messages)
+        stats = router.stats()
+        decisions = stats["decisions"]
+        report("routed", latencies, decisions[FAST] * args.fast_max_tokens + decisions[DEFAULT] * args.max_tokens)
+
+    print(f"routed to fast tier: {decisions[FAST]}/{len(messages)}")
+    for tier, timing in sorted(stats["latency"].items()):
+        print(f"  {tier:<8} {timing['count']:5d} completions, avg {timing['avg_seconds'] * 1000:7.1f} ms")
+
+    classifier = HeuristicClassifier()
+    iterations = 100000
+    started = time.perf_counter()
+    for index in range(iterations):
+        classifier.classify(MESSAGE_MIX[index % len(MESSAGE_MIX)])
+    print(f"classifier: {(time.perf_counter() - started) / iterations * 1e6:.2f} us/message")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Fair Scheduling Benchmark
+
+Simulates the background workers while one sender floods the bot: the
+spammer queues --spam batches at once, then --senders normal senders send
+one message every --interval seconds. Every batch keeps a worker busy for
+--service seconds. Reports the queue wait of the normal senders and of the
+spammer with a FIFO queue (the old worker queue) and with the fair
+scheduler.
+
+Example:
+    python -m benchmarks.bench_scheduling --workers 4 --spam 200 --senders 50
+"""
+
+import argparse
+import queue
+import statistics
+import threading
+import time
+
+from app.scheduling import FairScheduler
+
+
+class FifoQueue:
+    """Arrival-order queue with the scheduler's interface."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def put(self, sender, item, cost=1.0):
+        self._queue.put((sender, item))
+
+    def get(self):
+        return self._queue.get()
+
+    def done(self, sender):
+        pass
+
+    def close(self):
+        pass
+
+
+def run(scheduler, args):
+    """Return the queue waits in seconds of the spammer's and the normal senders' batches."""
+    waits = {"spammer": [], "normal": []}
+    remaining = threading.Semaphore(0)
+
+    def work():
+        while True:
+            scheduled = scheduler.get()
+            if scheduled is None:
+                return
+            sender, enqueued_at = scheduled
+            waits["spammer" if sender == "spammer" else "normal"].append(time.perf_counter() - enqueued_at)
+            time.sleep(args.service)
+            scheduler.done(sender)
+            remaining.release()
+
+    workers = [threading.Thread(target=work, daemon=True) for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    for _ in range(args.spam):
+        scheduler.put("spammer", time.perf_counter())
+    for number in range(args.senders):
+        scheduler.put(f"sender-{number}", time.perf_counter())
+        time.sleep(args.interval)
+    for _ in range(args.spam + args.senders):
+        remaining.acquire()
+    scheduler.close()
+    return waits
+
+
+def report(name, waits):
+    for kind in ("normal", "spammer"):
+        latencies = sorted(waits[kind])
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(f"{name:<6} {kind:<8} wait p50 {statistics.median(latencies) * 1000:8.1f} ms  "
+              f"p95 {p95 * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4, help="worker threads")
+    parser.add_argument("--spam", type=int, default=200, help="batches queued by the spammer")
+    parser.add_argument("--senders", type=int, default=50, help="normal senders, one message each")
+    parser.add_argument("--interval", type=float, default=0.02, help="seconds between normal messages")
+    parser.add_argument("--service", type=float, default=0.02, help="seconds a worker spends on a batch")
+    args = parser.parse_args()
+
+    report("fifo", run(FifoQueue(), args))
+    # the spammer may run on all workers at once, like with the FIFO queue; only the order differs
+    report("fair", run(FairScheduler(max_queue_size=0, max_per_sender=args.workers), args))
+
+
+if __name__ == "__main__":
+    main()
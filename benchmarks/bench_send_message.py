@@ -0,0 +1,76 @@
+"""
+WhatsAppClient.send_message Benchmark
+
+Compares the per-send latency of a fresh connection per request (module-level
+requests.post, the previous behaviour) with the pooled keep-alive session now
+owned by WhatsAppClient, against a local Graph API stub server.
+
+Example:
+    python -m benchmarks.bench_send_message --requests 500
+"""
+
+import argparse
+import statistics
+import time
+
+import requests
+from flask import Flask
+
+from app.whatsapp import WhatsAppClient
+from benchmarks.stubs import GraphStubServer
+
+
+def _summary(name, samples, connections):
+    """Format latency percentiles for a list of samples in seconds."""
+    samples = sorted(samples)
+    p50 = samples[len(samples) // 2] * 1000
+    p95 = samples[int(len(samples) * 0.95) - 1] * 1000
+    mean = statistics.mean(samples) * 1000
+    return f"{name:<24} mean {mean:7.3f} ms  p50 {p50:7.3f} ms  p95 {p95:7.3f} ms  connections {connections}"
+
+
+def bench_fresh_connection(server, client, count):
+    """Send with one-off requests.post calls, rebuilding URL and headers each time."""
+    samples = []
+    before = server.connections
+    for _ in range(count):
+        started = time.perf_counter()
+        url = f"{client.api_url}/{client.phone_number_id}/messages"
+        headers = {"Authorization": f"Bearer {client.access_token}", "Content-Type": "application/json"}
+        payload = {"messaging_product": "whatsapp", "to": "70000000000", "type": "text",
+                   "text": {"preview_url": False, "body": "hello"}}
+        requests.post(url, headers=headers, json=payload)
+        samples.append(time.perf_counter() - started)
+    return samples, server.connections - before
+
+
+def bench_pooled_session(server, client, count):
+    """Send through WhatsAppClient.send_message and its pooled session."""
+    samples = []
+    before = server.connections
+    for _ in range(count):
+        started = time.perf_counter()
+        client.send_message("hello", "70000000000")
+        samples.append(time.perf_counter() - started)
+    return samples, server.connections - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=300, help="sends per scenario")
+    parser.add_argument("--latency", type=float, default=0.0, help="stub server latency in seconds")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    with GraphStubServer(latency=args.latency) as server, app.app_context():
+        client = WhatsAppClient(server.url, "verify-token", "access-token", "123456")
+        # warm up both paths once so imports and the first handshake are not measured
+        bench_fresh_connection(server, client, 1)
+        bench_pooled_session(server, client, 1)
+
+        print(_summary("requests.post (before)", *bench_fresh_connection(server, client, args.requests)))
+        print(_summary("pooled session (after)", *bench_pooled_session(server, client, args.requests)))
+
+
+if __name__ == "__main__":
+    main()
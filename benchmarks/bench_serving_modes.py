@@ -0,0 +1,102 @@
+"""
+Serving Mode Benchmark (WSGI vs ASGI)
+
+Runs the bot twice against local OpenAI and Graph API stubs with artificial
+latency: once as the sync Flask app under gunicorn (app.main:app) and once as
+the asyncio app under uvicorn (app.asgi:app). Each server runs as a single
+process so memory is comparable; the report shows throughput, latency
+percentiles and the server's resident memory.
+
+Requires gunicorn, uvicorn and httpx (pip install gunicorn uvicorn httpx).
+Resident memory is read from /proc, so the memory column is Linux only.
+
+Example:
+    python -m benchmarks.bench_serving_modes --requests 400 --concurrency 100 --threads 16
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from app.async_clients import ShardedAsyncClient
+from benchmarks.harness import free_port, load_template, percentile, rss_kib, synthetic_payload, wait_until_listening
+from benchmarks.stubs import GraphStubServer, OpenAIStubServer
+
+
+async def _drive(url, template, total, concurrency):
+    """Post total webhooks with bounded concurrency, return latencies and errors."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+    # a single large httpx pool would make the load generator the bottleneck
+    client = ShardedAsyncClient(max_connections=concurrency, timeout=120)
+    try:
+        async def one(index):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(url, json=synthetic_payload(template, index))
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(index) for index in range(total)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await client.aclose()
+    return sorted(latencies), errors, elapsed
+
+
+def run_mode(name, command, env, port, args, template):
+    """Start a server, drive load against it and print one result line."""
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_listening(port, process)
+        latencies, errors, elapsed = asyncio.run(
+            _drive(f"http://127.0.0.1:{port}/", template, args.requests, args.concurrency))
+        rss = rss_kib(process.pid)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+    p50, p95, p99 = (percentile(latencies, fraction) * 1000 for fraction in (0.5, 0.95, 0.99))
+    print(f"{name:<28} {args.requests / elapsed:8.1f} req/s  p50 {p50:8.1f} ms  "
+          f"p95 {p95:8.1f} ms  p99 {p99:8.1f} ms  errors {errors}  rss {rss / 1024:6.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400, help="webhooks per mode")
+    parser.add_argument("--concurrency", type=int, default=100, help="concurrent webhook requests")
+    parser.add_argument("--threads", type=int, default=16, help="gunicorn threads of the WSGI process")
+    parser.add_argument("--openai-latency", type=float, default=0.3, help="stub completion latency in seconds")
+    parser.add_argument("--graph-latency", type=float, default=0.05, help="stub send latency in seconds")
+    args = parser.parse_args()
+
+    template = load_template("text_message_update.json")
+
+    os.makedirs("logs", exist_ok=True)
+    with GraphStubServer(latency=args.graph_latency) as graph, \
+            OpenAIStubServer(latency=args.openai_latency) as openai_stub:
+        env = dict(os.environ, WHATSAPP_API_URL=graph.url, OPENAI_API_BASE=openai_stub.api_base,
+                   OPENAI_TEMPERATURE="0.7", OPENAI_MODEL="gpt-3.5-turbo", DEDUP_BACKEND="none",
+                   MESSAGE_PROCESSING_MODE="inline")
+
+        port = free_port()
+        run_mode(f"wsgi gunicorn 1x{args.threads} thr",
+                 [sys.executable, "-m", "gunicorn", "app.main:app", "--bind", f"127.0.0.1:{port}",
+                  "--workers", "1", "--threads", str(args.threads), "--log-level", "warning"],
+                 env, port, args, template)
+
+        port = free_port()
+        run_mode("asgi uvicorn 1 proc",
+                 [sys.executable, "-m", "uvicorn", "app.asgi:app", "--host", "127.0.0.1", "--port", str(port),
+                  "--log-level", "warning"],
+                 env, port, args, template)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Sender-Affinity Sharding Benchmark
+
+Runs the Flask app in sharded mode with 1, 2, 4... worker processes against
+local OpenAI and Graph API stubs and reports throughput (replies delivered
+per second) and ordering: how many replies reached their recipient before
+an earlier reply to the same recipient. The background mode (threads in one
+process, no sender affinity) is measured for comparison. Webhooks are
+posted from a thread pool through the front end's test client, one text
+message per webhook, round-robin over the senders.
+
+The stubs echo each prompt, so the order of the delivered replies can be
+checked against the order of the sent messages.
+
+Example:
+    python -m benchmarks.bench_sharding --messages 2000 --senders 200 --processes 1,2,4
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import create_app
+from app.config import Config
+from benchmarks.stubs import GraphStubServer, OpenAIStubServer
+
+
+def _payload(sender, sequence):
+    """One-message webhook whose text carries the sender's sequence number."""
+    message = {"from": sender, "id": f"wamid.{sender}.{sequence}", "timestamp": "1752766753", "type": "text",
+               "text": {"body": f"{sender}:{sequence}"}}
+    value = {"messaging_product": "whatsapp", "metadata": {"phone_number_id": "987654321098765"},
+             "messages": [message]}
+    return json.dumps({"object": "whatsapp_business_account",
+                       "entry": [{"id": "1", "changes": [{"value": value}]}]}).encode()
+
+
+def _out_of_order(delivered):
+    """Count replies delivered after a later reply to the same recipient."""
+    latest, count = {}, 0
+    for recipient, text in delivered:
+        # the echoed prompt quotes the incoming "sender:sequence" message
+        sequence = int(text.split('"')[1].rsplit(":", 1)[1])
+        if sequence < latest.get(recipient, -1):
+            count += 1
+        latest[recipient] = max(sequence, latest.get(recipient, -1))
+    return count
+
+
+def run(mode, workers, threads, messages, senders, openai_latency, posters):
+    """Serve `messages` webhooks in one mode, return (replies/s, out-of-order replies, delivered)."""
+    with OpenAIStubServer(echo=True, latency=openai_latency) as openai_stub, GraphStubServer() as graph_stub:
+        class BenchConfig(Config):
+            MESSAGE_PROCESSING_MODE = mode
+            SHARD_PROCESSES = str(workers)
+            SHARD_THREADS = str(threads)
+            SHARD_QUEUE_MAXSIZE = "0"
+            WORKER_POOL_SIZE = str(workers * threads)
+            WORKER_QUEUE_MAXSIZE = "0"
+            OPENAI_API_BASE = openai_stub.api_base
+            OPENAI_MODEL = "gpt-stub"
+            OPENAI_TEMPERATURE = "0.7"
+            WHATSAPP_API_URL = graph_stub.url
+            WHATSAPP_RATE_LIMIT_RPS = "0"
+            METRICS_ENABLED = "false"
+            LOG_LEVEL = "WARNING"
+            LOG_FILE = ""
+
+        app = create_app(BenchConfig)
+        client = app.test_client()
+        bodies = [_payload(f"7{index % senders:010d}", index // senders) for index in range(messages)]
+        # warm up the worker processes before timing
+        client.post("/", data=_payload("79999999999", 0), content_type="application/json")
+        while not graph_stub.delivered:
+            time.sleep(0.01)
+        graph_stub.delivered.clear()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(posters) as pool:
+            list(pool.map(lambda body: client.post("/", data=body, content_type="application/json"), bodies))
+        while len(graph_stub.delivered) < messages and time.perf_counter() - started < 300:
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - started
+        app.worker_pool.stop(10)
+        delivered = list(graph_stub.delivered)
+    return len(delivered) / elapsed, _out_of_order(delivered), len(delivered)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000, help="webhooks per scenario")
+    parser.add_argument("--senders", type=int, default=200, help="distinct senders")
+    parser.add_argument("--processes", default=f"1,2,{os.cpu_count() or 4}", help="comma-separated process counts")
+    parser.add_argument("--threads", type=int, default=8, help="sender lanes per process")
+    parser.add_argument("--openai-latency", type=float, default=0.005, help="OpenAI stub latency in seconds")
+    parser.add_argument("--posters", type=int, default=16, help="threads posting webhooks")
+    args = parser.parse_args()
+
+    scenarios = [("background", 1)] + [("sharded", int(count)) for count in args.processes.split(",")]
+    for mode, workers in scenarios:
+        rate, out_of_order, delivered = run(mode, workers, args.threads, args.messages, args.senders,
+                                            args.openai_latency, args.posters)
+        label = f"{mode}, {workers * args.threads} threads" if mode == "background" else f"{mode}, {workers} process(es)"
+        print(f"{label:<26} {rate:8.1f} replies/s  out of order {out_of_order:5d}  delivered {delivered}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Startup Time Benchmark
+
+Starts fresh interpreters the way a gunicorn worker or an autoscaled
+container does and measures, in each, the import of the application, the
+application factory and the first webhook, answered inline through local
+OpenAI and Graph API stubs. A worker is ready to serve after the import and
+the factory; the first reply adds the first webhook, which also imports the
+HTTP and OpenAI libraries, loaded on first use. One more interpreter runs
+with -X importtime, and the slowest top-level packages and app modules are
+listed by cumulative import time.
+
+Example:
+    python -m benchmarks.bench_startup --runs 5 --top 15
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.harness import load_template, synthetic_payload
+from benchmarks.stubs import GraphStubServer, OpenAIStubServer
+
+
+# Run in each fresh interpreter; prints the three timings as JSON
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+response = app.test_client().post("/", query_string={"hub.verify_token": "bench"}, data=sys.argv[1],
+                                  content_type="application/json")
+answered = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print(json.dumps({"import": imported - started, "create_app": created - imported,
+                  "first_request": answered - created}))
+"""
+
+
+def child_env(openai_stub, graph_stub):
+    """Environment of the measured interpreters: inline mode against the stubs, no log file."""
+    return {**os.environ, "OPENAI_API_KEY": "bench", "OPENAI_TEMPERATURE": "0.7",
+            "OPENAI_API_BASE": openai_stub.api_base, "WHATSAPP_API_URL": graph_stub.url,
+            "WHATSAPP_WEBHOOK_VERIFY_TOKEN": "bench",
+            "MESSAGE_PROCESSING_MODE": "inline", "LOG_FILE": "", "LOG_LEVEL": "WARNING"}
+
+
+def import_times(env, top):
+    """
+    Return the slowest top-level packages and app modules of an application import.
+
+    Returns:
+        list[tuple[str, float, float]]: (module, self seconds, cumulative seconds), slowest first
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "from app import create_app; create_app()"],
+                            env=env, capture_output=True, text=True, check=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # the header line
+        name = name.strip()
+        if "." not in name or name.startswith("app."):
+            modules.append((name, int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return sorted(modules, key=lambda module: module[2], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters measured")
+    parser.add_argument("--top", type=int, default=15, help="modules listed by import time")
+    args = parser.parse_args()
+
+    payload = json.dumps(synthetic_payload(load_template("text_message_update.json"), 0))
+    with OpenAIStubServer() as openai_stub, GraphStubServer() as graph_stub:
+        env = child_env(openai_stub, graph_stub)
+        runs = []
+        for _ in range(args.runs):
+            result = subprocess.run([sys.executable, "-c", CHILD, payload], env=env, capture_output=True,
+                                    text=True, check=True)
+            runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+        modules = import_times(env, args.top)
+
+    print(f"{'phase':<16}{'median':>10}{'min':>10}")
+    for phase in ("import", "create_app", "first_request"):
+        values = [run[phase] for run in runs]
+        print(f"{phase:<16}{statistics.median(values) * 1000:8.1f} ms{min(values) * 1000:8.1f} ms")
+    for name, phases in (("ready to serve", ("import", "create_app")),
+                         ("first reply", ("import", "create_app", "first_request"))):
+        totals = [sum(run[phase] for phase in phases) for run in runs]
+        print(f"{name:<16}{statistics.median(totals) * 1000:8.1f} ms{min(totals) * 1000:8.1f} ms")
+
+    print(f"\n{'module':<36}{'self':>10}{'cumulative':>14}")
+    for name, self_seconds, cumulative in modules:
+        print(f"{name:<36}{self_seconds * 1000:8.1f} ms{cumulative * 1000:11.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark Harness Helpers
+
+This module provides the plumbing shared by the benchmarks that run the bot
+as a separate server process and drive it over HTTP.
+
+The helpers support:
+- Picking a free localhost port and waiting for a server to listen on it
+- Reading the resident memory of a process tree from /proc (Linux only)
+- Synthetic webhook payloads derived from the tests/resources templates
+- Nearest-rank latency percentiles
+- The git revision a result was measured on
+
+Example:
+    port = free_port()
+    process = subprocess.Popen(command)
+    wait_until_listening(port, process)
+    print(rss_kib(process.pid))
+"""
+
+import copy
+import json
+import math
+import os
+import socket
+import subprocess
+import time
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parent.parent
+RESOURCES = ROOT / "tests" / "resources"
+
+
+def free_port():
+    """Return a free localhost TCP port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_listening(port, process, timeout=30):
+    """
+    Wait for a server process to accept connections.
+
+    Raises:
+        RuntimeError: If the process exits or does not listen within timeout seconds
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def rss_kib(pid):
+    """Resident memory of a process and its children in KiB (Linux only, 0 elsewhere)."""
+    if not os.path.isdir("/proc"):
+        return 0
+    pids = [pid]
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as stat_file:
+                    if int(stat_file.read().rsplit(")", 1)[1].split()[1]) == pid:
+                        pids.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    total = 0
+    for child in pids:
+        try:
+            with open(f"/proc/{child}/status") as status_file:
+                for line in status_file:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+        except OSError:
+            continue
+    return total
+
+
+def load_template(name):
+    """Load a webhook payload template from tests/resources."""
+    with open(RESOURCES / name) as json_file:
+        return json.load(json_file)
+
+
+def iter_messages(payload):
+    """Yield every message of a webhook payload."""
+    for entry in payload.get("entry", []):
+        for change in entry.get("changes", []):
+            yield from change.get("value", {}).get("messages", [])
+
+
+def synthetic_payload(template, index):
+    """
+    Copy a webhook payload with unique message ids and senders.
+
+    Messages of the same sender in the template keep sharing a sender in the
+    copy, so batches that exercise per-sender grouping stay meaningful.
+
+    Args:
+        template (dict): Webhook payload, e.g. loaded with load_template
+        index (int): Sequence number making ids and senders unique
+
+    Returns:
+        dict: New payload
+    """
+    payload = copy.deepcopy(template)
+    senders = {}
+    for position, message in enumerate(iter_messages(payload)):
+        message["id"] = f"wamid.BENCH{index}.{position}"
+        message["from"] = senders.setdefault(message["from"], f"77{index % 10 ** 7:07d}{len(senders):02d}")
+    return payload
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of sorted samples (0 for no samples)."""
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, max(0, math.ceil(len(samples) * fraction) - 1))]
+
+
+def git_revision():
+    """
+    Describe the checked-out commit.
+
+    Returns:
+        tuple: (short commit hash or None outside a git checkout, whether tracked files are modified)
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+    return commit, bool(status.strip())
@@ -0,0 +1,322 @@
+"""
+End-to-End Load Test
+
+Serves the Flask app built by create_app in a child process, pointed at local
+OpenAI and Graph API stubs with configurable latency and error rates, and
+posts synthetic webhooks derived from tests/resources/*.json at a fixed
+target rate. Requests are sent open-loop: a slow server does not slow the
+sender down, so queueing shows up in the latency numbers instead of hiding
+behind a lower request rate.
+
+The report covers:
+- Webhook latency percentiles (p50/p95/p99), throughput and error rate
+- Replies delivered to the Graph stub and the time to drain them after the load
+- Resident memory of the app process at start, peak and end (Linux only)
+- The app's /stats after the run
+
+Every run is appended as one JSON line, with the git commit it ran on, to
+benchmarks/results/load_test.jsonl and compared with the previous run of the
+same scenario, so regressions show up across commits. App settings can be
+overridden per run with --set, e.g. --set MESSAGE_PROCESSING_MODE=background.
+
+Example:
+    python -m benchmarks.load_test --rps 50 --duration 20 --openai-error-rate 0.05
+    python -m benchmarks.load_test --rps 50 --duration 20 --fail-on-regression 0.2
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import httpx
+
+from app.async_clients import ShardedAsyncClient
+from benchmarks.harness import (ROOT, free_port, git_revision, iter_messages, load_template, percentile, rss_kib,
+                                synthetic_payload, wait_until_listening)
+from benchmarks.stubs import GraphStubServer, OpenAIStubServer
+
+
+DEFAULT_TEMPLATES = "text_message_update.json,batched_message_update.json,other_update.json"
+DEFAULT_RESULTS = ROOT / "benchmarks" / "results" / "load_test.jsonl"
+# metric name -> whether a higher value is better, used for the regression comparison
+COMPARED_METRICS = {
+    "throughput_rps": True,
+    "latency_p50_ms": False,
+    "latency_p95_ms": False,
+    "latency_p99_ms": False,
+    "error_rate": False,
+    "rss_peak_mib": False,
+}
+
+
+def serve(port):
+    """Serve the app built by create_app on a threaded WSGI server (runs in the child process)."""
+    from werkzeug.serving import make_server
+
+    from app import create_app
+
+    make_server("127.0.0.1", port, create_app(), threaded=True).serve_forever()
+
+
+async def _sample_memory(pid, samples, interval=0.25):
+    """Append the app's resident memory to samples until cancelled."""
+    while True:
+        samples.append(rss_kib(pid))
+        await asyncio.sleep(interval)
+
+
+async def _drive(url, payloads, rps, duration):
+    """
+    Post webhooks open-loop at rps for duration seconds.
+
+    Returns:
+        tuple: (sorted latencies in seconds, Counter of outcomes, elapsed seconds, requests sent)
+    """
+    total = max(1, int(rps * duration))
+    latencies, outcomes = [], Counter()
+    # a single large httpx pool would make the load generator the bottleneck
+    client = ShardedAsyncClient(max_connections=max(10, int(rps * 2)), timeout=120)
+
+    async def one(payload):
+        started = time.perf_counter()
+        try:
+            response = await client.post(url, json=payload)
+            outcomes[str(response.status_code)] += 1
+        except httpx.HTTPError as error:
+            outcomes[type(error).__name__] += 1
+        latencies.append(time.perf_counter() - started)
+
+    try:
+        tasks = []
+        started = time.perf_counter()
+        for index, payload in zip(range(total), payloads):
+            delay = started + index / rps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(one(payload)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+    finally:
+        await client.aclose()
+    return sorted(latencies), outcomes, elapsed, total
+
+
+def _wait_for_replies(graph, expected, timeout, settle=2.0):
+    """
+    Wait until the Graph stub has accepted the expected replies or deliveries stop.
+
+    Returns:
+        tuple: (replies delivered, seconds from the call until the last delivery)
+    """
+    started = time.monotonic()
+    delivered = graph.requests - graph.errors
+    last_change = started
+    while delivered < expected and time.monotonic() - last_change < settle and time.monotonic() - started < timeout:
+        time.sleep(0.05)
+        current = graph.requests - graph.errors
+        if current != delivered:
+            delivered, last_change = current, time.monotonic()
+    return delivered, last_change - started
+
+
+def run_load_test(args):
+    """
+    Run one load test scenario.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments
+
+    Returns:
+        dict: Result record with scenario, metrics and the app's /stats
+    """
+    templates = [load_template(name) for name in args.templates.split(",")]
+    payloads = (synthetic_payload(template, index)
+                for index, template in zip(itertools.count(), itertools.cycle(templates)))
+    total = max(1, int(args.rps * args.duration))
+    expected_replies = sum(sum(1 for message in iter_messages(templates[index % len(templates)])
+                               if message.get("type") == "text") for index in range(total))
+
+    os.makedirs("logs", exist_ok=True)
+    with GraphStubServer(latency=args.graph_latency, error_rate=args.graph_error_rate) as graph, \
+            OpenAIStubServer(latency=args.openai_latency, error_rate=args.openai_error_rate) as openai_stub:
+        env = dict(os.environ, WHATSAPP_API_URL=graph.url, OPENAI_API_BASE=openai_stub.api_base,
+                   OPENAI_API_KEY="stub", OPENAI_TEMPERATURE="0.7", OPENAI_MODEL="gpt-3.5-turbo",
+                   **dict(setting.split("=", 1) for setting in args.set))
+        port = free_port()
+        process = subprocess.Popen([sys.executable, "-m", "benchmarks.load_test", "--serve", str(port)],
+                                   env=env, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_listening(port, process)
+            memory = [rss_kib(process.pid)]
+
+            async def load():
+                sampler = asyncio.create_task(_sample_memory(process.pid, memory))
+                try:
+                    return await _drive(f"http://127.0.0.1:{port}/", payloads, args.rps, args.duration)
+                finally:
+                    sampler.cancel()
+
+            latencies, outcomes, elapsed, sent = asyncio.run(load())
+            delivered, drain = _wait_for_replies(graph, expected_replies, args.drain_timeout)
+            memory.append(rss_kib(process.pid))
+            app_stats = httpx.get(f"http://127.0.0.1:{port}/stats", timeout=10).json()
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+        upstream = {
+            "openai": {"requests": openai_stub.requests, "injected_errors": openai_stub.errors},
+            "graph": {"requests": graph.requests, "injected_errors": graph.errors},
+        }
+
+    failed = sent - outcomes.get("200", 0)
+    commit, dirty = git_revision()
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "dirty": dirty,
+        "scenario": _scenario(args),
+        "metrics": {
+            "requests": sent,
+            "throughput_rps": round(outcomes.get("200", 0) / elapsed, 2),
+            "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "latency_p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "latency_max_ms": round(latencies[-1] * 1000, 2),
+            "error_rate": round(failed / sent, 4),
+            "outcomes": dict(outcomes),
+            "replies_expected": expected_replies,
+            "replies_delivered": delivered,
+            "drain_seconds": round(drain, 2),
+            "rss_start_mib": round(memory[0] / 1024, 1),
+            "rss_peak_mib": round(max(memory) / 1024, 1),
+            "rss_end_mib": round(memory[-1] / 1024, 1),
+        },
+        "upstream": upstream,
+        "app_stats": app_stats,
+    }
+
+
+def _scenario(args):
+    """Parameters identifying comparable runs."""
+    return {
+        "rps": args.rps,
+        "duration": args.duration,
+        "templates": args.templates.split(","),
+        "openai_latency": args.openai_latency,
+        "openai_error_rate": args.openai_error_rate,
+        "graph_latency": args.graph_latency,
+        "graph_error_rate": args.graph_error_rate,
+        "settings": dict(sorted(setting.split("=", 1) for setting in args.set)),
+    }
+
+
+def previous_result(path, scenario):
+    """Return the last saved result of the same scenario, or None."""
+    previous = None
+    try:
+        with open(path) as results_file:
+            for line in results_file:
+                if line.strip():
+                    record = json.loads(line)
+                    if record.get("scenario") == scenario:
+                        previous = record
+    except FileNotFoundError:
+        pass
+    return previous
+
+
+def save_result(path, record):
+    """Append a result record as one JSON line."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as results_file:
+        results_file.write(json.dumps(record, sort_keys=True) + "\n")
+
+
+def regressions(previous, current, tolerance):
+    """
+    Compare two result records.
+
+    Args:
+        previous (dict): Earlier result of the same scenario
+        current (dict): New result
+        tolerance (float): Relative change (e.g. 0.1 for 10%) accepted before a metric counts as regressed
+
+    Returns:
+        list: (metric, previous value, current value, relative change, regressed) per compared metric
+    """
+    rows = []
+    for metric, higher_is_better in COMPARED_METRICS.items():
+        before, after = previous["metrics"].get(metric), current["metrics"].get(metric)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before if before else (0.0 if after == before else float("inf"))
+        worse = -change if higher_is_better else change
+        # error rates near zero make relative changes meaningless, so they also need an absolute step
+        regressed = worse > tolerance and (metric != "error_rate" or after - before > 0.01)
+        rows.append((metric, before, after, change, regressed))
+    return rows
+
+
+def _print_result(record):
+    """Print the metrics of one run."""
+    metrics = record["metrics"]
+    print(f"commit {record['commit'] or 'unknown'}{' (dirty)' if record['dirty'] else ''}  "
+          f"{metrics['requests']} requests")
+    print(f"throughput {metrics['throughput_rps']:8.1f} req/s  error rate {metrics['error_rate']:.2%}  "
+          f"outcomes {metrics['outcomes']}")
+    print(f"latency p50 {metrics['latency_p50_ms']:8.1f} ms  p95 {metrics['latency_p95_ms']:8.1f} ms  "
+          f"p99 {metrics['latency_p99_ms']:8.1f} ms  max {metrics['latency_max_ms']:8.1f} ms")
+    print(f"replies {metrics['replies_delivered']}/{metrics['replies_expected']} delivered, "
+          f"drained {metrics['drain_seconds']:.2f} s after the load")
+    print(f"rss start {metrics['rss_start_mib']:6.1f} MiB  peak {metrics['rss_peak_mib']:6.1f} MiB  "
+          f"end {metrics['rss_end_mib']:6.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--serve", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    parser.add_argument("--rps", type=float, default=20, help="target webhook requests per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load")
+    parser.add_argument("--templates", default=DEFAULT_TEMPLATES,
+                        help="comma-separated tests/resources payloads, used round-robin")
+    parser.add_argument("--openai-latency", type=float, default=0.3, help="stub completion latency in seconds")
+    parser.add_argument("--openai-error-rate", type=float, default=0.0, help="share of stub completions failing")
+    parser.add_argument("--graph-latency", type=float, default=0.05, help="stub send latency in seconds")
+    parser.add_argument("--graph-error-rate", type=float, default=0.0, help="share of stub sends failing")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="app environment override, may be repeated")
+    parser.add_argument("--drain-timeout", type=float, default=30, help="seconds to wait for pending replies")
+    parser.add_argument("--results", default=str(DEFAULT_RESULTS), help="JSON lines file of saved results")
+    parser.add_argument("--no-save", action="store_true", help="do not append this run to the results file")
+    parser.add_argument("--fail-on-regression", type=float, metavar="TOLERANCE",
+                        help="exit with status 1 if a metric is worse than the previous run by this fraction")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+
+    record = run_load_test(args)
+    _print_result(record)
+    previous = previous_result(args.results, record["scenario"])
+    regressed = False
+    if previous is not None:
+        print(f"compared with {previous['commit'] or 'unknown'} ({previous['timestamp']}):")
+        for metric, before, after, change, worse in regressions(previous, record, args.fail_on_regression or 0.1):
+            regressed = regressed or worse
+            print(f"  {metric:<16} {before:10.2f} -> {after:10.2f}  {change:+8.1%}{'  REGRESSION' if worse else ''}")
+    if not args.no_save:
+        save_result(args.results, record)
+    if regressed and args.fail_on_regression is not None:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+Local Stub Servers
+
+This module provides in-process HTTP servers that imitate the upstream APIs
+the bot talks to, so benchmarks can measure the bot itself without network
+noise, rate limits or API costs.
+
+The stubs support:
+- Graph API POST /{phone_number_id}/messages
+- Graph API GET /{media_id} and the media download it points to, streamed
+  in chunks from generated content of any size
+- OpenAI POST /v1/chat/completions, including server-sent event streaming
+- HTTP/1.1 keep-alive, so connection reuse is visible in the numbers
+- Configurable artificial latency
+- Configurable error rate, answering a share of requests with an error status
+- A log of the delivered messages and an echo mode for the completions,
+  so tests can check which reply reached which recipient in which order
+
+Example:
+    with GraphStubServer(latency=0.01) as server:
+        client = WhatsAppClient(server.url, "token", "token", "123")
+"""
+
+import hashlib
+import json
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Request handler that dispatches to the owning stub server."""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # headers and body are separate writes, avoid Nagle + delayed ACK stalls on keep-alive
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        self._respond(*self.server.stub.handle_post(self.path, body))
+
+    def do_GET(self):
+        self._respond(*self.server.stub.handle_get(self.path))
+
+    def _respond(self, status, payload, headers=None):
+        headers = headers or {}
+        if isinstance(payload, dict):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        # any other payload is an iterator of body chunks, server-sent events unless a type is given
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if "Content-Type" not in headers:
+            self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for chunk in payload:
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        """Silence the per-request access log."""
+
+
+class StubServer:
+    """
+    Base class for stub servers running on a background thread.
+
+    Attributes:
+        latency (float): Seconds added to every response
+        error_rate (float): Share of requests answered with error_status (0..1)
+        error_status (int): HTTP status of injected errors
+        url (str): Base URL of the running server
+        requests (int): Number of handled requests
+        errors (int): Number of injected errors
+        connections (int): Number of accepted TCP connections
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, error_status=503):
+        """
+        Initialize the stub server without starting it.
+
+        Args:
+            latency (float): Seconds added to every response
+            error_rate (float): Share of requests answered with error_status (0..1)
+            error_status (int): HTTP status of injected errors
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+        self.errors = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def handle_post(self, path, body):
+        """Return the (status, json payload) or (status, json payload, headers) answer for a POST request."""
+        raise NotImplementedError
+
+    def handle_get(self, path):
+        """Return the answer for a GET request, like handle_post; unknown paths by default."""
+        self._count_request()
+        return 404, {"error": {"message": "Unknown path"}}
+
+    def _count_request(self):
+        """Count a handled request and apply the artificial latency."""
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _injected_error(self):
+        """Return an error answer for a random error_rate share of requests, else None."""
+        if not self.error_rate or random.random() >= self.error_rate:
+            return None
+        with self._lock:
+            self.errors += 1
+        return self.error_status, {"error": {"message": "Injected stub error", "code": self.error_status}}
+
+    def start(self):
+        """Start serving on a free localhost port."""
+        stub = self
+
+        class _Server(ThreadingHTTPServer):
+            daemon_threads = True
+            # the default backlog of 5 refuses connections under benchmark concurrency
+            request_queue_size = 1024
+
+            def get_request(self):
+                request = super().get_request()
+                with stub._lock:
+                    stub.connections += 1
+                return request
+
+        self._server = _Server(("127.0.0.1", 0), _StubHandler)
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the server and wait for its thread."""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class GraphStubServer(StubServer):
+    """
+    Stub of the Graph API messages and media endpoints that accepts every message.
+
+    Attributes:
+        delivered (list): (recipient, text) of every accepted message, in arrival order
+        media (dict): media id -> (mime type, size, sha256) of the media added with add_media
+    """
+
+    CHUNK_BYTES = 65536
+    # content of the media files, repeated up to their size
+    PATTERN = bytes(range(256)) * (CHUNK_BYTES // 256)
+
+    def __init__(self, latency=0.0, error_rate=0.0, error_status=503):
+        super().__init__(latency=latency, error_rate=error_rate, error_status=error_status)
+        self.delivered = []
+        self.media = {}
+
+    def add_media(self, media_id, size, mime_type="image/jpeg"):
+        """
+        Serve a media file of the given size under a media id.
+
+        Args:
+            media_id (str): Media id of the file
+            size (int): Size in bytes
+            mime_type (str): MIME type announced for the file
+        """
+        digest = hashlib.sha256()
+        for chunk in self._content(size):
+            digest.update(chunk)
+        self.media[media_id] = (mime_type, size, digest.hexdigest())
+
+    def _content(self, size):
+        """Yield the content of a media file of the given size in chunks."""
+        for offset in range(0, size, self.CHUNK_BYTES):
+            yield self.PATTERN[:min(self.CHUNK_BYTES, size - offset)]
+
+    def handle_get(self, path):
+        self._count_request()
+        error = self._injected_error()
+        if error is not None:
+            return error
+        download = path.startswith("/media-files/")
+        media_id = path.rsplit("/", 1)[-1]
+        if media_id not in self.media:
+            return 404, {"error": {"message": "Unknown media id"}}
+        mime_type, size, sha256 = self.media[media_id]
+        if download:
+            return 200, self._content(size), {"Content-Type": mime_type}
+        return 200, {"messaging_product": "whatsapp", "id": media_id, "url": f"{self.url}/media-files/{media_id}",
+                     "mime_type": mime_type, "sha256": sha256, "file_size": size}
+
+    def handle_post(self, path, body):
+        self._count_request()
+        if not path.endswith("/messages"):
+            return 404, {"error": {"message": "Unknown path"}}
+        error = self._injected_error()
+        if error is not None:
+            return error
+        message = json.loads(body or b"{}")
+        with self._lock:
+            self.delivered.append((message.get("to"), message.get("text", {}).get("body")))
+        return 200, {
+            "messaging_product": "whatsapp",
+            "messages": [{"id": f"wamid.STUB{self.requests}"}],
+        }
+
+
+class OpenAIStubServer(StubServer):
+    """
+    Stub of the OpenAI chat completions endpoint that answers with a fixed reply.
+
+    Streaming requests get the reply word by word as server-sent events, with
+    token_delay seconds between the words.
+
+    Attributes:
+        reply (str): Text returned for every completion
+        token_delay (float): Seconds between streamed words
+        echo (bool): Answer with the last prompt message instead of the fixed reply
+        model_latency (dict): Extra seconds per model name, on top of latency
+        prompts (list): Messages of every received request
+    """
+
+    def __init__(self, reply="Hello! How can I help you today?", latency=0.0, token_delay=0.0,
+                 error_rate=0.0, error_status=503, echo=False, model_latency=None):
+        """
+        Initialize the stub.
+
+        Args:
+            reply (str): Text returned for every completion
+            latency (float): Seconds added before the response (or the first streamed word)
+            token_delay (float): Seconds between streamed words
+            error_rate (float): Share of requests answered with error_status (0..1)
+            error_status (int): HTTP status of injected errors
+            echo (bool): Answer with the last prompt message instead of the fixed reply
+            model_latency (dict, optional): Extra seconds per model name, e.g. a slower large model
+        """
+        super().__init__(latency=latency, error_rate=error_rate, error_status=error_status)
+        self.reply = reply
+        self.token_delay = token_delay
+        self.echo = echo
+        self.model_latency = model_latency or {}
+        self.prompts = []
+
+    @property
+    def api_base(self):
+        """Base URL to configure as the OpenAI API base."""
+        return f"{self.url}/v1"
+
+    def handle_post(self, path, body):
+        self._count_request()
+        if not path.endswith("/chat/completions"):
+            return 404, {"error": {"message": "Unknown path"}}
+        error = self._injected_error()
+        if error is not None:
+            return error
+        request = json.loads(body or b"{}")
+        self.prompts.append(request.get("messages"))
+        if self.model_latency.get(request.get("model")):
+            time.sleep(self.model_latency[request.get("model")])
+        if request.get("stream"):
+            return 200, self._stream(request.get("model"))
+        reply = request["messages"][-1]["content"] if self.echo and request.get("messages") else self.reply
+        words = len(reply.split())
+        return 200, {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "model": request.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": words, "total_tokens": 10 + words},
+        }
+
+    def _stream(self, model):
+        """Yield the reply word by word as chat.completion.chunk events."""
+        words = self.reply.split(" ")
+        for index, word in enumerate(words):
+            if index and self.token_delay:
+                time.sleep(self.token_delay)
+            content = word if index == 0 else f" {word}"
+            event = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}]}
+            yield f"data: {json.dumps(event)}\n\n".encode()
+        yield b"data: [DONE]\n\n"
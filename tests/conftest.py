@@ -47,3 +47,41 @@ def webhook_credentials():
         "hub.challenge": hub_challenge,
     }
     return query_string
+
+
+class FakeAIClient:
+    """Stand-in for AIClient that records prompts and replies instantly."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.prompts = []
+
+    def generate_reply(self, message, sender=None):
+        import time
+
+        if self.delay:
+            time.sleep(self.delay)
+        self.prompts.append(message)
+        return f"reply to: {message}"
+
+
+class FakeWhatsAppClient:
+    """Stand-in for WhatsAppClient.send_message that records sent messages."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, message_text, receiver_phone_number):
+        self.sent.append((receiver_phone_number, message_text))
+
+
+@pytest.fixture
+def fake_clients():
+    """
+    Provides fake AI and WhatsApp clients that never touch the network.
+
+    Usage:
+        def test_pipeline(fake_clients):
+            ai_client, whatsapp_client = fake_clients
+    """
+    return FakeAIClient(), FakeWhatsAppClient()
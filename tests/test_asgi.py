@@ -0,0 +1,81 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from app.asgi import WebhookASGIApp
+from app.config import Config
+from app.services import config_to_dict
+from benchmarks.stubs import GraphStubServer, OpenAIStubServer
+
+
+resources = Path(__file__).parent / "resources"
+
+with open(resources / "batched_message_update.json", "r") as json_file:
+    json_batched_data = json.load(json_file)
+
+with open(resources / "fake_text_message_update.json", "r") as json_file:
+    json_fake_message_data = json.load(json_file)
+
+
+def _config(graph, openai_stub):
+    config = config_to_dict(Config)
+    config.update({
+        "WHATSAPP_API_URL": graph.url,
+        "OPENAI_API_BASE": openai_stub.api_base,
+        "OPENAI_TEMPERATURE": "0.7",
+        "WHATSAPP_WEBHOOK_VERIFY_TOKEN": "verify-token",
+    })
+    return config
+
+
+async def _run(asgi_app, requests):
+    transport = httpx.ASGITransport(app=asgi_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        responses = [await request(client) for request in requests]
+    await asgi_app.shutdown()
+    return responses
+
+
+def test_asgi_webhook_replies_to_every_message():
+    """
+    The ASGI app verifies the webhook and answers every message of a batch through the async clients.
+    """
+    with GraphStubServer() as graph, OpenAIStubServer(reply="Hi there!") as openai_stub:
+        asgi_app = WebhookASGIApp(_config(graph, openai_stub))
+        verification, webhook, malformed = asyncio.run(_run(asgi_app, [
+            lambda client: client.get("/", params={"hub.verify_token": "verify-token", "hub.challenge": "123"}),
+            lambda client: client.post("/", json=json_batched_data),
+            lambda client: client.post("/", json=json_fake_message_data),
+        ]))
+
+        assert verification.status_code == 200
+        assert verification.text == "123"
+        assert webhook.status_code == 200
+        assert graph.requests == 4
+        assert openai_stub.requests == 4
+        assert malformed.status_code == 503
+        assert "Error during json extraction: " in malformed.text
+
+
+def test_sharded_client_spreads_requests_over_pools():
+    """
+    The sharded client splits its connections into small pools and uses them in turn.
+    """
+    from app.async_clients import ShardedAsyncClient
+
+    async def scenario(url):
+        client = ShardedAsyncClient(max_connections=25, shard_size=10)
+        responses = await asyncio.gather(*(client.post(url, json={}) for _ in range(30)))
+        await client.aclose()
+        return client, responses
+
+    with OpenAIStubServer() as openai_stub:
+        client, responses = asyncio.run(scenario(openai_stub.api_base + "/chat/completions"))
+
+    assert len(client.shards) == 3
+    assert all(response.status_code == 200 for response in responses)
+    assert openai_stub.requests == 30
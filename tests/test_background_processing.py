@@ -0,0 +1,91 @@
+import json
+from pathlib import Path
+
+from app import create_app
+from app.config import Config
+from app.pipeline import MessageProcessor
+from app.workers import WorkerPool
+from app.errors import RetryableError
+from app.messages import InboundMessage
+
+import pytest
+
+
+resources = Path(__file__).parent / "resources"
+
+with open(resources / "text_message_update.json", "r") as json_file:
+    json_message_data = json.load(json_file)
+
+
+class BackgroundConfig(Config):
+    MESSAGE_PROCESSING_MODE = "background"
+    WORKER_POOL_SIZE = "2"
+
+
+def test_webhook_acknowledges_before_processing(webhook_credentials, fake_clients):
+    """
+    In background mode the webhook returns right away and the workers send the reply.
+    """
+    ai_client, whatsapp_client = fake_clients
+    app = create_app(BackgroundConfig)
+    app.message_processor.ai_client = ai_client
+    app.message_processor.whatsapp_client = whatsapp_client
+
+    with app.test_client() as client:
+        response = client.post("/", query_string=webhook_credentials, json=json_message_data)
+        assert response.status_code == 200
+        assert response.get_json() == {"status": "accepted"}
+
+        app.worker_pool.join()
+        assert whatsapp_client.sent == [("70000000000", "reply to: hey")]
+
+        stats = client.get("/stats").get_json()
+        assert stats["mode"] == "background"
+        assert stats["workers"] == 2
+        assert stats["processed"] == 1
+        assert stats["stages"]["generate"]["count"] == 1
+
+    app.worker_pool.stop()
+
+
+def test_full_queue_raises_retryable_error(fake_clients):
+    """
+    A full queue must surface as RetryableError so WhatsApp redelivers the payload.
+    """
+    ai_client, whatsapp_client = fake_clients
+    app = create_app()
+    pool = WorkerPool(app, MessageProcessor(whatsapp_client, ai_client), size=1, max_queue_size=1)
+
+    messages = [InboundMessage(id="wamid.1", sender="70000000000", type="text", text="hey")]
+    pool.submit(messages)
+    with pytest.raises(RetryableError):
+        pool.submit(messages)
+
+    pool.start()
+    pool.join()
+    assert pool.stats()["processed"] == 1
+    pool.stop()
+
+
+def test_failed_batch_counts_the_unprocessed_messages(fake_clients):
+    """
+    A batch failing on its second message counts the first as processed and the rest as failed.
+    """
+    ai_client, whatsapp_client = fake_clients
+    generate_reply = ai_client.generate_reply
+
+    def failing_generate_reply(message, sender=None):
+        if message == "second":
+            raise RetryableError("OpenAI is down")
+        return generate_reply(message, sender)
+
+    ai_client.generate_reply = failing_generate_reply
+    app = create_app()
+    pool = WorkerPool(app, MessageProcessor(whatsapp_client, ai_client), size=1)
+    pool.start()
+    pool.submit([InboundMessage(id=f"wamid.{text}", sender="70000000000", type="text", text=text)
+                 for text in ("first", "second", "third")])
+    pool.join()
+    stats = pool.stats()
+    pool.stop()
+    assert (stats["processed"], stats["failed"]) == (1, 2)
@@ -0,0 +1,49 @@
+import json
+import time
+from pathlib import Path
+
+from app import create_app
+from app.whatsapp import WhatsAppClient
+from tests.conftest import FakeAIClient
+
+
+resources = Path(__file__).parent / "resources"
+
+with open(resources / "batched_message_update.json", "r") as json_file:
+    json_batched_data = json.load(json_file)
+
+
+def test_extract_messages_walks_every_entry_and_change():
+    """
+    Messages from every entry and change of a batched webhook are extracted in order.
+    """
+    client = WhatsAppClient("http://localhost", "verify-token", "access-token", "123456")
+    messages = client.extract_messages(json_batched_data)
+
+    assert [message.id for message in messages] == ["wamid.BATCH1", "wamid.BATCH2", "wamid.BATCH3", "wamid.BATCH4"]
+    assert messages[3].phone_number_id == "987654321098766"
+    assert messages[0].text == "first"
+    assert len(client.unpack_messages(json_batched_data)) == 4
+
+
+def test_batch_fans_out_across_senders_in_order(webhook_credentials, fake_clients):
+    """
+    Different senders are answered concurrently while one sender's replies keep their order.
+    """
+    _, whatsapp_client = fake_clients
+    ai_client = FakeAIClient(delay=0.2)
+    app = create_app()
+    app.message_processor.ai_client = ai_client
+    app.message_processor.whatsapp_client = whatsapp_client
+
+    with app.test_client() as client:
+        started = time.perf_counter()
+        response = client.post("/", query_string=webhook_credentials, json=json_batched_data)
+        elapsed = time.perf_counter() - started
+
+    assert response.status_code == 200
+    assert len(whatsapp_client.sent) == 4
+    # three senders in parallel, the slowest one has two sequential replies
+    assert elapsed < 0.6
+    first_sender = [text for number, text in whatsapp_client.sent if number == "70000000001"]
+    assert first_sender == ["reply to: first", "reply to: second"]
@@ -0,0 +1,87 @@
+import json
+import time
+from pathlib import Path
+
+from app import create_app
+from app.coalescer import MessageCoalescer
+from app.config import Config
+from app.messages import InboundMessage
+
+
+resources = Path(__file__).parent / "resources"
+
+with open(resources / "text_message_update.json", "r") as json_file:
+    json_message_data = json.load(json_file)
+
+
+def _message(index, sender="700", text=None):
+    return InboundMessage(id=f"wamid.{index}", sender=sender, type="text", text=text or f"part {index}")
+
+
+def test_burst_is_merged_after_window():
+    """
+    Messages arriving within the debounce window are flushed as a single merged message.
+    """
+    flushed = []
+    coalescer = MessageCoalescer(flushed.append, window=0.05, max_wait=1, max_batch=10)
+    coalescer.start()
+    for index in range(3):
+        coalescer.add(_message(index))
+    coalescer.add(_message(9, sender="701"))
+    time.sleep(0.15)
+    coalescer.stop()
+
+    merged = {batch[0].sender: batch for batch in flushed}
+    assert len(merged["700"]) == 1
+    assert merged["700"][0].text == "part 0\npart 1\npart 2"
+    assert merged["700"][0].all_ids == ("wamid.0", "wamid.1", "wamid.2")
+    assert coalescer.stats() == {"received": 4, "bursts": 2, "buffered_senders": 0}
+
+
+def test_max_batch_and_max_wait_bound_latency():
+    """
+    A full batch flushes immediately and a continuous stream is flushed after max_wait.
+    """
+    flushed = []
+    coalescer = MessageCoalescer(flushed.append, window=0.05, max_wait=0.12, max_batch=3)
+    coalescer.start()
+    for index in range(3):
+        coalescer.add(_message(index))
+    assert len(flushed) == 1
+
+    started = time.monotonic()
+    while time.monotonic() - started < 0.3:
+        coalescer.add(_message(3))
+        time.sleep(0.02)
+    coalescer.stop()
+    # the stream never paused for a whole window, max_wait still flushed it
+    assert len(flushed) >= 3
+
+
+class CoalescingConfig(Config):
+    MESSAGE_PROCESSING_MODE = "background"
+    COALESCE_WINDOW_SECONDS = "0.05"
+
+
+def test_webhook_burst_gets_one_reply(webhook_credentials, fake_clients):
+    """
+    Three webhooks from one sender in quick succession produce one model call and one reply.
+    """
+    ai_client, whatsapp_client = fake_clients
+    app = create_app(CoalescingConfig)
+    app.message_processor.ai_client = ai_client
+    app.message_processor.whatsapp_client = whatsapp_client
+
+    with app.test_client() as client:
+        for index, text in enumerate(["hi", "I have a question", "about delivery"]):
+            payload = json.loads(json.dumps(json_message_data))
+            message = payload["entry"][0]["changes"][0]["value"]["messages"][0]
+            message["id"] = f"wamid.BURST{index}"
+            message["text"]["body"] = text
+            assert client.post("/", query_string=webhook_credentials, json=payload).status_code == 200
+
+    app.coalescer.stop()
+    app.worker_pool.join()
+    app.worker_pool.stop()
+    assert ai_client.prompts == ["hi\nI have a question\nabout delivery"]
+    assert len(whatsapp_client.sent) == 1
@@ -0,0 +1,59 @@
+import time
+
+import openai
+
+from app.ai import AIClient
+from app.conversations import ConversationStore, estimate_tokens
+
+
+def test_history_is_trimmed_to_token_budget():
+    """
+    The ring buffer keeps the last turns and the prompt history stays under the token budget.
+    """
+    store = ConversationStore(max_turns=4, token_budget=120, summary_tokens=50)
+    for index in range(10):
+        store.record_exchange("700", f"question number {index} " * 5, f"answer number {index} " * 5)
+
+    messages = store.build_messages("700", "new prompt")
+    history_tokens = sum(estimate_tokens(message["content"]) for message in messages[:-1])
+    assert history_tokens <= 120
+    assert messages[0]["role"] == "system"
+    assert "question number" in messages[0]["content"]
+    assert messages[-1] == {"role": "user", "content": "new prompt"}
+    # the newest turn is always the one kept closest to the prompt
+    assert messages[-2]["content"].startswith("answer number 9")
+
+
+def test_idle_conversations_are_evicted():
+    """
+    Conversations idle for longer than the TTL are forgotten.
+    """
+    store = ConversationStore(idle_ttl=0.05)
+    store.record_exchange("700", "hi", "hello")
+    assert store.has_history("700")
+    time.sleep(0.06)
+    store.record_exchange("701", "hi", "hello")
+    assert not store.has_history("700")
+    assert len(store) == 1
+
+
+def test_generate_reply_sends_previous_turns(monkeypatch):
+    """
+    A follow-up message is sent together with the sender's previous exchange.
+    """
+    requests = []
+
+    def fake_create(**kwargs):
+        requests.append(kwargs["messages"])
+        return {"choices": [{"message": {"content": "reply"}}]}
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", fake_create)
+    client = AIClient("key", "gpt-3.5-turbo", 0.7, conversations=ConversationStore())
+
+    client.generate_reply("do you deliver?", "700")
+    client.generate_reply("how much?", "700")
+    client.generate_reply("hi", "701")
+
+    # history follows the static system prompt
+    assert [message["content"] for message in requests[1][1:3]] == ["do you deliver?", "reply"]
+    assert [message["role"] for message in requests[2]] == ["system", "user"]
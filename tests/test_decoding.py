@@ -0,0 +1,80 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from app import create_app, decoding
+from app.decoding import decode_webhook, is_status_only
+from app.errors import RetryableError
+
+
+resources = Path(__file__).parent / "resources"
+
+
+def _payload(*messages):
+    value = {"messaging_product": "whatsapp", "metadata": {"phone_number_id": "987654321098765"},
+             "messages": list(messages)}
+    return json.dumps({"object": "whatsapp_business_account",
+                       "entry": [{"id": "1", "changes": [{"value": value, "field": "messages"}]}]}).encode()
+
+
+MIXED_PAYLOAD = _payload(
+    {"from": "70000000001", "id": "wamid.1", "type": "text", "text": {"body": "hey"}},
+    {"from": "70000000001", "id": "wamid.2", "type": "image",
+     "image": {"id": "media.1", "mime_type": "image/jpeg", "caption": "my receipt"}},
+    {"from": "70000000001", "id": "wamid.3", "type": "interactive",
+     "interactive": {"type": "button_reply", "button_reply": {"id": "track", "title": "Track my order"}}},
+    {"from": "70000000001", "id": "wamid.4", "type": "interactive",
+     "interactive": {"type": "list_reply", "list_reply": {"id": "sizes", "title": "Size chart"}}},
+    {"from": "70000000001", "id": "wamid.5", "type": "button", "button": {"payload": "STOP", "text": "Stop"}},
+    {"from": "70000000001", "id": "wamid.6", "type": "location", "location": {"latitude": 43.2}},
+    # shapes the old extraction crashed on
+    {"from": "70000000001", "id": "wamid.7", "type": "text", "text": "not an object"},
+    {"from": "70000000001", "id": "wamid.8", "type": "unsupported", "errors": [{"code": 131051}]},
+)
+
+
+def test_status_only_updates_are_skipped_without_parsing(monkeypatch):
+    body = (resources / "other_update.json").read_bytes()
+
+    def fail(_):
+        raise AssertionError("status-only body was parsed")
+
+    monkeypatch.setattr(decoding, "_loads", fail)
+    assert is_status_only(body)
+    assert decode_webhook(body) == []
+    assert not is_status_only((resources / "text_message_update.json").read_bytes())
+
+
+def test_messages_are_classified_by_kind():
+    messages = decode_webhook(MIXED_PAYLOAD)
+
+    assert [message.kind for message in messages] == [
+        "text", "media", "interactive", "interactive", "interactive", "unsupported", "text", "unsupported"]
+    assert [message.text for message in messages] == [
+        "hey", None, "Track my order", "Size chart", "Stop", None, None, None]
+    image = messages[1]
+    assert (image.media_id, image.mime_type, image.caption) == ("media.1", "image/jpeg", "my receipt")
+    assert [message.reply_id for message in messages[2:5]] == ["track", "sizes", "STOP"]
+    assert messages[0].phone_number_id == "987654321098765"
+
+
+def test_malformed_bodies_are_rejected():
+    with pytest.raises(RetryableError, match="Error during json extraction"):
+        decode_webhook((resources / "fake_text_message_update.json").read_bytes())
+    with pytest.raises(ValueError, match="not valid JSON"):
+        decode_webhook(b"{not json")
+
+
+def test_webhook_answers_text_and_interactive_messages_only(webhook_credentials, fake_clients):
+    ai_client, whatsapp_client = fake_clients
+    app = create_app()
+    app.message_processor.ai_client = ai_client
+    app.message_processor.whatsapp_client = whatsapp_client
+
+    with app.test_client() as client:
+        response = client.post("/", query_string=webhook_credentials, data=MIXED_PAYLOAD,
+                               content_type="application/json")
+
+    assert response.status_code == 200
+    assert ai_client.prompts == ["hey", "Track my order", "Size chart", "Stop"]
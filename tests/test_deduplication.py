@@ -0,0 +1,62 @@
+import json
+import time
+from pathlib import Path
+
+from app import create_app
+from app.dedup import MessageDeduplicator
+from app.stores import MemoryTTLStore, SQLiteTTLStore
+
+
+resources = Path(__file__).parent / "resources"
+
+with open(resources / "text_message_update.json", "r") as json_file:
+    json_message_data = json.load(json_file)
+
+
+def test_memory_store_expires_and_evicts():
+    """
+    The memory store forgets keys after their TTL and never grows past max_entries.
+    """
+    store = MemoryTTLStore(max_entries=2, default_ttl=0.05)
+    assert store.add("a", "1")
+    assert not store.add("a", "1")
+
+    time.sleep(0.06)
+    assert store.add("a", "1")
+
+    store.add("b", "1")
+    store.add("c", "1")
+    assert len(store) == 2
+    assert store.get("a") is None
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    """
+    Two stores on the same file behave like two gunicorn workers sharing the dedup set.
+    """
+    first = MessageDeduplicator(SQLiteTTLStore(str(tmp_path / "dedup.sqlite3")), ttl=60)
+    second = MessageDeduplicator(SQLiteTTLStore(str(tmp_path / "dedup.sqlite3")), ttl=60)
+
+    assert first.claim("wamid.1")
+    assert not second.claim("wamid.1")
+
+    first.release("wamid.1")
+    assert second.claim("wamid.1")
+
+
+def test_redelivered_payload_is_answered_once(webhook_credentials, fake_clients):
+    """
+    A redelivered webhook payload must not produce a second reply.
+    """
+    ai_client, whatsapp_client = fake_clients
+    app = create_app()
+    app.message_processor.ai_client = ai_client
+    app.message_processor.whatsapp_client = whatsapp_client
+
+    with app.test_client() as client:
+        for _ in range(2):
+            response = client.post("/", query_string=webhook_credentials, json=json_message_data)
+            assert response.status_code == 200
+
+    assert len(whatsapp_client.sent) == 1
+    assert app.message_processor.dedup_stats() == {"claimed": 1, "duplicates": 1}
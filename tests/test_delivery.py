@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+from flask import Flask
+
+from app.delivery import AsyncReplyDelivery, ReplyDelivery
+from app.errors import RetryableError
+from app.messages import InboundMessage
+from app.outbox import Outbox
+from app.pipeline import MessageProcessor
+from app.segmenter import split_reply
+from tests.conftest import FakeAIClient, FakeWhatsAppClient
+
+
+REPLY = "First paragraph about delivery.\n\nSecond paragraph. It is about returns."
+
+
+class FlakyWhatsAppClient(FakeWhatsAppClient):
+    """Fake client whose listed calls (1-based) fail once."""
+
+    def __init__(self, failing_calls):
+        super().__init__()
+        self.failing_calls = set(failing_calls)
+        self.calls = 0
+
+    def send_message(self, message_text, receiver_phone_number):
+        self.calls += 1
+        if self.calls in self.failing_calls:
+            raise RetryableError("WhatsApp API 5xx error: 503")
+        super().send_message(message_text, receiver_phone_number)
+
+
+def test_split_reply_prefers_paragraphs():
+    """
+    Parts are cut at the paragraph break, stay within the limit and fall back to hard cuts.
+    """
+    assert split_reply(REPLY, 60) == ["First paragraph about delivery.",
+                                      "Second paragraph. It is about returns."]
+    assert split_reply(REPLY, 4096) == [REPLY]
+    assert split_reply("x" * 10, 4) == ["xxxx", "xxxx", "xx"]
+    assert split_reply("  ", 10) == []
+    assert all(len(part) <= 25 for part in split_reply(REPLY * 3, 25))
+
+
+def test_interrupted_reply_resumes_with_the_failed_part():
+    """
+    A failed second part keeps the rest; resuming sends it without sending the first part again.
+    """
+    whatsapp_client = FlakyWhatsAppClient(failing_calls=[2])
+    delivery = ReplyDelivery(whatsapp_client, max_part_chars=60)
+    with pytest.raises(RetryableError):
+        delivery.deliver("wamid.1", REPLY, "700")
+    assert delivery.stats()["pending"] == 1
+
+    assert delivery.resume("wamid.1")
+    assert [text for _, text in whatsapp_client.sent] == split_reply(REPLY, 60)
+    assert not delivery.resume("wamid.1")
+    stats = delivery.stats()
+    assert (stats["parts"], stats["split_replies"], stats["interrupted"], stats["resumed"]) == (2, 1, 1, 1)
+
+
+def test_failed_first_part_is_not_kept():
+    """
+    When nothing reached the user, a redelivery generates the reply again instead of resuming.
+    """
+    delivery = ReplyDelivery(FlakyWhatsAppClient(failing_calls=[1]), max_part_chars=60)
+    with pytest.raises(RetryableError):
+        delivery.deliver("wamid.1", REPLY, "700")
+    assert not delivery.resume("wamid.1")
+
+
+def test_processor_resumes_redelivered_message():
+    """
+    A redelivered message whose reply was interrupted is not sent to the model again.
+    """
+    ai_client = FakeAIClient()
+    whatsapp_client = FlakyWhatsAppClient(failing_calls=[2])
+    processor = MessageProcessor(whatsapp_client, ai_client, max_part_chars=20)
+    message = InboundMessage(id="wamid.1", sender="700", type="text", text="long question " * 3)
+    with Flask(__name__).app_context():
+        with pytest.raises(RetryableError):
+            processor.process(message)
+        processor.process(message)
+    assert len(ai_client.prompts) == 1
+    assert " ".join(text for _, text in whatsapp_client.sent) == f"reply to: {message.text}".strip()
+    assert processor.stats()["send_part"]["count"] == len(whatsapp_client.sent)
+
+
+def test_streamed_reply_resumes_after_a_failed_segment():
+    """
+    A segment failing after the first one keeps the rest of the stream; the redelivery sends only that.
+    """
+    class StreamingAIClient(FakeAIClient):
+        streaming = True
+
+        def stream_reply(self, message, sender=None):
+            self.prompts.append(message)
+            yield from ["First segment.", "Second segment.", "Third segment."]
+
+    ai_client = StreamingAIClient()
+    whatsapp_client = FlakyWhatsAppClient(failing_calls=[2])
+    processor = MessageProcessor(whatsapp_client, ai_client)
+    message = InboundMessage(id="wamid.1", sender="700", type="text", text="question")
+    with Flask(__name__).app_context():
+        with pytest.raises(RetryableError):
+            processor.process(message)
+        assert [text for _, text in whatsapp_client.sent] == ["First segment."]
+        processor.process(message)
+    assert len(ai_client.prompts) == 1
+    assert [text for _, text in whatsapp_client.sent] == ["First segment.", "Second segment.", "Third segment."]
+    assert processor.delivery.stats()["pending"] == 0
+
+
+def test_parts_are_committed_to_the_outbox_in_order(tmp_path):
+    """
+    With the outbox, every part becomes its own row, keyed after the answered message.
+    """
+    outbox = Outbox(str(tmp_path / "outbox.sqlite3"))
+    ReplyDelivery(FakeWhatsAppClient(), outbox, max_part_chars=60).deliver("wamid.1", REPLY, "700")
+    rows = outbox.claim(10)
+    assert [(row[1], row[3]) for row in rows] == [("wamid.1", split_reply(REPLY, 60)[0])]
+    assert outbox.contains("wamid.1#p1")
+
+
+def test_async_delivery_sends_parts_in_order():
+    """
+    The async delivery awaits each part before sending the next one.
+    """
+    class AsyncFakeWhatsAppClient(FakeWhatsAppClient):
+        async def send_message(self, message_text, receiver_phone_number):
+            await asyncio.sleep(0)
+            self.sent.append((receiver_phone_number, message_text))
+
+    whatsapp_client = AsyncFakeWhatsAppClient()
+    asyncio.run(AsyncReplyDelivery(whatsapp_client, max_part_chars=60).deliver("wamid.1", REPLY, "700"))
+    assert [text for _, text in whatsapp_client.sent] == split_reply(REPLY, 60)
@@ -0,0 +1,95 @@
+import json
+import os
+import shutil
+
+import openai
+import pytest
+
+from app.ai import AIClient
+from app.faq import FaqEngine, KeywordAutomaton
+
+
+FAQ_FILE = os.path.join(os.path.dirname(__file__), "resources", "faq.json")
+
+
+def test_automaton_finds_overlapping_patterns():
+    """
+    Patterns sharing prefixes and suffixes are all found in one pass.
+    """
+    automaton = KeywordAutomaton([("opening", "hours"), ("hours",), ("are", "you", "open"), ("you", "open", "today")])
+    matches = automaton.search("are you open today opening hours".split())
+    assert sorted(matches) == [(0, 4, 6), (1, 5, 6), (2, 0, 3), (3, 1, 4)]
+
+
+def test_exact_and_fuzzy_matches():
+    """
+    Confident matches are answered, misspellings fuzzily; mixed or uncovered questions fall through.
+    """
+    faq = FaqEngine(FAQ_FILE, reload_interval=0)
+    match = faq.match("What are your opening hours?")
+    assert (match.intent, match.method, match.score) == ("hours", "exact", 1.0)
+    assert faq.answer("Скажите адрес, пожалуйста") == "We are at 1 Abay Avenue, Almaty."
+    assert faq.match("openning hourss").method == "fuzzy"
+    # two intents, or too little of the message covered: ask the model
+    assert faq.match("opening hours and address?") is None
+    assert faq.match("Is the address on the invoice correct for my company registration?") is None
+    assert faq.match("Can I pay by card?") is None
+    stats = faq.stats()
+    assert (stats["exact"], stats["fuzzy"], stats["misses"]) == (2, 1, 3)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_hot_reload_keeps_previous_version_on_error(tmp_path):
+    """
+    A changed file is picked up on the next check; a broken one is ignored.
+    """
+    path = str(tmp_path / "faq.json")
+    shutil.copy(FAQ_FILE, path)
+    faq = FaqEngine(path, reload_interval=0.01)
+    assert faq.answer("wifi password") is None
+
+    with open(path, "w") as faq_file:
+        json.dump([{"intent": "wifi", "patterns": ["wifi password"], "answer": "It is 'coffee123'."}], faq_file)
+    os.utime(path, ns=(0, 10 ** 18))
+    faq._next_check = 0
+    assert faq.answer("wifi password?") == "It is 'coffee123'."
+    assert faq.answer("opening hours") is None
+
+    with open(path, "w") as faq_file:
+        faq_file.write("{broken")
+    os.utime(path, ns=(0, 2 * 10 ** 18))
+    faq._next_check = 0
+    assert faq.answer("wifi password?") == "It is 'coffee123'."
+    assert faq.stats()["reloads"] == 1
+    assert faq.stats()["reload_errors"] == 1
+
+
+def test_invalid_file_fails_at_startup(tmp_path):
+    """
+    A missing or malformed FAQ file is a configuration error.
+    """
+    path = tmp_path / "faq.json"
+    path.write_text('[{"intent": "hours"}]')
+    with pytest.raises(ValueError):
+        FaqEngine(str(path))
+    with pytest.raises(ValueError):
+        FaqEngine(str(tmp_path / "missing.json"))
+
+
+def test_generate_reply_skips_openai_for_faq(monkeypatch):
+    """
+    FAQ answers are returned without a completion; other messages still reach the model.
+    """
+    calls = []
+
+    def fake_create(**kwargs):
+        calls.append(kwargs)
+        return {"choices": [{"message": {"content": "Model reply"}}]}
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", fake_create)
+    client = AIClient("key", "gpt-3.5-turbo", 0.7, faq=FaqEngine(FAQ_FILE, reload_interval=0))
+
+    assert client.generate_reply("how much is delivery?") == "Delivery costs 1000 KZT and is free for orders over 20000 KZT."
+    assert calls == []
+    assert client.generate_reply("Do you sell gift cards?") == "Model reply"
+    assert len(calls) == 1
@@ -0,0 +1,135 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app import create_app, start_services
+from app.config import Config
+from app.lazy import LazyClient, after_fork
+from app.whatsapp import WhatsAppClient
+
+
+class Client:
+    """Client counting how often it was built."""
+
+    built = 0
+
+    def __init__(self):
+        Client.built += 1
+        self.name = "client"
+
+
+class BackgroundConfig(Config):
+    MESSAGE_PROCESSING_MODE = "background"
+    WORKER_POOL_SIZE = "1"
+
+
+# Run in a fresh interpreter, like a gunicorn master with --preload: build the app, fork a worker that serves
+PRELOAD = """
+import multiprocessing, os, sys, threading
+from app import create_app
+from app.config import Config
+
+class PreloadConfig(Config):
+    MESSAGE_PROCESSING_MODE = sys.argv[1]
+    WORKER_POOL_SIZE = SHARD_PROCESSES = SHARD_THREADS = "1"
+    OUTBOX_ENABLED = "true"
+    OUTBOX_SQLITE_PATH = sys.argv[2]
+    METRICS_ENABLED = "false"
+
+def background_threads():
+    return [thread.name for thread in threading.enumerate()
+            if thread.name.startswith(("whatsapp-worker", "outbox", "shard"))]
+
+app = create_app(PreloadConfig)
+assert app.services_pid is None and not background_threads() and not multiprocessing.active_children()
+pid = os.fork()
+if pid == 0:
+    with app.test_client() as client:
+        assert client.get("/stats").status_code == 200
+    assert app.services_pid == os.getpid() and background_threads()
+    sys.exit(0)
+_, status = os.waitpid(pid, 0)
+assert os.WEXITSTATUS(status) == 0, status
+assert app.services_pid is None and not background_threads() and not multiprocessing.active_children()
+"""
+
+
+def in_child(check):
+    """Run check() in a forked child process and return whether it passed."""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os._exit(0 if check() else 1)
+        except BaseException:
+            os._exit(2)
+    _, status = os.waitpid(pid, 0)
+    return os.WEXITSTATUS(status) == 0
+
+
+def test_lazy_client_builds_on_first_use():
+    """
+    The client is built once, on the first attribute access, and attributes are forwarded both ways.
+    """
+    Client.built = 0
+    proxy = LazyClient(Client)
+    assert not proxy.built and Client.built == 0
+
+    assert proxy.name == "client"
+    proxy.name = "renamed"
+    assert proxy.get().name == "renamed"
+    assert proxy.built and Client.built == 1
+
+
+def test_whatsapp_session_is_created_on_first_send():
+    """
+    Building the WhatsApp client opens no HTTP session; the session is reused afterwards.
+    """
+    client = WhatsAppClient("https://graph.example", "token", "access", "123")
+    assert client._session is None
+    assert client.session is client.session
+    assert client.session.headers["Authorization"] == "Bearer access"
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_child_builds_its_own_clients():
+    """
+    A child forked after the clients were built gets new clients, sessions and background workers.
+    """
+    proxy = LazyClient(Client)
+    parent_client = proxy.get()
+    whatsapp = WhatsAppClient("https://graph.example", "token", "access", "123")
+    parent_session = whatsapp.session
+    forks = []
+    after_fork(proxy, lambda owner: forks.append(owner))
+    app = create_app(BackgroundConfig)
+    start_services(app)
+    parent_ai_client, parent_pool = app.ai_client.get(), app.worker_pool
+
+    def check():
+        if app.worker_pool is parent_pool or app.worker_pool.stats()["workers"] != 0:
+            return False
+        start_services(app)
+        return (proxy.get() is not parent_client and forks == [proxy]
+                and whatsapp.session is not parent_session
+                and app.ai_client.get() is not parent_ai_client
+                and app.worker_pool.stats()["workers"] == 1)
+
+    try:
+        assert in_child(check)
+        assert proxy.get() is parent_client and app.worker_pool is parent_pool
+    finally:
+        app.worker_pool.stop()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+@pytest.mark.parametrize("mode", ["background", "sharded"])
+def test_preloading_master_starts_no_services(tmp_path, mode):
+    """
+    The master starts no worker pool, outbox sender or shard processes; the forked worker starts and stops its own.
+    """
+    result = subprocess.run([sys.executable, "-c", PRELOAD, mode, str(tmp_path / "outbox.sqlite3")],
+                            env={**os.environ, "LOG_FILE": ""}, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert "Traceback" not in result.stderr
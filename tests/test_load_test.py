@@ -0,0 +1,39 @@
+import requests
+
+from benchmarks.harness import iter_messages, load_template, percentile, synthetic_payload
+from benchmarks.load_test import regressions
+from benchmarks.stubs import GraphStubServer
+
+
+def test_stub_injects_errors_at_the_configured_rate():
+    with GraphStubServer(error_rate=1.0, error_status=500) as server:
+        response = requests.post(f"{server.url}/123/messages", json={})
+    assert response.status_code == 500
+    assert server.errors == 1
+
+    with GraphStubServer(error_rate=0.0) as server:
+        assert requests.post(f"{server.url}/123/messages", json={}).status_code == 200
+    assert server.errors == 0
+
+
+def test_synthetic_payload_is_unique_and_keeps_sender_grouping():
+    template = load_template("batched_message_update.json")
+    first, second = synthetic_payload(template, 1), synthetic_payload(template, 2)
+
+    original = [message["from"] for message in iter_messages(template)]
+    copied = [message["from"] for message in iter_messages(first)]
+    assert [original.index(sender) for sender in original] == [copied.index(sender) for sender in copied]
+    assert not set(copied) & {message["from"] for message in iter_messages(second)}
+    ids = [message["id"] for payload in (first, second) for message in iter_messages(payload)]
+    assert len(ids) == len(set(ids))
+    assert [message["from"] for message in iter_messages(template)] == original
+
+
+def test_percentile_and_regression_comparison():
+    assert percentile([0.1, 0.2, 0.3, 0.4], 0.5) == 0.2
+    assert percentile([], 0.99) == 0.0
+
+    previous = {"metrics": {"throughput_rps": 100.0, "latency_p95_ms": 50.0, "error_rate": 0.0}}
+    current = {"metrics": {"throughput_rps": 95.0, "latency_p95_ms": 80.0, "error_rate": 0.001}}
+    regressed = {metric for metric, _, _, _, worse in regressions(previous, current, 0.1) if worse}
+    assert regressed == {"latency_p95_ms"}
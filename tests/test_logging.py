@@ -0,0 +1,101 @@
+import io
+import json
+import logging
+import threading
+import time
+
+from app.config import Config
+from app.logging_setup import configure_logging, logging_stats, stop_logging
+from app.messages import InboundMessage
+from app.pipeline import MessageProcessor
+from app.services import config_to_dict
+
+
+def logging_config(**overrides):
+    return dict(config_to_dict(Config), LOG_LEVEL="INFO", **overrides)
+
+
+class LoggingAIClient:
+    """AI client stand-in that logs while the reply is generated."""
+
+    def generate_reply(self, message, sender=None):
+        logging.getLogger("tests.ai").info("generating reply to %s", message)
+        return "reply"
+
+
+class NullWhatsAppClient:
+    def send_message(self, message_text, receiver_phone_number):
+        pass
+
+
+def test_json_records_carry_message_correlation_fields():
+    """
+    Records logged while a message is processed carry its id and sender in the JSON output.
+    """
+    stream = io.StringIO()
+    configure_logging(logging_config(LOG_FORMAT="json"), handlers=[logging.StreamHandler(stream)])
+    try:
+        processor = MessageProcessor(NullWhatsAppClient(), LoggingAIClient())
+        processor.process(InboundMessage(id="wamid.1", sender="70000000000", type="text", text="hey"))
+        logging.getLogger("tests.ai").debug("filtered out by the level")
+        logging.getLogger("tests.ai").warning("outside of a message")
+    finally:
+        stop_logging()
+
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [record["message"] for record in records] == ["generating reply to hey", "outside of a message"]
+    assert records[0]["message_id"] == "wamid.1"
+    assert records[0]["sender"] == "70000000000"
+    assert records[0]["level"] == "INFO"
+    assert "message_id" not in records[1]
+
+
+class BlockingHandler(logging.Handler):
+    """Handler whose writes wait until released, like a stalled disk."""
+
+    def __init__(self):
+        super().__init__()
+        self.unblocked = threading.Event()
+        self.messages = []
+
+    def emit(self, record):
+        self.unblocked.wait(5)
+        self.messages.append(record.getMessage())
+
+
+def test_full_queue_drops_records_instead_of_blocking():
+    """
+    A stalled writer never blocks the logging thread; overflowing records are counted as dropped.
+    """
+    handler = BlockingHandler()
+    configure_logging(logging_config(LOG_QUEUE_SIZE="2"), handlers=[handler])
+    logger = logging.getLogger("tests.flood")
+    try:
+        started = time.perf_counter()
+        for index in range(20):
+            logger.warning("record %d", index)
+        assert time.perf_counter() - started < 0.5
+        assert logging_stats()["dropped"] >= 17
+    finally:
+        handler.unblocked.set()
+        stop_logging()
+    assert handler.messages[0] == "record 0"
+    assert 1 <= len(handler.messages) <= 3
+
+
+def test_third_party_formats_keep_process_and_caller_fields():
+    """
+    Configuring the app logging leaves the process-wide record fields alone, e.g. for gunicorn's error log format.
+    """
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    configure_logging(logging_config(), handlers=[handler])
+    handler.setFormatter(logging.Formatter("[%(process)d] %(threadName)s %(funcName)s:%(lineno)d %(message)s"))
+    try:
+        logging.getLogger("tests.gunicorn").warning("worker booted")
+    finally:
+        stop_logging()
+
+    line = stream.getvalue().strip()
+    assert line.startswith("[") and "test_third_party_formats_keep_process_and_caller_fields" in line
+    assert line.endswith("worker booted")
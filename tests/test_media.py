@@ -0,0 +1,102 @@
+import pytest
+from flask import Flask
+
+from app.errors import RetryableError
+from app.media import DescribeMediaProcessor, MediaDownloader, MediaHandler, MediaRejectedError, load_media_processor
+from app.messages import InboundMessage
+from app.pipeline import MessageProcessor
+from app.whatsapp import WhatsAppClient
+from benchmarks.stubs import GraphStubServer
+from tests.conftest import FakeAIClient, FakeWhatsAppClient
+
+
+class UpperProcessor:
+    """Processor returning the MIME type in capitals."""
+
+    def process(self, media, message):
+        return media.mime_type.upper()
+
+
+@pytest.fixture
+def graph():
+    with GraphStubServer() as server:
+        server.add_media("small", 1000)
+        server.add_media("large", 300_000, "audio/ogg")
+        yield server
+
+
+def downloader_for(graph, **options):
+    return MediaDownloader(WhatsAppClient(graph.url, "token", "access", "123"), **options)
+
+
+def image(media_id, caption=None):
+    return InboundMessage(id=f"wamid.{media_id}", sender="700", type="image", media_id=media_id,
+                          mime_type="image/jpeg", caption=caption)
+
+
+def test_small_files_stay_in_memory_and_large_ones_are_mapped(graph):
+    """
+    Downloads above the spool size go to disk and are memory-mapped; the content is intact either way.
+    """
+    downloader = downloader_for(graph, spool_bytes=100_000, chunk_bytes=8192)
+    with downloader.download("small") as small, downloader.download("large") as large:
+        assert not small.on_disk and large.on_disk
+        assert (small.size, large.size) == (1000, 300_000)
+        assert large.sha256 == graph.media["large"][2]
+        with large.mapped() as content:
+            assert content[:256] == GraphStubServer.PATTERN[:256]
+            assert len(content) == 300_000
+        assert sum(len(chunk) for chunk in small.chunks()) == 1000
+    assert downloader.stats()["spooled_to_disk"] == 1
+
+
+def test_size_limit_is_checked_before_downloading(graph):
+    """
+    A file announced above the limit is rejected with one metadata request and answered without its content.
+    """
+    handler = MediaHandler(downloader_for(graph, max_bytes=100_000))
+    with pytest.raises(MediaRejectedError):
+        handler.downloader.download("large")
+    assert graph.requests == 1
+
+    text = handler.to_text(image("large", caption="what is this?"))
+    assert text.startswith("what is this?\n[image received but it could not be opened")
+    assert handler.stats()["rejected"] == 1
+
+
+def test_concurrent_downloads_are_bounded(graph):
+    """
+    A download waiting for a free slot gives up with a retryable error.
+    """
+    downloader = downloader_for(graph, max_concurrent=1, acquire_timeout=0.01)
+    downloader._slots.acquire()
+    with pytest.raises(RetryableError):
+        downloader.download("small")
+    downloader._slots.release()
+    downloader.download("small").close()
+
+
+def test_pipeline_answers_media_messages(graph):
+    """
+    The processor's text, after the caption, is answered like a text message; without a handler media is skipped.
+    """
+    ai_client, whatsapp_client = FakeAIClient(), FakeWhatsAppClient()
+    with Flask(__name__).app_context():
+        MessageProcessor(whatsapp_client, ai_client).process(image("small"))
+        assert ai_client.prompts == []
+
+        media = MediaHandler(downloader_for(graph), DescribeMediaProcessor())
+        MessageProcessor(whatsapp_client, ai_client, media=media).process(image("small", caption="price?"))
+    assert ai_client.prompts == ["price?\n[image received: image/jpeg, 1000 bytes]"]
+    assert whatsapp_client.sent[0][0] == "700"
+
+
+def test_load_media_processor():
+    """
+    Custom processors are loaded from "module:attribute"; invalid paths fail with a ValueError.
+    """
+    assert isinstance(load_media_processor("tests.test_media:UpperProcessor"), UpperProcessor)
+    with pytest.raises(ValueError):
+        load_media_processor("tests.test_media:missing")
+    with pytest.raises(ValueError):
+        load_media_processor("tests.test_media:FakeAIClient")
@@ -0,0 +1,93 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+from app import create_app
+from app.config import Config
+from app.metrics import BotMetrics, MetricsRegistry
+from benchmarks.stubs import GraphStubServer, OpenAIStubServer
+
+
+resources = Path(__file__).parent / "resources"
+
+with open(resources / "batched_message_update.json", "r") as json_file:
+    batched_message_data = json.load(json_file)
+
+
+def test_thread_shards_are_merged_on_render():
+    """
+    Observations from many threads, including exited ones, all show up in a scrape.
+    """
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ("path",))
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+
+    def work():
+        for _ in range(100):
+            requests.inc("/")
+            latency.observe(0.5)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latency.observe(0.05)
+
+    text = registry.render()
+    assert 'requests_total{path="/"} 800' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 801' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 801' in text
+    assert "latency_seconds_count 801" in text
+    assert "# TYPE latency_seconds histogram" in text
+
+
+def test_multiprocess_snapshots_are_summed(tmp_path):
+    """
+    With a shared directory, a scrape adds up the snapshots of the other worker processes.
+    """
+    worker = BotMetrics(str(tmp_path))
+    worker.count_message("text")
+    worker.write_snapshot()
+    # pretend the snapshot came from another worker process
+    (tmp_path / f"metrics-{os.getpid()}.json").rename(tmp_path / "metrics-1.json")
+
+    scraped = BotMetrics(str(tmp_path))
+    scraped.count_message("text")
+    scraped.count_message("image")
+    text = scraped.render()
+    assert 'whatsapp_bot_messages_total{type="text"} 2' in text
+    assert 'whatsapp_bot_messages_total{type="image"} 1' in text
+
+
+def test_metrics_endpoint_reports_stages_tokens_and_messages():
+    """
+    A processed webhook shows up in the stage histograms, token counts and message counters.
+    """
+    with GraphStubServer() as graph, OpenAIStubServer() as openai_stub:
+        class StubConfig(Config):
+            WHATSAPP_API_URL = graph.url
+            OPENAI_API_BASE = openai_stub.api_base
+            OPENAI_TEMPERATURE = "0.7"
+            OPENAI_MODEL = "gpt-3.5-turbo"
+            DEDUP_BACKEND = "none"
+            REPLY_CACHE_BACKEND = "memory"
+
+        app = create_app(StubConfig)
+        with app.test_client() as client:
+            assert client.post("/", json=batched_message_data).status_code == 200
+            response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    text = response.get_data(as_text=True)
+    assert 'whatsapp_bot_messages_total{type="text"} 4' in text
+    assert 'whatsapp_bot_stage_duration_seconds_count{stage="unpack_messages"} 1' in text
+    assert 'whatsapp_bot_stage_duration_seconds_count{stage="generate_reply"} 4' in text
+    assert 'whatsapp_bot_stage_duration_seconds_count{stage="send_message"} 4' in text
+    assert 'whatsapp_bot_generate_reply_tokens_count{kind="completion"} 4' in text
+    assert 'whatsapp_bot_generate_reply_tokens_sum{kind="completion"} 28' in text
+    assert 'whatsapp_bot_reply_cache_requests_total{result="miss"} 4' in text
+    assert 'whatsapp_bot_upstream_retries_total{upstream="openai"} 0' in text
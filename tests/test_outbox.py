@@ -0,0 +1,130 @@
+import json
+import threading
+import time
+from pathlib import Path
+
+from flask import Flask
+
+from app import create_app
+from app.config import Config
+from app.errors import RetryableError
+from app.outbox import Outbox, OutboxSender, main
+from tests.conftest import FakeAIClient, FakeWhatsAppClient
+
+
+resources = Path(__file__).parent / "resources"
+
+with open(resources / "text_message_update.json", "r") as json_file:
+    json_message_data = json.load(json_file)
+
+
+class FlakyWhatsAppClient(FakeWhatsAppClient):
+    """Fails the first `failures` sends with a retryable error."""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def send_message(self, message_text, receiver_phone_number):
+        if self.failures:
+            self.failures -= 1
+            raise RetryableError("Graph API is down")
+        super().send_message(message_text, receiver_phone_number)
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_concurrent_replies_are_group_committed_and_sent_in_order(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.sqlite3"))
+    whatsapp_client = FakeWhatsAppClient()
+
+    def write(worker):
+        for index in range(20):
+            outbox.add(f"wamid.{worker}.{index}", f"7000000000{worker % 3}", f"{worker}.{index}")
+
+    threads = [threading.Thread(target=write, args=(worker,)) for worker in range(9)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    outbox.add("wamid.0.0", "70000000000", "duplicate of an already queued reply")
+
+    stats = outbox.stats()
+    assert stats["pending"] == 180
+    assert stats["commits"] < stats["added"]
+
+    sender = OutboxSender(Flask(__name__), outbox, whatsapp_client, concurrency=3, poll_interval=0.05)
+    sender.start()
+    try:
+        assert _wait_for(lambda: len(whatsapp_client.sent) == 180)
+    finally:
+        sender.stop()
+    for worker in range(9):
+        replies = [text for _, text in whatsapp_client.sent if text.startswith(f"{worker}.")]
+        assert replies == [f"{worker}.{index}" for index in range(20)]
+    assert outbox.stats()["sent"] == 180
+
+
+def test_failed_replies_are_retried_then_marked_dead_and_requeued(tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    outbox = Outbox(path)
+    outbox.add("wamid.1", "70000000000", "hello")
+    sender = OutboxSender(Flask(__name__), outbox, FlakyWhatsAppClient(failures=2), max_attempts=2, base_delay=0)
+
+    assert sender.deliver_due() == 1
+    assert sender.deliver_due() == 1
+    dead = outbox.rows("dead")
+    assert len(dead) == 1 and dead[0]["attempts"] == 2 and dead[0]["last_error"] == "Graph API is down"
+
+    main(["--path", path, "requeue"])
+    assert sender.deliver_due() == 1
+    assert outbox.stats()["sent"] == 1
+    main(["--path", path, "purge", "sent"])
+    assert outbox.rows() == []
+
+
+def test_leased_replies_are_recovered_on_start(tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    outbox = Outbox(path, lease_seconds=3600)
+    outbox.add("wamid.1", "70000000000", "hello")
+    # claimed by a process that died before sending
+    assert len(outbox.claim(10)) == 1
+    assert outbox.claim(10) == []
+
+    whatsapp_client = FakeWhatsAppClient()
+    sender = OutboxSender(Flask(__name__), Outbox(path), whatsapp_client, poll_interval=0.05)
+    sender.start()
+    try:
+        assert _wait_for(lambda: whatsapp_client.sent == [("70000000000", "hello")])
+    finally:
+        sender.stop()
+
+
+def test_webhook_replies_go_through_the_outbox(tmp_path, webhook_credentials):
+    class OutboxConfig(Config):
+        OUTBOX_ENABLED = "true"
+        OUTBOX_SQLITE_PATH = str(tmp_path / "outbox.sqlite3")
+        DEDUP_BACKEND = "none"
+
+    app = create_app(OutboxConfig)
+    ai_client, whatsapp_client = FakeAIClient(), FakeWhatsAppClient()
+    app.message_processor.ai_client = ai_client
+    app.message_processor.whatsapp_client = app.outbox_sender.whatsapp_client = whatsapp_client
+    try:
+        with app.test_client() as client:
+            assert client.post("/", query_string=webhook_credentials, json=json_message_data).status_code == 200
+            assert _wait_for(lambda: len(whatsapp_client.sent) == 1)
+            # a redelivery after the reply was committed is not generated again
+            assert client.post("/", query_string=webhook_credentials, json=json_message_data).status_code == 200
+            stats = client.get("/stats").get_json()
+    finally:
+        app.outbox_sender.stop()
+
+    assert len(ai_client.prompts) == 1
+    assert stats["outbox"]["sent"] == 1
+    assert stats["stages"]["outbox_write"]["count"] == 1
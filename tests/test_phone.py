@@ -0,0 +1,52 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from app.phone import BUILTIN_RULES, PhoneNormalizer, load_rules
+
+
+def test_numbers_are_normalized_to_e164_with_rewrite_rules():
+    normalizer = PhoneNormalizer(default_regions=["KZ"], rules=[BUILTIN_RULES["kz_trunk_prefix"]])
+
+    assert normalizer.normalize("77012345678") == "787012345678"
+    assert normalizer.normalize("+7 701 234-56-78") == "787012345678"
+    # local format with the trunk prefix, resolved through the default region
+    assert normalizer.normalize("8 701 234 56 78") == "787012345678"
+    # rules only apply to their region
+    assert normalizer.normalize("79161234567") == "79161234567"
+    assert normalizer.normalize("+1 (415) 555-2671") == "14155552671"
+    # invalid numbers, like test senders, are passed through as digits
+    assert normalizer.normalize("70000000000") == "70000000000"
+    with pytest.raises(ValueError):
+        normalizer.normalize("not a number")
+
+
+def test_lookups_are_memoized_in_a_bounded_cache():
+    normalizer = PhoneNormalizer(cache_size=2)
+    for number in ("14155552671", "14155552671", "79161234567", "77012345678", "14155552671"):
+        normalizer.normalize(number)
+
+    assert normalizer.stats() == {"hits": 1, "misses": 4, "entries": 2}
+
+
+def test_rules_are_loaded_by_name_from_builtins_and_a_file(tmp_path):
+    rules_file = tmp_path / "rules.json"
+    rules_file.write_text(json.dumps([
+        {"name": "us_strip_country_code", "region": "US", "pattern": r"^1(\d{10})$", "replacement": r"\1"},
+    ]))
+
+    rules = load_rules("kz_trunk_prefix, us_strip_country_code", str(rules_file))
+    assert [rule.name for rule in rules] == ["kz_trunk_prefix", "us_strip_country_code"]
+    assert PhoneNormalizer(rules=rules).normalize("14155552671") == "4155552671"
+    with pytest.raises(ValueError):
+        load_rules("no_such_rule")
+
+
+def test_phonenumbers_is_imported_on_first_use():
+    code = ("import sys; import app.whatsapp; before = 'phonenumbers' in sys.modules; "
+            "app.whatsapp.PhoneNormalizer().normalize('14155552671'); "
+            "print(before, 'phonenumbers' in sys.modules)")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.split() == ["False", "True"]
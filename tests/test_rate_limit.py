@@ -0,0 +1,123 @@
+import time
+
+import pytest
+from flask import Flask
+
+from app.errors import RetryableError
+from app.rate_limit import RateLimiter, SQLiteTokenBucket, TokenBucket, rate_limit_delay
+from app.whatsapp import WhatsAppClient
+from benchmarks.stubs import GraphStubServer
+
+
+class RateLimitedGraphStub(GraphStubServer):
+    """Graph API stub that answers the first request with a 429 and a Retry-After header."""
+
+    def handle_post(self, path, body):
+        if self.requests == 0:
+            self._count_request()
+            return 429, {"error": {"message": "Too many requests", "code": 130429}}, {"Retry-After": "1"}
+        return super().handle_post(path, body)
+
+
+def test_token_bucket_spaces_out_requests():
+    """
+    A bucket of 20 requests per second lets a one-request burst through and delays the rest.
+    """
+    limiter = RateLimiter("test", TokenBucket(rate=20, capacity=1))
+    started = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+    elapsed = time.monotonic() - started
+
+    assert 0.15 <= elapsed < 1.0
+    assert limiter.stats()["delayed"] == 4
+
+
+def test_acquire_fails_fast_when_the_wait_is_too_long():
+    """
+    A call that would wait longer than max_wait raises a retryable error instead of blocking.
+    """
+    limiter = RateLimiter("openai", TokenBucket(rate=1), TokenBucket(rate=10, capacity=100), max_wait=0.5)
+    limiter.acquire(tokens=100)
+
+    with pytest.raises(RetryableError, match="openai rate limit"):
+        limiter.acquire(tokens=100)
+    assert limiter.stats()["rejected"] == 1
+
+
+def test_rejected_call_returns_its_request_token(tmp_path):
+    """
+    A call rejected by a tight tokens bucket gives its request token back, so it costs no request budget.
+    """
+    for make_bucket in (lambda name, rate, capacity: TokenBucket(rate, capacity),
+                        lambda name, rate, capacity: SQLiteTokenBucket(str(tmp_path / "limits.sqlite3"), name,
+                                                                       rate, capacity)):
+        requests = make_bucket("requests", 0.01, 2)
+        limiter = RateLimiter("openai", requests, make_bucket("tokens", 1, 100), max_wait=0.5)
+        limiter.acquire(tokens=100)
+        for _ in range(5):
+            with pytest.raises(RetryableError):
+                limiter.acquire(tokens=100)
+
+        # one of the two requests is left, only the tokens bucket was short
+        assert requests.try_take(1) == 0
+        assert requests.try_take(1) > 0
+
+
+def test_rate_limit_headers_are_understood():
+    """
+    Retry-After, OpenAI reset headers and the Graph API usage header all yield a back-off delay.
+    """
+    assert rate_limit_delay({"Retry-After": "7"}) == 7
+    assert rate_limit_delay({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "1m30s"}) == 90
+    assert rate_limit_delay({"x-ratelimit-remaining-requests": "12", "x-ratelimit-reset-requests": "1s"}) is None
+    assert rate_limit_delay({"x-business-use-case-usage":
+                             '{"123": [{"call_count": 100, "estimated_time_to_regain_access": 2}]}'}) == 120
+    assert rate_limit_delay({}) is None
+
+
+def test_429_halves_the_rate_and_successes_recover_it():
+    """
+    The limiter halves its rate on a 429 (AIMD) and creeps back to the configured rate on success.
+    """
+    limiter = RateLimiter("test", TokenBucket(rate=10))
+    limiter.on_rate_limited({"Retry-After": "0"})
+    assert limiter.requests.rate == 5
+
+    for _ in range(20):
+        limiter.on_success()
+    assert limiter.requests.rate == 10
+
+
+def test_send_message_treats_429_as_retryable_and_pauses_the_limiter():
+    """
+    A Graph API 429 raises a retryable error and the next send waits out the Retry-After.
+    """
+    app = Flask(__name__)
+    limiter = RateLimiter("whatsapp", TokenBucket(rate=80), max_wait=5)
+    with RateLimitedGraphStub() as server, app.app_context():
+        client = WhatsAppClient(server.url, "verify-token", "access-token", "123456", rate_limiter=limiter)
+        with pytest.raises(RetryableError, match="rate limited"):
+            client.send_message("hello", "70000000000")
+
+        started = time.monotonic()
+        client.send_message("hello", "70000000000")
+
+        assert time.monotonic() - started >= 0.9
+        assert server.requests == 2
+        assert limiter.stats()["rate_limited"] == 1
+
+
+def test_sqlite_buckets_share_one_budget(tmp_path):
+    """
+    Two buckets on the same database file (e.g. two gunicorn workers) draw from one budget.
+    """
+    path = str(tmp_path / "rate_limit.sqlite3")
+    first = SQLiteTokenBucket(path, "whatsapp:requests", rate=1, capacity=2)
+    second = SQLiteTokenBucket(path, "whatsapp:requests", rate=1, capacity=2)
+
+    assert first.try_take() == 0
+    assert second.try_take() == 0
+    assert first.try_take() > 0
+    second.pause(30)
+    assert first.try_take() > 20
@@ -0,0 +1,73 @@
+import openai
+
+from app.ai import AIClient
+from app.reply_cache import ReplyCache, normalize_message
+from app.stores import MemoryTTLStore, SQLiteTTLStore, create_store
+
+
+def test_normalize_message():
+    """
+    Case, punctuation, whitespace and Unicode compatibility forms are normalized away.
+    """
+    assert normalize_message("  What are your HOURS?? ") == "what are your hours"
+    assert normalize_message("ＨＩ!") == "hi"
+    assert normalize_message("Привет,   мир") == "привет мир"
+
+
+def test_generate_reply_uses_cache(monkeypatch):
+    """
+    The second equivalent message is answered from the cache without an API call.
+    """
+    calls = []
+
+    def fake_create(**kwargs):
+        calls.append(kwargs)
+        return {"choices": [{"message": {"content": " We are open 9-18. "}}]}
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", fake_create)
+    cache = ReplyCache(MemoryTTLStore(max_entries=100, max_bytes=10000), ttl=60)
+    client = AIClient("key", "gpt-3.5-turbo", 0.7, reply_cache=cache)
+
+    assert client.generate_reply("What are your hours?") == "We are open 9-18."
+    assert client.generate_reply("what are your hours") == "We are open 9-18."
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+    # a different temperature must not reuse the cached reply
+    client.temperature = 0.2
+    client.generate_reply("What are your hours?")
+    assert len(calls) == 2
+
+
+def test_memory_store_respects_byte_cap():
+    """
+    The memory store evicts least recently used replies once the byte cap is exceeded.
+    """
+    store = MemoryTTLStore(max_entries=100, max_bytes=1000)
+    for index in range(20):
+        store.set(f"key-{index}", "x" * 100)
+    assert store.size_bytes <= 1000
+    assert store.get("key-19") is not None
+    assert store.get("key-0") is None
+
+
+def test_sqlite_store_respects_entry_and_byte_caps(tmp_path, monkeypatch):
+    """
+    The shared sqlite store evicts the oldest writes once a cap is exceeded, rewritten keys count as new.
+    """
+    monkeypatch.setattr(SQLiteTTLStore, "CAP_CHECK_EVERY", 1)
+    store = create_store("sqlite", max_entries=5, default_ttl=3600, sqlite_path=str(tmp_path / "cache.sqlite3"),
+                         max_bytes=10_000)
+    for index in range(10):
+        store.set(f"key-{index}", "x")
+        store.set("key-0", "x")
+    assert len(store) == 5
+    assert store.get("key-0") is not None and store.get("key-1") is None
+
+    store.max_entries = None
+    store.max_bytes = 1000
+    for index in range(20):
+        store.set(f"big-{index}", "x" * 100)
+    assert len(store) <= 9
+    assert store.get("big-19") is not None and store.get("big-0") is None
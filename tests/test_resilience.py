@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+import pytest
+from flask import Flask
+
+from app.async_clients import AsyncAIClient, ShardedAsyncClient
+from app.errors import CircuitOpenError, RateLimitError, RetryableError
+from app.resilience import CircuitBreaker, RetryPolicy
+from app.whatsapp import WhatsAppClient
+from benchmarks.stubs import GraphStubServer, OpenAIStubServer
+
+
+class FlakyGraphStub(GraphStubServer):
+    """Graph API stub that answers the first `failures` requests with a 503."""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def handle_post(self, path, body):
+        if self.requests < self.failures:
+            self._count_request()
+            return 503, {"error": {"message": "Service temporarily unavailable"}}
+        return super().handle_post(path, body)
+
+
+class FlakyOpenAIStub(OpenAIStubServer):
+    """OpenAI stub that answers the first request with a 500."""
+
+    def handle_post(self, path, body):
+        if self.requests == 0:
+            self._count_request()
+            return 500, {"error": {"message": "The server had an error"}}
+        return super().handle_post(path, body)
+
+
+def test_send_message_retries_transient_5xx():
+    """
+    A Graph API 503 is retried with backoff inside send_message instead of failing the webhook.
+    """
+    app = Flask(__name__)
+    policy = RetryPolicy("whatsapp", max_attempts=3, base_delay=0.01)
+    with FlakyGraphStub(failures=2) as server, app.app_context():
+        client = WhatsAppClient(server.url, "verify-token", "access-token", "123456", retry_policy=policy)
+        client.send_message("hello", "70000000000")
+
+    assert server.requests == 3
+    assert policy.stats() == {"calls": 1, "retries": 2, "failed": 0}
+
+
+def test_retries_stop_at_the_deadline():
+    """
+    No retry is started once its backoff would overrun the call's deadline.
+    """
+    attempts = []
+
+    def always_failing(timeout):
+        attempts.append(timeout)
+        raise RetryableError("upstream down")
+
+    policy = RetryPolicy("openai", max_attempts=100, base_delay=0.05, max_delay=0.05, deadline=0.3)
+    started = time.monotonic()
+    with pytest.raises(RetryableError, match="upstream down"):
+        policy.call(always_failing)
+
+    assert time.monotonic() - started < 0.5
+    assert 1 < len(attempts) < 100
+    assert attempts[0] == pytest.approx(0.3, abs=0.01)
+    assert all(later < earlier for earlier, later in zip(attempts, attempts[1:]))
+
+
+def test_circuit_breaker_fails_fast_and_recovers_after_a_probe():
+    """
+    After repeated failures the breaker rejects calls without reaching the upstream; a successful probe closes it.
+    """
+    breaker = CircuitBreaker("whatsapp", failure_threshold=2, reset_timeout=0.2)
+    policy = RetryPolicy("whatsapp", max_attempts=1)
+    calls = []
+
+    def failing(timeout):
+        calls.append(timeout)
+        raise RetryableError("WhatsApp API 5xx error: 503")
+
+    for _ in range(2):
+        with pytest.raises(RetryableError):
+            policy.call(failing, breaker)
+    with pytest.raises(CircuitOpenError):
+        policy.call(failing, breaker)
+    assert len(calls) == 2
+    assert breaker.stats()["state"] == "open"
+
+    time.sleep(0.25)
+    assert policy.call(lambda timeout: "sent", breaker) == "sent"
+    assert breaker.stats() == {"state": "closed", "consecutive_failures": 0, "opened": 1, "rejected": 1}
+
+
+def test_rate_limits_do_not_open_the_breaker():
+    """
+    A throttling upstream is alive, so 429s are retried but never trip the breaker.
+    """
+    breaker = CircuitBreaker("openai", failure_threshold=1)
+    policy = RetryPolicy("openai", max_attempts=2, base_delay=0.01)
+
+    def throttled(timeout):
+        raise RateLimitError("OpenAI rate limit: 429")
+
+    with pytest.raises(RateLimitError):
+        policy.call(throttled, breaker)
+    assert breaker.state == "closed"
+    assert policy.stats()["retries"] == 1
+
+
+def test_async_ai_client_retries_a_failed_completion():
+    """
+    The asyncio client goes through the same retry policy.
+    """
+    async def scenario(api_base):
+        http_client = ShardedAsyncClient(max_connections=2)
+        client = AsyncAIClient("key", "gpt-3.5-turbo", 0.7, api_base=api_base, http_client=http_client,
+                               retry_policy=RetryPolicy("openai", max_attempts=2, base_delay=0.01))
+        try:
+            return await client.generate_reply("hi"), client
+        finally:
+            await http_client.aclose()
+
+    with FlakyOpenAIStub(reply="Hello!") as openai_stub:
+        reply, client = asyncio.run(scenario(openai_stub.api_base))
+
+    assert reply == "Hello!"
+    assert openai_stub.requests == 2
+    assert client.retry_policy.stats()["retries"] == 1
@@ -0,0 +1,108 @@
+import os
+
+import openai
+import pytest
+
+from app.ai import AIClient
+from app.retrieval import KnowledgeIndex, Retriever, build_index, chunk_document
+
+
+CATALOG = """# Jackets
+
+The blue rain jacket costs 25000 KZT and comes in sizes S, M, L and XL.
+
+# Shoes
+
+Trail running shoes cost 30000 KZT, sizes 38 to 46.
+"""
+RETURNS = "Returns are accepted within 14 days with the receipt. Refunds are paid to the original card."
+
+
+@pytest.fixture
+def docs(tmp_path):
+    directory = tmp_path / "docs"
+    (directory / "policies").mkdir(parents=True)
+    (directory / "catalog.md").write_text(CATALOG)
+    (directory / "policies" / "returns.txt").write_text(RETURNS)
+    (directory / "image.png").write_bytes(b"\x89PNG")
+    return directory
+
+
+def test_chunk_document():
+    """
+    Paragraphs are merged up to the chunk size, longer ones are split between words.
+    """
+    assert chunk_document("one\n\ntwo\n\n\nthree", chunk_chars=9) == ["one\ntwo", "three"]
+    assert chunk_document("aaaa bbbb cccc", chunk_chars=9) == ["aaaa", "bbbb cccc"]
+
+
+def test_build_and_search(docs, tmp_path):
+    """
+    The best chunk of a query is found, plural forms included, and unknown words match nothing.
+    """
+    path = str(tmp_path / "knowledge.index")
+    stats = build_index(str(docs), path, chunk_chars=80)
+    assert (stats["files"], stats["reused_files"]) == (2, 0)
+    index = KnowledgeIndex(path)
+    score, chunk_id = index.search("how much are the trail running shoes?", top_k=1)[0]
+    assert score > 0
+    assert index.chunk_text(chunk_id) == "Trail running shoes cost 30000 KZT, sizes 38 to 46."
+    assert index.chunk_source(index.search("refund", top_k=1)[0][1]) == os.path.join("policies", "returns.txt")
+    assert index.search("zzz qqq") == []
+    index.close()
+
+
+def test_incremental_rebuild(docs, tmp_path):
+    """
+    Unchanged documents are reused from the previous index, changed ones are read again.
+    """
+    path = str(tmp_path / "knowledge.index")
+    build_index(str(docs), path, chunk_chars=80)
+    first_version = KnowledgeIndex(path).version
+
+    (docs / "policies" / "returns.txt").write_text(RETURNS + " Exchanges are free of charge.")
+    stats = build_index(str(docs), path, chunk_chars=80)
+    assert (stats["files"], stats["reused_files"]) == (2, 1)
+    index = KnowledgeIndex(path)
+    assert index.version != first_version
+    assert "Exchanges" in index.chunk_text(index.search("exchange", top_k=1)[0][1])
+
+
+def test_invalid_index(tmp_path):
+    """
+    A missing or foreign file is a configuration error.
+    """
+    path = tmp_path / "knowledge.index"
+    with pytest.raises(ValueError):
+        KnowledgeIndex(str(path))
+    path.write_bytes(b"not an index at all")
+    with pytest.raises(ValueError):
+        KnowledgeIndex(str(path))
+
+
+def test_snippets_are_added_after_the_static_prefix(docs, tmp_path, monkeypatch):
+    """
+    Retrieved snippets go into a second system message within the token budget.
+    """
+    requests = []
+
+    def fake_create(**kwargs):
+        requests.append(kwargs["messages"])
+        return {"choices": [{"message": {"content": "It costs 25000 KZT."}}]}
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", fake_create)
+    path = str(tmp_path / "knowledge.index")
+    build_index(str(docs), path, chunk_chars=80)
+    retriever = Retriever(KnowledgeIndex(path), top_k=3, token_budget=25)
+    client = AIClient("key", "gpt-3.5-turbo", 0.7, retriever=retriever)
+
+    client.generate_reply("How much is the blue jacket?")
+    client.generate_reply("Hello there")
+
+    roles = [message["role"] for message in requests[0]]
+    assert roles == ["system", "system", "user"]
+    assert "blue rain jacket" in requests[0][1]["content"]
+    assert "Trail running" not in requests[0][1]["content"]
+    assert [message["role"] for message in requests[1]] == ["system", "user"]
+    stats = retriever.stats()
+    assert (stats["queries"], stats["with_context"]) == (2, 1)
@@ -0,0 +1,99 @@
+import openai
+import pytest
+
+from app.ai import AIClient
+from app.ai_prompts import system_prompt
+from app.reply_cache import ReplyCache
+from app.routing import DEFAULT, FAST, HeuristicClassifier, ModelRouter, ModelTier, load_classifier, scripts_of
+from app.stores import MemoryTTLStore
+
+
+TIERS = [ModelTier(FAST, "small-model", 60), ModelTier(DEFAULT, "large-model", 150)]
+
+
+class AlwaysFast:
+    """Custom classifier used through load_classifier."""
+
+    def classify(self, text):
+        return FAST
+
+
+def test_heuristic_classifier():
+    """
+    Short small talk goes to the fast tier; questions, long texts and other scripts do not.
+    """
+    classifier = HeuristicClassifier(simple_max_chars=40, fast_scripts=("latin", "cyrillic"))
+    assert classifier.classify("thanks!") == FAST
+    assert classifier.classify("Спасибо, пока") == FAST
+    assert classifier.classify("see you tomorrow at the shop") == FAST
+    assert classifier.classify("What is the price of the blue one?") == DEFAULT
+    assert classifier.classify("Is the blue one in stock?") == DEFAULT
+    assert classifier.classify("сколько стоит доставка") == DEFAULT
+    assert classifier.classify("a" * 41) == DEFAULT
+    assert classifier.classify("thanks thanks thanks thanks thanks thanks") == FAST
+    assert classifier.classify("ありがとう") == DEFAULT
+    assert classifier.classify("   ") == DEFAULT
+    assert scripts_of("Hi Привет 123") == {"latin", "cyrillic"}
+
+
+def test_router_counts_decisions_and_falls_back():
+    """
+    Unknown classifier answers and classifier errors use the default tier and are counted.
+    """
+    class Flaky:
+        def classify(self, text):
+            if text == "boom":
+                raise RuntimeError("classifier failed")
+            return {"hi": FAST, "unknown": "premium"}.get(text, DEFAULT)
+
+    router = ModelRouter(TIERS, Flaky())
+    assert router.route("hi").model == "small-model"
+    assert router.route("unknown").model == "large-model"
+    assert router.route("boom").model == "large-model"
+    stats = router.stats()
+    assert stats["decisions"] == {FAST: 1, DEFAULT: 2}
+    assert stats["classifier_errors"] == 2
+    with pytest.raises(ValueError):
+        ModelRouter(TIERS, Flaky(), default_tier="premium")
+
+
+def test_load_classifier():
+    """
+    Custom classifiers are loaded from a module:attribute path.
+    """
+    assert load_classifier("tests.test_routing:AlwaysFast").classify("anything") == FAST
+    with pytest.raises(ValueError):
+        load_classifier("tests.test_routing:Missing")
+    with pytest.raises(ValueError):
+        load_classifier("tests.test_routing:TIERS")
+
+
+def test_generate_reply_uses_routed_tier(monkeypatch):
+    """
+    Each message is sent with its tier's model and max_tokens behind the static system prompt,
+    cached per model, and its latency is reported per tier.
+    """
+    calls = []
+
+    def fake_create(**kwargs):
+        calls.append(kwargs)
+        return {"choices": [{"message": {"content": "Reply"}}]}
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", fake_create)
+    router = ModelRouter(TIERS, HeuristicClassifier())
+    cache = ReplyCache(MemoryTTLStore(max_entries=100, max_bytes=10000), ttl=60)
+    client = AIClient("key", "large-model", 0.7, reply_cache=cache, max_tokens=150, router=router)
+
+    client.generate_reply("thanks")
+    client.generate_reply("How do I return an order I received yesterday?")
+    client.generate_reply("thanks")
+
+    assert [(call["model"], call["max_tokens"]) for call in calls] == [("small-model", 60), ("large-model", 150)]
+    for call in calls:
+        assert call["messages"][0] == {"role": "system", "content": system_prompt}
+        assert call["messages"][-1]["role"] == "user"
+    stats = router.stats()
+    assert stats["decisions"] == {FAST: 2, DEFAULT: 1}
+    # the cached reply costs no completion
+    assert stats["latency"][FAST]["count"] == 1
+    assert stats["latency"][DEFAULT]["count"] == 1
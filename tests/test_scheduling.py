@@ -0,0 +1,123 @@
+import threading
+
+import pytest
+
+from app import create_app
+from app.errors import RetryableError
+from app.messages import InboundMessage
+from app.pipeline import MessageProcessor
+from app.scheduling import FairScheduler, parse_priority_classes
+from app.workers import WorkerPool
+
+
+def drain(scheduler):
+    """Take every queued batch, one at a time, and return the senders in service order."""
+    order = []
+    scheduler.close()
+    while True:
+        scheduled = scheduler.get()
+        if scheduled is None:
+            return order
+        order.append(scheduled[0])
+        scheduler.done(scheduled[0])
+
+
+def test_spammer_does_not_delay_other_senders():
+    """
+    A sender with a long backlog is interleaved with the others instead of served first.
+    """
+    scheduler = FairScheduler()
+    for number in range(10):
+        scheduler.put("spammer", number)
+    scheduler.put("alice", "hi")
+    scheduler.put("bob", "hello")
+
+    order = drain(scheduler)
+    assert order[:4].count("spammer") == 2
+    assert set(order[:4]) == {"spammer", "alice", "bob"}
+    assert order.count("spammer") == 10
+
+
+def test_weights_of_priority_classes():
+    """
+    A sender of weight 4 is served four times as often as a default sender while both are backlogged.
+    """
+    scheduler = FairScheduler(classes=parse_priority_classes("vip=4:+77010000000"))
+    for number in range(20):
+        scheduler.put("77010000000", number)
+        scheduler.put("77099999999", number)
+
+    order = drain(scheduler)
+    assert order[:10].count("77010000000") == 8
+    assert scheduler.stats()["wait_by_class"].keys() == {"vip", "default"}
+
+
+def test_per_sender_concurrency_cap():
+    """
+    A sender's next batch waits until its running batch is done, while other senders proceed.
+    """
+    scheduler = FairScheduler()
+    scheduler.put("alice", 1)
+    scheduler.put("alice", 2)
+    scheduler.put("bob", 1)
+
+    assert scheduler.get() == ("alice", 1)
+    assert scheduler.get() == ("bob", 1)
+    result = []
+    worker = threading.Thread(target=lambda: result.append(scheduler.get()))
+    worker.start()
+    worker.join(0.1)
+    assert worker.is_alive() and not result
+
+    scheduler.done("alice")
+    worker.join(1)
+    assert result == [("alice", 2)]
+    stats = scheduler.stats()
+    assert (stats["queued"], stats["running"]) == (0, 2)
+    assert {sender["sender"] for sender in stats["senders"]} == {"alice", "bob"}
+
+
+def test_backlog_limits():
+    """
+    Both the total queue and one sender's backlog are bounded, and overflow is retryable.
+    """
+    scheduler = FairScheduler(max_queue_size=3, max_queued_per_sender=2)
+    scheduler.put("spammer", 1)
+    scheduler.put("spammer", 2)
+    with pytest.raises(RetryableError):
+        scheduler.put("spammer", 3)
+    scheduler.put("alice", 1)
+    with pytest.raises(RetryableError):
+        scheduler.put("bob", 1)
+    assert scheduler.stats()["rejected"] == 2
+
+
+def test_parse_priority_classes():
+    """
+    Classes map every listed sender to its class and weight; malformed settings are rejected.
+    """
+    assert parse_priority_classes("") == {}
+    assert parse_priority_classes("vip=4:1,2; bulk=0.5:3") == {"1": ("vip", 4.0), "2": ("vip", 4.0),
+                                                               "3": ("bulk", 0.5)}
+    with pytest.raises(ValueError):
+        parse_priority_classes("vip:1,2")
+    with pytest.raises(ValueError):
+        parse_priority_classes("vip=0:1")
+
+
+def test_worker_pool_reports_scheduler_stats(fake_clients):
+    """
+    The worker pool queues through the scheduler and includes its stats.
+    """
+    ai_client, whatsapp_client = fake_clients
+    app = create_app()
+    pool = WorkerPool(app, MessageProcessor(whatsapp_client, ai_client), size=2)
+    for number in range(3):
+        pool.submit([InboundMessage(id=f"wamid.{number}", sender=f"7000000000{number}", type="text", text="hey")])
+
+    pool.start()
+    pool.join()
+    stats = pool.stats()
+    assert stats["processed"] == 3
+    assert stats["scheduler"]["wait_by_class"]["default"]["count"] == 3
+    pool.stop()
@@ -0,0 +1,97 @@
+import json
+import os
+import time
+
+import pytest
+
+from app import create_app
+from app.config import Config
+from app.dispatcher import HashRing, ShardedDispatcher
+from benchmarks.stubs import GraphStubServer, OpenAIStubServer
+
+
+def _text_update(sender, message_id, body):
+    message = {"from": sender, "id": message_id, "timestamp": "1752766753", "type": "text", "text": {"body": body}}
+    value = {"messaging_product": "whatsapp", "metadata": {"phone_number_id": "987654321098765"},
+             "messages": [message]}
+    return {"object": "whatsapp_business_account", "entry": [{"id": "1", "changes": [{"value": value}]}]}
+
+
+def test_hash_ring_spreads_senders_and_moves_few_on_resize():
+    senders = [f"7{index:010d}" for index in range(10000)]
+    four = HashRing(range(4))
+    five = HashRing(range(5))
+
+    owners = [four.node_for(sender) for sender in senders]
+    rebuilt = HashRing(range(4))
+    assert owners == [rebuilt.node_for(sender) for sender in senders]
+    assert all(1500 < owners.count(node) < 3500 for node in range(4))
+
+    moved = [sender for sender, owner in zip(senders, owners) if five.node_for(sender) != owner]
+    assert len(moved) < 0.3 * len(senders)
+    # senders only move to the new process
+    assert {five.node_for(sender) for sender in moved} == {4}
+
+
+def test_sharded_mode_keeps_each_senders_replies_in_order(webhook_credentials):
+    with OpenAIStubServer(echo=True, latency=0.01) as openai_stub, GraphStubServer() as graph_stub:
+        class ShardedConfig(Config):
+            MESSAGE_PROCESSING_MODE = "sharded"
+            SHARD_PROCESSES = "2"
+            SHARD_THREADS = "2"
+            OPENAI_API_BASE = openai_stub.api_base
+            OPENAI_MODEL = "gpt-stub"
+            OPENAI_TEMPERATURE = "0.7"
+            WHATSAPP_API_URL = graph_stub.url
+            METRICS_ENABLED = "false"
+
+        app = create_app(ShardedConfig)
+        senders = [f"7000000000{index}" for index in range(6)]
+        try:
+            with app.test_client() as client:
+                for round_number in range(5):
+                    for sender in senders:
+                        payload = _text_update(sender, f"wamid.{sender}.{round_number}", f"{sender}:{round_number}")
+                        response = client.post("/", query_string=webhook_credentials, data=json.dumps(payload),
+                                               content_type="application/json")
+                        assert response.status_code == 200
+                deadline = time.monotonic() + 60
+                while len(graph_stub.delivered) < 30 and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                stats = client.get("/stats").get_json()
+        finally:
+            app.worker_pool.stop(10)
+
+    assert len(graph_stub.delivered) == 30
+    for sender in senders:
+        # the echoed prompt quotes the incoming message
+        replies = [text.split('"')[1] for recipient, text in graph_stub.delivered if recipient == sender]
+        assert replies == [f"{sender}:{round_number}" for round_number in range(5)]
+    assert stats["mode"] == "sharded"
+    assert [shard["index"] for shard in stats["shards"]] == [0, 1]
+    assert {sender: app.worker_pool.shard_for(sender) for sender in senders} == \
+        {sender: HashRing(range(2)).node_for(sender) for sender in senders}
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_child_leaves_the_parents_shards_alone():
+    """
+    A forked child neither stops nor restarts the parent's worker processes and starts from an empty set.
+    """
+    dispatcher = ShardedDispatcher(vars(Config), processor=None, processes=1, threads=1)
+    dispatcher.start()
+    try:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                dispatcher._ensure_alive(0)
+                dispatcher.stop(1)
+                os._exit(0 if not dispatcher.stats()["shards"][0]["alive"] else 1)
+            except BaseException:
+                os._exit(2)
+        _, status = os.waitpid(pid, 0)
+        assert os.WEXITSTATUS(status) == 0
+        assert dispatcher.stats()["shards"][0]["alive"]
+    finally:
+        dispatcher.stop(10)
+    assert not dispatcher.stats()["shards"][0]["alive"]
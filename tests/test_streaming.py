@@ -0,0 +1,73 @@
+import time
+
+from flask import Flask
+
+from app.ai import AIClient
+from app.messages import InboundMessage
+from app.pipeline import MessageProcessor
+from app.segmenter import SentenceSegmenter
+from benchmarks.stubs import OpenAIStubServer
+from tests.conftest import FakeWhatsAppClient
+
+
+LONG_REPLY = (
+    "Thanks for your question about delivery. We deliver every day from 9 to 21.\n\n"
+    "Orders placed before 18:00 arrive the next day. Delivery inside the city is free "
+    "for orders over 10000 tenge. Is there anything else I can help with?"
+)
+
+
+def test_segmenter_cuts_at_paragraph_and_sentence_boundaries():
+    """
+    Streamed fragments are cut at paragraph breaks first and sentence ends second.
+    """
+    segmenter = SentenceSegmenter(min_chars=60, max_chars=200)
+    segments = []
+    for word in LONG_REPLY.split(" "):
+        segments.extend(segmenter.feed(word + " "))
+    segments.append(segmenter.flush())
+
+    assert segments[0] == "Thanks for your question about delivery. We deliver every day from 9 to 21."
+    # the short sentence is grouped with the next one to reach min_chars
+    assert segments[1] == ("Orders placed before 18:00 arrive the next day. "
+                           "Delivery inside the city is free for orders over 10000 tenge.")
+    assert " ".join(segments) == LONG_REPLY.replace("\n\n", " ")
+
+
+def test_segmenter_hard_limit_without_boundaries():
+    """
+    Text without any boundary is still cut below max_chars, on whitespace.
+    """
+    segmenter = SentenceSegmenter(min_chars=10, max_chars=50)
+    segments = segmenter.feed("word " * 30)
+    assert segments
+    assert all(len(segment) <= 50 for segment in segments)
+
+
+def test_first_segment_is_sent_while_generation_continues():
+    """
+    Against a local streaming server, the first segment is delivered before the stream ends.
+    """
+    app = Flask(__name__)
+    with OpenAIStubServer(reply=LONG_REPLY, token_delay=0.01) as server, app.app_context():
+        ai_client = AIClient("key", "gpt-3.5-turbo", 0.7, api_base=server.api_base,
+                             streaming=True, segment_min_chars=60)
+        whatsapp_client = FakeWhatsAppClient()
+        sent_at = []
+        original_send = whatsapp_client.send_message
+
+        def send_message(text, number):
+            sent_at.append(time.perf_counter())
+            original_send(text, number)
+
+        whatsapp_client.send_message = send_message
+        processor = MessageProcessor(whatsapp_client, ai_client)
+
+        started = time.perf_counter()
+        processor.process(InboundMessage(id="wamid.1", sender="700", type="text", text="delivery?"))
+        finished = time.perf_counter()
+
+    assert len(whatsapp_client.sent) == 3
+    # the first segment went out well before the whole reply was generated
+    assert sent_at[0] - started < (finished - started) / 2
+    assert processor.stats()["first_segment"]["count"] == 1
@@ -0,0 +1,19 @@
+from flask import Flask
+
+from app.whatsapp import WhatsAppClient
+from benchmarks.stubs import GraphStubServer
+
+
+def test_send_message_reuses_pooled_connection():
+    """
+    Consecutive sends go over a single kept-alive connection to the Graph API.
+    """
+    app = Flask(__name__)
+    with GraphStubServer() as server, app.app_context():
+        client = WhatsAppClient(server.url, "verify-token", "access-token", "123456")
+        for _ in range(5):
+            client.send_message("hello", "70000000000")
+
+        assert server.requests == 5
+        assert server.connections == 1
+        assert client.messages_url == f"{server.url}/123456/messages"